@@ -8,6 +8,7 @@ namespace torch_ipex {
 namespace cpu {
 
 IPEX_DEFINE_DISPATCH(merged_embeddingbag_forward_cpu_kernel_stub);
+IPEX_DEFINE_DISPATCH(qmerged_embeddingbag_rowwise_forward_cpu_kernel_stub);
 
 std::vector<Tensor> merged_embeddingbag_forward_cpu(
     const std::vector<Tensor>& weights,
@@ -23,6 +24,27 @@ std::vector<Tensor> merged_embeddingbag_forward_cpu(
       kCPU, weights, indices, offsets, pooling_mode, include_last_offsets);
 }
 
+std::vector<Tensor> qmerged_embeddingbag_rowwise_forward_cpu(
+    const std::vector<Tensor>& weights,
+    const TensorList& indices,
+    const TensorList& offsets,
+    const std::vector<int64_t>& bits,
+    const int64_t pooling_mode,
+    const bool include_last_offsets) {
+  /*
+  pointer to qmerged_embeddingbag_rowwise_forward_cpu_kernel_impl(
+      weights, indices, offsets, bits, pooling_mode, include_last_offsets);
+  */
+  return qmerged_embeddingbag_rowwise_forward_cpu_kernel_stub(
+      kCPU,
+      weights,
+      indices,
+      offsets,
+      bits,
+      pooling_mode,
+      include_last_offsets);
+}
+
 } // namespace cpu
 } // namespace torch_ipex
 
@@ -65,6 +87,12 @@ TORCH_LIBRARY_FRAGMENT(torch_ipex, m) {
       "merged_embeddingbag_forward",
       c10::DispatchKey::AutocastCPU,
       torch_ipex::autocast::merged_embeddingbag_forward);
+  m.def(
+      "qmerged_embeddingbag_rowwise_forward(Tensor[] weights, Tensor[] indices, Tensor[] offsets, int[] bits, int pooling_mode, bool include_last_offsets) -> Tensor[]");
+  m.impl(
+      "qmerged_embeddingbag_rowwise_forward",
+      c10::DispatchKey::CPU,
+      torch_ipex::cpu::qmerged_embeddingbag_rowwise_forward_cpu);
 }
 
 } // namespace
@@ -159,6 +159,57 @@ struct AdaGradArgs {
   float lr;
 };
 
+/**
+ * The tables of a merged embedding bag may have different dtypes and
+ * embedding dims. All the tables are still walked inside one parallel region,
+ * so the dtype is dispatched per table by this helper instead of AT_DISPATCH:
+ * call check_table_dtypes before entering the parallel region, nothing is
+ * thrown here.
+ *
+ * How to use:
+ *
+ *   dispatch_table_dtype<allow_half>(dtype, [&](auto tag) {
+ *     using data_t = decltype(tag);
+ *     ...
+ *   });
+ */
+template <bool allow_half, typename func_t>
+inline void dispatch_table_dtype(const ScalarType data_type, const func_t& f) {
+  switch (data_type) {
+    case kFloat:
+      f(float());
+      break;
+    case kDouble:
+      f(double());
+      break;
+    case kBFloat16:
+      f(BFloat16());
+      break;
+    case kHalf:
+      if constexpr (allow_half) {
+        f(Half());
+      }
+      break;
+    default:
+      break;
+  }
+}
+
+inline void check_table_dtypes(
+    const TensorList& tensors,
+    const bool allow_half,
+    const char* name) {
+  for (const auto& t : tensors) {
+    auto data_type = t.scalar_type();
+    TORCH_CHECK(
+        data_type == kFloat || data_type == kDouble || data_type == kBFloat16 ||
+            (allow_half && data_type == kHalf),
+        name,
+        " does not support dtype ",
+        data_type);
+  }
+}
+
 template <typename data_t, typename acc_t, typename optimizer_args_t>
 class EmbeddingGradUpdate {};
 
@@ -191,6 +242,14 @@ std::vector<Tensor> merged_embeddingbag_forward_cpu_kernel_impl(
     const int64_t pooling_mode,
     const bool include_last_offsets);
 
+std::vector<Tensor> qmerged_embeddingbag_rowwise_forward_cpu_kernel_impl(
+    const TensorList& weights,
+    const TensorList& indices,
+    const TensorList& offsets,
+    const std::vector<int64_t>& bits,
+    const int64_t pooling_mode,
+    const bool include_last_offsets);
+
 std::vector<Tensor> merged_embeddingbag_backward_cpu_kernel_impl(
     const TensorList& grad_outs_,
     const TensorList& weights,
@@ -271,6 +330,18 @@ IPEX_DECLARE_DISPATCH(
     merged_embeddingbag_forward_cpu_kernel_fn,
     merged_embeddingbag_forward_cpu_kernel_stub);
 
+using qmerged_embeddingbag_rowwise_forward_cpu_kernel_fn =
+    std::vector<Tensor> (*)(
+        const TensorList&,
+        const TensorList&,
+        const TensorList&,
+        const std::vector<int64_t>&,
+        const int64_t,
+        const bool);
+IPEX_DECLARE_DISPATCH(
+    qmerged_embeddingbag_rowwise_forward_cpu_kernel_fn,
+    qmerged_embeddingbag_rowwise_forward_cpu_kernel_stub);
+
 using merged_embeddingbag_backward_cpu_kernel_fn = std::vector<Tensor> (*)(
     const TensorList&,
     const TensorList&,
@@ -1,12 +1,19 @@
 #include "TPPShmAllReduceAdd.h"
+#include <omp.h>
 #include <torch/all.h>
 namespace torch_ipex {
 namespace cpu {
 IPEX_DEFINE_DISPATCH(tpp_allreduce_kernel_stub);
 void tpp_shmallreduce_forward(
     at::Tensor t_in,
-    c10::intrusive_ptr<c10d::ProcessGroup> process_group) {
+    c10::intrusive_ptr<c10d::ProcessGroup> process_group,
+    int64_t num_threads) {
   RECORD_FUNCTION("tpp_all_reduce_add", c10::ArrayRef<c10::IValue>({}));
+  if (num_threads > 0) {
+    // only changes the OpenMP teams of the calling thread, i.e. the
+    // communication thread of the asynchronous all-reduce
+    omp_set_num_threads(num_threads);
+  }
   return tpp_allreduce_kernel_stub(kCPU, t_in, process_group);
 }
 
@@ -8,7 +8,8 @@ namespace cpu {
 
 void tpp_shmallreduce_forward(
     at::Tensor t_in,
-    c10::intrusive_ptr<c10d::ProcessGroup> process_group);
+    c10::intrusive_ptr<c10d::ProcessGroup> process_group,
+    int64_t num_threads = 0);
 
 using tpp_allreduce_impl_fn =
     void (*)(at::Tensor, c10::intrusive_ptr<c10d::ProcessGroup>);
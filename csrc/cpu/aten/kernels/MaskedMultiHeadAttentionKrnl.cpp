@@ -4,6 +4,7 @@
 #include <aten/FlashAttention.h>
 #include <aten/Gemm.h>
 #include <aten/MaskedMultiHeadAttention.h>
+#include <aten/utils/kv_cache_quant.h>
 #include <torch/all.h>
 #include <torch/csrc/autograd/function.h>
 #include <limits>
@@ -20,6 +21,36 @@ inline bool is_first_token_optimizable(at::Tensor key) {
       (key.scalar_type() == at::kHalf && utils::isa_has_avx512_fp16_support());
 }
 
+/*
+ *The indirect access kv cache is allocated in segments of `segment_size`
+ *(text_max_length) tokens. Returns the cache size that can hold `seq_len`
+ *tokens plus at least one more token, so that the memory follows the actual
+ *sequence length instead of a fixed max length. Without a segment size, the
+ *cache is doubled.
+ */
+inline int64_t get_kv_cache_size_by_segment(
+    int64_t seq_len,
+    int64_t segment_size) {
+  if (segment_size <= 0) {
+    return seq_len * 2;
+  }
+  return (seq_len / segment_size + 1) * segment_size;
+}
+
+/*
+ *The cache of `cache_size` tokens is full at `seq_len` tokens. It is extended
+ *to at least twice its size, so that the copies of the old cache take
+ *amortized O(1) per token instead of one full copy every segment, and still
+ *by whole segments.
+ */
+inline int64_t get_extended_kv_cache_size(
+    int64_t cache_size,
+    int64_t seq_len,
+    int64_t segment_size) {
+  return std::max(
+      get_kv_cache_size_by_segment(seq_len, segment_size), cache_size * 2);
+}
+
 template <typename T, typename KT, typename CT>
 inline void reduce_head(
     const T* q_ptr_start,
@@ -1117,6 +1148,54 @@ inline void copy_key_value(
   }
 }
 
+/*
+ *Quantizes the key/value of the prompt into the int8/int4 kv cache, see
+ *aten/utils/kv_cache_quant.h for the format of the cache rows.
+ */
+template <typename T>
+inline void copy_key_value_quantized(
+    at::Tensor key_cache,
+    const at::Tensor key,
+    at::Tensor value_cache,
+    const at::Tensor value,
+    int beam_batch,
+    int64_t kv_cache_bits) {
+  RECORD_FUNCTION(
+      "ipex::copy_key_value_quantized", c10::ArrayRef<c10::IValue>({}));
+  auto bs = key.size(0);
+  auto seq_len = key.size(1);
+  auto head_num = key.size(2);
+  auto head_size = key.size(3);
+  auto key_cache_ptr = key_cache.data_ptr<uint8_t>();
+  auto key_ptr = key.data_ptr<T>();
+  auto value_cache_ptr = value_cache.data_ptr<uint8_t>();
+  auto value_ptr = value.data_ptr<T>();
+  auto cache_strideS = key_cache.stride(0);
+  auto cache_strideB = key_cache.stride(1);
+  auto cache_strideH = key_cache.stride(2);
+  auto beam_size = beam_batch / bs;
+#pragma omp parallel for collapse(3)
+  for (auto si = 0; si < seq_len; si++) {
+    for (auto bi = 0; bi < bs; bi++) {
+      for (auto hi = 0; hi < head_num; hi++) {
+        auto cache_offset = si * cache_strideS +
+            bi * beam_size * cache_strideB + hi * cache_strideH;
+        auto state_offset = ((bi * seq_len + si) * head_num + hi) * head_size;
+        kv_quant::quantize_row(
+            key_ptr + state_offset,
+            key_cache_ptr + cache_offset,
+            head_size,
+            kv_cache_bits);
+        kv_quant::quantize_row(
+            value_ptr + state_offset,
+            value_cache_ptr + cache_offset,
+            head_size,
+            kv_cache_bits);
+      }
+    }
+  }
+}
+
 /*
  *The scale-dot product for indirect access kv chache and fuse
  *matmul+div+add+softmax to improve data reuse
@@ -1160,7 +1239,11 @@ scale_dot_product_for_indirect_access_kv_cache(
   auto head_size = query.size(3);
   auto b_ptr = beam_idx.data_ptr<long>();
   auto max_cache_size = beam_idx.size(0);
-  long new_beam_idx[beam_batch][offset + query.size(1) + 1] = {};
+  // keep the beam index history on the heap, its size grows with the context
+  // length and would overflow the stack for long sequences
+  auto new_beam_idx_buf =
+      at::zeros({beam_batch, offset + query.size(1) + 1}, beam_idx.options());
+  auto new_beam_idx = new_beam_idx_buf.accessor<long, 2>();
   auto prompt_len = b_ptr[(max_cache_size - 2) * beam_batch];
   auto prompt_bs = b_ptr[(max_cache_size - 1) * beam_batch];
   auto beam_size = 1;
@@ -1731,6 +1814,283 @@ scale_dot_product_for_indirect_access_kv_cache(
       attn_outs, at::Tensor(), key_cache, value_cache, beam_idx);
 }
 
+/*
+ *The scale-dot product for the int8/int4 indirect access kv cache. The current
+ *key/value are quantized into the cache first and then read back like the past
+ *tokens. The cache rows are not dequantized, their scales and mins are applied
+ *to the reduced sums, see aten/utils/kv_cache_quant.h.
+ *@param  kv_cache_bits 8 for the int8 cache and 4 for the int4 cache.
+ *@return attn_outs, None, key_cache, value_cache, beam_idx
+ */
+template <typename T>
+std::tuple<at::Tensor, at::Tensor, at::Tensor, at::Tensor, at::Tensor>
+scale_dot_product_for_indirect_access_quantized_kv_cache(
+    at::Tensor query,
+    at::Tensor key,
+    at::Tensor value,
+    at::Tensor& key_cache,
+    at::Tensor& value_cache,
+    at::Tensor& beam_idx,
+    const int64_t offset,
+    const double scale_factor,
+    at::Tensor& attention_mask,
+    int64_t kv_cache_bits) {
+  RECORD_FUNCTION(
+      "ipex::scale_dot_product_for_indirect_access_quantized_kv_cache",
+      c10::ArrayRef<c10::IValue>({}));
+  int beam_batch = beam_idx.size(1);
+  auto bs = query.size(0);
+  auto cur_len = query.size(1); // only process cur_len==1
+  auto head_num = query.size(2);
+  auto head_size = query.size(3);
+  auto b_ptr = beam_idx.data_ptr<long>();
+  auto max_cache_size = beam_idx.size(0);
+  auto new_beam_idx_buf =
+      at::zeros({beam_batch, offset + query.size(1) + 1}, beam_idx.options());
+  auto new_beam_idx = new_beam_idx_buf.accessor<long, 2>();
+  auto prompt_len = b_ptr[(max_cache_size - 2) * beam_batch];
+  auto prompt_bs = b_ptr[(max_cache_size - 1) * beam_batch];
+  auto beam_size = 1;
+  if (prompt_bs != 0) {
+    beam_size = beam_batch / prompt_bs;
+  }
+  auto need_update_beam_idx = offset > 0 and beam_size > 1;
+  auto kv_head = key.size(2);
+  auto group_size = head_num / kv_head;
+  auto seq_len = offset + cur_len;
+  query = query.contiguous();
+  key = key.contiguous();
+  value = value.contiguous();
+  auto attn_weights = at::empty({bs, head_num, cur_len, seq_len}, at::kFloat);
+  auto attn_outs =
+      at::empty({bs, head_num, cur_len, head_size}, value.options());
+  auto q_ptr = query.data_ptr<T>();
+  auto k_ptr = key.data_ptr<T>();
+  auto v_ptr = value.data_ptr<T>();
+  auto k_cache_ptr = key_cache.data_ptr<uint8_t>();
+  auto v_cache_ptr = value_cache.data_ptr<uint8_t>();
+  auto mask_ptr = attention_mask.data_ptr<T>();
+  auto attn_w_ptr = attn_weights.data_ptr<float>();
+  auto attn_out_ptr = attn_outs.data_ptr<T>();
+  auto mask_head_num = attention_mask.size(1);
+  auto mask_dim2 = attention_mask.size(2);
+  auto mask_bs_stride = mask_head_num * mask_dim2 * seq_len;
+
+  // stride information
+  auto qStrideB = query.stride(0);
+  auto qStrideH = query.stride(2);
+  auto kStrideB = key.stride(0);
+  auto kStrideH = key.stride(2);
+  auto vStrideB = value.stride(0);
+  auto vStrideH = value.stride(2);
+  // the key and value caches have the same layout
+  auto cStrideS = key_cache.stride(0);
+  auto cStrideB = key_cache.stride(1);
+  auto cStrideH = key_cache.stride(2);
+  auto attn_w_strideH = attn_weights.stride(1);
+
+  auto thread_numbers = omp_get_max_threads();
+  auto max_parallel_parts = thread_numbers * 4;
+  auto target_block_size = 32L;
+  if (bs <= 32 and seq_len < 65536) {
+    target_block_size = 8L;
+  }
+  auto kv_block_size = bs * head_num >= max_parallel_parts
+      ? seq_len
+      : std::max(seq_len / max_parallel_parts, 1L);
+  kv_block_size = std::min(kv_block_size, target_block_size);
+  auto kv_block_count = (seq_len + kv_block_size - 1) / kv_block_size;
+  if (need_update_beam_idx) {
+    // according to last decoded token to get the target beam for the past
+    for (int i = 0; i < bs; i++) {
+      new_beam_idx[i][offset - 1] = b_ptr[(offset - 1) * bs + i];
+      // for the token of input, the target beam is alwarys bi - bi%beam_size
+      for (int j = offset - 2; j >= prompt_len; j--) {
+        new_beam_idx[i][j] = b_ptr[j * bs + new_beam_idx[i][j + 1]];
+      }
+    }
+  }
+  // the beam of the cache to read the token ti of the sequence bi
+  auto get_beam = [&](int64_t bi, int64_t ti) -> int64_t {
+    if (ti == offset) {
+      return bi;
+    }
+    return need_update_beam_idx && ti >= prompt_len
+        ? new_beam_idx[bi][ti]
+        : bi / beam_size * beam_size;
+  };
+  {
+    RECORD_FUNCTION(
+        "ipex::iakv_sdp::quantize(key, value)", c10::ArrayRef<c10::IValue>({}));
+#pragma omp parallel for collapse(2)
+    for (auto bi = 0; bi < bs; bi++) {
+      for (auto kv_hi = 0; kv_hi < kv_head; kv_hi++) {
+        auto cache_offset =
+            offset * cStrideS + bi * cStrideB + kv_hi * cStrideH;
+        kv_quant::quantize_row(
+            k_ptr + bi * kStrideB + kv_hi * kStrideH,
+            k_cache_ptr + cache_offset,
+            head_size,
+            kv_cache_bits);
+        kv_quant::quantize_row(
+            v_ptr + bi * vStrideB + kv_hi * vStrideH,
+            v_cache_ptr + cache_offset,
+            head_size,
+            kv_cache_bits);
+      }
+    }
+  }
+  {
+    RECORD_FUNCTION(
+        "ipex::iakv_sdp::matmul(query, key)", c10::ArrayRef<c10::IValue>({}));
+#pragma omp parallel for collapse(3)
+    for (auto block_id = 0; block_id < kv_block_count; block_id++) {
+      for (auto bi = 0; bi < bs; bi++) {
+        for (auto kv_hi = 0; kv_hi < kv_head; kv_hi++) {
+          auto k_start = block_id * kv_block_size;
+          auto block_size = std::min(kv_block_size, seq_len - k_start);
+          for (auto ti = k_start; ti < k_start + block_size; ti++) {
+            auto k_cache_start = k_cache_ptr + ti * cStrideS +
+                get_beam(bi, ti) * cStrideB + kv_hi * cStrideH;
+            // maping the query head to key/value head to support MGA/MQA
+            for (auto hi = kv_hi * group_size; hi < (kv_hi + 1) * group_size;
+                 hi++) {
+              attn_w_ptr[(bi * head_num + hi) * attn_w_strideH + ti] =
+                  kv_quant::dot_row(
+                      q_ptr + bi * qStrideB + hi * qStrideH,
+                      k_cache_start,
+                      head_size,
+                      kv_cache_bits);
+            }
+          }
+        }
+      }
+    }
+  }
+  {
+    RECORD_FUNCTION(
+        "ipex::iakv_sdp::div_add_softmax", c10::ArrayRef<c10::IValue>({}));
+#pragma omp parallel for collapse(2)
+    for (auto bi = 0; bi < bs; bi++) {
+      for (auto hi = 0; hi < head_num; hi++) {
+        auto mask_ptr_start = mask_ptr + bi * mask_bs_stride +
+            (hi % mask_head_num) * mask_dim2 * seq_len;
+        auto attn_w_start = attn_w_ptr + (bi * head_num + hi) * attn_w_strideH;
+        auto max_val = -100000.0f;
+#if defined(CPU_CAPABILITY_AVX512)
+        torch_ipex::cpu::kernel::
+            _dil_div_add_reduce_max_fusion_kernel<float, T>(
+                attn_w_start,
+                mask_ptr_start,
+                scale_factor,
+                seq_len,
+                attn_w_start,
+                max_val);
+        torch_ipex::cpu::kernel::_dil_exp_reduce_sum_fusion_kernel(
+            attn_w_start, seq_len, attn_w_start, max_val);
+        torch_ipex::cpu::kernel::_dil_normalization_kernel<float>(
+            attn_w_start, max_val, seq_len, attn_w_start);
+#else
+        // div+add and find max
+        for (auto si = 0; si < seq_len; si++) {
+          attn_w_start[si] =
+              attn_w_start[si] / scale_factor + mask_ptr_start[si];
+          if (attn_w_start[si] > max_val) {
+            max_val = attn_w_start[si];
+          }
+        }
+        // softmax
+        float sum = 0.0f;
+        for (auto si = 0; si < seq_len; si++) {
+          attn_w_start[si] = exp(attn_w_start[si] - max_val);
+          sum += attn_w_start[si];
+        }
+        for (auto si = 0; si < seq_len; si++) {
+          attn_w_start[si] = attn_w_start[si] / sum;
+        }
+#endif
+      }
+    }
+  }
+  auto private_attn_outs =
+      at::empty({thread_numbers, bs, head_num, head_size}, at::kFloat);
+  auto private_attn_out_flag =
+      at::zeros({thread_numbers, bs, head_num}, at::kByte);
+  auto flag_access = private_attn_out_flag.accessor<uint8_t, 3>();
+  auto private_attn_out_ptr = private_attn_outs.data_ptr<float>();
+  auto attn_outs_stride_privT = private_attn_outs.stride(0);
+  auto attn_outs_stride_privB = private_attn_outs.stride(1);
+  auto attn_outs_stride_privH = private_attn_outs.stride(2);
+  {
+    RECORD_FUNCTION(
+        "ipex::iakv_sdp::matmul(attn_w, value)",
+        c10::ArrayRef<c10::IValue>({}));
+#pragma omp parallel for collapse(3)
+    for (auto block_id = 0; block_id < kv_block_count; block_id++) {
+      for (auto bi = 0; bi < bs; bi++) {
+        for (auto kv_hi = 0; kv_hi < kv_head; kv_hi++) {
+          auto thread_id = 0;
+          if (kv_block_size < seq_len)
+            thread_id = omp_get_thread_num();
+          auto v_start = block_id * kv_block_size;
+          auto block_size = std::min(kv_block_size, seq_len - v_start);
+          for (auto vi = v_start; vi < v_start + block_size; vi++) {
+            auto v_cache_start = v_cache_ptr + vi * cStrideS +
+                get_beam(bi, vi) * cStrideB + kv_hi * cStrideH;
+            for (auto hi = kv_hi * group_size; hi < (kv_hi + 1) * group_size;
+                 hi++) {
+              auto attn_out_start = private_attn_out_ptr +
+                  thread_id * attn_outs_stride_privT +
+                  bi * attn_outs_stride_privB + hi * attn_outs_stride_privH;
+              kv_quant::mul_and_accumulate_row(
+                  attn_w_ptr[(bi * head_num + hi) * attn_w_strideH + vi],
+                  v_cache_start,
+                  attn_out_start,
+                  head_size,
+                  kv_cache_bits,
+                  flag_access[thread_id][bi][hi]);
+              flag_access[thread_id][bi][hi] = 1;
+            }
+          }
+        }
+      }
+    }
+  }
+  {
+    RECORD_FUNCTION(
+        "ipex::iakv_sdp::reduction_private_result",
+        c10::ArrayRef<c10::IValue>({}));
+#pragma omp parallel for collapse(2)
+    for (auto bi = 0; bi < bs; bi++) {
+      for (auto hi = 0; hi < head_num; hi++) {
+        auto thr0_head_start = private_attn_out_ptr +
+            bi * attn_outs_stride_privB + hi * attn_outs_stride_privH;
+        if (flag_access[0][bi][hi] == 0) {
+          torch_ipex::cpu::kernel::zero_ker(thr0_head_start, head_size);
+        }
+        if (kv_block_size < seq_len) {
+          for (auto thread_id = 1; thread_id < thread_numbers; thread_id++) {
+            if (flag_access[thread_id][bi][hi] == 0) {
+              continue;
+            }
+            auto private_attn_out_start = private_attn_out_ptr +
+                thread_id * attn_outs_stride_privT +
+                bi * attn_outs_stride_privB + hi * attn_outs_stride_privH;
+            torch_ipex::cpu::kernel::add_ker<float, float>(
+                thr0_head_start, private_attn_out_start, head_size);
+          }
+        }
+        torch_ipex::cpu::kernel::move_ker<T, float>(
+            attn_out_ptr + (bi * head_num + hi) * head_size,
+            thr0_head_start,
+            head_size);
+      }
+    }
+  }
+  return std::make_tuple(
+      attn_outs, at::Tensor(), key_cache, value_cache, beam_idx);
+}
+
 #if defined(CPU_CAPABILITY_AVX512_FP16)
 std::tuple<at::Tensor, at::Tensor, at::Tensor, at::Tensor, at::Tensor>
 scale_dot_product_for_indirect_access_kv_cache_half(
@@ -1753,7 +2113,11 @@ scale_dot_product_for_indirect_access_kv_cache_half(
   auto head_size = query.size(3);
   auto b_ptr = beam_idx.data_ptr<long>();
   auto max_cache_size = beam_idx.size(0);
-  long new_beam_idx[beam_batch][offset + query.size(1) + 1] = {};
+  // keep the beam index history on the heap, its size grows with the context
+  // length and would overflow the stack for long sequences
+  auto new_beam_idx_buf =
+      at::zeros({beam_batch, offset + query.size(1) + 1}, beam_idx.options());
+  auto new_beam_idx = new_beam_idx_buf.accessor<long, 2>();
   auto prompt_len = b_ptr[(max_cache_size - 2) * beam_batch];
   auto prompt_bs = b_ptr[(max_cache_size - 1) * beam_batch];
   auto beam_size = 1;
@@ -2261,7 +2625,51 @@ zero_copy_kv_cache_masked_multihead_self_attention_kernel_impl(
   assert(
       key.scalar_type() == at::kBFloat16 || key.scalar_type() == at::kFloat ||
       key.scalar_type() == at::kHalf);
-  if (key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
+  if (key_cache.scalar_type() == at::kByte) {
+    TORCH_CHECK(
+        query.scalar_type() == key.scalar_type() &&
+            query.scalar_type() == value.scalar_type(),
+        "query, key and value must have the same data type to use the quantized kv cache");
+    auto kv_cache_bits = kv_quant::get_bits(key.size(3), key_cache.size(3));
+    if (query.scalar_type() == at::kFloat) {
+      return scale_dot_product_for_indirect_access_quantized_kv_cache<float>(
+          query,
+          key,
+          value,
+          key_cache,
+          value_cache,
+          beam_idx,
+          offset,
+          scale_attn,
+          attention_mask,
+          kv_cache_bits);
+    } else if (query.scalar_type() == at::kBFloat16) {
+      return scale_dot_product_for_indirect_access_quantized_kv_cache<
+          at::BFloat16>(
+          query,
+          key,
+          value,
+          key_cache,
+          value_cache,
+          beam_idx,
+          offset,
+          scale_attn,
+          attention_mask,
+          kv_cache_bits);
+    }
+    return scale_dot_product_for_indirect_access_quantized_kv_cache<at::Half>(
+        query,
+        key,
+        value,
+        key_cache,
+        value_cache,
+        beam_idx,
+        offset,
+        scale_attn,
+        attention_mask,
+        kv_cache_bits);
+  } else if (
+      key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
       query.scalar_type() == at::kBFloat16 &&
       value.scalar_type() == at::kBFloat16) {
     return scale_dot_product_for_indirect_access_kv_cache<
@@ -2429,7 +2837,20 @@ first_token_masked_mha(
         false,
         "key and value must be float, float16 or bfloat16 to use ipex::masked_multihead_self_attention_kernel_impl");
   }
-  if (key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
+  if (key_cache.scalar_type() == at::kByte) {
+    auto kv_cache_bits = kv_quant::get_bits(head_size, key_cache.size(3));
+    if (key.scalar_type() == at::kFloat) {
+      copy_key_value_quantized<float>(
+          key_cache, key, value_cache, value, beam_batch, kv_cache_bits);
+    } else if (key.scalar_type() == at::kBFloat16) {
+      copy_key_value_quantized<at::BFloat16>(
+          key_cache, key, value_cache, value, beam_batch, kv_cache_bits);
+    } else {
+      copy_key_value_quantized<at::Half>(
+          key_cache, key, value_cache, value, beam_batch, kv_cache_bits);
+    }
+  } else if (
+      key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
       key.scalar_type() == at::ScalarType::BFloat16) {
     copy_key_value<at::BFloat16, at::Float8_e5m2>(
         key_cache, key, value_cache, value, beam_batch);
@@ -2623,9 +3044,23 @@ masked_multihead_self_attention_kernel_impl(
   auto cache_size = key_cache.size(0);
   auto cur_len = query.size(1);
   if (offset == 0) {
-    max_positions =
-        max_positions > cur_len ? max_positions : max_positions + cur_len;
-    if (key_cache.scalar_type() == at::ScalarType::Float8_e5m2) {
+    max_positions = get_kv_cache_size_by_segment(cur_len, max_positions);
+    if (key_cache.scalar_type() == at::kByte ||
+        key_cache.scalar_type() == at::ScalarType::UInt4) {
+      // the uint8/uint4 placeholders select the int8/int4 cache, whose rows
+      // carry the scales, see aten/utils/kv_cache_quant.h
+      auto kv_cache_bits = key_cache.scalar_type() == at::kByte ? 8 : 4;
+      auto row_size = kv_quant::get_row_size(key.size(3), kv_cache_bits);
+      TORCH_CHECK(
+          kv_cache_bits == 8 || key.size(3) % 2 == 0,
+          "The int4 kv cache needs an even head_size");
+      key_cache = at::empty(
+          {max_positions, beam_batch, key.size(2), row_size},
+          key.options().dtype(at::kByte));
+      value_cache = at::empty(
+          {max_positions, beam_batch, value.size(2), row_size},
+          value.options().dtype(at::kByte));
+    } else if (key_cache.scalar_type() == at::ScalarType::Float8_e5m2) {
       key_cache = at::empty(
           {max_positions, beam_batch, key.size(2), key.size(3)},
           key.options().dtype(at::kFloat8_e5m2));
@@ -2657,12 +3092,15 @@ masked_multihead_self_attention_kernel_impl(
         query.size(0); // record the promt bs info
 
   } else if (offset > 0 && offset + cur_len > cache_size) {
-    auto new_cache_size = cache_size * 2;
+    // extend the cache geometrically, the old buffers are released once they
+    // are copied
+    auto new_cache_size =
+        get_extended_kv_cache_size(cache_size, offset + cur_len, max_positions);
     auto new_key_cache = at::empty(
-        {new_cache_size, beam_batch, key.size(2), key.size(3)},
+        {new_cache_size, beam_batch, key.size(2), key_cache.size(3)},
         key_cache.options());
     auto new_value_cache = at::empty(
-        {new_cache_size, beam_batch, value.size(2), value.size(3)},
+        {new_cache_size, beam_batch, value.size(2), value_cache.size(3)},
         value_cache.options());
     auto new_beam_idx =
         at::zeros({new_cache_size + 2, beam_batch}, beam_idx.options());
@@ -2859,6 +3297,10 @@ deepseekv2_mla_kernel_impl(
   TORCH_CHECK(
       query.dtype() == k_pe.dtype(),
       "query and k_pe must have the same data type to use ipex::deepseekv2_mla_kernel_impl");
+  TORCH_CHECK(
+      kv_cache.scalar_type() != at::kByte &&
+          kv_cache.scalar_type() != at::ScalarType::UInt4,
+      "The int8 and int4 kv cache are not supported by ipex::deepseekv2_mla_kernel_impl");
   auto offset = seq_info.data_ptr<long>()[0];
   auto beam_batch = beam_idx.size(1); // need to prepare the fake beam_idx as
                                       // (max_position, bs) for the first token
@@ -2879,8 +3321,7 @@ deepseekv2_mla_kernel_impl(
   auto attention_mask_v = attn_mask.value().contiguous();
   attention_mask_v = attention_mask_v.to(query.dtype());
   if (offset == 0) {
-    max_positions =
-        max_positions > cur_len ? max_positions : max_positions + cur_len;
+    max_positions = get_kv_cache_size_by_segment(cur_len, max_positions);
     if (kv_cache.scalar_type() == at::ScalarType::Float8_e5m2) {
       kv_cache = at::empty(
           {max_positions, beam_batch, kv_head_num, kv_head_size},
@@ -2907,7 +3348,10 @@ deepseekv2_mla_kernel_impl(
         query.size(0); // record the promt bs info
 
   } else if (offset > 0 && offset + cur_len > cache_size) {
-    auto new_cache_size = cache_size * 2;
+    // extend the cache geometrically, the old buffers are released once they
+    // are copied
+    auto new_cache_size =
+        get_extended_kv_cache_size(cache_size, offset + cur_len, max_positions);
     auto new_kv_cache = at::empty(
         {new_cache_size, beam_batch, kv_head_num, kv_head_size},
         kv_cache.options());
@@ -237,70 +237,92 @@ template <typename data_t, typename index_t>
 typename std::enable_if<
     std::is_same<data_t, Half>::value || std::is_same<data_t, BFloat16>::value,
     void>::type
-merged_embeddingbag_dense_backward(
-    data_t** o_ptr,
-    data_t** grads_ptr,
-    index_t** indices_ptr,
-    index_t** offsets_ptr,
+embeddingbag_dense_backward(
+    data_t* o_ptr,
+    const data_t* grads_ptr,
+    const index_t* indices_ptr,
+    const index_t* offsets_ptr,
     int64_t num_batch,
     int64_t num_emb,
     int64_t emb_dim,
-    std::vector<int64_t> last_offsets,
+    int64_t last_offset,
     int64_t pooling_mode) {
   using acc_t = acc_type<data_t, true>; // if use_cuda = False, float's acc type
                                         // will be double
-#pragma omp parallel
-  {
-    for (int32_t n = 0; n < num_emb; ++n) {
-      EmbeddingRowCache<acc_t> ewc;
-      embeddingbag_bwd_acc_kern<data_t, index_t, acc_t, /*use_cache=*/true>(
-          /*bs_begin=*/0,
-          num_batch,
-          num_emb,
-          emb_dim,
-          last_offsets[n],
-          indices_ptr[n],
-          offsets_ptr[n],
-          grads_ptr[n],
-          o_ptr[n],
-          pooling_mode,
-          ewc);
-      copy_from_grad_cache(o_ptr[n], ewc, emb_dim);
-    }
-  }
+  EmbeddingRowCache<acc_t> ewc;
+  embeddingbag_bwd_acc_kern<data_t, index_t, acc_t, /*use_cache=*/true>(
+      /*bs_begin=*/0,
+      num_batch,
+      num_emb,
+      emb_dim,
+      last_offset,
+      indices_ptr,
+      offsets_ptr,
+      grads_ptr,
+      o_ptr,
+      pooling_mode,
+      ewc);
+  copy_from_grad_cache(o_ptr, ewc, emb_dim);
 }
 
 template <typename data_t, typename index_t>
 typename std::enable_if<
     std::is_same<data_t, double>::value || std::is_same<data_t, float>::value,
     void>::type
-merged_embeddingbag_dense_backward(
-    data_t** o_ptr,
-    data_t** grads_ptr,
-    index_t** indices_ptr,
-    index_t** offsets_ptr,
+embeddingbag_dense_backward(
+    data_t* o_ptr,
+    const data_t* grads_ptr,
+    const index_t* indices_ptr,
+    const index_t* offsets_ptr,
     int64_t num_batch,
     int64_t num_emb,
     int64_t emb_dim,
-    std::vector<int64_t> last_offsets,
+    int64_t last_offset,
     int64_t pooling_mode) {
   // For float/double, do not need ewc to accumulate grad
   EmbeddingRowCache<data_t> dummy_ewc;
+  embeddingbag_bwd_acc_kern<data_t, index_t, data_t, /*use_cache=*/false>(
+      /*bs_begin=*/0,
+      num_batch,
+      num_emb,
+      emb_dim,
+      last_offset,
+      indices_ptr,
+      offsets_ptr,
+      grads_ptr,
+      o_ptr,
+      pooling_mode,
+      dummy_ewc);
+}
+
+template <typename index_t>
+void merged_embeddingbag_dense_backward(
+    void** o_ptr,
+    void** grads_ptr,
+    index_t** indices_ptr,
+    index_t** offsets_ptr,
+    int64_t num_batch,
+    int64_t num_emb,
+    const std::vector<int64_t>& emb_dims,
+    const std::vector<ScalarType>& data_types,
+    std::vector<int64_t> last_offsets,
+    int64_t pooling_mode) {
 #pragma omp parallel
   {
     for (int32_t n = 0; n < num_emb; ++n) {
-      embeddingbag_bwd_acc_kern<data_t, index_t, data_t, /*use_cache=*/false>(
-          /*bs_begin=*/0,
-          num_batch,
-          num_emb,
-          emb_dim,
-          last_offsets[n],
-          indices_ptr[n],
-          offsets_ptr[n],
-          grads_ptr[n],
-          o_ptr[n],
-          pooling_mode,
-          dummy_ewc);
+      dispatch_table_dtype</*allow_half=*/true>(data_types[n], [&](auto tag) {
+        using data_t = decltype(tag);
+        embeddingbag_dense_backward<data_t, index_t>(
+            static_cast<data_t*>(o_ptr[n]),
+            static_cast<const data_t*>(grads_ptr[n]),
+            indices_ptr[n],
+            offsets_ptr[n],
+            num_batch,
+            num_emb,
+            emb_dims[n],
+            last_offsets[n],
+            pooling_mode);
+      });
     }
   }
 }
@@ -318,62 +340,59 @@ std::vector<Tensor> merged_embeddingbag_backward_cpu_kernel_impl(
 
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb > 0);
   int64_t batch_size = grad_outs_[0].size(0);
-  int64_t emb_dim = weights[0].size(1);
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == indices.size());
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == offsets.size());
+  check_table_dtypes(
+      weights, /*allow_half=*/true, "merged_embeddingbag_dense_backward");
 
   auto index_type = indices[0].scalar_type();
-  auto data_type = weights[0].scalar_type();
 
+  std::vector<int64_t> emb_dims(num_emb);
+  std::vector<ScalarType> data_types(num_emb);
   std::vector<int64_t> last_offsets(num_emb, -1);
   std::vector<Tensor> contiguous_grad;
   std::vector<Tensor> outputs;
 
   for (int i = 0; i < num_emb; i++) {
     contiguous_grad.emplace_back(grad_outs_[i].contiguous());
+    emb_dims[i] = weights[i].size(1);
+    data_types[i] = weights[i].scalar_type();
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         indices[i].is_contiguous() && indices[i].scalar_type() == index_type);
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         offsets[i].is_contiguous() && offsets[i].scalar_type() == index_type);
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         contiguous_grad[i].is_contiguous() &&
-        contiguous_grad[i].scalar_type() == data_type);
+        contiguous_grad[i].scalar_type() == data_types[i] &&
+        contiguous_grad[i].size(1) == emb_dims[i]);
     // handle last offsets
     last_offsets[i] = indices[i].numel();
     outputs.emplace_back(zeros_like(weights[i], weights[i].options()));
   }
 
-  AT_DISPATCH_FLOATING_TYPES_AND2(
-      at::kBFloat16,
-      at::kHalf,
-      weights[0].scalar_type(),
-      "merged_embeddingbag_dense_backward",
-      [&] {
-        AT_DISPATCH_INDEX_TYPES(
-            indices[0].scalar_type(),
-            "merged_embeddingbag_dense_backward",
-            [&] {
-              scalar_t* grads_ptr[num_emb];
-              scalar_t* outputs_ptr[num_emb];
-              index_t* indices_ptr[num_emb];
-              index_t* offsets_ptr[num_emb];
-              for (int i = 0; i < num_emb; i++) {
-                grads_ptr[i] = contiguous_grad[i].data_ptr<scalar_t>();
-                outputs_ptr[i] = outputs[i].data_ptr<scalar_t>();
-                indices_ptr[i] = indices[i].data_ptr<index_t>();
-                offsets_ptr[i] = offsets[i].data_ptr<index_t>();
-              }
-              merged_embeddingbag_dense_backward<scalar_t, index_t>(
-                  outputs_ptr,
-                  grads_ptr,
-                  indices_ptr,
-                  offsets_ptr,
-                  batch_size,
-                  num_emb,
-                  emb_dim,
-                  last_offsets,
-                  pooling_mode);
-            });
+  AT_DISPATCH_INDEX_TYPES(
+      indices[0].scalar_type(), "merged_embeddingbag_dense_backward", [&] {
+        void* grads_ptr[num_emb];
+        void* outputs_ptr[num_emb];
+        index_t* indices_ptr[num_emb];
+        index_t* offsets_ptr[num_emb];
+        for (int i = 0; i < num_emb; i++) {
+          grads_ptr[i] = contiguous_grad[i].data_ptr();
+          outputs_ptr[i] = outputs[i].data_ptr();
+          indices_ptr[i] = indices[i].data_ptr<index_t>();
+          offsets_ptr[i] = offsets[i].data_ptr<index_t>();
+        }
+        merged_embeddingbag_dense_backward<index_t>(
+            outputs_ptr,
+            grads_ptr,
+            indices_ptr,
+            offsets_ptr,
+            batch_size,
+            num_emb,
+            emb_dims,
+            data_types,
+            last_offsets,
+            pooling_mode);
       });
   return outputs;
 }
@@ -610,118 +629,130 @@ void inline EmbeddingGradUpdate<data_t, acc_t, AdaGradArgs>::update(
   }
 }
 
-template <typename data_t, typename index_t, typename optimizer_arg_t>
+template <typename index_t, typename optimizer_arg_t>
 void merged_embeddingbag_backward_update(
-    data_t** w_ptr,
-    data_t** grads_ptr,
+    void** w_ptr,
+    void** grads_ptr,
     index_t** indices_ptr,
     index_t** offsets_ptr,
     int64_t num_batch,
     int64_t num_emb,
-    int64_t emb_dim,
+    const std::vector<int64_t>& emb_dims,
+    const std::vector<ScalarType>& data_types,
     std::vector<int64_t> last_offsets,
     int64_t pooling_mode,
     optimizer_arg_t& args) {
-  using acc_t =
-      acc_type<data_t, /*use_cuda=*/true>; // if use_cuda = False, float's acc
-                                           // type will be double
 #pragma omp parallel
   {
     for (int32_t n = 0; n < num_emb; ++n) {
-      EmbeddingRowCache<acc_t> ewc;
-      embeddingbag_bwd_acc_kern<data_t, index_t, acc_t, /*use_cache=*/true>(
-          /*bs_begin=*/0,
-          num_batch,
-          num_emb,
-          emb_dim,
-          last_offsets[n],
-          indices_ptr[n],
-          offsets_ptr[n],
-          grads_ptr[n],
-          /*outout_ptr=*/nullptr,
-          pooling_mode,
-          ewc);
-      EmbeddingGradUpdate<data_t, acc_t, optimizer_arg_t>::update(
-          w_ptr[n], ewc, args, n, emb_dim);
+      dispatch_table_dtype</*allow_half=*/false>(data_types[n], [&](auto tag) {
+        using data_t = decltype(tag);
+        using acc_t =
+            acc_type<data_t, /*use_cuda=*/true>; // if use_cuda = False, float's
+                                                 // acc type will be double
+        EmbeddingRowCache<acc_t> ewc;
+        embeddingbag_bwd_acc_kern<data_t, index_t, acc_t, /*use_cache=*/true>(
+            /*bs_begin=*/0,
+            num_batch,
+            num_emb,
+            emb_dims[n],
+            last_offsets[n],
+            indices_ptr[n],
+            offsets_ptr[n],
+            static_cast<const data_t*>(grads_ptr[n]),
+            /*outout_ptr=*/nullptr,
+            pooling_mode,
+            ewc);
+        EmbeddingGradUpdate<data_t, acc_t, optimizer_arg_t>::update(
+            static_cast<data_t*>(w_ptr[n]), ewc, args, n, emb_dims[n]);
+      });
     }
   }
 }
 
-void merged_embeddingbag_backward_sgd_cpu_kernel_impl(
+template <typename optimizer_arg_t>
+void merged_embeddingbag_backward_update_impl(
     const TensorList& grad_outs_,
     const TensorList& weights,
     const TensorList& indices,
     const TensorList& offsets,
     const int64_t pooling_mode,
-    const bool include_last_offsets,
-    const TensorList& bf16_trail,
-    const double weight_decay,
-    const double lr) {
-  RECORD_FUNCTION(__FUNCTION__, c10::ArrayRef<c10::IValue>({}));
-
+    optimizer_arg_t& args) {
   int64_t num_emb = weights.size();
 
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb > 0);
   int64_t batch_size = grad_outs_[0].size(0);
-  int64_t emb_dim = weights[0].size(1);
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == indices.size());
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == offsets.size());
+  check_table_dtypes(
+      weights, /*allow_half=*/false, "merged_embeddingbag_backward_update");
 
   auto index_type = indices[0].scalar_type();
-  auto data_type = weights[0].scalar_type();
 
+  std::vector<int64_t> emb_dims(num_emb);
+  std::vector<ScalarType> data_types(num_emb);
   std::vector<int64_t> last_offsets(num_emb, -1);
   std::vector<Tensor> contiguous_grad;
-  std::vector<Tensor> outputs;
 
   for (int i = 0; i < num_emb; i++) {
     contiguous_grad.emplace_back(grad_outs_[i].contiguous());
+    emb_dims[i] = weights[i].size(1);
+    data_types[i] = weights[i].scalar_type();
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         indices[i].is_contiguous() && indices[i].scalar_type() == index_type);
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         offsets[i].is_contiguous() && offsets[i].scalar_type() == index_type);
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         contiguous_grad[i].is_contiguous() &&
-        contiguous_grad[i].scalar_type() == data_type);
+        contiguous_grad[i].scalar_type() == data_types[i] &&
+        contiguous_grad[i].size(1) == emb_dims[i]);
     // handle last offsets
     last_offsets[i] = indices[i].numel();
   }
 
-  AT_DISPATCH_FLOATING_TYPES_AND(
-      at::kBFloat16,
-      weights[0].scalar_type(),
-      "merged_embeddingbag_backward_update",
-      [&] {
-        AT_DISPATCH_INDEX_TYPES(
-            indices[0].scalar_type(),
-            "merged_embeddingbag_backward_update",
-            [&] {
-              scalar_t* grads_ptr[num_emb];
-              scalar_t* weights_ptr[num_emb];
-              index_t* indices_ptr[num_emb];
-              index_t* offsets_ptr[num_emb];
-              for (int i = 0; i < num_emb; i++) {
-                weights_ptr[i] = weights[i].data_ptr<scalar_t>();
-                grads_ptr[i] = contiguous_grad[i].data_ptr<scalar_t>();
-                indices_ptr[i] = indices[i].data_ptr<index_t>();
-                offsets_ptr[i] = offsets[i].data_ptr<index_t>();
-              }
-              SGDArgs args = SGDArgs(bf16_trail, weight_decay, lr);
-              merged_embeddingbag_backward_update<scalar_t, index_t, SGDArgs>(
-                  weights_ptr,
-                  grads_ptr,
-                  indices_ptr,
-                  offsets_ptr,
-                  batch_size,
-                  num_emb,
-                  emb_dim,
-                  last_offsets,
-                  pooling_mode,
-                  args);
-            });
+  AT_DISPATCH_INDEX_TYPES(
+      indices[0].scalar_type(), "merged_embeddingbag_backward_update", [&] {
+        void* grads_ptr[num_emb];
+        void* weights_ptr[num_emb];
+        index_t* indices_ptr[num_emb];
+        index_t* offsets_ptr[num_emb];
+        for (int i = 0; i < num_emb; i++) {
+          weights_ptr[i] = weights[i].data_ptr();
+          grads_ptr[i] = contiguous_grad[i].data_ptr();
+          indices_ptr[i] = indices[i].data_ptr<index_t>();
+          offsets_ptr[i] = offsets[i].data_ptr<index_t>();
+        }
+        merged_embeddingbag_backward_update<index_t, optimizer_arg_t>(
+            weights_ptr,
+            grads_ptr,
+            indices_ptr,
+            offsets_ptr,
+            batch_size,
+            num_emb,
+            emb_dims,
+            data_types,
+            last_offsets,
+            pooling_mode,
+            args);
       });
 }
 
+void merged_embeddingbag_backward_sgd_cpu_kernel_impl(
+    const TensorList& grad_outs_,
+    const TensorList& weights,
+    const TensorList& indices,
+    const TensorList& offsets,
+    const int64_t pooling_mode,
+    const bool include_last_offsets,
+    const TensorList& bf16_trail,
+    const double weight_decay,
+    const double lr) {
+  RECORD_FUNCTION(__FUNCTION__, c10::ArrayRef<c10::IValue>({}));
+  SGDArgs args = SGDArgs(bf16_trail, weight_decay, lr);
+  merged_embeddingbag_backward_update_impl<SGDArgs>(
+      grad_outs_, weights, indices, offsets, pooling_mode, args);
+}
+
 void merged_embeddingbag_backward_adagrad_cpu_kernel_impl(
     const TensorList& grad_outs_,
     const TensorList& weights,
@@ -734,71 +765,9 @@ void merged_embeddingbag_backward_adagrad_cpu_kernel_impl(
     const double eps,
     const double lr) {
   RECORD_FUNCTION(__FUNCTION__, c10::ArrayRef<c10::IValue>({}));
-
-  int64_t num_emb = weights.size();
-
-  TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb > 0);
-  int64_t batch_size = grad_outs_[0].size(0);
-  int64_t emb_dim = weights[0].size(1);
-  TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == indices.size());
-  TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == offsets.size());
-
-  auto index_type = indices[0].scalar_type();
-  auto data_type = weights[0].scalar_type();
-
-  std::vector<int64_t> last_offsets(num_emb, -1);
-  std::vector<Tensor> contiguous_grad;
-  std::vector<Tensor> outputs;
-
-  for (int i = 0; i < num_emb; i++) {
-    contiguous_grad.emplace_back(grad_outs_[i].contiguous());
-    TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
-        indices[i].is_contiguous() && indices[i].scalar_type() == index_type);
-    TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
-        offsets[i].is_contiguous() && offsets[i].scalar_type() == index_type);
-    TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
-        contiguous_grad[i].is_contiguous() &&
-        contiguous_grad[i].scalar_type() == data_type);
-    // handle last offsets
-    last_offsets[i] = indices[i].numel();
-  }
-
-  AT_DISPATCH_FLOATING_TYPES_AND(
-      at::kBFloat16,
-      weights[0].scalar_type(),
-      "merged_embeddingbag_backward_update",
-      [&] {
-        AT_DISPATCH_INDEX_TYPES(
-            indices[0].scalar_type(),
-            "merged_embeddingbag_backward_update",
-            [&] {
-              scalar_t* grads_ptr[num_emb];
-              scalar_t* weights_ptr[num_emb];
-              index_t* indices_ptr[num_emb];
-              index_t* offsets_ptr[num_emb];
-              for (int i = 0; i < num_emb; i++) {
-                weights_ptr[i] = weights[i].data_ptr<scalar_t>();
-                grads_ptr[i] = contiguous_grad[i].data_ptr<scalar_t>();
-                indices_ptr[i] = indices[i].data_ptr<index_t>();
-                offsets_ptr[i] = offsets[i].data_ptr<index_t>();
-              }
-              AdaGradArgs args = AdaGradArgs(bf16_trail, hessian, eps, lr);
-              merged_embeddingbag_backward_update<
-                  scalar_t,
-                  index_t,
-                  AdaGradArgs>(
-                  weights_ptr,
-                  grads_ptr,
-                  indices_ptr,
-                  offsets_ptr,
-                  batch_size,
-                  num_emb,
-                  emb_dim,
-                  last_offsets,
-                  pooling_mode,
-                  args);
-            });
-      });
+  AdaGradArgs args = AdaGradArgs(bf16_trail, hessian, eps, lr);
+  merged_embeddingbag_backward_update_impl<AdaGradArgs>(
+      grad_outs_, weights, indices, offsets, pooling_mode, args);
 }
 
 template <typename acc_t, typename data_t, typename index_t>
@@ -490,15 +490,16 @@ Tensor merged_embedding_cat_fw_impl(
   return output;
 }
 
-template <typename data_t, typename index_t>
+template <typename index_t>
 void merged_embeddingbag(
-    data_t** o_ptr,
-    data_t** w_ptr,
+    void** o_ptr,
+    void** w_ptr,
     index_t** indices_ptr,
     index_t** offsets_ptr,
     int64_t num_batch,
     int64_t num_emb,
-    int64_t emb_dim,
+    const std::vector<int64_t>& emb_dims,
+    const std::vector<ScalarType>& data_types,
     std::vector<int64_t> last_offsets,
     int64_t pooling_mode) {
   constexpr int64_t b_block = 128;
@@ -508,21 +509,25 @@ void merged_embeddingbag(
     for (int64_t m = 0; m < num_emb; ++m) {
       const int64_t bs_begin = b * b_block;
       const int64_t bs_end = std::min(num_batch, (b + 1) * b_block);
-      data_t* r = &o_ptr[m][b * b_block * emb_dim];
+      const int64_t emb_dim = emb_dims[m];
       // avoid offsets not include last batch
       const index_t last_offset = bs_end == num_batch ? last_offsets[m] : -1;
-      embeddingbag_kern(
-          bs_begin,
-          bs_end,
-          num_emb,
-          emb_dim,
-          last_offset,
-          indices_ptr[m],
-          offsets_ptr[m],
-          w_ptr[m],
-          r,
-          /*result_stride=*/emb_dim,
-          pooling_mode);
+      dispatch_table_dtype</*allow_half=*/true>(data_types[m], [&](auto tag) {
+        using data_t = decltype(tag);
+        data_t* r = &static_cast<data_t*>(o_ptr[m])[b * b_block * emb_dim];
+        embeddingbag_kern<data_t, index_t>(
+            bs_begin,
+            bs_end,
+            num_emb,
+            emb_dim,
+            last_offset,
+            indices_ptr[m],
+            offsets_ptr[m],
+            static_cast<const data_t*>(w_ptr[m]),
+            r,
+            /*result_stride=*/emb_dim,
+            pooling_mode);
+      });
     }
   }
 }
@@ -542,13 +547,16 @@ std::vector<Tensor> merged_embeddingbag_forward_cpu_kernel_impl(
   if (include_last_offsets) {
     batch_size -= 1;
   }
-  int64_t emb_dim = weights[0].size(1);
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == indices.size());
   TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == offsets.size());
+  check_table_dtypes(weights, /*allow_half=*/true, "merged_embeddingbag");
 
   auto index_type = indices[0].scalar_type();
-  auto data_type = weights[0].scalar_type();
 
+  // the tables may have different embedding dims and dtypes, each table
+  // writes its own output
+  std::vector<int64_t> emb_dims(num_emb);
+  std::vector<ScalarType> data_types(num_emb);
   std::vector<int64_t> last_offsets(num_emb, -1);
   std::vector<Tensor> outputs;
 
@@ -558,44 +566,38 @@ std::vector<Tensor> merged_embeddingbag_forward_cpu_kernel_impl(
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
         offsets[i].is_contiguous() && offsets[i].scalar_type() == index_type);
     TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
-        weights[i].is_contiguous() && weights[i].scalar_type() == data_type);
-    TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
-        weights[i].dim() == 2 && weights[i].size(1) == emb_dim);
+        weights[i].is_contiguous() && weights[i].dim() == 2);
+    emb_dims[i] = weights[i].size(1);
+    data_types[i] = weights[i].scalar_type();
     // handle last offsets
     last_offsets[i] = indices[i].numel();
-    outputs.emplace_back(empty({batch_size, emb_dim}, weights[i].options()));
+    outputs.emplace_back(
+        empty({batch_size, emb_dims[i]}, weights[i].options()));
   }
 
-  AT_DISPATCH_FLOATING_TYPES_AND2(
-      at::kBFloat16,
-      at::kHalf,
-      weights[0].scalar_type(),
-      "merged_embeddingbag",
-      [&] {
-        AT_DISPATCH_INDEX_TYPES(
-            indices[0].scalar_type(), "merged_embeddingbag", [&] {
-              scalar_t* weights_ptr[num_emb];
-              scalar_t* outputs_ptr[num_emb];
-              index_t* indices_ptr[num_emb];
-              index_t* offsets_ptr[num_emb];
-              for (int i = 0; i < num_emb; i++) {
-                weights_ptr[i] = weights[i].data_ptr<scalar_t>();
-                outputs_ptr[i] = outputs[i].data_ptr<scalar_t>();
-                indices_ptr[i] = indices[i].data_ptr<index_t>();
-                offsets_ptr[i] = offsets[i].data_ptr<index_t>();
-              }
-              merged_embeddingbag<scalar_t, index_t>(
-                  outputs_ptr,
-                  weights_ptr,
-                  indices_ptr,
-                  offsets_ptr,
-                  batch_size,
-                  num_emb,
-                  emb_dim,
-                  last_offsets,
-                  pooling_mode);
-            });
-      });
+  AT_DISPATCH_INDEX_TYPES(indices[0].scalar_type(), "merged_embeddingbag", [&] {
+    void* weights_ptr[num_emb];
+    void* outputs_ptr[num_emb];
+    index_t* indices_ptr[num_emb];
+    index_t* offsets_ptr[num_emb];
+    for (int i = 0; i < num_emb; i++) {
+      weights_ptr[i] = weights[i].data_ptr();
+      outputs_ptr[i] = outputs[i].data_ptr();
+      indices_ptr[i] = indices[i].data_ptr<index_t>();
+      offsets_ptr[i] = offsets[i].data_ptr<index_t>();
+    }
+    merged_embeddingbag<index_t>(
+        outputs_ptr,
+        weights_ptr,
+        indices_ptr,
+        offsets_ptr,
+        batch_size,
+        num_emb,
+        emb_dims,
+        data_types,
+        last_offsets,
+        pooling_mode);
+  });
 
   return outputs;
 }
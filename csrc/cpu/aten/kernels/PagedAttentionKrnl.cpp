@@ -9,6 +9,7 @@
 #include <ATen/native/CPUBlas.h>
 #include <ATen/native/cpu/utils.h>
 #include <aten/PagedAttention.h>
+#include <aten/utils/kv_cache_quant.h>
 #include <aten/utils/mkl_gemm.h>
 #include <c10/util/irange.h>
 #include <torch/all.h>
@@ -161,6 +162,25 @@ at::Half* flexible_dequantize_cache<at::Half, at::Half>(
   return cache;
 }
 
+// Dequantizes num_rows quantized cache rows which are row_stride bytes apart.
+template <typename scalar_t>
+scalar_t* flexible_dequantize_cache(
+    uint8_t* cache,
+    scalar_t* buffers,
+    int64_t row_stride,
+    int64_t head_size,
+    int64_t num_rows,
+    int64_t kv_cache_bits) {
+  for (int64_t i = 0; i < num_rows; i++) {
+    kv_quant::dequantize_row(
+        cache + i * row_stride,
+        buffers + i * head_size,
+        head_size,
+        kv_cache_bits);
+  }
+  return buffers;
+}
+
 inline c10::SymFloat calculate_scale(
     const at::Tensor& query,
     c10::optional<double> scale) {
@@ -415,6 +435,46 @@ inline void mul_attenion_weights_and_value_of_head<float, at::Float8_e5m2>(
 #endif
 }
 
+/*
+ * The quantized cache rows are not dequantized, the scales and mins are
+ * applied to the reduced sums, see aten/utils/kv_cache_quant.h
+ */
+template <typename QT>
+void reduce_head(
+    const QT* q_ptr_start,
+    int64_t kv_head_group_size,
+    const uint8_t* k_cache_start,
+    float* attn_w_pos,
+    int attn_w_stride,
+    int64_t head_size,
+    int64_t kv_cache_bits) {
+  for (auto i = 0; i < kv_head_group_size; i++) {
+    attn_w_pos[i * attn_w_stride] = kv_quant::dot_row(
+        q_ptr_start + i * head_size, k_cache_start, head_size, kv_cache_bits);
+  }
+}
+
+inline void mul_attenion_weights_and_value_of_head(
+    const float* attn_w,
+    int attn_w_stride,
+    const uint8_t* v_cache_start,
+    float* attn_out_start,
+    int attn_out_strideH,
+    int kv_head_group_size,
+    int64_t head_size,
+    bool accumulated,
+    int64_t kv_cache_bits) {
+  for (auto i = 0; i < kv_head_group_size; i++) {
+    kv_quant::mul_and_accumulate_row(
+        attn_w[i * attn_w_stride],
+        v_cache_start,
+        attn_out_start + i * attn_out_strideH,
+        head_size,
+        kv_cache_bits,
+        accumulated);
+  }
+}
+
 template <typename OT, typename CT>
 inline void mul_attenion_weights_and_value_of_head(
     const float& attn_w,
@@ -1079,6 +1139,9 @@ void single_query_cached_kv_attention_vnni_kernel(
  * (num_heads).
  * @param k_scale       Scaling factor for key cache of data type fp8.
  * @param v_scale       Scaling factor for value cache of data type fp8.
+ *
+ * @tparam cache_t uint8_t for the quantized int8/int4 cache, whose format is
+ * deduced from the size of its last dim.
  */
 template <typename scalar_t, typename cache_t>
 void single_query_cached_kv_attention_kernel(
@@ -1115,6 +1178,10 @@ void single_query_cached_kv_attention_kernel(
   auto num_kv_heads = key_cache.size(1);
   auto kv_head_group_size = num_heads / num_kv_heads;
   auto max_num_blocks_per_seq = block_tables.size(1);
+  int64_t kv_cache_bits = 0;
+  if constexpr (std::is_same_v<cache_t, uint8_t>) {
+    kv_cache_bits = kv_quant::get_bits(head_size, key_cache.size(3));
+  }
 
   auto kv_block_strideN = key_cache.stride(0);
   auto kv_block_strideP = key_cache.stride(2);
@@ -1237,6 +1304,15 @@ void single_query_cached_kv_attention_kernel(
                 logits[logits_position + i * PARTITION_SIZE] =
                     -std::numeric_limits<float>::infinity();
               }
+            } else if constexpr (std::is_same_v<cache_t, uint8_t>) {
+              reduce_head(
+                  q_ptr_start,
+                  kv_head_group_size,
+                  k_cache_start,
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  head_size,
+                  kv_cache_bits);
             } else {
               reduce_head(
                   q_ptr_start,
@@ -1309,15 +1385,28 @@ void single_query_cached_kv_attention_kernel(
                 physical_block_id * kv_block_strideN +
                 block_offset * kv_block_strideP + kv_head_id * kv_block_strideH;
             auto accumulated = logits_position > 0;
-            mul_attenion_weights_and_value_of_head(
-                &(logits[logits_position]),
-                PARTITION_SIZE,
-                v_cache_start,
-                tmp_out_start,
-                tmp_out_strideH,
-                kv_head_group_size,
-                head_size,
-                accumulated);
+            if constexpr (std::is_same_v<cache_t, uint8_t>) {
+              mul_attenion_weights_and_value_of_head(
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  v_cache_start,
+                  tmp_out_start,
+                  tmp_out_strideH,
+                  kv_head_group_size,
+                  head_size,
+                  accumulated,
+                  kv_cache_bits);
+            } else {
+              mul_attenion_weights_and_value_of_head(
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  v_cache_start,
+                  tmp_out_start,
+                  tmp_out_strideH,
+                  kv_head_group_size,
+                  head_size,
+                  accumulated);
+            }
             logits_position++;
           }
         }
@@ -1428,7 +1517,8 @@ void single_query_cached_kv_attention_kernel(
  * @param k_scale Scaling factor for key cache of data type fp8.
  * @param v_scale Scaling factor for value cache of data type fp8.
  *
- * @tparam DST_T The data type of the output tensors.
+ * @tparam DST_T The data type of the output tensors. uint8_t quantizes every
+ * (token, head) into an int8/int4 row with its scales and mins.
  * @tparam SRC_T The data type of the input tensors.
  */
 template <typename DST_T, typename SRC_T>
@@ -1457,6 +1547,10 @@ void reshape_and_cache_kernel(
   auto key_state_strideH = key.stride(1);
   auto value_state_strideN = value.stride(0);
   auto value_state_strideH = value.stride(1);
+  int64_t kv_cache_bits = 0;
+  if constexpr (std::is_same_v<DST_T, uint8_t>) {
+    kv_cache_bits = kv_quant::get_bits(head_size, key_cache.size(3));
+  }
 #pragma omp parallel for collapse(2)
   for (auto ti = 0; ti < num_tokens; ti++) {
     for (auto hi = 0; hi < head_num; hi++) {
@@ -1471,10 +1565,17 @@ void reshape_and_cache_kernel(
       auto key_ptr_start = key_ptr + key_state_offset;
       auto value_cache_start = value_cache_ptr + cache_offset;
       auto value_ptr_start = value_ptr + value_state_offset;
-      fp8::scaled_convert<DST_T, SRC_T>(
-          key_ptr_start, key_cache_start, head_size, k_scale);
-      fp8::scaled_convert<DST_T, SRC_T>(
-          value_ptr_start, value_cache_start, head_size, v_scale);
+      if constexpr (std::is_same_v<DST_T, uint8_t>) {
+        kv_quant::quantize_row(
+            key_ptr_start, key_cache_start, head_size, kv_cache_bits);
+        kv_quant::quantize_row(
+            value_ptr_start, value_cache_start, head_size, kv_cache_bits);
+      } else {
+        fp8::scaled_convert<DST_T, SRC_T>(
+            key_ptr_start, key_cache_start, head_size, k_scale);
+        fp8::scaled_convert<DST_T, SRC_T>(
+            value_ptr_start, value_cache_start, head_size, v_scale);
+      }
     }
   }
 }
@@ -1545,6 +1646,10 @@ void flash_attn_varlen_kernel(
   auto max_num_blocks_per_seq = block_table.size(1);
   auto batch_size = cu_seqlens_q.size(0) - 1;
   auto block_size = key_cache.size(2);
+  int64_t kv_cache_bits = 0;
+  if constexpr (std::is_same_v<cache_t, uint8_t>) {
+    kv_cache_bits = kv_quant::get_bits(head_size, key_cache.size(3));
+  }
 
   auto qSplitSize = q_split_size > max_seqlen_q ? max_seqlen_q : q_split_size;
   auto kvSplitSize = block_size > max_seqlens_k ? max_seqlens_k : block_size;
@@ -1663,12 +1768,22 @@ void flash_attn_varlen_kernel(
             continue;
           }
 
-          scalar_t* key_start_ptr =
-              flexible_dequantize_cache<scalar_t, cache_t>(
-                  key_page_data,
-                  &k_cache_buf_ptrs[ompIdx * head_size * kvSplitSize],
-                  head_size * kvBlockSize,
-                  k_scale);
+          scalar_t* key_start_ptr = nullptr;
+          if constexpr (std::is_same_v<cache_t, uint8_t>) {
+            key_start_ptr = flexible_dequantize_cache<scalar_t>(
+                key_page_data,
+                &k_cache_buf_ptrs[ompIdx * head_size * kvSplitSize],
+                kv_block_strideP,
+                head_size,
+                kvBlockSize,
+                kv_cache_bits);
+          } else {
+            key_start_ptr = flexible_dequantize_cache<scalar_t, cache_t>(
+                key_page_data,
+                &k_cache_buf_ptrs[ompIdx * head_size * kvSplitSize],
+                head_size * kvBlockSize,
+                k_scale);
+          }
           // Calculate the scale * query * key
           // query block[qBlockSize, head_size], key block: [kvBlockSize,
           // head_size]
@@ -1759,11 +1874,22 @@ void flash_attn_varlen_kernel(
             }
           }
 
-          scalar_t* v_start_ptr = flexible_dequantize_cache<scalar_t, cache_t>(
-              value_page_data,
-              &v_cache_buf_ptrs[ompIdx * head_size * kvSplitSize],
-              head_size * kvBlockSize,
-              v_scale);
+          scalar_t* v_start_ptr = nullptr;
+          if constexpr (std::is_same_v<cache_t, uint8_t>) {
+            v_start_ptr = flexible_dequantize_cache<scalar_t>(
+                value_page_data,
+                &v_cache_buf_ptrs[ompIdx * head_size * kvSplitSize],
+                kv_block_strideP,
+                head_size,
+                kvBlockSize,
+                kv_cache_bits);
+          } else {
+            v_start_ptr = flexible_dequantize_cache<scalar_t, cache_t>(
+                value_page_data,
+                &v_cache_buf_ptrs[ompIdx * head_size * kvSplitSize],
+                head_size * kvBlockSize,
+                v_scale);
+          }
 
           // Calculate the sum of attn_weight * value
 
@@ -1831,7 +1957,8 @@ void single_query_cached_kv_attention_kernel_impl(
   bool use_vnni = beam_size >= 4 &&
       num_heads * batch_size > thread_numbers * 2 && kv_head_group_size == 1 &&
       head_size % 2 == 0 && block_size % 2 == 0;
-  if (key_cache.scalar_type() != at::ScalarType::Float8_e5m2 && use_vnni) {
+  if (key_cache.scalar_type() != at::ScalarType::Float8_e5m2 &&
+      key_cache.scalar_type() != at::ScalarType::Byte && use_vnni) {
     if (out.scalar_type() == at::ScalarType::Float) {
       single_query_cached_kv_attention_vnni_kernel<float, float>(
           out,
@@ -1881,6 +2008,60 @@ void single_query_cached_kv_attention_kernel_impl(
       TORCH_CHECK(
           false, "Unsupported data type for single_query_cached_kv_attention");
     }
+  } else if (key_cache.scalar_type() == at::ScalarType::Byte) {
+    if (out.scalar_type() == at::ScalarType::Float) {
+      single_query_cached_kv_attention_kernel<float, uint8_t>(
+          out,
+          query,
+          key_cache,
+          value_cache,
+          scale,
+          block_tables,
+          context_lens,
+          block_size,
+          max_context_len,
+          alibi_slopes,
+          window_size,
+          k_scale,
+          v_scale,
+          softcap);
+    } else if (out.scalar_type() == at::ScalarType::BFloat16) {
+      single_query_cached_kv_attention_kernel<at::BFloat16, uint8_t>(
+          out,
+          query,
+          key_cache,
+          value_cache,
+          scale,
+          block_tables,
+          context_lens,
+          block_size,
+          max_context_len,
+          alibi_slopes,
+          window_size,
+          k_scale,
+          v_scale,
+          softcap);
+    } else if (out.scalar_type() == at::ScalarType::Half) {
+      single_query_cached_kv_attention_kernel<at::Half, uint8_t>(
+          out,
+          query,
+          key_cache,
+          value_cache,
+          scale,
+          block_tables,
+          context_lens,
+          block_size,
+          max_context_len,
+          alibi_slopes,
+          window_size,
+          k_scale,
+          v_scale,
+          softcap);
+    } else {
+      TORCH_CHECK(
+          false,
+          "Unsupported data type for ipex::single_query_cached_kv_attention");
+    }
   } else if (
       key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
       out.scalar_type() == at::ScalarType::BFloat16) {
@@ -1973,12 +2154,40 @@ void reshape_and_cache_cpu_kernel_impl(
       slot_mapping.is_contiguous(), "slot_mapping should be contiguous");
   TORCH_CHECK(
       kv_cache_dtype == "fp8" || kv_cache_dtype == "fp8_e5m2" ||
+          kv_cache_dtype == "int8" || kv_cache_dtype == "int4" ||
           kv_cache_dtype == "auto",
       "not supported kv_cahce_dtype");
+  auto kv_cache_bits = kv_quant::get_bits(kv_cache_dtype);
+  TORCH_CHECK(
+      (kv_cache_bits != 0) == (key_cache.scalar_type() == at::ScalarType::Byte),
+      "the int8 and int4 kv_cache_dtype need the uint8 key_cache and value_cache");
+  if (kv_cache_bits != 0) {
+    TORCH_CHECK(
+        kv_quant::get_bits(key.size(2), key_cache.size(3)) == kv_cache_bits,
+        "the last dim of the key_cache should be ",
+        kv_quant::get_row_size(key.size(2), kv_cache_bits),
+        " for the ",
+        kv_cache_dtype,
+        " kv_cache_dtype");
+  }
   RECORD_FUNCTION(
       "ipex::reshape_and_cache_cpu_kernel_impl",
       c10::ArrayRef<c10::IValue>({}));
-  if (key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
+  if (key_cache.scalar_type() == at::ScalarType::Byte) {
+    if (key.scalar_type() == at::ScalarType::Float) {
+      reshape_and_cache_kernel<uint8_t, float>(
+          key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale);
+    } else if (key.scalar_type() == at::ScalarType::BFloat16) {
+      reshape_and_cache_kernel<uint8_t, at::BFloat16>(
+          key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale);
+    } else if (key.scalar_type() == at::ScalarType::Half) {
+      reshape_and_cache_kernel<uint8_t, at::Half>(
+          key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale);
+    } else {
+      TORCH_CHECK(false, "Unsupported data type for ipex::reshape_and_cache");
+    }
+  } else if (
+      key_cache.scalar_type() == at::ScalarType::Float8_e5m2 &&
       key.scalar_type() == at::ScalarType::Float) {
     reshape_and_cache_kernel<at::Float8_e5m2, float>(
         key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale);
@@ -2031,12 +2240,90 @@ void flash_attn_varlen_cpu_kernel_impl(
       "query and out should have the same data type");
   TORCH_CHECK(
       kv_cache_dtype == "fp8" || kv_cache_dtype == "fp8_e5m2" ||
+          kv_cache_dtype == "int8" || kv_cache_dtype == "int4" ||
           kv_cache_dtype == "auto",
       "not supported kv_cahce_dtype");
+  auto kv_cache_bits = kv_quant::get_bits(kv_cache_dtype);
+  TORCH_CHECK(
+      (kv_cache_bits != 0) == (key.scalar_type() == at::ScalarType::Byte),
+      "the int8 and int4 kv_cache_dtype need the uint8 key_cache and value_cache");
+  if (kv_cache_bits != 0) {
+    TORCH_CHECK(
+        kv_quant::get_bits(query.size(2), key.size(3)) == kv_cache_bits,
+        "the last dim of the key_cache should be ",
+        kv_quant::get_row_size(query.size(2), kv_cache_bits),
+        " for the ",
+        kv_cache_dtype,
+        " kv_cache_dtype");
+  }
   RECORD_FUNCTION(
       "ipex::flash_attn_varlen_cpu_kernel_impl",
       c10::ArrayRef<c10::IValue>({}));
-  if (key.scalar_type() == at::ScalarType::Float8_e5m2 &&
+  if (key.scalar_type() == at::ScalarType::Byte) {
+    // every kv block is dequantized once for each query split, so a larger
+    // split amortizes the dequantization over more queries
+    if (query.scalar_type() == at::ScalarType::Float) {
+      flash_attn_varlen_kernel<float, uint8_t, 64>(
+          out,
+          query,
+          key,
+          value,
+          cu_seqlens_q,
+          cu_seqlens_kv,
+          max_seqlen_q,
+          max_seqlen_kv,
+          softmax_scale,
+          is_causal,
+          block_table,
+          alibi_slopes,
+          window_size_left,
+          window_size_right,
+          k_scale,
+          v_scale,
+          softcap);
+    } else if (query.scalar_type() == at::ScalarType::BFloat16) {
+      flash_attn_varlen_kernel<at::BFloat16, uint8_t, 64>(
+          out,
+          query,
+          key,
+          value,
+          cu_seqlens_q,
+          cu_seqlens_kv,
+          max_seqlen_q,
+          max_seqlen_kv,
+          softmax_scale,
+          is_causal,
+          block_table,
+          alibi_slopes,
+          window_size_left,
+          window_size_right,
+          k_scale,
+          v_scale,
+          softcap);
+    } else if (query.scalar_type() == at::ScalarType::Half) {
+      flash_attn_varlen_kernel<at::Half, uint8_t, 64>(
+          out,
+          query,
+          key,
+          value,
+          cu_seqlens_q,
+          cu_seqlens_kv,
+          max_seqlen_q,
+          max_seqlen_kv,
+          softmax_scale,
+          is_causal,
+          block_table,
+          alibi_slopes,
+          window_size_left,
+          window_size_right,
+          k_scale,
+          v_scale,
+          softcap);
+    } else {
+      TORCH_CHECK(false, "Unsupported data type for ipex::flash_attn_varlen");
+    }
+  } else if (
+      key.scalar_type() == at::ScalarType::Float8_e5m2 &&
       query.scalar_type() == at::ScalarType::Float) {
     if (max_seqlen_q >= 768) {
       flash_attn_varlen_kernel<float, at::Float8_e5m2, 128>(
@@ -0,0 +1,251 @@
+#include <ATen/Tensor.h>
+#include <aten/MergedEmbeddingBag.h>
+#include <torch/all.h>
+#include "vec/vec.h"
+
+namespace torch_ipex {
+namespace cpu {
+
+namespace {
+
+using namespace at;
+
+/**
+ * Row-wise quantized tables store every row as
+ *   [packed quantized values | fp32 scale | fp32 bias]
+ * and a value is dequantized as q * scale + bias. 8 bits values take one
+ * byte each, 4 bits values are packed two per byte, the even element in the
+ * low nibble.
+ */
+constexpr int64_t kScaleBiasBytes = 2 * sizeof(float);
+
+template <int bits>
+inline void qrowwise_accumulate(
+    float* acc,
+    const uint8_t* q,
+    const float scale,
+    const int64_t emb_dim);
+
+template <>
+inline void qrowwise_accumulate<8>(
+    float* acc,
+    const uint8_t* q,
+    const float scale,
+    const int64_t emb_dim) {
+  int64_t i = 0;
+#if defined(CPU_CAPABILITY_AVX512)
+  const __m512 scale_v = _mm512_set1_ps(scale);
+  for (; i + 16 <= emb_dim; i += 16) {
+    __m512 x = _mm512_cvtepi32_ps(
+        _mm512_cvtepu8_epi32(_mm_loadu_si128((const __m128i*)(q + i))));
+    _mm512_storeu_ps(
+        acc + i, _mm512_fmadd_ps(x, scale_v, _mm512_loadu_ps(acc + i)));
+  }
+#endif
+  for (; i < emb_dim; ++i) {
+    acc[i] += scale * static_cast<float>(q[i]);
+  }
+}
+
+template <>
+inline void qrowwise_accumulate<4>(
+    float* acc,
+    const uint8_t* q,
+    const float scale,
+    const int64_t emb_dim) {
+  int64_t i = 0;
+#if defined(CPU_CAPABILITY_AVX512)
+  const __m512 scale_v = _mm512_set1_ps(scale);
+  const __m512i mask = _mm512_set1_epi32(0xF);
+  // interleave the low and high nibbles back to the element order
+  const __m512i idx_lo =
+      _mm512_set_epi32(23, 7, 22, 6, 21, 5, 20, 4, 19, 3, 18, 2, 17, 1, 16, 0);
+  const __m512i idx_hi = _mm512_set_epi32(
+      31, 15, 30, 14, 29, 13, 28, 12, 27, 11, 26, 10, 25, 9, 24, 8);
+  for (; i + 32 <= emb_dim; i += 32) {
+    __m512i x =
+        _mm512_cvtepu8_epi32(_mm_loadu_si128((const __m128i*)(q + i / 2)));
+    __m512i lo = _mm512_and_si512(x, mask);
+    __m512i hi = _mm512_srli_epi32(x, 4);
+    __m512 x0 = _mm512_cvtepi32_ps(_mm512_permutex2var_epi32(lo, idx_lo, hi));
+    __m512 x1 = _mm512_cvtepi32_ps(_mm512_permutex2var_epi32(lo, idx_hi, hi));
+    _mm512_storeu_ps(
+        acc + i, _mm512_fmadd_ps(x0, scale_v, _mm512_loadu_ps(acc + i)));
+    _mm512_storeu_ps(
+        acc + i + 16,
+        _mm512_fmadd_ps(x1, scale_v, _mm512_loadu_ps(acc + i + 16)));
+  }
+#endif
+  for (; i < emb_dim; i += 2) {
+    const uint8_t x = q[i / 2];
+    acc[i] += scale * static_cast<float>(x & 0xF);
+    acc[i + 1] += scale * static_cast<float>(x >> 4);
+  }
+}
+
+template <int bits, typename index_t>
+inline void qrowwise_embeddingbag_kern(
+    const int64_t bs_begin,
+    const int64_t bs_end,
+    const int64_t emb_dim,
+    const int64_t row_bytes,
+    const index_t last_offset,
+    const index_t* indices,
+    const index_t* offsets,
+    const uint8_t* weight,
+    float* result,
+    const int64_t pooling_mode) {
+  const int64_t data_bytes = row_bytes - kScaleBiasBytes;
+  for (int64_t b = bs_begin; b < bs_end; ++b) {
+    float* out = &result[b * emb_dim];
+    std::fill_n(out, emb_dim, 0.f);
+    int64_t start_idx = offsets[b];
+    int64_t end_idx =
+        ((b + 1) == bs_end && last_offset != -1) ? last_offset : offsets[b + 1];
+    // the biases are the same for all the elements of a row, sum them once
+    float bias_sum = 0.f;
+    for (int64_t j = start_idx; j < end_idx; ++j) {
+      const uint8_t* row = &weight[indices[j] * row_bytes];
+      float scale_bias[2];
+      memcpy(scale_bias, row + data_bytes, kScaleBiasBytes);
+      qrowwise_accumulate<bits>(out, row, scale_bias[0], emb_dim);
+      bias_sum += scale_bias[1];
+    }
+    const int64_t bag_size = end_idx - start_idx;
+    const float alpha =
+        (pooling_mode == MEAN && bag_size > 0) ? 1.f / bag_size : 1.f;
+    for (int64_t i = 0; i < emb_dim; ++i) {
+      out[i] = (out[i] + bias_sum) * alpha;
+    }
+  }
+}
+
+template <typename index_t>
+void qmerged_embeddingbag_rowwise(
+    float** o_ptr,
+    const uint8_t** w_ptr,
+    index_t** indices_ptr,
+    index_t** offsets_ptr,
+    int64_t num_batch,
+    int64_t num_emb,
+    const std::vector<int64_t>& emb_dims,
+    const std::vector<int64_t>& row_bytes,
+    const std::vector<int64_t>& bits,
+    std::vector<int64_t> last_offsets,
+    int64_t pooling_mode) {
+  constexpr int64_t b_block = 128;
+  const int64_t n_b_blocks = (num_batch - 1) / b_block + 1;
+#pragma omp parallel for collapse(2)
+  for (int64_t b = 0; b < n_b_blocks; ++b) {
+    for (int64_t m = 0; m < num_emb; ++m) {
+      const int64_t bs_begin = b * b_block;
+      const int64_t bs_end = std::min(num_batch, (b + 1) * b_block);
+      // avoid offsets not include last batch
+      const index_t last_offset = bs_end == num_batch ? last_offsets[m] : -1;
+      auto kern = bits[m] == 4 ? qrowwise_embeddingbag_kern<4, index_t>
+                               : qrowwise_embeddingbag_kern<8, index_t>;
+      kern(
+          bs_begin,
+          bs_end,
+          emb_dims[m],
+          row_bytes[m],
+          last_offset,
+          indices_ptr[m],
+          offsets_ptr[m],
+          w_ptr[m],
+          o_ptr[m],
+          pooling_mode);
+    }
+  }
+}
+
+std::vector<Tensor> qmerged_embeddingbag_rowwise_forward_cpu_kernel_impl(
+    const TensorList& weights,
+    const TensorList& indices,
+    const TensorList& offsets,
+    const std::vector<int64_t>& bits,
+    const int64_t pooling_mode,
+    const bool include_last_offsets) {
+  RECORD_FUNCTION(__FUNCTION__, c10::ArrayRef<c10::IValue>({}));
+
+  int64_t num_emb = weights.size();
+
+  TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb > 0);
+  int64_t batch_size = offsets[0].size(0);
+  if (include_last_offsets) {
+    batch_size -= 1;
+  }
+  TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == indices.size());
+  TORCH_INTERNAL_ASSERT_DEBUG_ONLY(num_emb == offsets.size());
+  TORCH_CHECK(
+      num_emb == bits.size(),
+      "qmerged_embeddingbag_rowwise: expect one bit width per table");
+
+  auto index_type = indices[0].scalar_type();
+
+  std::vector<int64_t> emb_dims(num_emb);
+  std::vector<int64_t> row_bytes(num_emb);
+  std::vector<int64_t> last_offsets(num_emb, -1);
+  std::vector<Tensor> outputs;
+
+  for (int i = 0; i < num_emb; i++) {
+    TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
+        indices[i].is_contiguous() && indices[i].scalar_type() == index_type);
+    TORCH_INTERNAL_ASSERT_DEBUG_ONLY(
+        offsets[i].is_contiguous() && offsets[i].scalar_type() == index_type);
+    TORCH_CHECK(
+        weights[i].scalar_type() == at::kByte && weights[i].dim() == 2 &&
+            weights[i].is_contiguous(),
+        "qmerged_embeddingbag_rowwise: expect contiguous 2D uint8 weights");
+    TORCH_CHECK(
+        bits[i] == 8 || bits[i] == 4,
+        "qmerged_embeddingbag_rowwise: only support 8 or 4 bits, got ",
+        bits[i]);
+    row_bytes[i] = weights[i].size(1);
+    TORCH_CHECK(
+        row_bytes[i] > kScaleBiasBytes,
+        "qmerged_embeddingbag_rowwise: rows are too short to hold scale and bias");
+    emb_dims[i] = (row_bytes[i] - kScaleBiasBytes) * 8 / bits[i];
+    // handle last offsets
+    last_offsets[i] = indices[i].numel();
+    outputs.emplace_back(
+        empty({batch_size, emb_dims[i]}, weights[i].options().dtype(kFloat)));
+  }
+
+  AT_DISPATCH_INDEX_TYPES(
+      indices[0].scalar_type(), "qmerged_embeddingbag_rowwise", [&] {
+        const uint8_t* weights_ptr[num_emb];
+        float* outputs_ptr[num_emb];
+        index_t* indices_ptr[num_emb];
+        index_t* offsets_ptr[num_emb];
+        for (int i = 0; i < num_emb; i++) {
+          weights_ptr[i] = weights[i].data_ptr<uint8_t>();
+          outputs_ptr[i] = outputs[i].data_ptr<float>();
+          indices_ptr[i] = indices[i].data_ptr<index_t>();
+          offsets_ptr[i] = offsets[i].data_ptr<index_t>();
+        }
+        qmerged_embeddingbag_rowwise<index_t>(
+            outputs_ptr,
+            weights_ptr,
+            indices_ptr,
+            offsets_ptr,
+            batch_size,
+            num_emb,
+            emb_dims,
+            row_bytes,
+            bits,
+            last_offsets,
+            pooling_mode);
+      });
+
+  return outputs;
+}
+
+} // anonymous namespace
+
+IPEX_REGISTER_DISPATCH(
+    qmerged_embeddingbag_rowwise_forward_cpu_kernel_stub,
+    &qmerged_embeddingbag_rowwise_forward_cpu_kernel_impl);
+
+} // namespace cpu
+} // namespace torch_ipex
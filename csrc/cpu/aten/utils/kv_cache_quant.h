@@ -0,0 +1,274 @@
+#pragma once
+
+#include <ATen/ATen.h>
+#include <algorithm>
+#include <cmath>
+#include <cstring>
+#include <string>
+
+namespace torch_ipex {
+namespace cpu {
+namespace kv_quant {
+
+/*
+ * Quantized KV cache formats. Every (token, kv head) of the cache is stored as
+ * one row of uint8, the codes are followed by the fp32 (scale, min) pairs
+ * which dequantize them, so the key/value cache keeps a single tensor and the
+ * scales are read together with the codes:
+ *   INT8: head_size asymmetric 8-bit codes, then 1 (scale, min) pair.
+ *   INT4: head_size / 2 bytes of 4-bit codes (the even element in the low
+ *         nibble), then 1 (scale, min) pair for every group of
+ *         int4_group_size(head_size) elements.
+ * An element is dequantized as code * scale + min.
+ */
+constexpr int64_t kInt4GroupSize = 32;
+constexpr int64_t kScaleMinBytes = 2 * sizeof(float);
+
+inline int64_t int4_group_size(int64_t head_size) {
+  return head_size % kInt4GroupSize == 0 ? kInt4GroupSize : head_size;
+}
+
+// The number of bytes of the cache row of one (token, kv head).
+inline int64_t get_row_size(int64_t head_size, int64_t bits) {
+  if (bits == 8) {
+    return head_size + kScaleMinBytes;
+  }
+  return head_size / 2 +
+      head_size / int4_group_size(head_size) * kScaleMinBytes;
+}
+
+// Returns 8 or 4 for the quantized kv_cache_dtype "int8" or "int4", else 0.
+inline int64_t get_bits(const std::string& kv_cache_dtype) {
+  if (kv_cache_dtype == "int8") {
+    return 8;
+  }
+  if (kv_cache_dtype == "int4") {
+    return 4;
+  }
+  return 0;
+}
+
+// Deduces the format of a quantized cache from the size of its rows.
+inline int64_t get_bits(int64_t head_size, int64_t row_size) {
+  if (row_size == get_row_size(head_size, 8)) {
+    return 8;
+  }
+  TORCH_CHECK(
+      head_size % 2 == 0 && row_size == get_row_size(head_size, 4),
+      "The last dim of the quantized kv cache should be ",
+      get_row_size(head_size, 8),
+      " for int8 or ",
+      get_row_size(head_size, 4),
+      " for int4 with head_size ",
+      head_size,
+      ", but got ",
+      row_size);
+  return 4;
+}
+
+inline void load_scale_min(const uint8_t* ptr, float& scale, float& min_val) {
+  // the rows are byte aligned only
+  std::memcpy(&scale, ptr, sizeof(float));
+  std::memcpy(&min_val, ptr + sizeof(float), sizeof(float));
+}
+
+inline void store_scale_min(uint8_t* ptr, float scale, float min_val) {
+  std::memcpy(ptr, &scale, sizeof(float));
+  std::memcpy(ptr + sizeof(float), &min_val, sizeof(float));
+}
+
+template <typename T>
+inline void get_scale_min(
+    const T* src,
+    int64_t len,
+    float max_code,
+    float& scale,
+    float& min_val) {
+  float max_val = static_cast<float>(src[0]);
+  min_val = max_val;
+  for (int64_t i = 1; i < len; i++) {
+    auto val = static_cast<float>(src[i]);
+    max_val = std::max(max_val, val);
+    min_val = std::min(min_val, val);
+  }
+  scale = (max_val - min_val) / max_code;
+}
+
+inline uint8_t quantize_val(
+    float val,
+    float min_val,
+    float inv_scale,
+    float max_code) {
+  return static_cast<uint8_t>(std::nearbyint(
+      std::min(std::max((val - min_val) * inv_scale, 0.f), max_code)));
+}
+
+/*
+ * Quantizes the key/value of one (token, kv head) into a cache row.
+ */
+template <typename T>
+inline void quantize_row(
+    const T* src,
+    uint8_t* row,
+    int64_t head_size,
+    int64_t bits) {
+  float scale, min_val;
+  if (bits == 8) {
+    get_scale_min(src, head_size, 255.f, scale, min_val);
+    float inv_scale = scale > 0 ? 1.f / scale : 0.f;
+    for (int64_t i = 0; i < head_size; i++) {
+      row[i] =
+          quantize_val(static_cast<float>(src[i]), min_val, inv_scale, 255.f);
+    }
+    store_scale_min(row + head_size, scale, min_val);
+    return;
+  }
+  auto group_size = int4_group_size(head_size);
+  auto scale_min_ptr = row + head_size / 2;
+  for (int64_t g = 0; g < head_size; g += group_size) {
+    get_scale_min(src + g, group_size, 15.f, scale, min_val);
+    float inv_scale = scale > 0 ? 1.f / scale : 0.f;
+    for (int64_t i = g; i < g + group_size; i += 2) {
+      auto lo =
+          quantize_val(static_cast<float>(src[i]), min_val, inv_scale, 15.f);
+      auto hi = quantize_val(
+          static_cast<float>(src[i + 1]), min_val, inv_scale, 15.f);
+      row[i / 2] = lo | (hi << 4);
+    }
+    store_scale_min(scale_min_ptr, scale, min_val);
+    scale_min_ptr += kScaleMinBytes;
+  }
+}
+
+/*
+ * Returns the dot product of the query and one dequantized cache row. The row
+ * is not dequantized, the scale and min are applied to the reduced sums:
+ * sum(q * (code * scale + min)) = scale * sum(q * code) + min * sum(q).
+ */
+template <typename T>
+inline float dot_row(
+    const T* q_ptr,
+    const uint8_t* row,
+    int64_t head_size,
+    int64_t bits) {
+  float scale, min_val;
+  if (bits == 8) {
+    float q_code_sum = 0.f, q_sum = 0.f;
+#pragma omp simd reduction(+ : q_code_sum, q_sum)
+    for (int64_t i = 0; i < head_size; i++) {
+      auto q = static_cast<float>(q_ptr[i]);
+      q_code_sum += q * static_cast<float>(row[i]);
+      q_sum += q;
+    }
+    load_scale_min(row + head_size, scale, min_val);
+    return scale * q_code_sum + min_val * q_sum;
+  }
+  auto group_size = int4_group_size(head_size);
+  auto scale_min_ptr = row + head_size / 2;
+  float sum = 0.f;
+  for (int64_t g = 0; g < head_size; g += group_size) {
+    float q_code_sum = 0.f, q_sum = 0.f;
+#pragma omp simd reduction(+ : q_code_sum, q_sum)
+    for (int64_t i = g; i < g + group_size; i += 2) {
+      auto q0 = static_cast<float>(q_ptr[i]);
+      auto q1 = static_cast<float>(q_ptr[i + 1]);
+      auto codes = row[i / 2];
+      q_code_sum += q0 * static_cast<float>(codes & 0xF) +
+          q1 * static_cast<float>(codes >> 4);
+      q_sum += q0 + q1;
+    }
+    load_scale_min(scale_min_ptr, scale, min_val);
+    sum += scale * q_code_sum + min_val * q_sum;
+    scale_min_ptr += kScaleMinBytes;
+  }
+  return sum;
+}
+
+/*
+ * out (+)= attn_w * dequantized cache row. The scale is folded into the
+ * attention weight: w * (code * scale + min) = (w * scale) * code + w * min.
+ */
+inline void mul_and_accumulate_row(
+    float attn_w,
+    const uint8_t* row,
+    float* out,
+    int64_t head_size,
+    int64_t bits,
+    bool accumulate) {
+  float scale, min_val;
+  if (bits == 8) {
+    load_scale_min(row + head_size, scale, min_val);
+    float w_scale = attn_w * scale, w_min = attn_w * min_val;
+    if (accumulate) {
+#pragma omp simd
+      for (int64_t i = 0; i < head_size; i++) {
+        out[i] += w_scale * static_cast<float>(row[i]) + w_min;
+      }
+    } else {
+#pragma omp simd
+      for (int64_t i = 0; i < head_size; i++) {
+        out[i] = w_scale * static_cast<float>(row[i]) + w_min;
+      }
+    }
+    return;
+  }
+  auto group_size = int4_group_size(head_size);
+  auto scale_min_ptr = row + head_size / 2;
+  for (int64_t g = 0; g < head_size; g += group_size) {
+    load_scale_min(scale_min_ptr, scale, min_val);
+    float w_scale = attn_w * scale, w_min = attn_w * min_val;
+    if (accumulate) {
+#pragma omp simd
+      for (int64_t i = g; i < g + group_size; i += 2) {
+        auto codes = row[i / 2];
+        out[i] += w_scale * static_cast<float>(codes & 0xF) + w_min;
+        out[i + 1] += w_scale * static_cast<float>(codes >> 4) + w_min;
+      }
+    } else {
+#pragma omp simd
+      for (int64_t i = g; i < g + group_size; i += 2) {
+        auto codes = row[i / 2];
+        out[i] = w_scale * static_cast<float>(codes & 0xF) + w_min;
+        out[i + 1] = w_scale * static_cast<float>(codes >> 4) + w_min;
+      }
+    }
+    scale_min_ptr += kScaleMinBytes;
+  }
+}
+
+/*
+ * Dequantizes one cache row, used where the kernel feeds the cache to a GEMM.
+ */
+template <typename T>
+inline void dequantize_row(
+    const uint8_t* row,
+    T* dst,
+    int64_t head_size,
+    int64_t bits) {
+  float scale, min_val;
+  if (bits == 8) {
+    load_scale_min(row + head_size, scale, min_val);
+#pragma omp simd
+    for (int64_t i = 0; i < head_size; i++) {
+      dst[i] = static_cast<T>(static_cast<float>(row[i]) * scale + min_val);
+    }
+    return;
+  }
+  auto group_size = int4_group_size(head_size);
+  auto scale_min_ptr = row + head_size / 2;
+  for (int64_t g = 0; g < head_size; g += group_size) {
+    load_scale_min(scale_min_ptr, scale, min_val);
+    for (int64_t i = g; i < g + group_size; i += 2) {
+      auto codes = row[i / 2];
+      dst[i] =
+          static_cast<T>(static_cast<float>(codes & 0xF) * scale + min_val);
+      dst[i + 1] =
+          static_cast<T>(static_cast<float>(codes >> 4) * scale + min_val);
+    }
+    scale_min_ptr += kScaleMinBytes;
+  }
+}
+
+} // namespace kv_quant
+} // namespace cpu
+} // namespace torch_ipex
@@ -191,6 +191,18 @@ parser.add_argument(
     help="Quantize weight symmetrically for weight only quantization. It usually brings better latency at"
     " the cost of accuracy. It has not effect if you are loading low-precision checkpoints.",
 )
+parser.add_argument(
+    "--pipeline-parallel",
+    action="store_true",
+    help="Split the decoder layers into contiguous stages over the ranks (e.g. one rank per socket)"
+    " instead of tensor parallel, the batch is streamed through the stages in micro-batches.",
+)
+parser.add_argument(
+    "--num-micro-batches",
+    default=None,
+    type=int,
+    help="The number of micro-batches of --pipeline-parallel, the number of ranks by default.",
+)
 args = parser.parse_args()
 print(args)
 
@@ -204,6 +216,19 @@ if args.ipex or args.ipex_weight_only_quantization:
     except Exception:
         pass
 
+if args.pipeline_parallel:
+    import os
+    import torch.distributed as dist
+
+    # the stages exchange the hidden states with point-to-point messages
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", "29500")
+    dist.init_process_group(
+        "gloo",
+        rank=int(os.environ.get("PMI_RANK", os.environ.get("RANK", 0))),
+        world_size=int(os.environ.get("PMI_SIZE", os.environ.get("WORLD_SIZE", 1))),
+    )
+
 # dtype
 amp_enabled = False if args.dtype == "float32" or not args.quant_with_amp else True
 amp_dtype = getattr(torch, args.dtype)
@@ -323,6 +348,8 @@ if args.ipex:
         inplace=True,
         deployment_mode=args.deployment_mode,
         cache_weight_for_large_batch=args.cache_weight_for_large_batch,
+        pipeline_parallel=args.pipeline_parallel,
+        num_micro_batches=args.num_micro_batches,
     )
 elif args.ipex_weight_only_quantization:
     from intel_extension_for_pytorch.quantization import (
@@ -392,6 +419,8 @@ elif args.ipex_weight_only_quantization:
         quantization_config=qconfig,
         inplace=True,
         cache_weight_for_large_batch=args.cache_weight_for_large_batch,
+        pipeline_parallel=args.pipeline_parallel,
+        num_micro_batches=args.num_micro_batches,
     )
 
 if args.torch_compile:
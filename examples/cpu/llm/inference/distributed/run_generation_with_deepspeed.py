@@ -207,10 +207,28 @@ parser.add_argument(
     choices=[
         "auto",
         "fp8_e5m2",
+        "int8",
+        "int4",
     ],
     default="auto",
     help='Data type for kv cache storage. If "auto", will use model '
-    "data type. fp8 type now supports e5m2.",
+    "data type. fp8 type now supports e5m2. int8 and int4 quantize the kv cache"
+    " per token and head, not supported by the MLA attention of DeepSeek.",
+)
+parser.add_argument(
+    "--allreduce-overlap-chunks",
+    default=1,
+    type=int,
+    help="Split the tokens into this number of chunks in the row-parallel linears of"
+    " the decoder layers, the all-reduce of a chunk overlaps the compute of the next."
+    " Eager mode only, the traced model of --deployment-mode runs unchunked.",
+)
+parser.add_argument(
+    "--moe-expert-parallel",
+    action="store_true",
+    help="For the fused MoE of DeepSeek models, place whole routed experts on the"
+    " ranks instead of sharding every expert. INT8 weight-only quantized experts with"
+    " lowp_mode BF16 or INT8 stay tensor parallel.",
 )
 parser.add_argument(
     "--low-precision-checkpoint",
@@ -403,6 +421,10 @@ if args.kv_cache_dtype == "auto":
     kv_cache_dtype = None
 elif args.kv_cache_dtype == "fp8_e5m2":
     kv_cache_dtype = torch.float8_e5m2
+elif args.kv_cache_dtype == "int8":
+    kv_cache_dtype = torch.uint8
+elif args.kv_cache_dtype == "int4":
+    kv_cache_dtype = torch.uint4
 config.kv_cache_dtype = kv_cache_dtype
 
 # For DeepSeek models
@@ -412,6 +434,8 @@ if not args.ipex_weight_only_quantization and args.ipex and args.dtype == "bfloa
 if args.ipex_weight_only_quantization and args.weight_dtype == "INT8":
     config.use_fused_moe = True
     config.use_fused_moe_woq = True
+config.moe_expert_parallel = args.moe_expert_parallel
+config.allreduce_overlap_chunks = args.allreduce_overlap_chunks
 
 if not hasattr(config, "text_max_length") and args.prompt is None:
     config.text_max_length = int(args.input_tokens) + int(args.max_new_tokens)
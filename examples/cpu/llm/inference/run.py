@@ -294,6 +294,21 @@ def main(args_in: Optional[List[str]] = None) -> None:
     # deepspeed inference related arguments.
     parser.add_argument("--autotp", action="store_true")
     parser.add_argument("--shard-model", action="store_true")
+    parser.add_argument(
+        "--allreduce-overlap-chunks",
+        default=1,
+        type=int,
+        help="With --autotp, split the tokens into this number of chunks in the"
+        " row-parallel linears of the decoder layers, the all-reduce of a chunk"
+        " overlaps the compute of the next.",
+    )
+    parser.add_argument(
+        "--moe-expert-parallel",
+        action="store_true",
+        help="For the fused MoE of DeepSeek models with --autotp, place whole routed"
+        " experts on the ranks instead of sharding every expert. INT8 weight-only"
+        " quantized experts with lowp_mode BF16 or INT8 stay tensor parallel.",
+    )
     parser.add_argument(
         "--local_rank", required=False, type=int, help="used by dist launchers"
     )
@@ -313,10 +328,28 @@ def main(args_in: Optional[List[str]] = None) -> None:
         choices=[
             "auto",
             "fp8_e5m2",
+            "int8",
+            "int4",
         ],
         default="auto",
         help='Data type for kv cache storage. If "auto", will use model '
-        "data type. fp8 type now supports e5m2.",
+        "data type. fp8 type now supports e5m2. int8 and int4 quantize the kv cache"
+        " per token and head, not supported by the MLA attention of DeepSeek.",
+    )
+    parser.add_argument(
+        "--moe-expert-cache-size",
+        default=0,
+        type=int,
+        help="For the fused MoE of DeepSeek models, the number of routed experts of every"
+        " layer kept in DRAM, the other experts are memory-mapped from --moe-offload-dir"
+        " and loaded on demand. 0 keeps all the experts in DRAM.",
+    )
+    parser.add_argument(
+        "--moe-offload-dir",
+        default=None,
+        type=str,
+        help="The directory (local disk, or a mount of CXL/far memory) storing the"
+        " offloaded experts when --moe-expert-cache-size is set.",
     )
     parser.add_argument(
         "--verbose",
@@ -360,6 +393,11 @@ def main(args_in: Optional[List[str]] = None) -> None:
             infer_cmd.extend(["--batch-size", str(args.batch_size)])
             infer_cmd.extend(["--kv-cache-dtype", args.kv_cache_dtype])
             infer_cmd.extend(["--input-mode", str(args.input_mode)])
+            if args.moe_expert_cache_size > 0:
+                infer_cmd.extend(
+                    ["--moe-expert-cache-size", str(args.moe_expert_cache_size)]
+                )
+                infer_cmd.extend(["--moe-offload-dir", str(args.moe_offload_dir)])
             if args.vision_text_model:
                 infer_cmd.extend(["--vision-text-model"])
             if args.greedy:
@@ -667,6 +705,11 @@ def main(args_in: Optional[List[str]] = None) -> None:
         infer_cmd.extend(["--input-mode", str(args.input_mode)])
         if args.local_rank is not None:
             infer_cmd.extend(["--local_rank", str(args.local_rank)])
+        infer_cmd.extend(
+            ["--allreduce-overlap-chunks", str(args.allreduce_overlap_chunks)]
+        )
+        if args.moe_expert_parallel:
+            infer_cmd.extend(["--moe-expert-parallel"])
         if args.greedy:
             infer_cmd.extend(["--greedy"])
         if args.streaming:
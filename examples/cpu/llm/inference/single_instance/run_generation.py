@@ -111,10 +111,29 @@ parser.add_argument(
     choices=[
         "auto",
         "fp8_e5m2",
+        "int8",
+        "int4",
     ],
     default="auto",
     help='Data type for kv cache storage. If "auto", will use model '
-    "data type. fp8 type now supports e5m2.",
+    "data type. fp8 type now supports e5m2. int8 and int4 quantize the kv cache"
+    " per token and head, not supported by the MLA attention of DeepSeek.",
+)
+parser.add_argument(
+    "--moe-expert-cache-size",
+    default=0,
+    type=int,
+    help="For the fused MoE of DeepSeek models, the number of routed experts of every"
+    " layer kept in DRAM, the other experts are memory-mapped from --moe-offload-dir"
+    " and loaded on demand. 0 keeps all the experts in DRAM. Runs in eager mode,"
+    " --deployment-mode is turned off with it.",
+)
+parser.add_argument(
+    "--moe-offload-dir",
+    default=None,
+    type=str,
+    help="The directory (local disk, or a mount of CXL/far memory) storing the"
+    " offloaded experts when --moe-expert-cache-size is set.",
 )
 parser.add_argument(
     "--input-mode",
@@ -181,11 +200,17 @@ else:
 if args.ipex and args.dtype == "bfloat16":
     config.use_fused_moe = True
     config.use_fused_moe_woq = False
+    config.moe_expert_cache_size = args.moe_expert_cache_size
+    config.moe_offload_dir = args.moe_offload_dir
 
 if args.kv_cache_dtype == "auto":
     kv_cache_dtype = None
 elif args.kv_cache_dtype == "fp8_e5m2":
     kv_cache_dtype = torch.float8_e5m2
+elif args.kv_cache_dtype == "int8":
+    kv_cache_dtype = torch.uint8
+elif args.kv_cache_dtype == "int4":
+    kv_cache_dtype = torch.uint4
 config.kv_cache_dtype = kv_cache_dtype
 
 if not hasattr(config, "text_max_length") and args.prompt is None:
@@ -25,6 +25,14 @@ parser.add_argument("--act-order", default=False, action=argparse.BooleanOptiona
 parser.add_argument("--nsamples", default=128, type=int)
 parser.add_argument("--pad-max-length", default=2048, type=int)
 parser.add_argument("--use-max-length", default=False, type=bool)
+parser.add_argument("--calib-batch-size", default=1, type=int)
+parser.add_argument("--num-workers", default=1, type=int)
+parser.add_argument(
+    "--cache-dir",
+    default=None,
+    type=str,
+    help="directory of the spilled activations and per-block checkpoints to resume from",
+)
 args = parser.parse_args()
 
 
@@ -198,5 +206,8 @@ compressed_model = ipex.quantization.gptq(
     nsamples=args.nsamples,
     use_max_length=args.use_max_length,
     pad_max_length=args.pad_max_length,
+    calib_batch_size=args.calib_batch_size,
+    num_workers=args.num_workers,
+    cache_dir=args.cache_dir,
     save_dir=args.output_dir,
 )
@@ -10,7 +10,13 @@ from ..strategy import STRATEGIES
 from intel_extension_for_pytorch.cpu.launch import CPUPoolList
 
 # ### tuning ####
-tuning_default = {"strategy": "grid", "max_trials": 100}
+tuning_default = {
+    "strategy": "grid",
+    "max_trials": 100,
+    "n_startup_trials": 10,
+    "eta": 3,
+    "min_budget": 0.1,
+}
 
 
 def _valid_strategy(data):
@@ -23,6 +29,12 @@ tuning_schema = Schema(
     {
         Optional("strategy", default="grid"): And(str, Use(_valid_strategy)),
         Optional("max_trials", default=100): int,
+        # tpe and hyperband: number of random trials before the model is used
+        Optional("n_startup_trials", default=10): And(int, lambda s: s > 0),
+        # hyperband: keep 1/eta of the trials at each rung, starting from a
+        # min_budget fraction of the full budget
+        Optional("eta", default=3): And(int, lambda s: s > 1),
+        Optional("min_budget", default=0.1): And(Or(int, float), lambda s: 0 < s <= 1),
     }
 )
 
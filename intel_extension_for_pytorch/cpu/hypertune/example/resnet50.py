@@ -3,15 +3,19 @@ import torchvision.models as models
 
 
 def inference(model, data):
+    # fraction of the full budget of this trial, see the hyperband strategy
+    import os
+
+    budget = float(os.environ.get("IPEX_HYPERTUNE_BUDGET", "1.0"))
     with torch.no_grad():
         # warm up
-        for _ in range(100):
+        for _ in range(max(1, int(100 * budget))):
             model(data)
 
         # measure
         import time
 
-        measure_iter = 100
+        measure_iter = max(1, int(100 * budget))
         start = time.time()
         for _ in range(measure_iter):
             output = model(data)
@@ -1,8 +1,14 @@
 # reference: https://github.com/intel/neural-compressor/blob/\
 #            15477100cef756e430c8ef8ef79729f0c80c8ce6/neural_compressor/objective.py
+import os
 import subprocess
 from ...utils._logger import logger, WarningType
 
+# The fraction of the full budget of a trial is passed to the program in this
+# environment variable. A program supporting early stopping scales its work
+# (e.g. the number of benchmark iterations) by it.
+HYPERTUNE_BUDGET_ENV = "IPEX_HYPERTUNE_BUDGET"
+
 
 class MultiObjective(object):
     def __init__(self, program, program_args, tune_launcher):
@@ -10,7 +16,7 @@ class MultiObjective(object):
         self.program_args = program_args
         self.tune_launcher = tune_launcher
 
-    def evaluate(self, cfg):
+    def evaluate(self, cfg, budget=1.0):
         cmd = ["ipexrun"]
 
         if self.tune_launcher:
@@ -20,7 +26,11 @@ class MultiObjective(object):
         cmd += [self.program]
         cmd += self.program_args
 
-        r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        env = os.environ.copy()
+        env[HYPERTUNE_BUDGET_ENV] = str(budget)
+        r = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
+        )
 
         # todo: r.returncode != 0
 
@@ -0,0 +1,52 @@
+import math
+from .strategy import strategy_registry
+from .tpe import TPETuneStrategy
+
+
+@strategy_registry
+class HyperbandTuneStrategy(TPETuneStrategy):
+    # Hyperband with successive halving brackets. In a bracket, n configurations
+    # run with a small fraction of the full budget, the best 1/eta of them run
+    # again with eta times the budget, and so on up to the full budget. The
+    # brackets trade the number of configurations for the initial budget. The
+    # new configurations are suggested by TPE on the full budget results once
+    # n_startup_trials of them are observed (as BOHB), and sampled randomly before.
+    record_budget = True
+
+    def __init__(self, conf):
+        super().__init__(conf)
+        self.eta = conf.execution_conf.tuning.eta
+        self.min_budget = conf.execution_conf.tuning.min_budget
+        self.s_max = int(
+            math.floor(math.log(1.0 / self.min_budget) / math.log(self.eta) + 1e-9)
+        )
+
+    def _successive_halving(self, s):
+        n = int(math.ceil((self.s_max + 1) / (s + 1) * self.eta**s))
+        tune_cfgs = []
+        for _ in range(n):
+            tune_cfg = self._next_cfg()
+            if tune_cfg is None:
+                break
+            self.seen.add(self.sampler.key(tune_cfg))
+            tune_cfgs.append(tune_cfg)
+
+        for i in range(s + 1):
+            self.budget = min(1.0, self.eta ** (i - s))
+            results = []
+            for tune_cfg in tune_cfgs:
+                yield tune_cfg
+                results.append(self.tune_history[-1][2])
+            if i == s:
+                break
+            # Early stop all but the best 1/eta configurations
+            scores = self._scores(results)
+            num_kept = max(1, len(tune_cfgs) // self.eta)
+            order = sorted(range(len(tune_cfgs)), key=lambda j: scores[j])
+            tune_cfgs = [tune_cfgs[j] for j in order[:num_kept]]
+
+    def next_tune_cfg(self):
+        while len(self.seen) < self.sampler.space_size:
+            for s in range(self.s_max, -1, -1):
+                yield from self._successive_halving(s)
+        self.budget = 1.0
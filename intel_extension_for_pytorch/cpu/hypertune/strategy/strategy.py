@@ -21,6 +21,10 @@ def strategy_registry(cls):
 
 
 class TuneStrategy(object):
+    # whether the budget of each trial is recorded, for strategies running
+    # trials with a fraction of the full budget
+    record_budget = False
+
     def __init__(self, conf):
         self.conf = conf.execution_conf
         self.program = conf.program
@@ -28,6 +32,11 @@ class TuneStrategy(object):
         self.usr_objectives = conf.usr_objectives
 
         self.max_trials = conf.execution_conf.tuning.max_trials
+        # fraction of the full budget of the next trial, set by the strategies
+        # with early stopping before yielding a configuration
+        self.budget = 1.0
+        # (tune_cfg, budget, tune_result) of the finished trials, in order
+        self.tune_history = []
 
         # hyperparams #
         self.hyperparam2searchspace = OrderedDict()
@@ -45,10 +54,11 @@ class TuneStrategy(object):
         # output #
         output_name = "record.csv"
         log_name = os.path.join(self.conf.output_dir, output_name)
-        csvfile = open(log_name, "w", newline="")
-        self.tune_result_record = csv.writer(csvfile, delimiter=",")
+        self.tune_result_file = open(log_name, "w", newline="")
+        self.tune_result_record = csv.writer(self.tune_result_file, delimiter=",")
         self.tune_result_record.writerow(
             list(self.hyperparam2searchspace.keys())
+            + (["budget"] if self.record_budget else [])
             + [objective["name"] for objective in self.usr_objectives]
         )
 
@@ -61,21 +71,31 @@ class TuneStrategy(object):
 
     def traverse(self):
         click.secho("Starting hypertuning...", fg="green")
+        # trials of a fraction of the full budget count as the fraction of a trial
         trials_count = 0
+        runs_count = 0
 
         for tune_cfg in self.next_tune_cfg():
-            trials_count += 1
+            budget = self.budget
+            trials_count += budget
+            runs_count += 1
 
             click.secho("\nTune ", fg="green", nl=False)
-            click.secho("{trials_count}", fg="blue", nl=False)
+            click.secho(f"{runs_count}", fg="blue", nl=False)
 
             click.secho("\nCurrent configuration is: ", fg="green", nl=False)
-            click.secho("{tune_cfg}", fg="blue")
+            click.secho(f"{tune_cfg}", fg="blue")
+            if budget < 1.0:
+                click.secho("Budget: ", fg="green", nl=False)
+                click.secho(f"{budget:.4g}", fg="blue")
 
-            curr_tune_result = self.multiobjective.evaluate(tune_cfg)
+            curr_tune_result = self.multiobjective.evaluate(tune_cfg, budget)
+            self.tune_history.append((tune_cfg, budget, curr_tune_result))
 
-            self._update_best_tune_result(curr_tune_result, tune_cfg)
-            self._record_tune_result(curr_tune_result, tune_cfg)
+            # results of a partial budget are not comparable with the full ones
+            if budget >= 1.0:
+                self._update_best_tune_result(curr_tune_result, tune_cfg)
+            self._record_tune_result(curr_tune_result, tune_cfg, budget)
 
             need_stop = self._stop(trials_count)
 
@@ -94,6 +114,25 @@ class TuneStrategy(object):
         self._print_best_result()
         return
 
+    def _scores(self, tune_results):
+        # Scalarizes the results of several trials for the model-based strategies,
+        # lower is better. The score of a trial is the sum of its ranks of every
+        # objective, and a trial missing objective values is ranked last.
+        scores = [0.0] * len(tune_results)
+        for i, objective in enumerate(self.usr_objectives):
+            sign = -1.0 if objective["higher_is_better"] else 1.0
+            vals = [
+                sign * result[i] if len(result) == len(self.usr_objectives) else None
+                for result in tune_results
+            ]
+            order = sorted(
+                range(len(vals)),
+                key=lambda j: (vals[j] is None, vals[j] if vals[j] is not None else 0),
+            )
+            for rank, j in enumerate(order):
+                scores[j] += rank
+        return scores
+
     def _compare(self, higher_is_better, src, dst):
         if higher_is_better:
             return src > dst
@@ -123,20 +162,27 @@ class TuneStrategy(object):
                 self.best_tune_result = curr_tune_result
                 self.best_tune_cfg = curr_tune_cfg
 
-    def _record_tune_result(self, curr_tune_result, curr_tune_cfg):
+    def _record_tune_result(self, curr_tune_result, curr_tune_cfg, budget=1.0):
         for objective, val in zip(self.usr_objectives, curr_tune_result):
-            click.secho("{objective['name']}: {val}", fg="blue")
+            click.secho(f"{objective['name']}: {val}", fg="blue")
 
-        click.secho("Best configuration is: ", fg="green", nl=False)
-        click.secho("{self.best_tune_cfg}", fg="blue")
-        for objective, val in zip(self.usr_objectives, self.best_tune_result):
-            click.secho("{objective['name']}: {val}", fg="blue")
+        if self.best_tune_result is not None:
+            click.secho("Best configuration is: ", fg="green", nl=False)
+            click.secho(f"{self.best_tune_cfg}", fg="blue")
+            for objective, val in zip(self.usr_objectives, self.best_tune_result):
+                click.secho(f"{objective['name']}: {val}", fg="blue")
 
         curr_tune_cfg_val = list(_ for _ in curr_tune_cfg.values())
-        self.tune_result_record.writerow(curr_tune_cfg_val + curr_tune_result)
+        self.tune_result_record.writerow(
+            curr_tune_cfg_val
+            + ([budget] if self.record_budget else [])
+            + curr_tune_result
+        )
+        # keep the record of the finished trials if the tuning is interrupted
+        self.tune_result_file.flush()
 
     def _stop(self, trials_count):
-        if all(
+        if self.best_tune_result is not None and all(
             [
                 self._compare(higher_is_better, best_val, target_val)
                 for higher_is_better, best_val, target_val in zip(
@@ -151,7 +197,7 @@ class TuneStrategy(object):
         ):
             click.secho("\nFound configuration meeting the target values.", fg="red")
             return True
-        elif trials_count == self.max_trials:
+        elif trials_count >= self.max_trials:
             click.secho(
                 "\nMax trials is reached, but didn't find configuration meeting the objective goal.",
                 fg="red",
@@ -161,6 +207,6 @@ class TuneStrategy(object):
 
     def _print_best_result(self):
         click.secho("Best configuration found is: ", fg="green", nl=False)
-        click.secho("{self.best_tune_cfg}", fg="blue")
-        for objective, val in zip(self.usr_objectives, self.best_tune_result):
-            click.secho("{objective['name']}: {val}", fg="blue")
+        click.secho(f"{self.best_tune_cfg}", fg="blue")
+        for objective, val in zip(self.usr_objectives, self.best_tune_result or []):
+            click.secho(f"{objective['name']}: {val}", fg="blue")
@@ -0,0 +1,132 @@
+import itertools
+import math
+import numpy as np
+from .strategy import strategy_registry, TuneStrategy
+
+
+class _TPESampler(object):
+    # Tree-structured Parzen Estimator over categorical search spaces.
+    # The observations are split into the best gamma fraction and the rest, the
+    # distribution of each hyperparameter is estimated on both parts, l(x) and
+    # g(x), with a uniform prior. The candidates are sampled from l(x), and the
+    # one maximizing l(x) / g(x) is suggested.
+    def __init__(self, hyperparam2searchspace, gamma=0.25, n_candidates=24):
+        self.hyperparam2searchspace = hyperparam2searchspace
+        self.hyperparams = list(hyperparam2searchspace.keys())
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.space_size = math.prod(
+            len(space) for space in hyperparam2searchspace.values()
+        )
+
+    def key(self, cfg):
+        return tuple(cfg[hp] for hp in self.hyperparams)
+
+    def _unseen(self, seen):
+        return [
+            dict(zip(self.hyperparams, comb))
+            for comb in itertools.product(
+                *(self.hyperparam2searchspace[hp] for hp in self.hyperparams)
+            )
+            if comb not in seen
+        ]
+
+    def _sample(self, probs):
+        return {
+            hp: self.hyperparam2searchspace[hp][
+                np.random.choice(len(probs[hp]), p=probs[hp])
+            ]
+            for hp in self.hyperparams
+        }
+
+    def _estimate(self, cfgs):
+        # Frequencies of the values of each hyperparameter, with one
+        # pseudo-count spread uniformly over the search space
+        probs = {}
+        for hp in self.hyperparams:
+            space = self.hyperparam2searchspace[hp]
+            counts = np.full(len(space), 1.0 / len(space))
+            for cfg in cfgs:
+                counts[space.index(cfg[hp])] += 1
+            probs[hp] = counts / counts.sum()
+        return probs
+
+    def sample_random(self, seen):
+        r"""
+        Returns a configuration not in ``seen`` sampled uniformly, or None if the
+        search space is exhausted.
+        """
+        if len(seen) >= self.space_size:
+            return None
+        if len(seen) > self.space_size // 2:
+            unseen = self._unseen(seen)
+            return unseen[np.random.randint(len(unseen))]
+        uniform = {
+            hp: np.full(len(space), 1.0 / len(space))
+            for hp, space in self.hyperparam2searchspace.items()
+        }
+        while True:
+            cfg = self._sample(uniform)
+            if self.key(cfg) not in seen:
+                return cfg
+
+    def suggest(self, cfgs, scores, seen):
+        r"""
+        Returns the configuration not in ``seen`` with the highest expected
+        improvement given the observed ``cfgs`` and their ``scores`` (lower is
+        better), or None if the search space is exhausted.
+        """
+        order = np.argsort(scores, kind="stable")
+        n_good = max(1, int(math.ceil(self.gamma * len(cfgs))))
+        good = self._estimate([cfgs[i] for i in order[:n_good]])
+        bad = self._estimate([cfgs[i] for i in order[n_good:]])
+
+        best_cfg, best_ratio = None, -float("inf")
+        for _ in range(self.n_candidates):
+            cfg = self._sample(good)
+            if self.key(cfg) in seen:
+                continue
+            ratio = sum(
+                math.log(good[hp][self.hyperparam2searchspace[hp].index(cfg[hp])])
+                - math.log(bad[hp][self.hyperparam2searchspace[hp].index(cfg[hp])])
+                for hp in self.hyperparams
+            )
+            if ratio > best_ratio:
+                best_cfg, best_ratio = cfg, ratio
+        if best_cfg is None:
+            # All the candidates were tried already, explore instead
+            return self.sample_random(seen)
+        return best_cfg
+
+
+@strategy_registry
+class TPETuneStrategy(TuneStrategy):
+    def __init__(self, conf):
+        super().__init__(conf)
+        self.n_startup_trials = conf.execution_conf.tuning.n_startup_trials
+        self.sampler = _TPESampler(self.hyperparam2searchspace)
+        self.seen = set()
+
+    def _full_budget_history(self):
+        cfgs, results = [], []
+        for cfg, budget, result in self.tune_history:
+            if budget >= 1.0:
+                cfgs.append(cfg)
+                results.append(result)
+        return cfgs, results
+
+    def _next_cfg(self):
+        # Random configurations until n_startup_trials results are observed,
+        # then the configurations suggested by the model
+        cfgs, results = self._full_budget_history()
+        if len(cfgs) < self.n_startup_trials:
+            return self.sampler.sample_random(self.seen)
+        return self.sampler.suggest(cfgs, self._scores(results), self.seen)
+
+    def next_tune_cfg(self):
+        while True:
+            tune_cfg = self._next_cfg()
+            if tune_cfg is None:
+                return
+            self.seen.add(self.sampler.key(tune_cfg))
+            yield tune_cfg
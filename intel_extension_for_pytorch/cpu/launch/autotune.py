@@ -0,0 +1,317 @@
+import contextlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from ...utils._logger import WarningType
+
+_DEFAULT_PROFILE = "ipexrun_autotune_profile.json"
+_PROFILE_VERSION = 1
+_LAYOUT_KEYS = [
+    "ninstances",
+    "ncores_per_instance",
+    "bind_numa_node",
+    "use_logical_cores",
+    "use_e_cores",
+    "nodes_list",
+    "cores_list",
+]
+
+
+def add_autotune_params(parser):
+    group = parser.add_argument_group("Autotune Arguments")
+    group.add_argument(
+        "--autotune",
+        action="store_true",
+        default=False,
+        help="Benchmark candidate instance layouts with the hook of --autotune-hook inside the launcher "
+        + "process, write the best one to --autotune-profile and launch the program with it.",
+    )
+    group.add_argument(
+        "--autotune-hook",
+        "--autotune_hook",
+        default="",
+        type=str,
+        help='The benchmark hook of --autotune, in format of "path/to/file.py:function" or "module:function". '
+        + "The function is called once per instance on the cores of the instance and returns a callable, "
+        + "every call of which runs one iteration and returns the number of samples processed (None for 1).",
+    )
+    group.add_argument(
+        "--autotune-profile",
+        "--autotune_profile",
+        default="",
+        type=str,
+        help="The profile file of the best instance layout. Written by --autotune "
+        + f'("{_DEFAULT_PROFILE}" if empty). Without --autotune, the layout of the profile is used to launch.',
+    )
+    group.add_argument(
+        "--autotune-metric",
+        "--autotune_metric",
+        default="throughput",
+        type=str,
+        choices=["throughput", "latency"],
+        help="The metric to select the best instance layout, the highest total throughput of all instances "
+        + "or the lowest average latency of an iteration.",
+    )
+    group.add_argument(
+        "--autotune-warmup",
+        "--autotune_warmup",
+        default=2,
+        type=int,
+        help="Number of untimed iterations of every instance of a candidate layout.",
+    )
+    group.add_argument(
+        "--autotune-iters",
+        "--autotune_iters",
+        default=10,
+        type=int,
+        help="Number of timed iterations of every instance of a candidate layout.",
+    )
+
+
+def load_autotune_hook(hook):
+    path, _, name = hook.rpartition(":")
+    if path == "" or name == "":
+        raise ValueError(
+            f'--autotune-hook should be "path/to/file.py:function" or "module:function", but got "{hook}".'
+        )
+    if path.endswith(".py"):
+        path = os.path.abspath(path)
+        spec = importlib.util.spec_from_file_location(
+            f"_ipex_autotune_hook_{uuid.uuid4().hex}", path
+        )
+        module = importlib.util.module_from_spec(spec)
+        # the hook may import the modules next to it
+        sys.path.insert(0, os.path.dirname(path))
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(path)
+    return getattr(module, name)
+
+
+@contextlib.contextmanager
+def _pin_current_thread(core_ids):
+    import torch
+    from ..runtime import CPUPool, pin, is_runtime_ext_enabled
+
+    if is_runtime_ext_enabled():
+        with pin(CPUPool(core_ids=core_ids)):
+            yield
+        return
+    # Without the runtime extension, the OpenMP threads forked by this thread
+    # inherit its affinity.
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, core_ids)
+    torch.set_num_threads(len(core_ids))
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+class LayoutAutotuner:
+    """
+    Benchmarks the instance layouts generated by CPUPoolList.gen_pools_ondemand
+    in the launcher process. The instances of a layout run the hook concurrently
+    in threads pinned to their cores, instead of a subprocess per trial.
+    """
+
+    def __init__(self, cpuinfo, logger=None):
+        self.cpuinfo = cpuinfo
+        self.logger = logger
+
+    def verbose(self, level, msg, warning_type=None):
+        if self.logger:
+            logging_fn = {
+                "warning": self.logger.warning,
+                "info": self.logger.info,
+            }
+            assert (
+                level in logging_fn.keys()
+            ), f"Unrecognized logging level {level} is detected. Available levels are {logging_fn.keys()}."
+            if warning_type:
+                logging_fn[level](msg, _type=warning_type)
+            else:
+                logging_fn[level](msg)
+        else:
+            print(msg)
+
+    def gen_candidates(
+        self,
+        use_logical_cores=False,
+        use_e_cores=False,
+        nodes_list=None,
+        cores_list=None,
+    ):
+        """
+        Returns the candidate layouts: one instance on all the cores, and
+        instances bound to a NUMA node with 1, 2, 4, ... cores up to all the
+        cores of a node. Every candidate is a dict of the arguments of
+        gen_pools_ondemand and the generated "pools".
+        """
+        common = {
+            "use_logical_cores": use_logical_cores,
+            "use_e_cores": use_e_cores,
+            "nodes_list": nodes_list,
+            "cores_list": cores_list,
+        }
+        self.cpuinfo.gen_pools_ondemand(ninstances=1, **common)
+        pool = self.cpuinfo.pools_ondemand[0]
+        ncores_node = min(
+            len([c for c in pool if c.node == node])
+            for node in set([c.node for c in pool])
+        )
+        layouts = [{"ninstances": 1, "ncores_per_instance": 0, "bind_numa_node": False}]
+        ncores = 1
+        while ncores < ncores_node:
+            layouts.append(
+                {"ninstances": 0, "ncores_per_instance": ncores, "bind_numa_node": True}
+            )
+            ncores *= 2
+        layouts.append(
+            {
+                "ninstances": 0,
+                "ncores_per_instance": ncores_node,
+                "bind_numa_node": True,
+            }
+        )
+
+        candidates = []
+        seen = set()
+        for layout in layouts:
+            self.cpuinfo.gen_pools_ondemand(**layout, **common)
+            pools = list(self.cpuinfo.pools_ondemand)
+            key = tuple(p.get_pool_txt()["cores"] for p in pools)
+            if key in seen:
+                continue
+            seen.add(key)
+            # the number of instances reproduces the same pools in later launches
+            layout["ninstances"] = len(pools)
+            candidates.append(dict(layout, pools=pools))
+        return candidates
+
+    def benchmark(self, pools, hook, warmup=2, iters=10):
+        """
+        Runs the hook on every pool concurrently, returns the total throughput
+        in samples per second and the average latency of an iteration in ms.
+        """
+        barrier = threading.Barrier(len(pools))
+        results = [None] * len(pools)
+        errors = []
+
+        def run(index):
+            try:
+                with _pin_current_thread([c.cpu for c in pools[index]]):
+                    step = hook()
+                    for _ in range(warmup):
+                        step()
+                    barrier.wait()
+                    num_samples = 0
+                    start = time.perf_counter()
+                    for _ in range(iters):
+                        n = step()
+                        num_samples += 1 if n is None else n
+                    results[index] = (num_samples, time.perf_counter() - start)
+            except BaseException as e:
+                errors.append(e)
+                barrier.abort()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(pools))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+        throughput = sum(n / t for n, t in results)
+        latency = 1000.0 * sum(t / iters for _, t in results) / len(results)
+        return throughput, latency
+
+    def tune(
+        self,
+        hook,
+        metric="throughput",
+        warmup=2,
+        iters=10,
+        use_logical_cores=False,
+        use_e_cores=False,
+        nodes_list="",
+        cores_list="",
+        parse_list_argument=None,
+    ):
+        """
+        Benchmarks all the candidate layouts, returns the profile of the best one.
+        """
+        assert iters > 0, "Argument --autotune-iters should be a positive value."
+        nodes = parse_list_argument(nodes_list) if parse_list_argument else []
+        cores = parse_list_argument(cores_list) if parse_list_argument else []
+        results = []
+        for candidate in self.gen_candidates(
+            use_logical_cores, use_e_cores, nodes, cores
+        ):
+            pools = candidate.pop("pools")
+            throughput, latency = self.benchmark(pools, hook, warmup, iters)
+            self.verbose(
+                "info",
+                f"autotune: {len(pools)} instance(s) x {len(pools[0])} core(s), "
+                + f"throughput {throughput:.2f} samples/s, latency {latency:.2f} ms",
+            )
+            results.append(dict(candidate, throughput=throughput, latency_ms=latency))
+        if metric == "throughput":
+            best = max(results, key=lambda r: r["throughput"])
+        else:
+            best = min(results, key=lambda r: r["latency_ms"])
+        layout = {
+            k: best[k] for k in ["ninstances", "ncores_per_instance", "bind_numa_node"]
+        }
+        layout.update(
+            {
+                "use_logical_cores": use_logical_cores,
+                "use_e_cores": use_e_cores,
+                "nodes_list": nodes_list,
+                "cores_list": cores_list,
+            }
+        )
+        return {
+            "version": _PROFILE_VERSION,
+            "num_cpus": len(self.cpuinfo.pool_all),
+            "num_nodes": len(set([c.node for c in self.cpuinfo.pool_all])),
+            "metric": metric,
+            "layout": layout,
+            "results": results,
+        }
+
+    def save_profile(self, profile, path):
+        with open(path, "w") as f:
+            json.dump(profile, f, indent=2)
+        layout = profile["layout"]
+        self.verbose(
+            "info",
+            f'autotune: the best layout is {layout["ninstances"]} instance(s) with '
+            + f'--ncores-per-instance {layout["ncores_per_instance"]}, saved to {path}',
+        )
+
+    def apply_profile(self, args, path):
+        """
+        Sets the layout arguments of args from the profile file.
+        """
+        with open(path, "r") as f:
+            profile = json.load(f)
+        assert (
+            profile.get("version", 0) == _PROFILE_VERSION
+        ), f"Unsupported autotune profile version in {path}."
+        num_cpus = len(self.cpuinfo.pool_all)
+        if profile["num_cpus"] != num_cpus:
+            self.verbose(
+                "warning",
+                f'The autotune profile {path} was generated on {profile["num_cpus"]} CPUs, '
+                + f"but this machine has {num_cpus} CPUs. Please run --autotune again.",
+                warning_type=WarningType.AmbiguousArgument,
+            )
+        for k in _LAYOUT_KEYS:
+            setattr(args, k, profile["layout"][k])
+        return profile
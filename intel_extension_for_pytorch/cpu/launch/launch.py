@@ -8,6 +8,8 @@ from datetime import datetime
 import intel_extension_for_pytorch.cpu.auto_ipex as auto_ipex
 from .launcher_distributed import DistributedTrainingLauncher
 from .launcher_multi_instances import MultiInstancesLauncher
+from .autotune import add_autotune_params
+from .supervisor import add_supervisor_params
 from ...utils._logger import WarningType, format_str
 
 logger = logging.getLogger("IPEX-launcher")
@@ -69,6 +71,26 @@ For memory management, it configures NUMA binding and preload optimized memory a
 
    >>> ipexrun  --cores-list "0-3" --ninstances 2 --ncores-per-instance 2 --instance-idx 0 python_script args
 
+3. Autotune the instance layout.
+   The candidate layouts are benchmarked with a hook inside the launcher, the best one is saved to a profile file.
+   The hook is called once per instance and returns a callable running one iteration.
+
+   eg: tune with the hook "benchmark" defined in bench.py, then launch with the saved profile
+::
+
+   >>> ipexrun  --autotune --autotune-hook bench.py:benchmark --autotune-profile spr.json python_script args
+   >>> ipexrun  --autotune-profile spr.json python_script args
+
+4. Supervise the instances.
+   A crashed instance, or an instance without metrics reports for --heartbeat-timeout seconds, is restarted on
+   its cores. The instances report with intel_extension_for_pytorch.cpu.launch.report_instance_metrics and the
+   aggregated metrics are written to summary.json in --metrics-dir. SIGINT/SIGTERM drains the instances.
+
+   eg: supervise the instances of the throughput mode, restart an instance 5 times at most
+::
+
+   >>> ipexrun  --throughput-mode --supervise --max-restarts 5 --heartbeat-timeout 120 --metrics-dir ./metrics python_script args
+
 *** Distributed Training ***
 
 spawns up multiple distributed training processes on each of the training nodes. For intel_extension_for_pytorch, oneCCL
@@ -223,6 +245,8 @@ def init_parser(parser):
     launcher_multi_instances.add_common_params(parser)
     launcher_multi_instances.add_params(parser)
     launcher_distributed.add_params(parser)
+    add_autotune_params(parser)
+    add_supervisor_params(parser)
     auto_ipex.add_auto_ipex_params(parser)
     add_deprecated_params(parser)
 
@@ -3,6 +3,8 @@ import subprocess
 import os
 import intel_extension_for_pytorch.cpu.auto_ipex as auto_ipex
 from .launcher_base import Launcher
+from .autotune import LayoutAutotuner, load_autotune_hook, _DEFAULT_PROFILE
+from .supervisor import InstanceSupervisor, _INSTANCE_IDX_ENV, _METRICS_FILE_ENV
 from ...utils._logger import WarningType
 
 
@@ -123,7 +125,15 @@ class MultiInstancesLauncher(Launcher):
         return tm_local
 
     def execution_command_builder(
-        self, args, omp_runtime, task_mgr, environ, cpu_pools, index
+        self,
+        args,
+        omp_runtime,
+        task_mgr,
+        environ,
+        cpu_pools,
+        index,
+        supervised=False,
+        append_log=False,
     ):
         assert index > -1 and index <= len(
             cpu_pools
@@ -159,6 +169,11 @@ class MultiInstancesLauncher(Launcher):
         omp_num_threads = self.check_env("OMP_NUM_THREADS", len(pool))
         environ_local["OMP_NUM_THREADS"] = str(omp_num_threads)
         self.verbose("info", f"env: OMP_NUM_THREADS={omp_num_threads}")
+        if supervised:
+            environ_local[_INSTANCE_IDX_ENV] = str(index)
+            environ_local[_METRICS_FILE_ENV] = os.path.join(
+                args.metrics_dir, f"instance_{index}.json"
+            )
 
         if not args.no_python:
             cmd.append(sys.executable)
@@ -170,22 +185,77 @@ class MultiInstancesLauncher(Launcher):
         log_name = os.path.join(args.log_dir, log_name)
         cmd.extend(args.program_args)
         cmd_s = " ".join(cmd)
+        executable = None
         if args.log_dir:
-            cmd_s = f"{cmd_s} 2>&1 | tee {log_name}"
+            tee_params = "-a " if append_log else ""
+            cmd_s = f"{cmd_s} 2>&1 | tee {tee_params}{log_name}"
+            if supervised:
+                # pipefail keeps the exit status of the program instead of
+                # tee's, the supervisor restarts the instance on it
+                cmd_s = f"set -o pipefail; {cmd_s}"
+                executable = "/bin/bash"
         self.verbose("info", f"cmd: {cmd_s}")
         if len(set([c.node for c in pool])) > 1:
             self.verbose(
                 "warning",
                 f"Cross NUMA nodes execution detected: cores [{cores_list_local}] are on different NUMA nodes [{nodes_list_local}]",
             )
-        process = subprocess.Popen(cmd_s, env=environ_local, shell=True)
+        # A supervised instance gets its own session, so that the shell, the
+        # program and tee are signaled together.
+        process = subprocess.Popen(
+            cmd_s,
+            env=environ_local,
+            shell=True,
+            executable=executable,
+            start_new_session=supervised,
+        )
         return {"process": process, "cmd": cmd_s}
 
+    def autotune(self, args):
+        """
+        Benchmarks the instance layouts with the hook of --autotune-hook and
+        saves the best one to --autotune-profile, then sets the layout arguments
+        from the profile.
+        """
+        autotuner = LayoutAutotuner(self.cpuinfo, self.logger)
+        profile_path = args.autotune_profile
+        if args.autotune:
+            assert (
+                args.autotune_hook != ""
+            ), "Argument --autotune needs a benchmark hook set by --autotune-hook."
+            if profile_path == "":
+                profile_path = _DEFAULT_PROFILE
+            profile = autotuner.tune(
+                load_autotune_hook(args.autotune_hook),
+                metric=args.autotune_metric,
+                warmup=args.autotune_warmup,
+                iters=args.autotune_iters,
+                use_logical_cores=args.use_logical_cores,
+                use_e_cores=args.use_e_cores,
+                nodes_list=args.nodes_list,
+                cores_list=args.cores_list,
+                parse_list_argument=self.parse_list_argument,
+            )
+            autotuner.save_profile(profile, profile_path)
+        autotuner.apply_profile(args, profile_path)
+        self.verbose(
+            "info",
+            f"Instance layout from the autotune profile {profile_path}: --ninstances {args.ninstances} "
+            + f"--ncores-per-instance {args.ncores_per_instance}"
+            + (" --bind-numa-node" if args.bind_numa_node else ""),
+        )
+
     def launch(self, args):
         if args.latency_mode and args.throughput_mode:
             raise RuntimeError(
                 "Argument latency_mode and throughput_mode cannot be set at the same time."
             )
+        if args.autotune or args.autotune_profile != "":
+            if args.latency_mode or args.throughput_mode:
+                raise RuntimeError(
+                    "Argument autotune and autotune_profile cannot be set with latency_mode or throughput_mode."
+                )
+            self.autotune(args)
         if args.latency_mode:
             if (
                 args.ninstances > 0
@@ -302,6 +372,32 @@ class MultiInstancesLauncher(Launcher):
         assert set(instance_idx).issubset(
             set(instances_available)
         ), "Designated nodes list contains invalid nodes."
+        if args.supervise:
+            supervisor = InstanceSupervisor(
+                self,
+                args,
+                lambda i, restarted: self.execution_command_builder(
+                    args=args,
+                    omp_runtime=omp_runtime,
+                    task_mgr=task_mgr,
+                    environ=environ_local,
+                    cpu_pools=self.cpuinfo.pools_ondemand,
+                    index=i,
+                    supervised=True,
+                    append_log=restarted,
+                ),
+                self.cpuinfo.pools_ondemand,
+            )
+            try:
+                supervisor.run(instance_idx)
+            finally:
+                if args.auto_ipex:
+                    # Clean the temp file
+                    if os.path.exists(args.program) and args.program.endswith(
+                        "_auto_ipex"
+                    ):
+                        os.remove(args.program)
+            return
         processes = []
         for i in instance_idx:
             process = self.execution_command_builder(
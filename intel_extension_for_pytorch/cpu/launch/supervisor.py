@@ -0,0 +1,397 @@
+import atexit
+import json
+import os
+import signal
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from ...utils._logger import WarningType
+
+_INSTANCE_IDX_ENV = "IPEX_LAUNCHER_INSTANCE_IDX"
+_METRICS_FILE_ENV = "IPEX_LAUNCHER_METRICS_FILE"
+_SUMMARY_FILE = "summary.json"
+# an instance slower than the others for this number of consecutive checks is restarted
+_SLOW_CHECKS = 3
+
+
+def add_supervisor_params(parser):
+    group = parser.add_argument_group("Supervisor Arguments")
+    group.add_argument(
+        "--supervise",
+        action="store_true",
+        default=False,
+        help="Supervise the instances: restart a crashed, wedged or slow instance on the same cores, "
+        + "collect the metrics of the instances and drain them on SIGINT/SIGTERM.",
+    )
+    group.add_argument(
+        "--max-restarts",
+        "--max_restarts",
+        default=3,
+        type=int,
+        help="Max number of restarts of each instance with --supervise.",
+    )
+    group.add_argument(
+        "--metrics-dir",
+        "--metrics_dir",
+        default="",
+        type=str,
+        help="The directory of the metrics files with --supervise. Every instance reports to its file with "
+        + "intel_extension_for_pytorch.cpu.launch.report_instance_metrics, the supervisor aggregates them "
+        + f"to {_SUMMARY_FILE}. A temporary directory is used if empty.",
+    )
+    group.add_argument(
+        "--health-check-interval",
+        "--health_check_interval",
+        default=5.0,
+        type=float,
+        help="Interval in seconds of the health checks and the metrics aggregation with --supervise.",
+    )
+    group.add_argument(
+        "--heartbeat-timeout",
+        "--heartbeat_timeout",
+        default=0.0,
+        type=float,
+        help="Restart an instance which has not reported metrics for this number of seconds since its start "
+        + "or its last report. 0 disables the check.",
+    )
+    group.add_argument(
+        "--slow-instance-ratio",
+        "--slow_instance_ratio",
+        default=0.0,
+        type=float,
+        help="Restart an instance whose throughput is lower than this ratio of the median throughput of the "
+        + f"instances for {_SLOW_CHECKS} consecutive health checks. 0 disables the check.",
+    )
+    group.add_argument(
+        "--drain-timeout",
+        "--drain_timeout",
+        default=30.0,
+        type=float,
+        help="Seconds to wait for the instances to exit after SIGTERM before they are killed.",
+    )
+
+
+class _InstanceMetrics:
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.num_samples = 0
+        self.num_iters = 0
+        self.total_latency = 0.0
+        self.window_start = self.start_time
+        self.window_samples = 0
+        self.window_iters = 0
+        self.window_latency = 0.0
+        self.last_write = 0.0
+
+    def add(self, num_samples, latency_ms):
+        with self.lock:
+            self.num_samples += num_samples
+            self.num_iters += 1
+            self.window_samples += num_samples
+            self.window_iters += 1
+            if latency_ms is not None:
+                self.total_latency += latency_ms
+                self.window_latency += latency_ms
+            now = time.time()
+            if now - self.last_write >= self.interval:
+                self._write(now)
+
+    def flush(self):
+        with self.lock:
+            if self.window_iters > 0:
+                self._write(time.time())
+
+    def _write(self, now):
+        elapsed = max(now - self.window_start, 1e-9)
+        metrics = {
+            "pid": os.getpid(),
+            "time": now,
+            "num_samples": self.num_samples,
+            "num_iters": self.num_iters,
+            # over the last report interval
+            "throughput": self.window_samples / elapsed,
+            "latency_ms": (
+                self.window_latency / self.window_iters if self.window_iters else 0.0
+            ),
+            "avg_latency_ms": (
+                self.total_latency / self.num_iters if self.num_iters else 0.0
+            ),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metrics, f)
+        os.replace(tmp_path, self.path)
+        self.last_write = now
+        self.window_start = now
+        self.window_samples = 0
+        self.window_iters = 0
+        self.window_latency = 0.0
+
+
+_instance_metrics = None
+
+
+def report_instance_metrics(num_samples=1, latency_ms=None):
+    r"""
+    Reports an iteration of the instance to the supervisor of ``ipexrun
+    --supervise``, e.g. a batch of ``num_samples`` samples which took
+    ``latency_ms`` milliseconds. The metrics are written to the metrics file of
+    the instance at most once per second, and also serve as its heartbeat. It
+    does nothing if the program is not launched with ``--supervise``.
+    """
+    global _instance_metrics
+    if _instance_metrics is None:
+        path = os.environ.get(_METRICS_FILE_ENV, "")
+        if path == "":
+            return
+        _instance_metrics = _InstanceMetrics(path)
+        atexit.register(_instance_metrics.flush)
+    _instance_metrics.add(num_samples, latency_ms)
+
+
+class _Instance:
+    def __init__(self, index, cores):
+        self.index = index
+        self.cores = cores
+        self.process = None
+        self.cmd = ""
+        self.start_time = 0.0
+        self.restarts = 0
+        self.status = "pending"
+        self.returncode = None
+        self.metrics = {}
+        self.slow_checks = 0
+        self.restart_reason = ""
+
+
+class InstanceSupervisor:
+    """
+    Runs the instances of MultiInstancesLauncher, restarts the crashed, wedged
+    and slow ones on the same core pool, and aggregates the metrics reported by
+    the instances to a summary file.
+    """
+
+    def __init__(self, launcher, args, spawn_fn, cpu_pools):
+        self.launcher = launcher
+        self.args = args
+        self.spawn_fn = spawn_fn
+        self.cpu_pools = cpu_pools
+        self.instances = []
+        self.draining = False
+        self.drain_deadline = 0.0
+        if args.metrics_dir == "":
+            args.metrics_dir = tempfile.mkdtemp(prefix="ipexrun_metrics_")
+        os.makedirs(args.metrics_dir, exist_ok=True)
+
+    def verbose(self, level, msg, warning_type=None):
+        self.launcher.verbose(level, msg, warning_type)
+
+    def metrics_file(self, index):
+        return os.path.join(self.args.metrics_dir, f"instance_{index}.json")
+
+    def _spawn(self, instance):
+        metrics_file = self.metrics_file(instance.index)
+        if os.path.exists(metrics_file):
+            os.remove(metrics_file)
+        ret = self.spawn_fn(instance.index, instance.restarts > 0)
+        instance.process = ret["process"]
+        instance.cmd = ret["cmd"]
+        instance.start_time = time.time()
+        instance.status = "running"
+        instance.metrics = {}
+        instance.slow_checks = 0
+
+    def _signal(self, instance, sig):
+        # the instances are started in their own sessions, so that the shell,
+        # the program and tee get the signal together
+        try:
+            os.killpg(instance.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _stop(self, instance, timeout):
+        self._signal(instance, signal.SIGTERM)
+        try:
+            instance.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._signal(instance, signal.SIGKILL)
+            instance.process.wait()
+        instance.returncode = instance.process.returncode
+
+    def _restart(self, instance, reason):
+        if instance.restarts >= self.args.max_restarts:
+            self.verbose(
+                "warning",
+                f"Instance {instance.index} {reason}, reached --max-restarts {self.args.max_restarts}.",
+                warning_type=WarningType.NotSupported,
+            )
+            instance.status = "failed"
+            return
+        instance.restarts += 1
+        instance.restart_reason = reason
+        self.verbose(
+            "warning",
+            f"Instance {instance.index} {reason}, restarting it on cores [{instance.cores}] "
+            + f"({instance.restarts}/{self.args.max_restarts}).",
+            warning_type=WarningType.NotSupported,
+        )
+        self._spawn(instance)
+
+    def _read_metrics(self, instance):
+        try:
+            with open(self.metrics_file(instance.index), "r") as f:
+                instance.metrics = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _check_health(self, instance, now):
+        if self.args.heartbeat_timeout > 0:
+            last_beat = max(instance.start_time, instance.metrics.get("time", 0.0))
+            if now - last_beat > self.args.heartbeat_timeout:
+                self._stop(instance, self.args.drain_timeout)
+                self._restart(
+                    instance,
+                    f"has not reported for {self.args.heartbeat_timeout} seconds",
+                )
+
+    def _check_slow(self, running):
+        if self.args.slow_instance_ratio <= 0:
+            return
+        reported = [i for i in running if "throughput" in i.metrics]
+        if len(reported) < 2:
+            return
+        median = statistics.median([i.metrics["throughput"] for i in reported])
+        for instance in reported:
+            if instance.metrics["throughput"] < self.args.slow_instance_ratio * median:
+                instance.slow_checks += 1
+            else:
+                instance.slow_checks = 0
+            if instance.slow_checks >= _SLOW_CHECKS:
+                self._stop(instance, self.args.drain_timeout)
+                self._restart(
+                    instance,
+                    "is slower than {:.2f} of the median throughput".format(
+                        self.args.slow_instance_ratio
+                    ),
+                )
+
+    def summary(self):
+        instances = []
+        for instance in self.instances:
+            instances.append(
+                {
+                    "index": instance.index,
+                    "cores": instance.cores,
+                    "pid": instance.process.pid if instance.process else None,
+                    "status": instance.status,
+                    "returncode": instance.returncode,
+                    "restarts": instance.restarts,
+                    "restart_reason": instance.restart_reason,
+                    "throughput": instance.metrics.get("throughput", 0.0),
+                    "latency_ms": instance.metrics.get("latency_ms", 0.0),
+                    "num_samples": instance.metrics.get("num_samples", 0),
+                }
+            )
+        running = [i for i in instances if i["status"] == "running"]
+        return {
+            "time": time.time(),
+            "num_instances": len(instances),
+            "num_running": len(running),
+            "throughput": sum(i["throughput"] for i in running),
+            "latency_ms": (
+                statistics.mean([i["latency_ms"] for i in running]) if running else 0.0
+            ),
+            "num_samples": sum(i["num_samples"] for i in instances),
+            "instances": instances,
+        }
+
+    def _write_summary(self):
+        path = os.path.join(self.args.metrics_dir, _SUMMARY_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def drain(self, signum=None, frame=None):
+        """
+        Stops restarting the instances and sends SIGTERM to them, the ones still
+        running after --drain-timeout are killed.
+        """
+        if self.draining:
+            return
+        self.draining = True
+        self.verbose("info", "Draining the instances...")
+        for instance in self.instances:
+            if instance.status == "running":
+                self._signal(instance, signal.SIGTERM)
+        self.drain_deadline = time.time() + self.args.drain_timeout
+
+    def run(self, instance_idx):
+        for i in instance_idx:
+            instance = _Instance(i, self.cpu_pools[i].get_pool_txt()["cores"])
+            self.instances.append(instance)
+            self._spawn(instance)
+        self.verbose(
+            "info", f"Supervising the instances, metrics in {self.args.metrics_dir}"
+        )
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for sig in [signal.SIGINT, signal.SIGTERM]:
+                previous_handlers[sig] = signal.signal(sig, self.drain)
+        try:
+            while True:
+                running = [i for i in self.instances if i.status == "running"]
+                if not running:
+                    break
+                deadline = time.time() + self.args.health_check_interval
+                # wake up early when an instance exits
+                while time.time() < deadline and all(
+                    i.process.poll() is None for i in running
+                ):
+                    time.sleep(min(0.1, self.args.health_check_interval))
+                now = time.time()
+                for instance in running:
+                    self._read_metrics(instance)
+                    returncode = instance.process.poll()
+                    if returncode is None:
+                        if self.draining:
+                            if now > self.drain_deadline:
+                                self._signal(instance, signal.SIGKILL)
+                        else:
+                            self._check_health(instance, now)
+                        continue
+                    instance.returncode = returncode
+                    if returncode == 0 or self.draining:
+                        instance.status = "finished" if returncode == 0 else "drained"
+                    else:
+                        self._restart(instance, f"exited with code {returncode}")
+                if not self.draining:
+                    self._check_slow(
+                        [i for i in self.instances if i.status == "running"]
+                    )
+                self._write_summary()
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+            for instance in self.instances:
+                if instance.process is not None and instance.process.poll() is None:
+                    self._stop(instance, self.args.drain_timeout)
+            self._write_summary()
+        summary = self.summary()
+        self.verbose(
+            "info",
+            f'Instances summary: {summary["num_samples"]} samples, '
+            + ", ".join(
+                f'instance {i["index"]} {i["status"]} ({i["restarts"]} restarts)'
+                for i in summary["instances"]
+            ),
+        )
+        failed = [i for i in self.instances if i.status == "failed"]
+        if failed:
+            raise subprocess.CalledProcessError(
+                returncode=failed[0].returncode, cmd=failed[0].cmd
+            )
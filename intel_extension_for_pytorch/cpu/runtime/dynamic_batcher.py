@@ -0,0 +1,358 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional, Union
+
+import torch
+
+from .cpupool import CPUPool
+from .multi_stream import (
+    MultiStreamModule,
+    MultiStreamModuleHint,
+    default_multi_stream_module_split_hint,
+    default_multi_stream_module_concat_hint,
+    _get_split_size,
+)
+
+
+def _concat_by_hint(hint_object, input_objects):
+    # Concatenates the inputs of several requests along the dims of the hint.
+    # The inputs hinted with None are taken from the first request.
+    if isinstance(hint_object, (list, tuple)):
+        return type(hint_object)(
+            _concat_by_hint(sub_hint, [obj[i] for obj in input_objects])
+            for i, sub_hint in enumerate(hint_object)
+        )
+    elif isinstance(hint_object, dict):
+        return {
+            key: _concat_by_hint(sub_hint, [obj[key] for obj in input_objects])
+            for key, sub_hint in hint_object.items()
+        }
+    elif isinstance(hint_object, int):
+        return torch.cat(input_objects, dim=hint_object)
+    else:
+        return input_objects[0]
+
+
+def _split_by_hint(hint_object, output_object, sizes):
+    # Splits the batched output along the dims of the hint, returns the output
+    # of each request. The outputs hinted with None are shared by the requests.
+    if isinstance(hint_object, (list, tuple)):
+        per_item = [
+            _split_by_hint(sub_hint, output_object[i], sizes)
+            for i, sub_hint in enumerate(hint_object)
+        ]
+        return [
+            type(output_object)(item[j] for item in per_item) for j in range(len(sizes))
+        ]
+    elif isinstance(hint_object, dict):
+        per_key = {
+            key: _split_by_hint(sub_hint, output_object[key], sizes)
+            for key, sub_hint in hint_object.items()
+        }
+        return [{key: per_key[key][j] for key in per_key} for j in range(len(sizes))]
+    elif isinstance(hint_object, int):
+        return list(torch.split(output_object, sizes, dim=hint_object))
+    else:
+        return [output_object] * len(sizes)
+
+
+def _default_bucket_key(hint_object, input_object):
+    # Requests are batched together only if the inputs to split have the same
+    # dtype and shape except the split dim, and the other inputs are the same.
+    if isinstance(hint_object, (list, tuple)):
+        return tuple(
+            _default_bucket_key(sub_hint, input_object[i])
+            for i, sub_hint in enumerate(hint_object)
+        )
+    elif isinstance(hint_object, dict):
+        return tuple(
+            (key, _default_bucket_key(sub_hint, input_object[key]))
+            for key, sub_hint in hint_object.items()
+        )
+    elif isinstance(hint_object, int):
+        shape = list(input_object.shape)
+        del shape[hint_object]
+        return (input_object.dtype, tuple(shape))
+    elif isinstance(input_object, torch.Tensor):
+        return ("tensor", id(input_object))
+    try:
+        hash(input_object)
+        return input_object
+    except TypeError:
+        return ("object", id(input_object))
+
+
+class _Request(object):
+    def __init__(self, args, kwargs, batch_size, bucket_key):
+        self.args = args
+        self.kwargs = kwargs
+        self.batch_size = batch_size
+        self.bucket_key = bucket_key
+        self.arrival_time = time.perf_counter()
+        self.future = Future()
+
+
+class DynamicBatcher(object):
+    r"""
+    DynamicBatcher coalesces the concurrent inference requests into batches and
+    runs them with a MultiStreamModule. A batch is dispatched once it reaches
+    ``max_batch_size`` samples, or when its oldest request has waited for
+    ``max_wait_ms``. Only requests of the same bucket are batched together, by
+    default the requests whose inputs to split have the same dtype and shape
+    except the batch dim. The inputs are concatenated along the dims of
+    ``input_split_hint``, and the batched output is split back to each request
+    along the dims of ``output_concat_hint``.
+
+    Args:
+        model (torch.jit.ScriptModule or torch.nn.Module): The input model. A
+            MultiStreamModule is used as it is, and ``num_streams``,
+            ``cpu_pool`` and the hints are taken from it.
+        max_batch_size (int): The max number of samples in one batch. A request
+            with more samples is run as a batch of its own. The default value is 32.
+        max_wait_ms (float): The max time in milliseconds a request waits for
+            other requests to fill its batch. The default value is 5.
+        cpu_pool (intel_extension_for_pytorch.cpu.runtime.CPUPool): An
+            intel_extension_for_pytorch.cpu.runtime.CPUPool object, contains
+            all CPU cores used to run the batches.
+        num_streams (Union[int, str]): Number of streams of the MultiStreamModule.
+            The default value is "AUTO".
+        input_split_hint (MultiStreamModuleHint): Hint about how to concat the
+            inputs of the requests and split the batch into streams.
+        output_concat_hint (MultiStreamModuleHint): Hint about how to concat the
+            outputs of the streams and split the output into requests.
+        bucket_fn (Callable): A function taking the ``args`` and ``kwargs`` of a
+            request and returning a hashable key, only requests with the same key
+            are batched together. The default value is None, which means the
+            default bucketing described above.
+
+    Returns:
+        intel_extension_for_pytorch.cpu.runtime.DynamicBatcher: Generated
+        intel_extension_for_pytorch.cpu.runtime.DynamicBatcher object.
+
+    :meta public:
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        cpu_pool: CPUPool = CPUPool(),
+        num_streams: Union[int, str] = "AUTO",
+        input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
+        output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint,
+        bucket_fn: Optional[Callable] = None,
+    ):
+        assert max_batch_size > 0, "max_batch_size of DynamicBatcher must be positive"
+        assert max_wait_ms >= 0, "max_wait_ms of DynamicBatcher must not be negative"
+        if isinstance(model, MultiStreamModule):
+            assert (
+                model.concat_output
+            ), "DynamicBatcher needs a MultiStreamModule with concat_output=True"
+            self.multi_stream_model = model
+        else:
+            self.multi_stream_model = MultiStreamModule(
+                model,
+                num_streams=num_streams,
+                cpu_pool=cpu_pool,
+                concat_output=True,
+                input_split_hint=input_split_hint,
+                output_concat_hint=output_concat_hint,
+            )
+        self.input_split_hint = self.multi_stream_model.input_split_hint
+        self.output_concat_hint = self.multi_stream_model.output_concat_hint
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.bucket_fn = bucket_fn
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.reset_metrics()
+        self.worker = threading.Thread(target=self._serve, daemon=True)
+        self.worker.start()
+
+    def reset_metrics(self):
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_batched_samples = 0
+        self.total_queueing_latency = 0.0
+        self.max_queueing_latency = 0.0
+
+    def get_metrics(self):
+        r"""
+        Returns a dict of the metrics since the creation or the last
+        ``reset_metrics``:
+
+            * ``num_requests``, ``num_batches``: the number of requests and batches run.
+            * ``avg_batch_size``: the average number of samples in a batch.
+            * ``batch_fill_rate``: ``avg_batch_size`` divided by ``max_batch_size``.
+            * ``avg_queueing_latency_ms``, ``max_queueing_latency_ms``: the time from
+              the submission of a request to the dispatch of its batch.
+        """
+        with self.condition:
+            avg_batch_size = (
+                self.num_batched_samples / self.num_batches if self.num_batches else 0.0
+            )
+            return {
+                "num_requests": self.num_requests,
+                "num_batches": self.num_batches,
+                "avg_batch_size": avg_batch_size,
+                "batch_fill_rate": avg_batch_size / self.max_batch_size,
+                "avg_queueing_latency_ms": (
+                    1000.0 * self.total_queueing_latency / self.num_requests
+                    if self.num_requests
+                    else 0.0
+                ),
+                "max_queueing_latency_ms": 1000.0 * self.max_queueing_latency,
+            }
+
+    def submit(self, *args, **kwargs):
+        r"""
+        Queues one request, and returns a ``concurrent.futures.Future`` of its
+        output. The inputs hinted to split carry the samples of this request
+        along the split dim.
+        """
+        batch_size = _get_split_size(
+            (self.input_split_hint.args, self.input_split_hint.kwargs), (args, kwargs)
+        )
+        assert (
+            batch_size is not None
+        ), "DynamicBatcher needs at least one input to split"
+        if self.bucket_fn is not None:
+            bucket_key = self.bucket_fn(args, kwargs)
+        else:
+            bucket_key = _default_bucket_key(
+                (self.input_split_hint.args, self.input_split_hint.kwargs),
+                (args, kwargs),
+            )
+        request = _Request(args, kwargs, batch_size, bucket_key)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Submit request to a closed DynamicBatcher")
+            self.pending.append(request)
+            self.condition.notify()
+        return request.future
+
+    def __call__(self, *args, **kwargs):
+        # Blocks until the batch of this request is finished
+        return self.submit(*args, **kwargs).result()
+
+    async def infer_async(self, *args, **kwargs):
+        r"""
+        The coroutine version of ``__call__``, awaits the output of the request
+        in the running event loop.
+        """
+        return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+    def close(self):
+        r"""
+        Runs the pending requests and stops the batching thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _take_batch(self):
+        # The oldest request decides the bucket of the next batch, the other
+        # requests of this bucket join it in arrival order.
+        bucket_key = self.pending[0].bucket_key
+        batch, rest = [], []
+        num_samples = 0
+        for request in self.pending:
+            if request.bucket_key == bucket_key and (
+                not batch or num_samples + request.batch_size <= self.max_batch_size
+            ):
+                batch.append(request)
+                num_samples += request.batch_size
+            else:
+                rest.append(request)
+        self.pending = rest
+        return batch
+
+    def _ready_to_dispatch(self):
+        if not self.pending:
+            return False
+        if self.closed:
+            return True
+        oldest = self.pending[0]
+        if time.perf_counter() - oldest.arrival_time >= self.max_wait:
+            return True
+        num_samples = sum(
+            request.batch_size
+            for request in self.pending
+            if request.bucket_key == oldest.bucket_key
+        )
+        return num_samples >= self.max_batch_size
+
+    def _serve(self):
+        while True:
+            with self.condition:
+                while not self._ready_to_dispatch():
+                    if self.closed and not self.pending:
+                        return
+                    timeout = None
+                    if self.pending:
+                        timeout = max(
+                            self.pending[0].arrival_time
+                            + self.max_wait
+                            - time.perf_counter(),
+                            0.0,
+                        )
+                    self.condition.wait(timeout)
+                batch = self._take_batch()
+                dispatch_time = time.perf_counter()
+                for request in batch:
+                    queueing_latency = dispatch_time - request.arrival_time
+                    self.total_queueing_latency += queueing_latency
+                    self.max_queueing_latency = max(
+                        self.max_queueing_latency, queueing_latency
+                    )
+                self.num_requests += len(batch)
+                self.num_batches += 1
+                self.num_batched_samples += sum(request.batch_size for request in batch)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        try:
+            if len(batch) == 1:
+                outputs = [self.multi_stream_model(*batch[0].args, **batch[0].kwargs)]
+            else:
+                args = _concat_by_hint(
+                    self.input_split_hint.args, [request.args for request in batch]
+                )
+                kwargs = _concat_by_hint(
+                    self.input_split_hint.kwargs, [request.kwargs for request in batch]
+                )
+                output = self.multi_stream_model(*args, **kwargs)
+                outputs = self._split_output(
+                    output, [request.batch_size for request in batch]
+                )
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        for request, output in zip(batch, outputs):
+            request.future.set_result(output)
+
+    def _split_output(self, output, sizes):
+        # The same structure as returned by MultiStreamModule._concat_output_for_each_stream
+        if self.output_concat_hint.args and self.output_concat_hint.kwargs:
+            return _split_by_hint(
+                (self.output_concat_hint.args[0], self.output_concat_hint.kwargs),
+                output,
+                sizes,
+            )
+        elif self.output_concat_hint.args:
+            return _split_by_hint(self.output_concat_hint.args[0], output, sizes)
+        else:
+            return _split_by_hint(self.output_concat_hint.kwargs, output, sizes)
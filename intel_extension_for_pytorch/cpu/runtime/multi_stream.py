@@ -4,7 +4,11 @@ from typing import Union
 import intel_extension_for_pytorch._C as core
 from .cpupool import CPUPool
 from .task import Task
+import asyncio
 import copy
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from ...utils._logger import logger, WarningType
 
 
@@ -37,6 +41,11 @@ class MultiStreamModuleHint(object):
 default_multi_stream_module_split_hint = MultiStreamModuleHint(0)
 default_multi_stream_module_concat_hint = MultiStreamModuleHint(0)
 
+# Weight of the latest measurement in the latency/throughput EMA of adaptive
+# MultiStreamModule, and the number of forward calls between two re-probes.
+_ADAPTIVE_EMA_ALPHA = 0.2
+_ADAPTIVE_PROBE_INTERVAL = 64
+
 
 def get_default_num_streams(cpu_pool):
     # One core per stream usually brings better overall throughput than other configurations.
@@ -44,6 +53,43 @@ def get_default_num_streams(cpu_pool):
     return cpu_pool.core_ids.__len__()
 
 
+def _get_split_size(hint_object, input_object):
+    # Batchsize along the split dim of the first input hinted with an int.
+    if isinstance(hint_object, (list, tuple)):
+        items = zip(hint_object, input_object)
+    elif isinstance(hint_object, dict):
+        items = ((hint_object[key], input_object[key]) for key in hint_object)
+    elif isinstance(hint_object, int):
+        return input_object.size(hint_object)
+    else:
+        return None
+    for sub_hint, sub_input in items:
+        split_size = _get_split_size(sub_hint, sub_input)
+        if split_size is not None:
+            return split_size
+    return None
+
+
+def _create_tasks(model, core_list, num_streams):
+    # If the core number is not divisible by stream number,
+    # the remainder streams will be allocated one extra core.
+    cores_per_instance = core_list.__len__() // num_streams
+    num_stream_allocated_extra_core = core_list.__len__() % num_streams
+    tasks = []
+    start_core_list_idx = 0
+    end_core_list_idx = 0
+    for j in range(num_streams):
+        if j < num_stream_allocated_extra_core:
+            end_core_list_idx += cores_per_instance + 1
+        else:
+            end_core_list_idx += cores_per_instance
+        tasks.append(
+            Task(model, CPUPool(core_list[start_core_list_idx:end_core_list_idx]))
+        )
+        start_core_list_idx = end_core_list_idx
+    return tasks
+
+
 class MultiStreamModule(nn.Module):
     r"""
     MultiStreamModule supports inference with multi-stream throughput mode.
@@ -81,6 +127,19 @@ class MultiStreamModule(nn.Module):
             how to split the inputs.
         output_concat_hint (MultiStreamModuleHint): Hint to MultiStreamModule about
             how to concat the outputs.
+        adaptive (bool): A flag indicates whether the number of streams and the
+            micro-batch of each stream are tuned online. The default value is
+            False. If True, ``num_streams`` is the max number of streams, and each
+            forward picks among 1, 2, 4, ... up to ``num_streams`` streams the one
+            with the lowest measured latency for inputs of similar batchsize. The
+            cores of ``cpu_pool`` are re-partitioned to the picked number of
+            streams, and the micro-batch of each stream is sized by its measured
+            throughput. With ``concat_output`` as False, the output is the list of
+            the outputs of each micro-batch.
+        work_stealing (bool): Only used when ``adaptive`` is True. A flag indicates
+            whether the batch is split into more micro-batches than streams, so
+            that a stream finished early takes the remaining micro-batches instead
+            of waiting for a straggler. The default value is True.
 
     Returns:
         intel_extension_for_pytorch.cpu.runtime.MultiStreamModule: Generated
@@ -97,6 +156,8 @@ class MultiStreamModule(nn.Module):
         concat_output: bool = True,
         input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
         output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint,
+        adaptive: bool = False,
+        work_stealing: bool = True,
     ):
         super(MultiStreamModule, self).__init__()
         assert (
@@ -136,28 +197,15 @@ class MultiStreamModule(nn.Module):
         if self.num_streams == 1:
             # Sync execution path if num_stream is 1.
             self.model = model
+            # Created on the first forward_async
+            self.async_task = None
         else:
             self.cores_per_instance = self.core_list.__len__() // self.num_streams
-            num_stream_allocated_extra_core = (
-                self.core_list.__len__() % self.num_streams
-            )
-            self.tasks = []
-            start_core_list_idx = 0
-            end_core_list_idx = 0
-            for j in range(self.num_streams):
-                if j < num_stream_allocated_extra_core:
-                    # If the core number is not divisible by stream number,
-                    # the remainder streams(num_stream_allocated_extra_core) will be allocated one extra core.
-                    end_core_list_idx += self.cores_per_instance + 1
-                else:
-                    end_core_list_idx += self.cores_per_instance
-                self.tasks.append(
-                    Task(
-                        model,
-                        CPUPool(self.core_list[start_core_list_idx:end_core_list_idx]),
-                    )
-                )
-                start_core_list_idx = end_core_list_idx
+            self.tasks = _create_tasks(model, self.core_list, self.num_streams)
+        self.adaptive = adaptive and self.num_streams > 1
+        self.work_stealing = work_stealing
+        if self.adaptive:
+            self._init_adaptive_status(model)
         self.concat_output = concat_output
         self.input_split_hint = input_split_hint
         self.output_concat_hint = output_concat_hint
@@ -481,10 +529,217 @@ class MultiStreamModule(nn.Module):
         else:
             return return_obj
 
+    def _init_adaptive_status(self, model):
+        # Candidate stream numbers: powers of 2 below num_streams, and num_streams.
+        # The Tasks of every candidate are created here, the cores of cpu_pool are
+        # split among the Tasks of each candidate as the non-adaptive path does.
+        self.candidate_num_streams = []
+        n = 1
+        while n < self.num_streams:
+            self.candidate_num_streams.append(n)
+            n *= 2
+        self.candidate_num_streams.append(self.num_streams)
+        self.candidate_tasks = {
+            n: (
+                self.tasks
+                if n == self.num_streams
+                else _create_tasks(model, self.core_list, n)
+            )
+            for n in self.candidate_num_streams
+        }
+        # One thread per stream to drive its Task and time it.
+        self.stream_executor = ThreadPoolExecutor(max_workers=self.num_streams)
+        # EMA of the forward latency per sample, keyed by
+        # (batchsize bucket of power of 2, stream number).
+        self.latency_per_sample = {}
+        # Number of forward calls of each batchsize bucket, used to re-probe
+        # the candidates periodically since the load of the machine changes.
+        self.bucket_calls = {}
+        # EMA of the throughput (samples/s) of each stream, keyed by stream number.
+        self.stream_throughput = {n: [None] * n for n in self.candidate_num_streams}
+
+    def _select_num_streams(self, split_size):
+        bucket = split_size.bit_length()
+        calls = self.bucket_calls.get(bucket, 0)
+        self.bucket_calls[bucket] = calls + 1
+        candidates = [n for n in self.candidate_num_streams if n <= split_size]
+        # Explore the candidates without measurement first
+        for n in candidates:
+            if (bucket, n) not in self.latency_per_sample:
+                return n
+        if calls % _ADAPTIVE_PROBE_INTERVAL == _ADAPTIVE_PROBE_INTERVAL - 1:
+            # Re-probe the candidates in turn
+            return candidates[(calls // _ADAPTIVE_PROBE_INTERVAL) % len(candidates)]
+        return min(candidates, key=lambda n: self.latency_per_sample[(bucket, n)])
+
+    def _get_micro_batch_sizes(self, split_size, num_streams):
+        if self.work_stealing:
+            # Equal micro-batches, twice as many as the streams
+            num_chunks = min(split_size, 2 * num_streams)
+            weights = [1.0] * num_chunks
+        else:
+            # One micro-batch per stream, proportional to its throughput
+            throughput = self.stream_throughput[num_streams]
+            measured = [t for t in throughput if t is not None]
+            default = sum(measured) / len(measured) if measured else 1.0
+            weights = [default if t is None else t for t in throughput]
+        # Each micro-batch has at least 1 sample, the rest are allocated by
+        # largest remainder of the weights.
+        num_chunks = len(weights)
+        quotas = [(split_size - num_chunks) * w / sum(weights) for w in weights]
+        sizes = [1 + int(q) for q in quotas]
+        order = sorted(
+            range(num_chunks), key=lambda i: quotas[i] - int(quotas[i]), reverse=True
+        )
+        for i in order[: split_size - sum(sizes)]:
+            sizes[i] += 1
+        return sizes
+
+    def _split_micro_batches(self, args, kwargs):
+        # Picks the number of streams and splits the raw input into micro-batches.
+        # Returns the stream number, the micro-batch inputs and the queue of
+        # micro-batches of each stream.
+        split_size = _get_split_size(
+            (self.input_split_hint.args, self.input_split_hint.kwargs), (args, kwargs)
+        )
+        assert (
+            split_size is not None
+        ), "Adaptive MultiStreamModule needs at least one input to split"
+        num_streams = self._select_num_streams(split_size)
+        sizes = self._get_micro_batch_sizes(split_size, num_streams)
+
+        # The split status is set here so that _do_get_input_for_each_stream
+        # only slices the inputs.
+        self.split_size = split_size
+        self.current_split_end_idx = 0
+        chunk_inputs = []
+        for size in sizes:
+            self.current_split_start_idx = self.current_split_end_idx
+            self.current_split_end_idx += size
+            chunk_args = copy.deepcopy(self.input_split_hint.args)
+            chunk_kwargs = copy.deepcopy(self.input_split_hint.kwargs)
+            for i in range(self.input_split_hint.args_len):
+                self._do_get_input_for_each_stream(
+                    self.input_split_hint.args, args, chunk_args, i, 0
+                )
+            for key in self.input_split_hint.kwargs:
+                self._do_get_input_for_each_stream(
+                    self.input_split_hint.kwargs, kwargs, chunk_kwargs, key, 0
+                )
+            chunk_inputs.append((chunk_args, chunk_kwargs, size))
+
+        if self.work_stealing:
+            # All streams take micro-batches from a shared queue
+            shared_queue = deque(range(len(sizes)))
+            chunk_queues = [shared_queue] * min(num_streams, len(sizes))
+        else:
+            chunk_queues = [deque([stream_id]) for stream_id in range(num_streams)]
+        self.used_num_streams = len(chunk_queues)
+        return num_streams, chunk_inputs, chunk_queues
+
+    def _update_adaptive_status(self, num_streams, split_size, elapsed, stream_stats):
+        key = (split_size.bit_length(), num_streams)
+        latency_per_sample = elapsed / split_size
+        last = self.latency_per_sample.get(key, latency_per_sample)
+        self.latency_per_sample[key] = (
+            1 - _ADAPTIVE_EMA_ALPHA
+        ) * last + _ADAPTIVE_EMA_ALPHA * latency_per_sample
+        throughput = self.stream_throughput[num_streams]
+        for stream_id, (num_samples, busy_time) in enumerate(stream_stats):
+            if num_samples == 0 or busy_time <= 0:
+                continue
+            current = num_samples / busy_time
+            last = throughput[stream_id]
+            throughput[stream_id] = (
+                current
+                if last is None
+                else (1 - _ADAPTIVE_EMA_ALPHA) * last + _ADAPTIVE_EMA_ALPHA * current
+            )
+
+    def _gather_micro_batch_outputs(self, chunk_outputs):
+        if not self.concat_output:
+            return chunk_outputs
+        for chunk_id, chunk_output in enumerate(chunk_outputs):
+            self._generate_outputs([chunk_output], chunk_id)
+        return self._concat_output_for_each_stream()
+
+    def _drive_stream(self, task, chunk_queue, chunk_inputs, chunk_outputs):
+        # Runs the micro-batches taken from chunk_queue on task until it is empty.
+        # Returns the number of samples and the busy time of this stream.
+        num_samples = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                chunk_id = chunk_queue.popleft()
+            except IndexError:
+                break
+            args, kwargs, size = chunk_inputs[chunk_id]
+            chunk_outputs[chunk_id] = task(*args, **kwargs).get()
+            num_samples += size
+        return num_samples, time.perf_counter() - start
+
+    async def _drive_stream_async(self, task, chunk_queue, chunk_inputs, chunk_outputs):
+        # The same as _drive_stream, but awaits the Task in the event loop
+        num_samples = 0
+        start = time.perf_counter()
+        while chunk_queue:
+            chunk_id = chunk_queue.popleft()
+            args, kwargs, size = chunk_inputs[chunk_id]
+            chunk_outputs[chunk_id] = await task.run_async_awaitable(*args, **kwargs)
+            num_samples += size
+        return num_samples, time.perf_counter() - start
+
+    def _adaptive_forward(self, *args, **kwargs):
+        num_streams, chunk_inputs, chunk_queues = self._split_micro_batches(
+            args, kwargs
+        )
+        chunk_outputs = [None] * len(chunk_inputs)
+        start = time.perf_counter()
+        stream_futures = [
+            self.stream_executor.submit(
+                self._drive_stream,
+                self.candidate_tasks[num_streams][stream_id],
+                chunk_queue,
+                chunk_inputs,
+                chunk_outputs,
+            )
+            for stream_id, chunk_queue in enumerate(chunk_queues)
+        ]
+        stream_stats = [future.result() for future in stream_futures]
+        self._update_adaptive_status(
+            num_streams, self.split_size, time.perf_counter() - start, stream_stats
+        )
+        return self._gather_micro_batch_outputs(chunk_outputs)
+
+    async def _adaptive_forward_async(self, *args, **kwargs):
+        num_streams, chunk_inputs, chunk_queues = self._split_micro_batches(
+            args, kwargs
+        )
+        split_size = self.split_size
+        chunk_outputs = [None] * len(chunk_inputs)
+        start = time.perf_counter()
+        stream_stats = await asyncio.gather(
+            *[
+                self._drive_stream_async(
+                    self.candidate_tasks[num_streams][stream_id],
+                    chunk_queue,
+                    chunk_inputs,
+                    chunk_outputs,
+                )
+                for stream_id, chunk_queue in enumerate(chunk_queues)
+            ]
+        )
+        self._update_adaptive_status(
+            num_streams, split_size, time.perf_counter() - start, stream_stats
+        )
+        return self._gather_micro_batch_outputs(chunk_outputs)
+
     def forward(self, *args, **kwargs):
         # Reset the forward status to default value which mainly contains information
         # to split inputs. They will init afterwards for each forward call.
         self.reset_forward_status()
+        if self.adaptive:
+            return self._adaptive_forward(*args, **kwargs)
         if self.num_streams == 1:
             # Sync execution path if num_stream is 1
             if not core.is_same_core_affinity_setting(self.core_list):
@@ -523,6 +778,41 @@ class MultiStreamModule(nn.Module):
             self._concat_output_for_each_stream() if self.concat_output else results_raw
         )
 
+    async def forward_async(self, *args, **kwargs):
+        r"""
+        The coroutine version of ``forward``. The inputs are split and submitted
+        to the streams as ``forward`` does, but the results are awaited in the
+        running event loop instead of blocking the calling thread, so that one
+        event loop can keep several requests in flight on the streams.
+        """
+        self.reset_forward_status()
+        if self.adaptive:
+            return await self._adaptive_forward_async(*args, **kwargs)
+        if self.num_streams == 1:
+            # The sync path runs in the calling thread, use a Task to not block
+            # the event loop.
+            if self.async_task is None:
+                self.async_task = Task(self.model, self.cpu_pool)
+            results_raw = await self.async_task.run_async_awaitable(*args, **kwargs)
+            return results_raw if self.concat_output else [results_raw]
+
+        # Split the raw input to generate input for each stream
+        self._get_input_for_each_stream(self.input_split_hint, *args, **kwargs)
+        results_raw = await asyncio.gather(
+            *[
+                self.tasks[stream_id].run_async_awaitable(
+                    *(self.args_streams_input[stream_id]),
+                    **(self.kwargs_streams_input[stream_id]),
+                )
+                for stream_id in range(self.used_num_streams)
+            ]
+        )
+        if not self.concat_output:
+            return list(results_raw)
+        for stream_id, stream_output in enumerate(results_raw):
+            self._generate_outputs([stream_output], stream_id)
+        return self._concat_output_for_each_stream()
+
     def get_stream_number(self):
         return self.num_streams
 
@@ -573,26 +863,7 @@ class _MultiStreamBenchmarkModule(nn.Module):
             self.model = model
         else:
             self.cores_per_instance = self.core_list.__len__() // self.num_streams
-            num_stream_allocated_extra_core = (
-                self.core_list.__len__() % self.num_streams
-            )
-            self.tasks = []
-            start_core_list_idx = 0
-            end_core_list_idx = 0
-            for j in range(self.num_streams):
-                if j < num_stream_allocated_extra_core:
-                    # If the core number is not divisible by stream number,
-                    # the remainder streams(num_stream_allocated_extra_core) will be allocated one extra core.
-                    end_core_list_idx += self.cores_per_instance + 1
-                else:
-                    end_core_list_idx += self.cores_per_instance
-                self.tasks.append(
-                    Task(
-                        model,
-                        CPUPool(self.core_list[start_core_list_idx:end_core_list_idx]),
-                    )
-                )
-                start_core_list_idx = end_core_list_idx
+            self.tasks = _create_tasks(model, self.core_list, self.num_streams)
 
     def forward(self, *args, **kwargs):
         if self.num_streams == 1:
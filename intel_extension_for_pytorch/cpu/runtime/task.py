@@ -1,3 +1,4 @@
+import asyncio
 import torch
 import intel_extension_for_pytorch as ipex
 from .cpupool import CPUPool
@@ -31,6 +32,31 @@ class Task(object):
         # async execution
         return self._task.run_async(*args, **kwargs)
 
+    def run_async_awaitable(self, *args, **kwargs):
+        r"""
+        Submits the computation like ``__call__``, and returns an
+        ``asyncio.Future`` of the running event loop instead of a blocking
+        future. The Future is resolved by the event loop once the Task finishes,
+        so no Python thread waits for the result. It must be called with a
+        running event loop, e.g. ``y = await task.run_async_awaitable(x)``.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future_tensor = self._task.run_async(*args, **kwargs)
+
+        def _set_result():
+            # Run in the event loop, the result is ready and get() doesn't block
+            if future.cancelled():
+                return
+            try:
+                future.set_result(future_tensor.get())
+            except Exception as e:
+                future.set_exception(e)
+
+        # The done callback is invoked in the thread of the Task
+        future_tensor.add_done_callback(lambda: loop.call_soon_threadsafe(_set_result))
+        return future
+
     def run_sync(self, *args, **kwargs):
         # sync execution
         return self._task.run_sync(*args, **kwargs)
@@ -181,7 +181,11 @@ void InitIpexModuleBindings(py::module m) {
 
   // runtime
   py::class_<torch_ipex::runtime::FutureTensor>(m, "FutureTensor")
-      .def("get", &torch_ipex::runtime::FutureTensor::get);
+      .def("get", &torch_ipex::runtime::FutureTensor::get)
+      .def("done", &torch_ipex::runtime::FutureTensor::done)
+      .def(
+          "add_done_callback",
+          &torch_ipex::runtime::FutureTensor::add_done_callback);
 
   // The holder type is std::shared_ptr<torch_ipex::runtime::CPUPool>.
   // Please use std::shared_ptr<torch_ipex::runtime::CPUPool> as funtion
@@ -276,7 +280,14 @@ void InitIpexModuleBindings(py::module m) {
 
   // communication related
   m.def("get_rank", &torch_ipex::cpu::get_rank);
-  m.def("tpp_shm_allreduce", &torch_ipex::cpu::tpp_shmallreduce_forward);
+  // releases the GIL so that it can run in a communication thread
+  m.def(
+      "tpp_shm_allreduce",
+      &torch_ipex::cpu::tpp_shmallreduce_forward,
+      py::arg("t_in"),
+      py::arg("process_group"),
+      py::arg("num_threads") = 0,
+      py::call_guard<py::gil_scoped_release>());
   m.def("get_world_size", &torch_ipex::cpu::get_world_size);
   m.def("barrier", &torch_ipex::cpu::barrier);
 
@@ -21,6 +21,46 @@ py::object FutureTensor::get() {
   }
 }
 
+bool FutureTensor::done() {
+  std::lock_guard<std::mutex> lock(this->state->mutex);
+  return this->state->done;
+}
+
+void FutureTensor::add_done_callback(py::function callback) {
+  {
+    std::lock_guard<std::mutex> lock(this->state->mutex);
+    if (!this->state->done) {
+      this->state->callbacks.emplace_back(std::move(callback));
+      return;
+    }
+  }
+  // Already finished, the GIL is held by the caller
+  callback();
+}
+
+void FutureState::mark_done() {
+  std::vector<py::function> callbacks_to_run;
+  {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    this->done = true;
+    callbacks_to_run.swap(this->callbacks);
+  }
+  if (callbacks_to_run.empty()) {
+    return;
+  }
+  pybind11::gil_scoped_acquire gil_guard;
+  for (auto& callback : callbacks_to_run) {
+    try {
+      callback();
+    } catch (py::error_already_set& e) {
+      // There is no caller to propagate the exception to
+      e.discard_as_unraisable(__func__);
+    }
+  }
+  // py::function must be released with GIL
+  callbacks_to_run.clear();
+}
+
 TaskModule::TaskModule(
     const torch::jit::Module& script_module,
     const torch_ipex::runtime::CPUPool& cpu_pool,
@@ -51,6 +91,8 @@ std::unique_ptr<FutureTensor> TaskModule::run_async(
   std::unique_ptr<FutureTensor> future_tensor_result =
       std::make_unique<FutureTensor>();
 
+  auto state = future_tensor_result->state;
+
   // Get the thread_local status such as grad_mode and set it into the Async
   // thread
   auto grad_mode = at::GradMode::is_enabled();
@@ -84,28 +126,33 @@ std::unique_ptr<FutureTensor> TaskModule::run_async(
         if (this->task_executor->is_stop())
           throw std::runtime_error(
               "submit TaskModule(py::object) on stopped ThreadPool");
-        this->task_executor->get_tasks().emplace([task, grad_mode]() {
+        this->task_executor->get_tasks().emplace([task, grad_mode, state]() {
           // set the thread local status, such as the grad mode before
           // execuating the status
           at::GradMode::set_enabled(grad_mode);
           // execuate the task
           (*task)();
+          state->mark_done();
         });
       }
       this->task_executor->get_condition().notify_one();
     }
   } else {
     CHECK(this->module_initialized_);
-    this->args = args;
-    this->kwargs = kwargs;
+    // Each submission owns its inputs, since several tasks may be in flight.
+    // They are moved out and released inside the task while GIL is held.
+    auto inputs = std::make_shared<std::pair<py::args, py::kwargs>>(
+        std::move(args), std::move(kwargs));
 
     typedef std::function<py::object()> SubmitFunctionType;
     typedef decltype(SubmitFunctionType()()) return_type;
     auto task = std::make_shared<std::packaged_task<return_type()>>(
-        [&, this]() -> py::object {
+        [inputs, this]() -> py::object {
           {
             pybind11::gil_scoped_acquire gil_guard;
-            return this->module_(*(this->args), **(this->kwargs));
+            py::args task_args = std::move(inputs->first);
+            py::kwargs task_kwargs = std::move(inputs->second);
+            return this->module_(*task_args, **task_kwargs);
           }
         });
 
@@ -118,12 +165,13 @@ std::unique_ptr<FutureTensor> TaskModule::run_async(
       if (this->task_executor->is_stop())
         throw std::runtime_error(
             "submit TaskModule(py::object) on stopped ThreadPool");
-      this->task_executor->get_tasks().emplace([task, grad_mode]() {
+      this->task_executor->get_tasks().emplace([task, grad_mode, state]() {
         // set the thread local status, such as the grad mode before execuating
         // the status
         at::GradMode::set_enabled(grad_mode);
         // execuate the task
         (*task)();
+        state->mark_done();
       });
     }
     this->task_executor->get_condition().notify_one();
@@ -5,6 +5,7 @@
 #include <future>
 #include <iostream>
 #include <memory>
+#include <mutex>
 #include <stdexcept>
 #include <vector>
 
@@ -17,6 +18,16 @@
 
 namespace torch_ipex {
 namespace runtime {
+/*FutureState is shared by the FutureTensor and the task in the TaskExecutor, it
+ * records the completion and runs the done callbacks*/
+struct FutureState {
+  std::mutex mutex;
+  bool done{false};
+  std::vector<py::function> callbacks;
+  // invoked by the TaskExecutor thread (without GIL) once the task finished
+  void mark_done();
+};
+
 struct FutureTensor {
   // script module
   std::future<c10::IValue> future_script_tensor;
@@ -24,8 +35,15 @@ struct FutureTensor {
   // nn module
   std::future<py::object> future_tensor;
   bool module_initialized_{false};
+  // completion status
+  std::shared_ptr<FutureState> state{std::make_shared<FutureState>()};
   // get the result
   py::object get();
+  // whether the result is ready, get() will not block if true
+  bool done();
+  // callback is invoked without argument in the TaskExecutor thread once the
+  // task finished, or immediately if it has already finished
+  void add_done_callback(py::function callback);
 };
 
 /*TaskModule is used to handle Python input of nn.module or script module*/
@@ -57,8 +75,6 @@ class TaskModule {
 
   // TaskExecutor
   std::shared_ptr<TaskExecutor> task_executor;
-  py::args args;
-  py::kwargs kwargs;
 };
 
 } // namespace runtime
@@ -1,8 +1,9 @@
 import warnings
-from .frontend import optimize
+from .frontend import optimize, save_optimized, load_optimized
 from . import modules
 from . import functional
 from . import quantization
+from . import serving
 
 try:
     from . import generation
@@ -1,3 +1,9 @@
-from intel_extension_for_pytorch.transformers.optimize import optimize
+from intel_extension_for_pytorch.transformers.optimize import (
+    optimize,
+    save_optimized,
+    load_optimized,
+)
 
 optimize = optimize
+save_optimized = save_optimized
+load_optimized = load_optimized
@@ -139,8 +139,10 @@ def indirect_access_kv_cache_attention(
 
         head_mask (torch.Tensor): Head mask tensor which is not supported by kernel yet.
         attention_mask(torch.Tensor): Attention mask information.
-        text_max_length (int) : the max length of kv cache to be used for generation
-            (allocate the pre-cache buffer).
+        text_max_length (int) : the segment length of kv cache to be used for generation.
+            The first token allocates the pre-cache buffer in whole segments of text_max_length
+            tokens, and a full buffer is extended to the larger of the next segment multiple and
+            twice its size. If it is 0, the buffer is doubled.
 
     Return:
         attn_output: weighted value which is the output of scale dot product.
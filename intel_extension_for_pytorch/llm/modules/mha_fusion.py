@@ -467,10 +467,27 @@ class PagedAttention:
         slot_mapping (torch.Tensor):  It stores the position to store the key/value in the pre-allocated buffers.
             The shape should be the number of sequences. For sequence ``i``, the ``slot_mapping[i] // block_number``
             can get the block index, and the ``slot_mapping % block_size`` can get the offset of this block.
-        kv_cache_dtype (str): The data type of the key and value cache.
+        kv_cache_dtype (str): The data type of the key and value cache, "auto" for the dtype of
+            ``key_cache``, "fp8"/"fp8_e5m2" for the float8_e5m2 cache, or "int8"/"int4" for the
+            quantized cache.
         k_scale (float): The scale used by the fp8 key cache.
         v_scale (float): The scale used by the fp8 value cache.
 
+    The int8/int4 key and value caches are allocated as torch.uint8 and the last dim of their
+    shape should be ``get_kv_cache_head_size(head_size, kv_cache_dtype)`` instead of head_size.
+    Every (token, head) row is quantized asymmetrically when it is stored, and its fp32 scale and
+    min are kept at the end of the row, one pair for int8 and one pair for every 32 elements of
+    head_size for int4. The attention methods take the quantized caches as they are.
+
+    [class method]: get_kv_cache_head_size
+
+    .. highlight:: python
+    .. code-block:: python
+
+        ipex.llm.modules.PagedAttention.get_kv_cache_head_size(head_size, kv_cache_dtype)
+
+    Returns the size of the last dim of the key/value cache for ``kv_cache_dtype``.
+
     [class method]: reshape_and_cache_flash
     ipex.llm.modules.PagedAttention.reshape_and_cache_flash(key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale)
     This operator is used to store the key/value token states into the pre-allcated kv_cache buffers of paged attention.
@@ -613,6 +630,17 @@ class PagedAttention:
             v_scale,
         )
 
+    @classmethod
+    def get_kv_cache_head_size(cls, head_size: int, kv_cache_dtype: str = "auto"):
+        # keep aligned with csrc/cpu/aten/utils/kv_cache_quant.h
+        if kv_cache_dtype == "int8":
+            return head_size + 8
+        if kv_cache_dtype == "int4":
+            assert head_size % 2 == 0, "int4 kv cache needs an even head_size"
+            group_size = 32 if head_size % 32 == 0 else head_size
+            return head_size // 2 + head_size // group_size * 8
+        return head_size
+
     @classmethod
     def reshape_and_cache_flash(
         cls,
@@ -739,12 +767,24 @@ class IndirectAccessKVCacheAttention(nn.Module):
     The shape of the pre-allocated key(value) buffer is [max_seq, beam*batch, head_num, head_size],
     the hidden state of key/value which is the shape of [beam*batch, head_num, head_size] is stored token by token.
     All beam idx information of every timestamp is also stored in a Tensor with the shape of [max_seq, beam*batch].
+    The buffers are allocated in segments of text_max_length tokens and at least doubled when they are full, so
+    max_seq follows the actual sequence length rather than a fixed max length, the copies of the growth stay
+    linear in the sequence length, and the buffers are released once the generation is done.
+    With ``ipex.llm.optimize``, the segment length is taken from ``model.config.text_max_length`` (2048 by default).
+
+    The kv_cache buffers are quantized to int8 or int4 when the placeholder key_cache of the first token
+    is a torch.uint8 or torch.uint4 tensor (with ``ipex.llm.optimize``, set ``model.config.kv_cache_dtype``).
+    They are then torch.uint8 tensors whose last dim holds the codes of head_size elements followed by the
+    fp32 scales and mins, one pair for int8 and one pair for every 32 elements of head_size for int4.
 
     `module init`
 
     Args:
-        text_max_length (int) : the max length of kv cache to be used
-            for generation (allocate the pre-cache buffer).
+        text_max_length (int) : the segment length of kv cache to be used
+            for generation. The first token allocates the pre-cache buffer in whole
+            segments, and a full buffer is extended to the larger of the next
+            segment multiple and twice its size, so it is not extended by one
+            segment at a time.
 
     `forward()`
 
@@ -0,0 +1,11 @@
+from .sequence import SamplingParams, Sequence, SequenceStatus
+from .block_manager import (
+    BlockAllocator,
+    BlockSpaceManager,
+    PrefixCachingBlockAllocator,
+)
+from .scheduler import Scheduler, SchedulerConfig, SchedulerOutput
+from .attention import PagedAttentionMetadata, paged_attention
+from .lora import LoRAConfig, LoRALinear, LoRAManager
+from .spec_decode import DraftModelProposer, NgramProposer, SpeculativeConfig
+from .engine import Engine, RequestOutput
@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import torch
+
+from ..modules import PagedAttention
+from .block_manager import BlockSpaceManager
+
+
+@dataclass
+class PagedAttentionMetadata:
+    r"""
+    The batch layout of one serving iteration, shared by all decoder layers.
+    The tokens of all scheduled sequences are flattened into one dimension and
+    prefill chunks and decode tokens can be mixed in the same batch.
+
+    Args:
+        slot_mapping (torch.Tensor): [num_tokens], the KV cache slot of every token.
+        block_tables (torch.Tensor): [num_seqs, max_num_blocks_per_seq].
+        cu_seqlens_q (torch.Tensor): [num_seqs + 1], accumulated number of new tokens.
+        cu_seqlens_kv (torch.Tensor): [num_seqs + 1], accumulated context lengths
+            (cached tokens plus new tokens).
+        max_seqlen_q (int): the max number of new tokens of one sequence.
+        max_seqlen_kv (int): the max context length of one sequence.
+        kv_cache_dtype (str): the data type of the KV cache. Default is "auto".
+    """
+
+    slot_mapping: torch.Tensor
+    block_tables: torch.Tensor
+    cu_seqlens_q: torch.Tensor
+    cu_seqlens_kv: torch.Tensor
+    max_seqlen_q: int
+    max_seqlen_kv: int
+    kv_cache_dtype: str = "auto"
+
+    @property
+    def num_seqs(self) -> int:
+        return self.cu_seqlens_q.size(0) - 1
+
+    @property
+    def last_token_indices(self) -> torch.Tensor:
+        return self.cu_seqlens_q[1:].long() - 1
+
+
+def prepare_paged_inputs(
+    block_manager: BlockSpaceManager, batch: List[Tuple[int, List[int], int]]
+):
+    r"""
+    Flattens a batch of (seq_id, new token ids, position of the first new token)
+    into the model inputs ``input_ids``, ``positions`` and the
+    ``PagedAttentionMetadata`` of the batch. The slots of the new tokens must be
+    allocated in ``block_manager``.
+    """
+    input_ids, positions, slot_mapping = [], [], []
+    cu_seqlens_q, cu_seqlens_kv = [0], [0]
+    block_tables = []
+    for seq_id, token_ids, start in batch:
+        end = start + len(token_ids)
+        input_ids.extend(token_ids)
+        positions.extend(range(start, end))
+        slot_mapping.extend(
+            block_manager.get_slot(seq_id, pos) for pos in range(start, end)
+        )
+        cu_seqlens_q.append(cu_seqlens_q[-1] + len(token_ids))
+        cu_seqlens_kv.append(cu_seqlens_kv[-1] + end)
+        block_tables.append(block_manager.get_block_table(seq_id))
+    max_num_blocks = max(len(table) for table in block_tables)
+    block_tables = [
+        table + [0] * (max_num_blocks - len(table)) for table in block_tables
+    ]
+    attn_metadata = PagedAttentionMetadata(
+        slot_mapping=torch.tensor(slot_mapping, dtype=torch.int32),
+        block_tables=torch.tensor(block_tables, dtype=torch.int32),
+        cu_seqlens_q=torch.tensor(cu_seqlens_q, dtype=torch.int32),
+        cu_seqlens_kv=torch.tensor(cu_seqlens_kv, dtype=torch.int32),
+        max_seqlen_q=max(len(token_ids) for _, token_ids, _ in batch),
+        max_seqlen_kv=max(start + len(token_ids) for _, token_ids, start in batch),
+    )
+    return (
+        torch.tensor(input_ids, dtype=torch.long),
+        torch.tensor(positions, dtype=torch.long),
+        attn_metadata,
+    )
+
+
+def paged_attention(
+    query: torch.Tensor,
+    key: torch.Tensor,
+    value: torch.Tensor,
+    key_cache: torch.Tensor,
+    value_cache: torch.Tensor,
+    attn_metadata: PagedAttentionMetadata,
+    scale: float,
+    alibi_slopes: Optional[torch.Tensor] = None,
+    window_size: int = -1,
+    softcap: float = -1.0,
+):
+    r"""
+    Stores the new key/value tokens into the paged KV cache and computes the
+    causal attention of the new query tokens against their whole context.
+    It is the attention used by the models served by ``ipex.llm.serving.Engine``.
+
+    Args:
+        query (torch.Tensor): [num_tokens, num_head, head_size].
+        key (torch.Tensor): [num_tokens, num_kv_head, head_size].
+        value (torch.Tensor): [num_tokens, num_kv_head, head_size].
+        key_cache (torch.Tensor): [num_blocks, num_kv_head, block_size, head_size].
+        value_cache (torch.Tensor): [num_blocks, num_kv_head, block_size, head_size].
+        attn_metadata (PagedAttentionMetadata): the batch layout of this iteration.
+        scale (float): the scale used by the scale-dot-product.
+        alibi_slopes (torch.Tensor, optinal): the alibi slope with the shape of (num_heads).
+        window_size (int): left size of sliding window, default is -1.
+        softcap (float): the positive softcap value to apply on the attention weights, default is -1.
+
+    Return:
+        output (torch.Tensor): [num_tokens, num_head, head_size].
+    """
+
+    PagedAttention.reshape_and_cache(
+        key,
+        value,
+        key_cache,
+        value_cache,
+        attn_metadata.slot_mapping,
+        attn_metadata.kv_cache_dtype,
+    )
+    output = torch.empty_like(query)
+    PagedAttention.flash_attn_varlen_func(
+        output,
+        query,
+        key_cache,
+        value_cache,
+        attn_metadata.cu_seqlens_q,
+        attn_metadata.cu_seqlens_kv,
+        attn_metadata.max_seqlen_q,
+        attn_metadata.max_seqlen_kv,
+        scale,
+        True,
+        attn_metadata.block_tables,
+        alibi_slopes,
+        window_size,
+        -1,
+        attn_metadata.kv_cache_dtype,
+        softcap=softcap,
+    )
+    return output
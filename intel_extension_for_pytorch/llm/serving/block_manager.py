@@ -0,0 +1,292 @@
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence
+
+
+def hash_block_tokens(parent_hash: Optional[int], token_ids: Sequence[int]) -> int:
+    r"""
+    The key of a full KV cache block. It chains the hash of the previous block,
+    so that two blocks only match when the whole prefix up to them matches.
+    """
+    return hash((parent_hash, tuple(token_ids)))
+
+
+def compute_block_hashes(
+    token_ids: Sequence[int], block_size: int, num_blocks: int
+) -> List[int]:
+    hashes = []
+    parent_hash = None
+    for i in range(num_blocks):
+        parent_hash = hash_block_tokens(
+            parent_hash, token_ids[i * block_size : (i + 1) * block_size]
+        )
+        hashes.append(parent_hash)
+    return hashes
+
+
+class BlockAllocator:
+    r"""
+    Allocator of the physical blocks of a paged KV cache. Blocks are handed out
+    from a free list and reference counted, so that a block can be shared by
+    several sequences and is only returned to the free list once the last
+    owner releases it.
+
+    Args:
+        num_blocks (int): the number of physical blocks in the KV cache buffers.
+    """
+
+    def __init__(self, num_blocks: int):
+        assert num_blocks > 0, "BlockAllocator: num_blocks should be positive"
+        self.num_blocks = num_blocks
+        self.free_blocks = deque(range(num_blocks))
+        self.ref_counts = [0] * num_blocks
+
+    @property
+    def num_free_blocks(self) -> int:
+        return len(self.free_blocks)
+
+    def allocate(self) -> int:
+        if not self.free_blocks:
+            raise RuntimeError("BlockAllocator: out of KV cache blocks")
+        block = self.free_blocks.popleft()
+        self.ref_counts[block] = 1
+        return block
+
+    def incref(self, block: int):
+        assert self.ref_counts[block] > 0, f"block {block} is not allocated"
+        self.ref_counts[block] += 1
+
+    def free(self, block: int):
+        assert self.ref_counts[block] > 0, f"double free of block {block}"
+        self.ref_counts[block] -= 1
+        if self.ref_counts[block] == 0:
+            self.free_blocks.append(block)
+
+
+class PrefixCachingBlockAllocator(BlockAllocator):
+    r"""
+    Block allocator that keeps the blocks of shared prefixes after their last
+    owner releases them. A full block is registered with the hash of its
+    tokens (and of the tokens before it), later sequences with the same prefix
+    take the cached block instead of recomputing it. Cached blocks that are not
+    used by any sequence are evicted in LRU order when a new block is needed or
+    when more than ``max_cached_blocks`` of them are retained.
+
+    Args:
+        num_blocks (int): the number of physical blocks in the KV cache buffers.
+        max_cached_blocks (int): the max number of unused blocks kept for prefix
+            reuse. Default is None, which means bounded by ``num_blocks`` only.
+    """
+
+    def __init__(self, num_blocks: int, max_cached_blocks: Optional[int] = None):
+        super().__init__(num_blocks)
+        self.max_cached_blocks = max_cached_blocks
+        self.hash_to_block: Dict[int, int] = {}
+        self.block_to_hash: Dict[int, int] = {}
+        # unused cached blocks, the least recently used first
+        self.evictor: "OrderedDict[int, None]" = OrderedDict()
+
+    @property
+    def num_free_blocks(self) -> int:
+        return len(self.free_blocks) + len(self.evictor)
+
+    @property
+    def num_cached_blocks(self) -> int:
+        return len(self.block_to_hash)
+
+    def _evict(self) -> int:
+        block, _ = self.evictor.popitem(last=False)
+        del self.hash_to_block[self.block_to_hash.pop(block)]
+        return block
+
+    def allocate(self) -> int:
+        if not self.free_blocks and self.evictor:
+            self.free_blocks.append(self._evict())
+        return super().allocate()
+
+    def free(self, block: int):
+        assert self.ref_counts[block] > 0, f"double free of block {block}"
+        self.ref_counts[block] -= 1
+        if self.ref_counts[block] > 0:
+            return
+        if block not in self.block_to_hash:
+            self.free_blocks.append(block)
+            return
+        self.evictor[block] = None
+        if self.max_cached_blocks is not None:
+            while len(self.evictor) > self.max_cached_blocks:
+                self.free_blocks.append(self._evict())
+
+    def peek(self, block_hash: int) -> bool:
+        return block_hash in self.hash_to_block
+
+    def lookup(self, block_hash: int) -> Optional[int]:
+        r"""
+        Returns the cached block of ``block_hash`` with one more reference,
+        or None on a cache miss.
+        """
+        block = self.hash_to_block.get(block_hash, None)
+        if block is None:
+            return None
+        if block in self.evictor:
+            del self.evictor[block]
+            self.ref_counts[block] = 1
+        else:
+            self.incref(block)
+        return block
+
+    def register(self, block: int, block_hash: int):
+        r"""
+        Registers a full block whose key/value are computed. If the same prefix
+        is already cached in another block, the first one is kept.
+        """
+        if block_hash in self.hash_to_block or block in self.block_to_hash:
+            return
+        self.hash_to_block[block_hash] = block
+        self.block_to_hash[block] = block_hash
+
+
+class BlockSpaceManager:
+    r"""
+    Maps the logical token positions of every running sequence to the physical
+    slots of the paged KV cache (the block tables consumed by
+    ``ipex.llm.modules.PagedAttention``).
+
+    Args:
+        block_size (int): the number of tokens stored in one block.
+        num_blocks (int): the number of physical blocks in the KV cache buffers.
+        watermark (float): fraction of blocks kept free when admitting new
+            sequences, so that running sequences can keep growing without being
+            preempted immediately. Default is 0.01.
+        enable_prefix_caching (bool): keep the full blocks of computed tokens,
+            keyed by the hash of their prefix, and reuse them for the sequences
+            that start with the same tokens. Default is False.
+        max_cached_blocks (int): the max number of unused blocks kept for prefix
+            reuse when ``enable_prefix_caching`` is True. Default is None.
+    """
+
+    def __init__(
+        self,
+        block_size: int,
+        num_blocks: int,
+        watermark: float = 0.01,
+        enable_prefix_caching: bool = False,
+        max_cached_blocks: Optional[int] = None,
+    ):
+        self.block_size = block_size
+        self.enable_prefix_caching = enable_prefix_caching
+        if enable_prefix_caching:
+            self.allocator = PrefixCachingBlockAllocator(num_blocks, max_cached_blocks)
+        else:
+            self.allocator = BlockAllocator(num_blocks)
+        self.watermark_blocks = int(watermark * num_blocks)
+        self.block_tables: Dict[int, List[int]] = {}
+        # hashes of the registered full blocks of every sequence
+        self.block_hashes: Dict[int, List[int]] = {}
+        self.num_queried_prefix_tokens = 0
+        self.num_hit_prefix_tokens = 0
+
+    def _num_required_blocks(self, num_tokens: int) -> int:
+        return (num_tokens + self.block_size - 1) // self.block_size
+
+    @property
+    def num_free_blocks(self) -> int:
+        return self.allocator.num_free_blocks
+
+    def can_allocate(self, num_tokens: int) -> bool:
+        return (
+            self.allocator.num_free_blocks - self._num_required_blocks(num_tokens)
+            >= self.watermark_blocks
+        )
+
+    def can_append_slots(self, seq_id: int, num_tokens: int) -> bool:
+        block_table = self.block_tables.get(seq_id, [])
+        num_new_blocks = self._num_required_blocks(num_tokens) - len(block_table)
+        return num_new_blocks <= self.allocator.num_free_blocks
+
+    def append_slots(self, seq_id: int, num_tokens: int):
+        r"""
+        Makes sure the blocks of ``seq_id`` can hold ``num_tokens`` tokens in total.
+        """
+        block_table = self.block_tables.setdefault(seq_id, [])
+        while len(block_table) < self._num_required_blocks(num_tokens):
+            block_table.append(self.allocator.allocate())
+
+    def free(self, seq_id: int):
+        self.block_hashes.pop(seq_id, None)
+        for block in self.block_tables.pop(seq_id, []):
+            self.allocator.free(block)
+
+    @property
+    def prefix_cache_hit_rate(self) -> float:
+        if self.num_queried_prefix_tokens == 0:
+            return 0.0
+        return self.num_hit_prefix_tokens / self.num_queried_prefix_tokens
+
+    def _num_cacheable_blocks(self, token_ids: List[int]) -> int:
+        # the last token is always computed to get the logits of the sequence
+        return (len(token_ids) - 1) // self.block_size
+
+    def get_num_cached_tokens(self, token_ids: List[int]) -> int:
+        r"""
+        Returns the length of the longest cached prefix of ``token_ids``
+        without taking its blocks.
+        """
+        if not self.enable_prefix_caching:
+            return 0
+        num_blocks = 0
+        for block_hash in compute_block_hashes(
+            token_ids, self.block_size, self._num_cacheable_blocks(token_ids)
+        ):
+            if not self.allocator.peek(block_hash):
+                break
+            num_blocks += 1
+        return num_blocks * self.block_size
+
+    def allocate_cached_prefix(self, seq_id: int, token_ids: List[int]) -> int:
+        r"""
+        Starts the block table of a new sequence with the cached blocks of the
+        longest cached prefix of ``token_ids``, and returns its length. The
+        generation starts from the first uncached token.
+        """
+        if not self.enable_prefix_caching:
+            return 0
+        assert not self.block_tables.get(seq_id, []), f"{seq_id} already has blocks"
+        block_table = self.block_tables.setdefault(seq_id, [])
+        hashes = compute_block_hashes(
+            token_ids, self.block_size, self._num_cacheable_blocks(token_ids)
+        )
+        for block_hash in hashes:
+            block = self.allocator.lookup(block_hash)
+            if block is None:
+                break
+            block_table.append(block)
+        self.block_hashes[seq_id] = hashes[: len(block_table)]
+        num_cached_tokens = len(block_table) * self.block_size
+        self.num_queried_prefix_tokens += len(token_ids)
+        self.num_hit_prefix_tokens += num_cached_tokens
+        return num_cached_tokens
+
+    def mark_computed(self, seq_id: int, token_ids: List[int], num_computed: int):
+        r"""
+        Registers the blocks of ``seq_id`` that are full of computed tokens
+        in the prefix cache.
+        """
+        if not self.enable_prefix_caching:
+            return
+        hashes = self.block_hashes.setdefault(seq_id, [])
+        block_table = self.block_tables[seq_id]
+        while (len(hashes) + 1) * self.block_size <= num_computed:
+            i = len(hashes)
+            block_hash = hash_block_tokens(
+                hashes[-1] if hashes else None,
+                token_ids[i * self.block_size : (i + 1) * self.block_size],
+            )
+            hashes.append(block_hash)
+            self.allocator.register(block_table[i], block_hash)
+
+    def get_block_table(self, seq_id: int) -> List[int]:
+        return self.block_tables[seq_id]
+
+    def get_slot(self, seq_id: int, position: int) -> int:
+        block = self.block_tables[seq_id][position // self.block_size]
+        return block * self.block_size + position % self.block_size
@@ -0,0 +1,397 @@
+import itertools
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+from .attention import prepare_paged_inputs
+from .block_manager import BlockSpaceManager
+from .lora import LoRAManager
+from .scheduler import Scheduler, SchedulerConfig
+from .sequence import SamplingParams, Sequence, SequenceStatus
+from .spec_decode import DraftModelProposer, NgramProposer, SpeculativeConfig
+
+
+@dataclass
+class RequestOutput:
+    request_id: str
+    prompt_token_ids: List[int]
+    output_token_ids: List[int]
+    finished: bool
+    finish_reason: Optional[str] = None
+
+
+def _finish_reason(status: SequenceStatus) -> Optional[str]:
+    return {
+        SequenceStatus.FINISHED_STOPPED: "stop",
+        SequenceStatus.FINISHED_LENGTH: "length",
+        SequenceStatus.FINISHED_ABORTED: "abort",
+    }.get(status, None)
+
+
+def _sample(logits: torch.Tensor, seqs: List[Sequence]) -> List[int]:
+    # logits: [num_seqs, vocab_size]
+    logits = logits.float()
+    if all(seq.sampling_params.temperature == 0.0 for seq in seqs):
+        return logits.argmax(dim=-1).tolist()
+    tokens = []
+    for row, seq in zip(logits, seqs):
+        params = seq.sampling_params
+        if params.temperature == 0.0:
+            tokens.append(int(row.argmax()))
+            continue
+        row = row / params.temperature
+        if params.top_k > 0:
+            kth = torch.topk(row, min(params.top_k, row.size(-1))).values[-1]
+            row = row.masked_fill(row < kth, float("-inf"))
+        if params.top_p < 1.0:
+            sorted_logits, sorted_idx = torch.sort(row, descending=True)
+            cum_probs = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+            remove = cum_probs - sorted_logits.softmax(dim=-1) > params.top_p
+            row = row.index_fill(0, sorted_idx[remove], float("-inf"))
+        tokens.append(int(torch.multinomial(row.softmax(dim=-1), 1)))
+    return tokens
+
+
+class Engine:
+    r"""
+    In-process LLM serving engine with iteration-level continuous batching on
+    top of ``ipex.llm.modules.PagedAttention``. Requests are added at any time
+    with ``add_request``; every ``step`` schedules one forward that mixes the
+    prefill (chunks) of newly admitted requests with one decode token of each
+    running request, so that the cores stay busy when short requests finish.
+    The KV cache is a pool of fixed-size blocks owned by the engine, the block
+    tables map every sequence to its physical blocks.
+
+    `module init`
+
+    Args:
+        model (Callable): the model to serve, called as
+            ``model(input_ids, positions, kv_caches, attn_metadata)`` and returning the
+            logits of shape [num_tokens, vocab_size] or [num_seqs, vocab_size] (the logits
+            of the last token of every sequence). ``input_ids`` and ``positions`` are
+            flattened [num_tokens] tensors, ``kv_caches`` is a list of (key_cache, value_cache)
+            per layer and ``attn_metadata`` is a ``PagedAttentionMetadata``. The attention
+            layers are expected to call ``ipex.llm.serving.paged_attention``.
+        num_layers (int): the number of decoder layers.
+        num_kv_heads (int): the number of key/value heads.
+        head_size (int): the head dimension.
+        num_blocks (int): the number of blocks of the KV cache of every layer.
+        block_size (int): the number of tokens of one block. Default is 16.
+        dtype (torch.dtype): the data type of the KV cache. Default is torch.bfloat16.
+        scheduler_config (SchedulerConfig): the scheduling limits. Default is SchedulerConfig().
+        enable_prefix_caching (bool): reuse the KV cache blocks of the prompt prefixes
+            shared by several requests (e.g. a system prompt) instead of recomputing
+            them. Default is False.
+        max_cached_blocks (int): the max number of unused blocks retained for prefix
+            reuse, they are evicted in LRU order. Default is None, which means all the
+            free blocks can be used as prefix cache.
+        speculative_config (SpeculativeConfig): enables speculative decoding of the
+            greedy requests, ``model`` must then return the logits of every token.
+            Default is None.
+        lora_manager (LoRAManager): serves the LoRA adapters of the requests added
+            with a ``lora_id``, the adapters must be registered to it. The requests of
+            more than ``max_loras`` adapters are served in turns. Default is None.
+
+    Examples:
+        >>> engine = ipex.llm.serving.Engine(model, 32, 8, 128, num_blocks=4096)
+        >>> engine.add_request("0", prompt_token_ids, ipex.llm.serving.SamplingParams(max_new_tokens=32))
+        >>> while engine.has_unfinished_requests():
+        >>>     for output in engine.step():
+        >>>         if output.finished:
+        >>>             print(output.output_token_ids)
+    """
+
+    def __init__(
+        self,
+        model: Callable,
+        num_layers: int,
+        num_kv_heads: int,
+        head_size: int,
+        num_blocks: int,
+        block_size: int = 16,
+        dtype: torch.dtype = torch.bfloat16,
+        scheduler_config: Optional[SchedulerConfig] = None,
+        enable_prefix_caching: bool = False,
+        max_cached_blocks: Optional[int] = None,
+        speculative_config: Optional[SpeculativeConfig] = None,
+        lora_manager: Optional[LoRAManager] = None,
+    ):
+        self.model = model
+        self.block_size = block_size
+        self.scheduler_config = (
+            SchedulerConfig() if scheduler_config is None else scheduler_config
+        )
+        self.block_manager = BlockSpaceManager(
+            block_size,
+            num_blocks,
+            enable_prefix_caching=enable_prefix_caching,
+            max_cached_blocks=max_cached_blocks,
+        )
+        # a forward holds at most max_loras distinct adapters, the requests of
+        # the other adapters are deferred by the scheduler
+        self.scheduler = Scheduler(
+            self.scheduler_config,
+            self.block_manager,
+            None if lora_manager is None else lora_manager.config.max_loras,
+        )
+        cache_shape = (num_blocks, num_kv_heads, block_size, head_size)
+        self.kv_caches = [
+            (
+                torch.zeros(cache_shape, dtype=dtype),
+                torch.zeros(cache_shape, dtype=dtype),
+            )
+            for _ in range(num_layers)
+        ]
+        self.seq_counter = itertools.count()
+        self.requests: Dict[str, Sequence] = {}
+        self.speculative_config = speculative_config
+        self.proposer = None
+        if speculative_config is not None:
+            if speculative_config.draft_model is None:
+                self.proposer = NgramProposer(
+                    speculative_config.prompt_lookup_max,
+                    speculative_config.prompt_lookup_min,
+                )
+            else:
+                # the shared prefix blocks only hold the KV cache of the target model
+                if enable_prefix_caching:
+                    raise ValueError(
+                        "Engine: prefix caching is not supported with a draft model"
+                    )
+                self.proposer = DraftModelProposer(
+                    speculative_config.draft_model,
+                    self.block_manager,
+                    speculative_config.draft_num_layers,
+                    speculative_config.draft_num_kv_heads,
+                    speculative_config.draft_head_size,
+                    num_blocks,
+                    dtype,
+                )
+        self.num_draft_tokens = 0
+        self.num_accepted_tokens = 0
+        # the KV cache of a prefix depends on the adapter of the request
+        if lora_manager is not None and enable_prefix_caching:
+            raise ValueError(
+                "Engine: prefix caching is not supported with a LoRA manager"
+            )
+        self.lora_manager = lora_manager
+
+    def add_request(
+        self,
+        request_id: str,
+        prompt_token_ids: List[int],
+        sampling_params: Optional[SamplingParams] = None,
+        lora_id: Optional[str] = None,
+    ):
+        if request_id in self.requests:
+            raise ValueError(f"Engine: request {request_id} already exists")
+        if lora_id is not None and (
+            self.lora_manager is None or lora_id not in self.lora_manager.adapters
+        ):
+            raise ValueError(f"Engine: LoRA adapter {lora_id} is not registered")
+        if (
+            not self.scheduler_config.enable_chunked_prefill
+            and len(prompt_token_ids) > self.scheduler_config.max_num_batched_tokens
+        ):
+            raise ValueError(
+                f"Engine: the prompt of request {request_id} is longer than max_num_batched_tokens,"
+                + " please enable chunked prefill"
+            )
+        sampling_params = (
+            SamplingParams() if sampling_params is None else sampling_params
+        )
+        # a request that cannot fit in the whole KV cache would be preempted
+        # and recomputed forever
+        num_cache_tokens = self.block_manager.allocator.num_blocks * self.block_size
+        if len(prompt_token_ids) + sampling_params.max_new_tokens > num_cache_tokens:
+            raise ValueError(
+                f"Engine: request {request_id} needs {len(prompt_token_ids)} prompt tokens"
+                + f" and {sampling_params.max_new_tokens} new tokens, more than the"
+                + f" {num_cache_tokens} tokens of the KV cache"
+            )
+        seq = Sequence(
+            next(self.seq_counter),
+            request_id,
+            prompt_token_ids,
+            sampling_params,
+            lora_id=lora_id,
+        )
+        self.requests[request_id] = seq
+        self.scheduler.add_sequence(seq)
+
+    def abort_request(self, request_id: str):
+        for seq in self.scheduler.abort(request_id):
+            self._free_draft(seq)
+        self.requests.pop(request_id, None)
+
+    def has_unfinished_requests(self) -> bool:
+        return self.scheduler.has_unfinished_sequences()
+
+    @property
+    def draft_acceptance_rate(self) -> float:
+        if self.num_draft_tokens == 0:
+            return 0.0
+        return self.num_accepted_tokens / self.num_draft_tokens
+
+    def _free_draft(self, seq: Sequence):
+        if self.proposer is not None:
+            self.proposer.free(seq.seq_id)
+
+    def _propose(self, scheduled, num_batched_tokens: int) -> Dict[int, List[int]]:
+        # only the greedy decode steps are speculated, the draft tokens share
+        # the token budget of the iteration
+        budget = self.scheduler_config.max_num_batched_tokens - num_batched_tokens
+        seqs, num_tokens = [], []
+        for seq, num_new_tokens in scheduled:
+            if budget <= 0:
+                break
+            if (
+                num_new_tokens != seq.num_uncomputed_tokens
+                or num_new_tokens != 1
+                or seq.sampling_params.temperature != 0.0
+            ):
+                continue
+            # the verification generates up to num_draft + 1 tokens
+            num_draft = min(
+                self.speculative_config.num_speculative_tokens,
+                seq.sampling_params.max_new_tokens - len(seq.output_token_ids) - 1,
+                budget,
+            )
+            if num_draft <= 0 or not self.block_manager.can_append_slots(
+                seq.seq_id, len(seq) + num_draft
+            ):
+                continue
+            self.block_manager.append_slots(seq.seq_id, len(seq) + num_draft)
+            seqs.append(seq)
+            num_tokens.append(num_draft)
+            budget -= num_draft
+        if not seqs:
+            return {}
+        drafts = self.proposer.propose(seqs, num_tokens)
+        return {seq.seq_id: draft for seq, draft in zip(seqs, drafts) if draft}
+
+    def _verify(self, seq: Sequence, draft: List[int], logits: torch.Tensor):
+        # logits: [len(draft) + 1, vocab_size], the predictions after the last
+        # token of the sequence and after every draft token
+        target = logits.argmax(dim=-1).tolist()
+        num_accepted = 0
+        while num_accepted < len(draft) and draft[num_accepted] == target[num_accepted]:
+            num_accepted += 1
+        self.num_draft_tokens += len(draft)
+        self.num_accepted_tokens += num_accepted
+        for token in target[: num_accepted + 1]:
+            seq.append_token(token)
+            if seq.is_finished():
+                break
+        # the key/value of the rejected draft tokens are overwritten later
+        seq.num_computed_tokens = len(seq) - 1
+
+    def _request_output(self, seq: Sequence) -> RequestOutput:
+        return RequestOutput(
+            seq.request_id,
+            seq.prompt_token_ids,
+            list(seq.output_token_ids),
+            seq.is_finished(),
+            _finish_reason(seq.status),
+        )
+
+    def _prepare_inputs(self, scheduled, drafts: Optional[Dict[int, List[int]]] = None):
+        drafts = {} if drafts is None else drafts
+        batch = [
+            (
+                seq.seq_id,
+                seq.token_ids[
+                    seq.num_computed_tokens : seq.num_computed_tokens + num_tokens
+                ]
+                + drafts.get(seq.seq_id, []),
+                seq.num_computed_tokens,
+            )
+            for seq, num_tokens in scheduled
+        ]
+        return prepare_paged_inputs(self.block_manager, batch)
+
+    @torch.inference_mode()
+    def step(self) -> List[RequestOutput]:
+        r"""
+        Runs one iteration and returns the outputs of the requests that got new
+        tokens (or finished) in this iteration.
+        """
+        scheduler_output = self.scheduler.schedule()
+        for seq in scheduler_output.preempted:
+            self._free_draft(seq)
+        if scheduler_output.is_empty():
+            return []
+        scheduled = scheduler_output.scheduled
+        drafts = {}
+        if self.proposer is not None:
+            drafts = self._propose(scheduled, scheduler_output.num_batched_tokens)
+        input_ids, positions, attn_metadata = self._prepare_inputs(scheduled, drafts)
+        if self.lora_manager is not None:
+            self.lora_manager.set_batch_adapters(
+                [seq.lora_id for seq, _ in scheduled],
+                [n + len(drafts.get(seq.seq_id, [])) for seq, n in scheduled],
+            )
+        try:
+            logits = self.model(input_ids, positions, self.kv_caches, attn_metadata)
+        finally:
+            if self.lora_manager is not None:
+                self.lora_manager.reset_batch()
+        last_token_indices = attn_metadata.last_token_indices.tolist()
+        if logits.size(0) == attn_metadata.num_seqs:
+            if drafts:
+                raise RuntimeError(
+                    "Engine: speculative decoding needs the logits of all the tokens"
+                )
+            last_token_indices = list(range(attn_metadata.num_seqs))
+
+        # only the sequences whose prefill completes in this step get a new token,
+        # the others just advanced their prefill chunk
+        outputs = []
+        sample_rows, sample_seqs = [], []
+        for i, (seq, num_tokens) in enumerate(scheduled):
+            seq.num_computed_tokens += num_tokens
+            row = last_token_indices[i]
+            if seq.seq_id in drafts:
+                draft = drafts[seq.seq_id]
+                self._verify(seq, draft, logits[row - len(draft) : row + 1])
+                outputs.append(self._request_output(seq))
+            elif seq.num_uncomputed_tokens == 0:
+                sample_rows.append(row)
+                sample_seqs.append(seq)
+            self.block_manager.mark_computed(
+                seq.seq_id, seq.token_ids, seq.num_computed_tokens
+            )
+        if sample_seqs:
+            next_tokens = _sample(logits[sample_rows], sample_seqs)
+            for seq, token in zip(sample_seqs, next_tokens):
+                seq.append_token(token)
+                outputs.append(self._request_output(seq))
+        for seq in self.scheduler.free_finished():
+            self._free_draft(seq)
+            self.requests.pop(seq.request_id, None)
+        return outputs
+
+    def generate(
+        self,
+        prompts: List[List[int]],
+        sampling_params: Optional[SamplingParams] = None,
+        lora_ids: Optional[List[Optional[str]]] = None,
+    ) -> List[RequestOutput]:
+        r"""
+        Serves a list of tokenized prompts to completion with continuous batching
+        and returns their outputs in the order of ``prompts``. ``lora_ids`` gives
+        the LoRA adapter of every prompt, None means the base model.
+        """
+        lora_ids = [None] * len(prompts) if lora_ids is None else lora_ids
+        request_ids = []
+        for prompt, lora_id in zip(prompts, lora_ids):
+            request_id = f"generate-{next(self.seq_counter)}"
+            self.add_request(request_id, prompt, sampling_params, lora_id)
+            request_ids.append(request_id)
+        finished = {}
+        while self.has_unfinished_requests():
+            for output in self.step():
+                if output.finished:
+                    finished[output.request_id] = output
+        return [finished[request_id] for request_id in request_ids]
@@ -0,0 +1,445 @@
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from torch import nn
+
+from ..functional import bgmv_expand_slice, bgmv_shrink
+
+
+@dataclass
+class LoRAConfig:
+    r"""
+    Args:
+        max_loras (int): the number of adapters resident in the weight pool at
+            the same time, i.e. the max number of distinct adapters in one batch.
+            The other registered adapters are kept in CPU memory and loaded on
+            demand. Default is 8.
+        max_lora_rank (int): the max rank of the adapters. Default is 16.
+        target_modules (list): the names of the linear layers that can carry a
+            LoRA, as in the Hugging Face model, e.g. ``q_proj`` or ``down_proj``.
+        dtype (torch.dtype): the data type of the weight pool, it should be the
+            data type of the activations, the fused kernels support torch.bfloat16
+            and torch.half. Default is torch.bfloat16.
+    """
+
+    max_loras: int = 8
+    max_lora_rank: int = 16
+    target_modules: List[str] = field(
+        default_factory=lambda: [
+            "q_proj",
+            "k_proj",
+            "v_proj",
+            "o_proj",
+            "gate_proj",
+            "up_proj",
+            "down_proj",
+        ]
+    )
+    dtype: torch.dtype = torch.bfloat16
+
+
+class LoRALinear(nn.Module):
+    r"""
+    A linear layer with a stacked pool of LoRA weights. Row ``i`` of the pool
+    holds the adapter of slot ``i``, slot 0 is all zeros and is used by the
+    tokens without adapter. The output features may be split into slices (e.g.
+    the q/k/v parts of a concatenated linear), every slice has its own A and B.
+    The scaling of every adapter is folded into its B.
+
+    ``tpp_fallback`` is set while a token of the batch uses an adapter, so that
+    the fused linears (``linear_add``, ``linear_silu_mul``, ...) holding this
+    layer call its forward instead of reading the base weight. Without adapter,
+    they run their fused kernels on the base weight, which is exposed as the
+    ``weight``, ``bias``, ``weight_for_large_batch`` and ``_op_context`` of
+    this layer.
+
+    The adapters of a batch are chosen in Python for every forward, so this
+    layer only works in eager mode, not in a model traced by
+    ``ipex.llm.optimize(deployment_mode=True)``.
+    """
+
+    def __init__(
+        self,
+        base_layer: nn.Module,
+        slice_sizes: List[int],
+        manager: "LoRAManager",
+    ):
+        super().__init__()
+        self.base_layer = base_layer
+        self.in_features = base_layer.in_features
+        self.out_features = base_layer.out_features
+        assert (
+            sum(slice_sizes) == self.out_features
+        ), "LoRALinear: the slices should cover the output features"
+        self.slice_sizes = list(slice_sizes)
+        self.slice_offsets = [sum(slice_sizes[:i]) for i in range(len(slice_sizes))]
+        config = manager.config
+        num_slots = config.max_loras + 1
+        self.lora_a = [
+            torch.zeros(
+                num_slots, config.max_lora_rank, self.in_features, dtype=config.dtype
+            )
+            for _ in slice_sizes
+        ]
+        self.lora_b = [
+            torch.zeros(num_slots, size, config.max_lora_rank, dtype=config.dtype)
+            for size in slice_sizes
+        ]
+        # not registered as attribute of nn.Module, the manager is not a module
+        self.__dict__["manager"] = manager
+
+    @property
+    def tpp_fallback(self):
+        return self.manager.seq_indices is not None or getattr(
+            self.base_layer, "tpp_fallback", True
+        )
+
+    @property
+    def weight(self):
+        return self.base_layer.weight
+
+    @property
+    def bias(self):
+        return self.base_layer.bias
+
+    @property
+    def weight_for_large_batch(self):
+        return getattr(self.base_layer, "weight_for_large_batch", None)
+
+    @property
+    def _op_context(self):
+        # the fused WOQ kernels are only used on the base weight
+        if self.manager.seq_indices is not None:
+            return None
+        return getattr(self.base_layer, "_op_context", None)
+
+    def set_slot(
+        self,
+        slot: int,
+        slice_index: int,
+        lora_a: Optional[torch.Tensor],
+        lora_b: Optional[torch.Tensor],
+    ):
+        self.lora_a[slice_index][slot].zero_()
+        self.lora_b[slice_index][slot].zero_()
+        if lora_a is not None:
+            rank = lora_a.size(0)
+            self.lora_a[slice_index][slot, :rank].copy_(lora_a)
+            self.lora_b[slice_index][slot, :, :rank].copy_(lora_b)
+
+    def forward(self, x):
+        out = self.base_layer(x)
+        indices = self.manager.get_token_indices(x)
+        if indices is None:
+            return out
+        x_2d = x.reshape(-1, self.in_features)
+        out_2d = out.contiguous().view(-1, self.out_features)
+        if (
+            x_2d.dtype in [torch.bfloat16, torch.half]
+            and x_2d.dtype == self.manager.config.dtype
+            and out_2d.dtype == x_2d.dtype
+        ):
+            x_2d = x_2d.contiguous()
+            buffer = x_2d.new_empty(x_2d.size(0), self.manager.config.max_lora_rank)
+            for lora_a, lora_b, offset, size in zip(
+                self.lora_a, self.lora_b, self.slice_offsets, self.slice_sizes
+            ):
+                bgmv_shrink(x_2d, lora_a, buffer, indices, 1.0)
+                bgmv_expand_slice(buffer, lora_b, out_2d, indices, offset, size, True)
+        else:
+            # the fused kernels support bfloat16 and half, and need the same data
+            # type for the activations and the pool, other cases go through the
+            # adapters of the batch one by one
+            for slot in indices.unique().tolist():
+                if slot == 0:
+                    continue
+                rows = (indices == slot).nonzero().squeeze(1)
+                x_slot = x_2d.index_select(0, rows).to(self.manager.config.dtype)
+                for lora_a, lora_b, offset, size in zip(
+                    self.lora_a, self.lora_b, self.slice_offsets, self.slice_sizes
+                ):
+                    delta = (x_slot @ lora_a[slot].t()) @ lora_b[slot].t()
+                    out_2d[rows, offset : offset + size] += delta.to(out_2d.dtype)
+        return out_2d.view(out.shape)
+
+    def extra_repr(self):
+        return f"slice_sizes = {self.slice_sizes}"
+
+
+# The Hugging Face linear layers fused by ipex.llm.optimize: the name relative
+# to the decoder layer -> (fused module of the decoder layer, attribute of the linear)
+_FUSED_LINEAR_NAMES = {
+    "self_attn.o_proj": [("mha_linear_add", "linear")],
+    "mlp.down_proj": [("mlp_linear_add", "linear"), ("mlp_linear_add_add", "linear")],
+    "mlp.gate_proj": [("linear_silu_mul", "linear_s")],
+    "mlp.up_proj": [("linear_silu_mul", "linear_m")],
+}
+_CONCAT_QKV_NAMES = ["q_proj", "k_proj", "v_proj"]
+
+_LORA_KEY_PATTERN = re.compile(
+    r"^(?:base_model\.model\.)?(.+)\.lora_([AB])(?:\.[^.]+)?\.weight$"
+)
+
+
+def _is_linear(module):
+    return (
+        hasattr(module, "in_features")
+        and hasattr(module, "out_features")
+        and not isinstance(module, LoRALinear)
+    )
+
+
+def _qkv_slice_sizes(config, out_features: int) -> List[int]:
+    if config is None or not hasattr(config, "num_attention_heads"):
+        assert out_features % 3 == 0, "LoRAManager: cannot split the q/k/v linear"
+        return [out_features // 3] * 3
+    num_heads = config.num_attention_heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // num_heads
+    num_kv_heads = getattr(config, "num_key_value_heads", None) or num_heads
+    sizes = [num_heads * head_dim, num_kv_heads * head_dim, num_kv_heads * head_dim]
+    if sum(sizes) != out_features:
+        raise ValueError(
+            f"LoRAManager: the q/k/v sizes {sizes} do not match the concatenated linear"
+            + f" of {out_features} output features"
+        )
+    return sizes
+
+
+def _find_lora_targets(model: nn.Module, target_modules: List[str]):
+    r"""
+    Returns {Hugging Face module name: (owner module, attribute, slice index,
+    slice sizes)} of the linear layers to wrap. The layers fused by
+    ``ipex.llm.optimize`` are found under their fused modules.
+    """
+    from ...transformers.models.cpu.fusions.linear_fusion import (
+        _IPEXConcatLinearCPU,
+    )
+
+    config = getattr(model, "config", None)
+    targets = {}
+    for name, module in model.named_modules():
+        prefix = name + "." if name else ""
+        for attr, child in module.named_children():
+            if attr in target_modules and _is_linear(child):
+                targets[prefix + attr] = (module, attr, 0, None)
+        concat_qkv = getattr(module, "concat_qkv", None)
+        if concat_qkv is not None and concat_qkv.num_concat == 3:
+            if (
+                isinstance(concat_qkv, _IPEXConcatLinearCPU)
+                and concat_qkv.concat_linear is not None
+            ):
+                sizes = _qkv_slice_sizes(config, concat_qkv.concat_linear.out_features)
+                for i, attr in enumerate(_CONCAT_QKV_NAMES):
+                    if attr in target_modules:
+                        targets[prefix + attr] = (concat_qkv, "concat_linear", i, sizes)
+            else:
+                for i, attr in enumerate(_CONCAT_QKV_NAMES):
+                    if attr in target_modules:
+                        targets[prefix + attr] = (concat_qkv, f"linear_{i}", 0, None)
+        for hf_name, candidates in _FUSED_LINEAR_NAMES.items():
+            if hf_name.split(".")[-1] not in target_modules:
+                continue
+            for fused_name, attr in candidates:
+                fused = getattr(module, fused_name, None)
+                if fused is not None and isinstance(
+                    getattr(fused, attr, None), nn.Module
+                ):
+                    targets[prefix + hf_name] = (fused, attr, 0, None)
+                    break
+    return targets
+
+
+class LoRAManager:
+    r"""
+    Serves many LoRA adapters with one copy of the base model. The target linear
+    layers of ``model`` (plain or fused by ``ipex.llm.optimize``) are wrapped by
+    ``LoRALinear``, whose stacked weight pools hold up to ``max_loras``
+    adapters. Adapters are registered in CPU memory with ``add_adapter`` and
+    loaded into a pool slot when a batch uses them, evicting the least recently
+    used adapter that is not used by the batch. Every token of a batch is mapped
+    to the slot of its adapter, and the LoRA of all the tokens is applied by
+    the ``bgmv_shrink`` / ``bgmv_expand_slice`` kernels in one pass per layer.
+
+    The adapters are switched in Python between the forwards, so the model is
+    served in eager mode only: optimize it with
+    ``ipex.llm.optimize(..., deployment_mode=False)``, a traced model is
+    rejected.
+
+    `module init`
+
+    Args:
+        model (torch.nn.Module): the base model, optimized or not.
+        lora_config (LoRAConfig): the pool size, max rank and target modules.
+
+    Examples:
+        >>> manager = ipex.llm.serving.LoRAManager(model, ipex.llm.serving.LoRAConfig(max_loras=4))
+        >>> manager.add_adapter("sql", peft_state_dict, lora_alpha=32)
+        >>> manager.set_batch_adapters(["sql", None])
+        >>> logits = model(input_ids)
+    """
+
+    def __init__(self, model: nn.Module, lora_config: Optional[LoRAConfig] = None):
+        if hasattr(model, "trace_graph"):
+            raise ValueError(
+                "LoRAManager: the model is traced by ipex.llm.optimize, which would"
+                + " keep the adapters of the trace, optimize it with deployment_mode=False"
+            )
+        self.config = LoRAConfig() if lora_config is None else lora_config
+        targets = _find_lora_targets(model, self.config.target_modules)
+        if not targets:
+            raise ValueError("LoRAManager: no target module is found in the model")
+        # {module name: (LoRALinear, slice index)}
+        self.lora_layers: Dict[str, Tuple[LoRALinear, int]] = {}
+        wrapped = {}
+        for name, (owner, attr, slice_index, sizes) in targets.items():
+            key = (id(owner), attr)
+            if key not in wrapped:
+                base_layer = getattr(owner, attr)
+                if sizes is None:
+                    sizes = [base_layer.out_features]
+                wrapped[key] = LoRALinear(base_layer, sizes, self)
+                setattr(owner, attr, wrapped[key])
+            self.lora_layers[name] = (wrapped[key], slice_index)
+        # {adapter id: {module name: (A, B)}}, kept in CPU memory
+        self.adapters: Dict[str, Dict[str, Tuple[torch.Tensor, torch.Tensor]]] = {}
+        # {adapter id: slot} of the resident adapters in LRU order
+        self.slots: "OrderedDict[str, int]" = OrderedDict()
+        self.free_slots = list(range(1, self.config.max_loras + 1))
+        self.num_loads = 0
+        self.num_evictions = 0
+        self.seq_indices: Optional[torch.Tensor] = None
+        self.token_indices: Optional[torch.Tensor] = None
+
+    def add_adapter(
+        self,
+        adapter_id: str,
+        state_dict: Dict[str, torch.Tensor],
+        lora_alpha: Optional[float] = None,
+    ):
+        r"""
+        Registers an adapter. ``state_dict`` is in the PEFT format, i.e. the
+        ``<module name>.lora_A.weight`` of shape [rank, in_features] and the
+        ``<module name>.lora_B.weight`` of shape [out_features, rank], the
+        ``base_model.model.`` prefix is optional. The scaling is
+        ``lora_alpha / rank``, 1.0 if ``lora_alpha`` is None.
+        """
+        if adapter_id in self.adapters:
+            raise ValueError(f"LoRAManager: adapter {adapter_id} already exists")
+        weights: Dict[str, Dict[str, torch.Tensor]] = {}
+        for key, value in state_dict.items():
+            match = _LORA_KEY_PATTERN.match(key)
+            if match is None:
+                continue
+            name, ab = match.groups()
+            if name not in self.lora_layers:
+                raise ValueError(
+                    f"LoRAManager: {name} of adapter {adapter_id} is not a target module"
+                )
+            weights.setdefault(name, {})[ab] = value
+        adapter = {}
+        for name, ab in weights.items():
+            if "A" not in ab or "B" not in ab:
+                raise ValueError(f"LoRAManager: {name} needs both lora_A and lora_B")
+            lora_a, lora_b = ab["A"], ab["B"]
+            rank = lora_a.size(0)
+            layer, slice_index = self.lora_layers[name]
+            if rank > self.config.max_lora_rank:
+                raise ValueError(
+                    f"LoRAManager: the rank {rank} of adapter {adapter_id} is larger than"
+                    + f" max_lora_rank {self.config.max_lora_rank}"
+                )
+            if list(lora_a.shape) != [rank, layer.in_features] or list(
+                lora_b.shape
+            ) != [layer.slice_sizes[slice_index], rank]:
+                raise ValueError(
+                    f"LoRAManager: the LoRA shapes of {name} do not match the model"
+                )
+            scaling = 1.0 if lora_alpha is None else lora_alpha / rank
+            adapter[name] = (
+                lora_a.to(self.config.dtype),
+                (lora_b.float() * scaling).to(self.config.dtype),
+            )
+        if not adapter:
+            raise ValueError(f"LoRAManager: adapter {adapter_id} has no LoRA weight")
+        self.adapters[adapter_id] = adapter
+
+    def remove_adapter(self, adapter_id: str):
+        self.adapters.pop(adapter_id)
+        slot = self.slots.pop(adapter_id, None)
+        if slot is not None:
+            self.free_slots.append(slot)
+
+    def _load(self, adapter_id: str, pinned) -> int:
+        if adapter_id in self.slots:
+            self.slots.move_to_end(adapter_id)
+            return self.slots[adapter_id]
+        if adapter_id not in self.adapters:
+            raise KeyError(f"LoRAManager: adapter {adapter_id} is not registered")
+        if self.free_slots:
+            slot = self.free_slots.pop(0)
+        else:
+            victim = next(a for a in self.slots if a not in pinned)
+            slot = self.slots.pop(victim)
+            self.num_evictions += 1
+        adapter = self.adapters[adapter_id]
+        for name, (layer, slice_index) in self.lora_layers.items():
+            lora_a, lora_b = adapter.get(name, (None, None))
+            layer.set_slot(slot, slice_index, lora_a, lora_b)
+        self.slots[adapter_id] = slot
+        self.num_loads += 1
+        return slot
+
+    def set_batch_adapters(
+        self,
+        adapter_ids: List[Optional[str]],
+        num_tokens: Optional[List[int]] = None,
+    ):
+        r"""
+        Sets the adapters of the sequences of the next forward, None means the
+        base model. ``num_tokens`` is the number of tokens of every sequence in
+        a flattened [num_tokens, hidden_size] input, it is not needed for the
+        [batch_size, seq_len, hidden_size] inputs.
+        """
+        pinned = set(a for a in adapter_ids if a is not None)
+        if len(pinned) > self.config.max_loras:
+            raise ValueError(
+                f"LoRAManager: {len(pinned)} adapters in one batch, more than"
+                + f" max_loras {self.config.max_loras}"
+            )
+        slots = [0 if a is None else self._load(a, pinned) for a in adapter_ids]
+        if not pinned:
+            self.reset_batch()
+            return
+        self.seq_indices = torch.tensor(slots, dtype=torch.long)
+        self.token_indices = None
+        if num_tokens is not None:
+            self.token_indices = self.seq_indices.repeat_interleave(
+                torch.tensor(num_tokens, dtype=torch.long)
+            )
+
+    def reset_batch(self):
+        self.seq_indices = None
+        self.token_indices = None
+
+    def get_token_indices(self, x: torch.Tensor) -> Optional[torch.Tensor]:
+        r"""
+        Returns the pool slot of every row of ``x`` flattened to 2D, or None when
+        no token of the batch uses an adapter.
+        """
+        if self.seq_indices is None:
+            return None
+        num_rows = x.numel() // x.size(-1)
+        if self.token_indices is not None and self.token_indices.numel() == num_rows:
+            return self.token_indices
+        if self.seq_indices.numel() == num_rows:
+            return self.seq_indices
+        if x.dim() == 3 and self.seq_indices.numel() == x.size(0):
+            self.token_indices = self.seq_indices.repeat_interleave(x.size(1))
+            return self.token_indices
+        raise RuntimeError(
+            f"LoRAManager: the adapters are set for {self.seq_indices.numel()} sequences,"
+            + f" but the input has the shape {list(x.shape)}"
+        )
@@ -0,0 +1,168 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Set, Tuple
+
+from .block_manager import BlockSpaceManager
+from .sequence import Sequence, SequenceStatus
+
+
+@dataclass
+class SchedulerConfig:
+    r"""
+    Args:
+        max_num_seqs (int): the max number of sequences in one iteration. Default is 256.
+        max_num_batched_tokens (int): the max number of tokens (prefill and decode)
+            fed to one forward. Default is 2048.
+        enable_chunked_prefill (bool): split long prompts into chunks of at most
+            the remaining token budget, so that they are mixed with the decode
+            tokens of the running sequences. Default is True.
+    """
+
+    max_num_seqs: int = 256
+    max_num_batched_tokens: int = 2048
+    enable_chunked_prefill: bool = True
+
+
+@dataclass
+class SchedulerOutput:
+    # (sequence, number of tokens fed to this forward)
+    scheduled: List[Tuple[Sequence, int]] = field(default_factory=list)
+    preempted: List[Sequence] = field(default_factory=list)
+
+    @property
+    def num_batched_tokens(self) -> int:
+        return sum(n for _, n in self.scheduled)
+
+    def is_empty(self) -> bool:
+        return len(self.scheduled) == 0
+
+
+class Scheduler:
+    r"""
+    Iteration-level (continuous batching) scheduler. Each call of ``schedule``
+    decides the tokens of the next forward: the running sequences go first
+    (one decode token, or the next chunk of an unfinished prefill), then the
+    waiting sequences are admitted in arrival order while the token budget,
+    ``max_num_seqs`` and the free KV cache blocks allow. When a running sequence
+    cannot get a new block, the most recently admitted sequence is preempted and
+    recomputed later.
+
+    With ``max_loras``, one forward holds the sequences of at most ``max_loras``
+    distinct LoRA adapters: the running sequences of the other adapters wait for
+    a later iteration, and the admission stops at the first waiting sequence
+    whose adapter does not fit.
+    """
+
+    def __init__(
+        self,
+        config: SchedulerConfig,
+        block_manager: BlockSpaceManager,
+        max_loras: Optional[int] = None,
+    ):
+        self.config = config
+        self.block_manager = block_manager
+        self.max_loras = max_loras
+        self.waiting: Deque[Sequence] = deque()
+        self.running: List[Sequence] = []
+
+    def add_sequence(self, seq: Sequence):
+        self.waiting.append(seq)
+
+    def abort(self, request_id: str) -> List[Sequence]:
+        aborted = []
+        for queue in (self.waiting, self.running):
+            for seq in list(queue):
+                if seq.request_id == request_id:
+                    queue.remove(seq)
+                    self.block_manager.free(seq.seq_id)
+                    seq.status = SequenceStatus.FINISHED_ABORTED
+                    aborted.append(seq)
+        return aborted
+
+    def has_unfinished_sequences(self) -> bool:
+        return len(self.waiting) > 0 or len(self.running) > 0
+
+    def _preempt(self, seq: Sequence, output: SchedulerOutput):
+        self.running.remove(seq)
+        self.block_manager.free(seq.seq_id)
+        seq.reset_for_recompute()
+        self.waiting.appendleft(seq)
+        output.preempted.append(seq)
+
+    def _fits_lora(self, seq: Sequence, lora_ids: Set[str]) -> bool:
+        return (
+            self.max_loras is None
+            or seq.lora_id is None
+            or seq.lora_id in lora_ids
+            or len(lora_ids) < self.max_loras
+        )
+
+    def schedule(self) -> SchedulerOutput:
+        output = SchedulerOutput()
+        budget = self.config.max_num_batched_tokens
+        # the adapters of the scheduled sequences
+        lora_ids: Set[str] = set()
+
+        # running sequences, in admission order
+        running = list(self.running)
+        while running and budget > 0:
+            seq = running.pop(0)
+            if not self._fits_lora(seq, lora_ids):
+                continue
+            num_tokens = min(seq.num_uncomputed_tokens, budget)
+            total = seq.num_computed_tokens + num_tokens
+            while not self.block_manager.can_append_slots(seq.seq_id, total):
+                if running:
+                    self._preempt(running.pop(), output)
+                else:
+                    break
+            if not self.block_manager.can_append_slots(seq.seq_id, total):
+                self._preempt(seq, output)
+                break
+            self.block_manager.append_slots(seq.seq_id, total)
+            output.scheduled.append((seq, num_tokens))
+            budget -= num_tokens
+            if seq.lora_id is not None:
+                lora_ids.add(seq.lora_id)
+
+        # waiting sequences, never admitted in the iteration that preempted
+        while (
+            self.waiting
+            and budget > 0
+            and not output.preempted
+            and len(self.running) < self.config.max_num_seqs
+        ):
+            seq = self.waiting[0]
+            if not self._fits_lora(seq, lora_ids):
+                break
+            # the tokens of a cached prefix are neither computed nor counted
+            # in the token budget
+            num_cached_tokens = self.block_manager.get_num_cached_tokens(seq.token_ids)
+            num_tokens = seq.num_uncomputed_tokens - num_cached_tokens
+            if num_tokens > budget:
+                if not self.config.enable_chunked_prefill:
+                    break
+                num_tokens = budget
+            if not self.block_manager.can_allocate(num_cached_tokens + num_tokens):
+                break
+            self.waiting.popleft()
+            seq.num_computed_tokens = self.block_manager.allocate_cached_prefix(
+                seq.seq_id, seq.token_ids
+            )
+            self.block_manager.append_slots(
+                seq.seq_id, seq.num_computed_tokens + num_tokens
+            )
+            seq.status = SequenceStatus.RUNNING
+            self.running.append(seq)
+            output.scheduled.append((seq, num_tokens))
+            budget -= num_tokens
+            if seq.lora_id is not None:
+                lora_ids.add(seq.lora_id)
+        return output
+
+    def free_finished(self) -> List[Sequence]:
+        finished = [seq for seq in self.running if seq.is_finished()]
+        for seq in finished:
+            self.running.remove(seq)
+            self.block_manager.free(seq.seq_id)
+        return finished
@@ -0,0 +1,107 @@
+import time
+from enum import Enum
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+@dataclass
+class SamplingParams:
+    r"""
+    Sampling parameters of one request.
+
+    Args:
+        max_new_tokens (int): the max number of tokens to generate. Default is 16.
+        temperature (float): sampling temperature, 0.0 means greedy search. Default is 0.0.
+        top_k (int): keep only the top_k most likely tokens, 0 disables it. Default is 0.
+        top_p (float): keep the smallest token set whose cumulative probability
+            reaches top_p, 1.0 disables it. Default is 1.0.
+        eos_token_id (int): generation stops when this token is sampled. Default is None.
+        stop_token_ids (list): additional token ids that stop the generation.
+        ignore_eos (bool): keep generating after eos until max_new_tokens. Default is False.
+    """
+
+    max_new_tokens: int = 16
+    temperature: float = 0.0
+    top_k: int = 0
+    top_p: float = 1.0
+    eos_token_id: Optional[int] = None
+    stop_token_ids: List[int] = field(default_factory=list)
+    ignore_eos: bool = False
+
+
+class SequenceStatus(Enum):
+    WAITING = 0
+    RUNNING = 1
+    FINISHED_STOPPED = 2
+    FINISHED_LENGTH = 3
+    FINISHED_ABORTED = 4
+
+    @staticmethod
+    def is_finished(status) -> bool:
+        return status in [
+            SequenceStatus.FINISHED_STOPPED,
+            SequenceStatus.FINISHED_LENGTH,
+            SequenceStatus.FINISHED_ABORTED,
+        ]
+
+
+class Sequence:
+    r"""
+    The state of one request inside the serving engine.
+    ``num_computed_tokens`` counts the tokens whose key/value are already stored
+    in the paged KV cache, the remaining tokens are fed to the next forward.
+    """
+
+    def __init__(
+        self,
+        seq_id: int,
+        request_id: str,
+        prompt_token_ids: List[int],
+        sampling_params: SamplingParams,
+        arrival_time: Optional[float] = None,
+        lora_id: Optional[str] = None,
+    ):
+        assert len(prompt_token_ids) > 0, "Sequence: the prompt should not be empty"
+        self.seq_id = seq_id
+        self.request_id = request_id
+        self.prompt_token_ids = list(prompt_token_ids)
+        self.output_token_ids: List[int] = []
+        self.sampling_params = sampling_params
+        self.arrival_time = time.time() if arrival_time is None else arrival_time
+        self.status = SequenceStatus.WAITING
+        self.num_computed_tokens = 0
+        self.lora_id = lora_id
+
+    @property
+    def token_ids(self) -> List[int]:
+        return self.prompt_token_ids + self.output_token_ids
+
+    def __len__(self):
+        return len(self.prompt_token_ids) + len(self.output_token_ids)
+
+    @property
+    def num_uncomputed_tokens(self) -> int:
+        return len(self) - self.num_computed_tokens
+
+    @property
+    def is_prefill(self) -> bool:
+        return self.num_computed_tokens < len(self.prompt_token_ids)
+
+    def is_finished(self) -> bool:
+        return SequenceStatus.is_finished(self.status)
+
+    def reset_for_recompute(self):
+        # Preemption by recomputation: the generated tokens are kept and
+        # become part of the prompt that is prefilled again.
+        self.num_computed_tokens = 0
+        self.status = SequenceStatus.WAITING
+
+    def append_token(self, token_id: int):
+        self.output_token_ids.append(token_id)
+        params = self.sampling_params
+        if not params.ignore_eos and (
+            token_id == params.eos_token_id or token_id in params.stop_token_ids
+        ):
+            self.status = SequenceStatus.FINISHED_STOPPED
+        elif len(self.output_token_ids) >= params.max_new_tokens:
+            self.status = SequenceStatus.FINISHED_LENGTH
@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+from .attention import prepare_paged_inputs
+from .block_manager import BlockSpaceManager
+from .sequence import Sequence
+
+
+@dataclass
+class SpeculativeConfig:
+    r"""
+    Speculative decoding of the greedy requests: every decode step proposes up
+    to ``num_speculative_tokens`` draft tokens, the target model verifies them
+    in one multi-token forward, and the longest prefix matching its own greedy
+    tokens is accepted plus one token of the target model. The generated tokens
+    are identical to those of the normal decoding.
+
+    Args:
+        num_speculative_tokens (int): the max number of draft tokens of one sequence
+            verified in one forward. Default is 4.
+        draft_model (Callable): a small model sharing the tokenizer of the target
+            model and its calling convention, i.e.
+            ``draft_model(input_ids, positions, kv_caches, attn_metadata)``.
+            Default is None, which means the draft tokens are proposed by prompt
+            lookup: the tokens following the latest earlier occurrence of the last
+            n-gram of the sequence.
+        draft_num_layers (int): the number of decoder layers of ``draft_model``.
+        draft_num_kv_heads (int): the number of key/value heads of ``draft_model``.
+        draft_head_size (int): the head dimension of ``draft_model``.
+        prompt_lookup_max (int): the longest n-gram looked up when ``draft_model``
+            is None. Default is 3.
+        prompt_lookup_min (int): the shortest n-gram looked up when ``draft_model``
+            is None. Default is 1.
+    """
+
+    num_speculative_tokens: int = 4
+    draft_model: Optional[Callable] = None
+    draft_num_layers: int = 0
+    draft_num_kv_heads: int = 0
+    draft_head_size: int = 0
+    prompt_lookup_max: int = 3
+    prompt_lookup_min: int = 1
+
+
+class NgramProposer:
+    r"""
+    Prompt lookup decoding. The draft tokens are copied from the tokens that
+    follow the latest earlier occurrence of the last ``n`` tokens of the
+    sequence, trying the longest ``n`` first. It needs no extra model and works
+    well when the output repeats parts of the prompt (summarization, code
+    editing, retrieval augmented generation).
+    """
+
+    def __init__(self, prompt_lookup_max: int = 3, prompt_lookup_min: int = 1):
+        assert (
+            0 < prompt_lookup_min <= prompt_lookup_max
+        ), "NgramProposer: invalid n-gram range"
+        self.prompt_lookup_max = prompt_lookup_max
+        self.prompt_lookup_min = prompt_lookup_min
+
+    def _propose(self, token_ids: List[int], num_tokens: int) -> List[int]:
+        for n in range(self.prompt_lookup_max, self.prompt_lookup_min - 1, -1):
+            if len(token_ids) <= n:
+                continue
+            pattern = token_ids[-n:]
+            for start in range(len(token_ids) - n - 1, -1, -1):
+                if token_ids[start : start + n] == pattern:
+                    return token_ids[start + n : start + n + num_tokens]
+        return []
+
+    def propose(self, seqs: List[Sequence], num_tokens: List[int]) -> List[List[int]]:
+        return [self._propose(seq.token_ids, n) for seq, n in zip(seqs, num_tokens)]
+
+    def free(self, seq_id: int):
+        pass
+
+
+class DraftModelProposer:
+    r"""
+    Proposes the draft tokens with greedy decoding of a small draft model.
+    The draft model has its own paged KV cache but shares the block tables of
+    the target model, so a draft token is stored in the same slot as the
+    target token at the same position. The draft KV cache of a sequence is
+    valid up to the tokens accepted by the target model, the rejected entries
+    are overwritten by the next proposal.
+    """
+
+    def __init__(
+        self,
+        model: Callable,
+        block_manager: BlockSpaceManager,
+        num_layers: int,
+        num_kv_heads: int,
+        head_size: int,
+        num_blocks: int,
+        dtype: torch.dtype,
+    ):
+        self.model = model
+        self.block_manager = block_manager
+        cache_shape = (num_blocks, num_kv_heads, block_manager.block_size, head_size)
+        self.kv_caches = [
+            (
+                torch.zeros(cache_shape, dtype=dtype),
+                torch.zeros(cache_shape, dtype=dtype),
+            )
+            for _ in range(num_layers)
+        ]
+        # the number of tokens of every sequence stored in the draft KV cache
+        self.num_computed_tokens: Dict[int, int] = {}
+
+    def _forward(self, batch) -> List[int]:
+        input_ids, positions, attn_metadata = prepare_paged_inputs(
+            self.block_manager, batch
+        )
+        logits = self.model(input_ids, positions, self.kv_caches, attn_metadata)
+        if logits.size(0) != attn_metadata.num_seqs:
+            logits = logits[attn_metadata.last_token_indices]
+        return logits.argmax(dim=-1).tolist()
+
+    def propose(self, seqs: List[Sequence], num_tokens: List[int]) -> List[List[int]]:
+        drafts: List[List[int]] = [[] for _ in seqs]
+        # the first forward also catches up the tokens that are not in the
+        # draft KV cache yet (the prompt, and the last accepted tokens)
+        batch, active = [], []
+        for i, seq in enumerate(seqs):
+            start = min(
+                self.num_computed_tokens.get(seq.seq_id, 0), seq.num_computed_tokens
+            )
+            batch.append((seq.seq_id, seq.token_ids[start:], start))
+            active.append(i)
+        while batch:
+            next_tokens = self._forward(batch)
+            next_batch, next_active = [], []
+            for (seq_id, token_ids, start), i, token in zip(batch, active, next_tokens):
+                self.num_computed_tokens[seq_id] = start + len(token_ids)
+                drafts[i].append(token)
+                if len(drafts[i]) < num_tokens[i]:
+                    next_batch.append((seq_id, [token], start + len(token_ids)))
+                    next_active.append(i)
+            batch, active = next_batch, next_active
+        return drafts
+
+    def free(self, seq_id: int):
+        self.num_computed_tokens.pop(seq_id, None)
@@ -31,6 +31,7 @@ from transformers.utils import (
 )
 from transformers.tokenization_utils_base import BatchEncoding, EncodedInput
 from collections.abc import Mapping, Sized
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
 import pathlib
@@ -697,18 +698,71 @@ def _preprocess_deepseek_v3_checkpoint(checkpoint, quant_config):
             del data
 
 
+class _LazySafetensorsTensor:
+    r"""
+    A tensor of a memory-mapped safetensors file. Only the indexed range is read
+    from the file, so that sharding reads the part of the tensor owned by the
+    current rank instead of the whole tensor.
+    """
+
+    def __init__(self, handle, key):
+        self._handle = handle
+        self._key = key
+        self._slice = handle.get_slice(key)
+        self.shape = torch.Size(self._slice.get_shape())
+
+    def size(self, dim=None):
+        return self.shape if dim is None else self.shape[dim]
+
+    def __getitem__(self, index):
+        return self._slice[index]
+
+    def load(self):
+        return self._handle.get_tensor(self._key)
+
+
+def _load_checkpoint_file_lazily(ckpt):
+    r"""
+    Opens a checkpoint file without reading the tensors: safetensors files are
+    memory-mapped and read on indexing, the other files are loaded with
+    ``mmap=True`` when they are saved in the zip format.
+    """
+    if str(ckpt).endswith(".safetensors"):
+        from safetensors import safe_open
+
+        handle = safe_open(ckpt, framework="pt")
+        return {key: _LazySafetensorsTensor(handle, key) for key in handle.keys()}
+    try:
+        return torch.load(ckpt, weights_only=True, mmap=True)
+    except RuntimeError:
+        # legacy (non-zip) format cannot be memory-mapped
+        return torch.load(ckpt, weights_only=True)
+
+
+def _materialize_checkpoint(checkpoint):
+    return {
+        key: data.load() if isinstance(data, _LazySafetensorsTensor) else data
+        for key, data in checkpoint.items()
+    }
+
+
 def load_low_precision_checkpoint(
     pathname: Union[str, os.PathLike],
     rank: int = 0,
     world_size: int = 1,
+    num_workers: int = 4,
 ):
     r"""
     Load low precision checkpoint from a file or a directory containing multiple files.
     Supported file format: .pt, .bin, .pth, .safetensors.
+    The files are memory-mapped and loaded by a thread pool. With ``world_size > 1``,
+    every rank only reads the shards it owns (see ``shard_low_precision_checkpoint``
+    for the sharding policy), so the memory usage per rank scales with 1 / world_size.
     Args:
         pathname (str or os.PathLike): Path to the checkpoint file or directory containing multiple checkpoint files.
         rank (int, optional): Rank of the current process for Tensor Parallel. Default: 0.
         world_size (int, optional): World size for Tensor Parallel. Default: 1.
+        num_workers (int, optional): The number of threads loading the checkpoint files in parallel. Default: 4.
     Returns:
         Tuple[Dict[str, torch.Tensor], Dict[str, Any]]: A tuple of low precision checkpoint and quantization config.
         The quantization config contains quantization method, group size and desc_act.
@@ -727,14 +781,12 @@ def load_low_precision_checkpoint(
     config_file = pathname + "/config.json"
     assert os.path.exists(config_file), f"Cannot find config.json in path: {pathname}."
 
-    load_fn = partial(torch.load, weights_only=True)
     if file_type == "*.safetensors":
         try:
-            import safetensors
+            import safetensors  # noqa: F401
         except ImportError:
             print("Please install safetensors package to load safetensors checkpoint.")
             exit(1)
-        load_fn = safetensors.torch.load_file
 
     # load config.json and find quantization_config
     model_config = None
@@ -819,12 +871,16 @@ def load_low_precision_checkpoint(
     logger.debug(
         f"Loading {len(checkpoint_files)} checkpoint files on rank {rank}/{world_size}"
     )
-    for ckpt in checkpoint_files:
-        data_f = load_fn(ckpt)
+
+    def load_fn(ckpt):
+        data_f = _load_checkpoint_file_lazily(ckpt)
         if quant_method == "fp8":
+            for key in data_f:
+                if "weight_scale_inv" in key:
+                    data_f[key] = _materialize_checkpoint({key: data_f[key]})[key]
             _preprocess_deepseek_v3_checkpoint(data_f, quant_config)
         if world_size > 1:
-            data_f_shard = shard_low_precision_checkpoint(
+            data_f = shard_low_precision_checkpoint(
                 data_f,
                 model_config,
                 rank,
@@ -834,8 +890,11 @@ def load_low_precision_checkpoint(
                 desc_act,
                 bits,
             )
-            low_precision_checkpoint.update(data_f_shard)
-        else:
+        return _materialize_checkpoint(data_f)
+
+    num_workers = max(1, min(num_workers, len(checkpoint_files)))
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for data_f in executor.map(load_fn, checkpoint_files):
             low_precision_checkpoint.update(data_f)
     logger.debug(f"loading checkpoint files done on rank {rank}/{world_size}")
 
@@ -3,8 +3,11 @@ from ...cpu.nn import _roi_align
 from .merged_embeddingbag import MergedEmbeddingBagWithSGD
 from .merged_embeddingbag import MergedEmbeddingBag
 from .merged_embeddingbag import MergedEmbeddingBagWithCat
+from .merged_embeddingbag import QuantizedMergedEmbeddingBag
 from .merged_embeddingbag import MergedEmbeddingBagWithAdaGrad
 from .merged_embeddingbag import DistMergeEmbeddingBagWithAdaGrad
+from .merged_embeddingbag_sharding import EmbeddingShardingPlan
+from .merged_embeddingbag_cache import MergedEmbeddingBagWithCache
 from ...cpu.nn.linear_fuse_eltwise import IPEXLinearEltwise
 from .weight_only_quantization import (
     WeightOnlyQuantizedLinear,
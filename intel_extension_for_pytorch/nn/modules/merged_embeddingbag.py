@@ -1,7 +1,7 @@
 import torch
 from torch import nn
 from torch.autograd import Function
-from typing import List, Optional, NamedTuple
+from typing import List, Optional, NamedTuple, Union
 import enum
 
 
@@ -256,6 +256,11 @@ class MergedEmbeddingBag(nn.Module):
         could benefit low parallelization efficiency scenarios when data size read out from embedding tables are not
         large enough.
 
+    The tables may have different `embedding_dim`, `dtype` and `include_last_offset`, e.g. a 16-dim float table
+    and a 256-dim bfloat16 table, without padding them to the same shape. They are still looked up by a single
+    kernel, each table returns its own output of shape `(batch_size, embedding_dim)`. `pooling_mode` must be the same
+    for all the tables.
+
     Now `MergedEmbeddingBagWithSGD` is the only option running with an optimizer. We plan to add more optimizer support
     in the future. Visit `MergedEmbeddingBagWithSGD` for introduction of `MergedEmbeddingBagWith[Optimizer]`.
     """
@@ -269,14 +274,14 @@ class MergedEmbeddingBag(nn.Module):
         super(MergedEmbeddingBag, self).__init__()
         self.n_tables = len(embedding_specs)
         assert self.n_tables > 0, "MergedEmbeddingBag at least have 1 table"
-        self.embedding_dim = embedding_specs[0].embedding_dim
-        assert all(
-            specs.embedding_dim == self.embedding_dim for specs in embedding_specs
-        ), "expect all tables have same embedding_dim"
-        self.dtype = embedding_specs[0].dtype
-        assert all(
-            specs.dtype == self.dtype for specs in embedding_specs
-        ), "expect all tables have same dtype"
+        # tables may have different embedding_dim and dtype, they are still
+        # looked up by a single kernel which writes one output per table
+        self.embedding_dims = [specs.embedding_dim for specs in embedding_specs]
+        self.dtypes = [specs.dtype for specs in embedding_specs]
+        self.embedding_dim = (
+            self.embedding_dims[0] if len(set(self.embedding_dims)) == 1 else None
+        )
+        self.dtype = self.dtypes[0] if len(set(self.dtypes)) == 1 else None
         self.pooling_mode = embedding_specs[0].pooling_mode
         assert self.pooling_mode in (
             "sum",
@@ -289,11 +294,15 @@ class MergedEmbeddingBag(nn.Module):
             self.pooling_mode = PoolingMode.SUM
         else:
             self.pooling_mode = PoolingMode.MEAN
-        self.include_last_offset = embedding_specs[0].include_last_offset
-        assert all(
-            specs.include_last_offset == self.include_last_offset
-            for specs in embedding_specs
-        ), "expect all tables have same include_last_offset"
+        include_last_offsets = [specs.include_last_offset for specs in embedding_specs]
+        self.include_last_offset = all(include_last_offsets)
+        # With mixed include_last_offset, the last offset of the tables having it
+        # is dropped in forward, the kernel takes the end of the last bag from the
+        # number of indices.
+        self.drop_last_offset = [
+            include_last_offset and not self.include_last_offset
+            for include_last_offset in include_last_offsets
+        ]
 
         # Currently MergedEmbeddingBag only support all dense
         self.dense = all(not specs.sparse for specs in embedding_specs)
@@ -329,6 +338,18 @@ class MergedEmbeddingBag(nn.Module):
             )
         return cls(embedding_specs)
 
+    def normalize_offsets(self, offsets):
+        r"""
+        Drop the last offset of the tables with `include_last_offset=True` when
+        the tables are mixed with ones having `include_last_offset=False`.
+        """
+        if not any(self.drop_last_offset):
+            return offsets
+        return [
+            offset[:-1] if drop else offset
+            for offset, drop in zip(offsets, self.drop_last_offset)
+        ]
+
     def extra_repr(self) -> str:
         s = "number of tables={}\n".format(self.n_tables)
         for i in range(self.n_tables):
@@ -355,7 +376,11 @@ class MergedEmbeddingBag(nn.Module):
         """
         assert self.dense
         return merged_embeddingbag(
-            self.weights, indices, offsets, self.pooling_mode, self.include_last_offset
+            self.weights,
+            indices,
+            self.normalize_offsets(offsets),
+            self.pooling_mode,
+            self.include_last_offset,
         )
 
 
@@ -470,7 +495,7 @@ class MergedEmbeddingBagWithSGD(MergedEmbeddingBag):
         return merged_embeddingbag_sgd(
             self.weights,
             indices,
-            offsets,
+            self.normalize_offsets(offsets),
             self.pooling_mode,
             self.include_last_offset,
             self.sgd_args,
@@ -575,7 +600,7 @@ class MergedEmbeddingBagWithAdaGrad(MergedEmbeddingBag):
         return merged_embeddingbag_adagrad(
             self.weights,
             indices,
-            offsets,
+            self.normalize_offsets(offsets),
             self.pooling_mode,
             self.include_last_offset,
             self.adagrad_args,
@@ -635,6 +660,9 @@ class MergedEmbeddingBagWithCat(MergedEmbeddingBag):
         embedding_specs: List[EmbeddingSpec],
     ):
         super(MergedEmbeddingBagWithCat, self).__init__(embedding_specs)
+        assert (
+            self.embedding_dim is not None and self.dtype is not None
+        ), "expect all tables have same embedding_dim and dtype for MergedEmbeddingBagWithCat"
 
     def forward(self, indices, offsets, dense_feature):
         r"""
@@ -653,7 +681,278 @@ class MergedEmbeddingBagWithCat(MergedEmbeddingBag):
         )
 
 
+def quantize_rowwise(weight, bits=8, chunk_rows=65536):
+    r"""
+    Quantize a 2D table row by row to `bits` (8 or 4) unsigned integers with
+    a fp32 scale and bias per row. Every packed row is
+    `[quantized values | scale | bias]` in a uint8 tensor, 4 bits values are
+    packed two per byte with the even element in the low nibble.
+    """
+    assert bits in (8, 4), "only support 8 or 4 bits row-wise quantization"
+    num_rows, emb_dim = weight.shape
+    assert (
+        bits == 8 or emb_dim % 2 == 0
+    ), "expect even embedding_dim for 4 bits row-wise quantization"
+    data_bytes = emb_dim * bits // 8
+    qmax = 2**bits - 1
+    qweight = torch.empty((num_rows, data_bytes + 8), dtype=torch.uint8)
+    # trained tables may be large, quantize a chunk of rows at a time
+    for begin in range(0, num_rows, chunk_rows):
+        w = weight[begin : begin + chunk_rows].float()
+        w_min = w.min(dim=1, keepdim=True).values
+        scale = (w.max(dim=1, keepdim=True).values - w_min) / qmax
+        inv_scale = torch.where(scale > 0, 1.0 / scale, torch.zeros_like(scale))
+        q = ((w - w_min) * inv_scale).round_().clamp_(0, qmax).to(torch.uint8)
+        if bits == 4:
+            q = q[:, 0::2] | (q[:, 1::2] << 4)
+        qrows = qweight[begin : begin + chunk_rows]
+        qrows[:, :data_bytes] = q
+        qrows[:, data_bytes:] = torch.cat([scale, w_min], dim=1).view(torch.uint8)
+    return qweight
+
+
+def dequantize_rowwise(qweight, bits=8):
+    r"""
+    Reverse of `quantize_rowwise`, returns a fp32 table.
+    """
+    data_bytes = qweight.size(1) - 8
+    scale_bias = qweight[:, data_bytes:].contiguous().view(torch.float)
+    q = qweight[:, :data_bytes]
+    if bits == 4:
+        q = torch.stack([q & 0xF, q >> 4], dim=2).flatten(1)
+    return q.float() * scale_bias[:, :1] + scale_bias[:, 1:]
+
+
+def qmerged_embeddingbag_rowwise(
+    qweights, indices, offsets, bits, pooling_mode, include_last_offset
+):
+    return torch.ops.torch_ipex.qmerged_embeddingbag_rowwise_forward(
+        qweights, indices, offsets, bits, pooling_mode, include_last_offset
+    )
+
+
+class QuantizedMergedEmbeddingBag(nn.Module):
+    r"""
+    Inference only `MergedEmbeddingBag` with row-wise INT8 or INT4 quantized tables.
+
+    Every row of a table keeps its own fp32 scale and bias, so a row of `embedding_dim`
+    fp32 values shrinks from `4 * embedding_dim` bytes to `embedding_dim + 8` bytes with
+    INT8, and to `embedding_dim / 2 + 8` bytes with INT4. The rows are dequantized while
+    being pooled in a single kernel for all the tables, the outputs are fp32. Embedding
+    lookups are bound by memory bandwidth, so smaller rows directly speed them up.
+
+    Convert trained tables with:
+
+        >>> merged_emb = MergedEmbeddingBag.from_embeddingbag_list(EmbLists)
+        >>> qmerged_emb = QuantizedMergedEmbeddingBag.from_float(merged_emb, bits=8)
+        >>> outputs = qmerged_emb(indices, offsets)
+
+    `bits` can also be a list to pick 8 or 4 bits per table, e.g. INT4 for the largest
+    tables only. INT4 tables expect an even `embedding_dim`.
+    """
+
+    def __init__(
+        self,
+        qweights: List[torch.Tensor],
+        bits: List[int],
+        pooling_mode: PoolingMode,
+        include_last_offset: bool,
+        drop_last_offset: Optional[List[bool]] = None,
+    ):
+        super(QuantizedMergedEmbeddingBag, self).__init__()
+        self.n_tables = len(qweights)
+        assert self.n_tables > 0, "QuantizedMergedEmbeddingBag at least have 1 table"
+        assert len(bits) == self.n_tables, "expect one bits for each table"
+        assert all(b in (8, 4) for b in bits), "only support 8 or 4 bits tables"
+        self.bits = list(bits)
+        self.embedding_dims = [
+            (qweight.size(1) - 8) * 8 // b for qweight, b in zip(qweights, self.bits)
+        ]
+        self.pooling_mode = pooling_mode
+        self.include_last_offset = include_last_offset
+        self.drop_last_offset = (
+            drop_last_offset
+            if drop_last_offset is not None
+            else [False] * self.n_tables
+        )
+        for i, qweight in enumerate(qweights):
+            assert qweight.dtype == torch.uint8 and qweight.dim() == 2
+            self.register_buffer("qweight{}".format(i), qweight.contiguous())
+
+    @property
+    def qweights(self):
+        return [getattr(self, "qweight{}".format(i)) for i in range(self.n_tables)]
+
+    @classmethod
+    def from_float(
+        cls,
+        merged_emb: MergedEmbeddingBag,
+        bits: Union[int, List[int]] = 8,
+    ):
+        r"""
+        Quantize the tables of a trained `MergedEmbeddingBag` (or its subclasses).
+        """
+        if isinstance(bits, int):
+            bits = [bits] * merged_emb.n_tables
+        qweights = [
+            quantize_rowwise(weight.detach(), b)
+            for weight, b in zip(merged_emb.weights, bits)
+        ]
+        return cls(
+            qweights,
+            bits,
+            merged_emb.pooling_mode,
+            merged_emb.include_last_offset,
+            merged_emb.drop_last_offset,
+        )
+
+    @classmethod
+    def from_embeddingbag_list(
+        cls,
+        tables: List[torch.nn.EmbeddingBag],
+        bits: Union[int, List[int]] = 8,
+    ):
+        return cls.from_float(MergedEmbeddingBag.from_embeddingbag_list(tables), bits)
+
+    normalize_offsets = MergedEmbeddingBag.normalize_offsets
+
+    def extra_repr(self) -> str:
+        s = "number of tables={}\n".format(self.n_tables)
+        for i in range(self.n_tables):
+            s += "table{}: {}, {}, {}, int{}".format(
+                i,
+                self.qweights[i].shape[0],
+                self.embedding_dims[i],
+                self.pooling_mode,
+                self.bits[i],
+            )
+            if i != self.n_tables - 1:
+                s += "\n"
+        return s
+
+    def forward(self, indices, offsets):
+        r"""
+        Args:
+            indices (List[Tensor]):
+                See https://pytorch.org/docs/stable/generated/torch.nn.EmbeddingBag.html#torch.nn.EmbeddingBag.forward
+            offsets (List[Tensor]):
+                See https://pytorch.org/docs/stable/generated/torch.nn.EmbeddingBag.html#torch.nn.EmbeddingBag.forward
+        Returns:
+            List[Tensor] fp32 output shape of `(batch_size, embedding_dim)` which length = num of tables.
+        """
+        return qmerged_embeddingbag_rowwise(
+            self.qweights,
+            indices,
+            self.normalize_offsets(offsets),
+            self.bits,
+            self.pooling_mode,
+            self.include_last_offset,
+        )
+
+
 import torch.distributed as dist
+from .merged_embeddingbag_sharding import EmbeddingShardingPlan
+
+
+def _align8(nbytes):
+    return (nbytes + 7) // 8 * 8
+
+
+def _as_bytes(t):
+    return t.contiguous().view(-1).view(torch.uint8)
+
+
+def pack_sparse_buffers(
+    send_idx: List[torch.Tensor],
+    send_buf: List[torch.Tensor],
+    send_ofs: List[torch.Tensor],
+):
+    r"""
+    Pack the indices, values and offsets sent to every rank into a single uint8 buffer.
+    The chunk of each rank is `[offsets | values | indices]`, every section is padded
+    to 8 bytes so it can be viewed back in place. Returns the buffer, the
+    `[num indices, num offsets]` header of each chunk and the chunk sizes in bytes.
+    """
+    header = torch.tensor(
+        [[idx.numel(), ofs.numel()] for idx, ofs in zip(send_idx, send_ofs)],
+        dtype=torch.int64,
+    )
+    pieces = []
+    split_sizes = []
+    for idx, buf, ofs in zip(send_idx, send_buf, send_ofs):
+        size = 0
+        for t in (ofs, buf, idx):
+            nbytes = t.numel() * t.element_size()
+            pieces.append(_as_bytes(t))
+            if _align8(nbytes) != nbytes:
+                pieces.append(torch.zeros(_align8(nbytes) - nbytes, dtype=torch.uint8))
+            size += _align8(nbytes)
+        split_sizes.append(size)
+    return torch.cat(pieces), header, split_sizes
+
+
+def _sparse_split_sizes(header, index_type, val_type, emb_dim):
+    index_size = torch.empty(0, dtype=index_type).element_size()
+    val_size = torch.empty(0, dtype=val_type).element_size()
+    return [
+        _align8(n_ofs * 8)
+        + _align8(n_idx * emb_dim * val_size)
+        + _align8(n_idx * index_size)
+        for n_idx, n_ofs in header.tolist()
+    ]
+
+
+def unpack_sparse_buffers(
+    buffer: torch.Tensor,
+    header: torch.Tensor,
+    index_type: torch.dtype,
+    val_type: torch.dtype,
+    emb_dim: int,
+):
+    r"""
+    Reverse of `pack_sparse_buffers`, views the received chunks as lists of indices,
+    values and offsets without copying.
+    """
+    recv_idx, recv_buf, recv_ofs = [], [], []
+    begin = 0
+    for n_idx, n_ofs in header.tolist():
+        for n, dtype, out in (
+            (n_ofs, torch.int64, recv_ofs),
+            (n_idx * emb_dim, val_type, recv_buf),
+            (n_idx, index_type, recv_idx),
+        ):
+            nbytes = n * torch.empty(0, dtype=dtype).element_size()
+            out.append(buffer[begin : begin + nbytes].view(dtype))
+            begin += _align8(nbytes)
+    recv_buf = [buf.view(-1, emb_dim) for buf in recv_buf]
+    return recv_idx, recv_buf, recv_ofs
+
+
+class SparseAll2AllWork(object):
+    r"""
+    Handle of a `sparse_all2all` started with `async_op=True`, `wait()` returns the received
+    indices, values and offsets.
+    """
+
+    def __init__(self, work, recv, recv_header, index_type, val_type, emb_dim):
+        self._work = work
+        self._recv = recv
+        self._recv_header = recv_header
+        self._index_type = index_type
+        self._val_type = val_type
+        self._emb_dim = emb_dim
+
+    def wait(self):
+        if self._work is not None:
+            self._work.wait()
+            self._work = None
+        return unpack_sparse_buffers(
+            self._recv,
+            self._recv_header,
+            self._index_type,
+            self._val_type,
+            self._emb_dim,
+        )
 
 
 def sparse_all2all(
@@ -661,31 +960,38 @@ def sparse_all2all(
     send_idx: List[torch.Tensor],
     send_buf: List[torch.Tensor],
     send_ofs: List[torch.Tensor],
+    async_op: bool = False,
 ):
-    # the first thing to know is the recv tensor sizes
-    # this requires an all to all
-    is_buffers = [torch.empty(1, dtype=torch.int64) for _ in range(world_size)]
-    for i in range(world_size):
-        is_buffers[i][0] = send_idx[i].shape[0]
-    os_buffers = [torch.empty(1, dtype=torch.int64) for _ in range(world_size)]
-    dist.all_to_all(os_buffers, is_buffers)
-    dist.barrier()
-
-    # init received buffers sizes
+    # indices, values and offsets are sent in one packed message, only the tiny
+    # header with the sizes is exchanged before it to size the receive buffer
     index_type = send_idx[0].dtype
     val_type = send_buf[0].dtype
     emb_dim = send_buf[0].shape[1]
-    ofs_size = send_ofs[0].shape[0]
-    recv_idx = [torch.zeros(os_buffers[i], dtype=index_type) for i in range(world_size)]
-    recv_buf = [
-        torch.zeros((os_buffers[i], emb_dim), dtype=val_type) for i in range(world_size)
-    ]
-    recv_ofs = [torch.zeros((ofs_size,), dtype=torch.int64) for i in range(world_size)]
-    dist.all_to_all(recv_idx, send_idx)
-    dist.all_to_all(recv_buf, send_buf)
-    dist.all_to_all(recv_ofs, send_ofs)
-    dist.barrier()
-    return recv_idx, recv_buf, recv_ofs
+    send, header, send_split_sizes = pack_sparse_buffers(send_idx, send_buf, send_ofs)
+    recv_header = torch.empty_like(header)
+    dist.all_to_all_single(recv_header, header)
+    recv_split_sizes = _sparse_split_sizes(recv_header, index_type, val_type, emb_dim)
+    recv = torch.empty(sum(recv_split_sizes), dtype=torch.uint8)
+    work = dist.all_to_all_single(
+        recv, send, recv_split_sizes, send_split_sizes, async_op=async_op
+    )
+    work = SparseAll2AllWork(
+        work if async_op else None, recv, recv_header, index_type, val_type, emb_dim
+    )
+    return work if async_op else work.wait()
+
+
+def dist_merged_embeddingbag_forward_local(
+    weight, row_offset, indices, offsets, rank, world_size, include_last_offsets
+):
+    (
+        send_idx,
+        send_buf,
+        send_ofs,
+    ) = torch.ops.torch_ipex.mergedemb_distribute_forward_local(
+        weight, row_offset, indices, offsets, rank, world_size, include_last_offsets
+    )
+    return sparse_all2all(world_size, send_idx, send_buf, send_ofs, async_op=True)
 
 
 class DistMergeEmbeddingBagFunc(Function):
@@ -700,6 +1006,7 @@ class DistMergeEmbeddingBagFunc(Function):
         world_size: int,
         include_last_offsets: bool,
         adagrad_args: AdaGradArgs,
+        exchange: Optional[SparseAll2AllWork] = None,
     ):
         global_bs = offsets[0].size(0)
         if include_last_offsets:
@@ -715,16 +1022,17 @@ class DistMergeEmbeddingBagFunc(Function):
         ctx.world_size = world_size
         num_emb = len(indices)
         emb_dim = weight.shape[1]
-        (
-            send_idx,
-            send_buf,
-            send_ofs,
-        ) = torch.ops.torch_ipex.mergedemb_distribute_forward_local(
-            weight, row_offset, indices, offsets, rank, world_size, include_last_offsets
-        )
-        recv_idx, recv_buf, recv_ofs = sparse_all2all(
-            world_size, send_idx, send_buf, send_ofs
-        )
+        if exchange is None:
+            exchange = dist_merged_embeddingbag_forward_local(
+                weight,
+                row_offset,
+                indices,
+                offsets,
+                rank,
+                world_size,
+                include_last_offsets,
+            )
+        recv_idx, recv_buf, recv_ofs = exchange.wait()
         output = torch.empty((local_bs, num_emb, emb_dim), dtype=weight.dtype)
         torch.ops.torch_ipex.mergedemb_distribute_forward_merge(
             output, recv_idx, recv_buf, recv_ofs, num_emb
@@ -758,7 +1066,20 @@ class DistMergeEmbeddingBagFunc(Function):
         torch.ops.torch_ipex.mergedemb_distribute_backward_merge_adagrad_update(
             recv_idx, recv_buf, recv_ofs, weight, trail[0], hessian[0], lr, eps
         )
-        return None, None, None, None, None, None, None, None
+        return None, None, None, None, None, None, None, None, None
+
+
+class DistMergeEmbeddingBagWork(object):
+    r"""
+    Handle of `DistMergeEmbeddingBagWithAdaGrad.forward_async`, `wait()` returns the output.
+    """
+
+    def __init__(self, args, exchange: SparseAll2AllWork):
+        self._args = args
+        self._exchange = exchange
+
+    def wait(self):
+        return DistMergeEmbeddingBagFunc.apply(*self._args, self._exchange)
 
 
 class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
@@ -775,6 +1096,11 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
         >>> dist.init_process_group("ccl", world_size=world_size, rank=rank)
         >>> distributed_emb = DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(EmbLists)
         >>> out = distributed_emb(indices, offsets)
+
+    The tables are placed by an `EmbeddingShardingPlan`, planned from the table sizes and `access_freq`
+    (lookups of every table per sample) if not given. Each rank only builds its own rows, pass tables with
+    `weight=None` in `embedding_specs` to initialize them on the local rows only, or memory-mapped weights to
+    only read the local rows.
     """
 
     def __init__(
@@ -782,25 +1108,47 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
         embedding_specs: List[EmbeddingSpec],
         lr: float = 0.01,
         eps: float = 1e-10,
+        access_freq: Optional[List[float]] = None,
+        sharding_plan: Optional[EmbeddingShardingPlan] = None,
     ):
-        super(MergedEmbeddingBagWithAdaGrad, self).__init__(embedding_specs)
+        # keep the full tables out of the module, only the local rows are built
+        super(MergedEmbeddingBagWithAdaGrad, self).__init__(
+            [
+                spec._replace(
+                    weight=torch.empty((0, spec.embedding_dim), dtype=spec.dtype)
+                )
+                for spec in embedding_specs
+            ]
+        )
         assert (
             self.pooling_mode == PoolingMode.SUM
         ), "only support SUM for DistMergeEmbeddingBagWithAdaGrad"
+        assert (
+            self.embedding_dim is not None and self.dtype is not None
+        ), "expect all tables have same embedding_dim and dtype for DistMergeEmbeddingBagWithAdaGrad"
+        assert not any(
+            self.drop_last_offset
+        ), "expect all tables have same include_last_offset for DistMergeEmbeddingBagWithAdaGrad"
         self._rank = dist.get_rank()
         self._size = dist.get_world_size()
-        # create row_offset
+        if sharding_plan is None:
+            sharding_plan = EmbeddingShardingPlan.plan(
+                [spec.num_embeddings for spec in embedding_specs],
+                self._size,
+                access_freq,
+            )
+        assert sharding_plan.world_size == self._size
+        self.sharding_plan = sharding_plan
+        # the plan maps indices to global rows, the kernels need no row_offset
         self._row_offset = [0 for i in range(self.n_tables + 1)]
-        for i in range(self.n_tables):
-            self._row_offset[i + 1] = self.weights[i].shape[0] + self._row_offset[i]
-        # create allin1 weight
-        # TODO: The initialization for weight here requiures 2 * total weight size PEAK memory
-        # We may able to optimize here to:
-        #     1. Require (1 + 1 / world_size) PEAK memory if always load all table first
-        #     2. Require (1 / world_size) memory with loading optimizations like using "meta" device
-        weight_allin1 = torch.cat([w.data for w in self.weights])[
-            self._rank :: self._size, :
-        ].clone()
+        # create allin1 weight with the local rows only, peak memory is 1 / world_size
+        # of the total weight size on top of the given tables
+        weight_allin1 = sharding_plan.shard(
+            self._rank,
+            [spec.weight for spec in embedding_specs],
+            self.embedding_dim,
+            self.dtype,
+        )
         # drop the oringal weighs
         self.weights = nn.ParameterList([nn.parameter.Parameter(weight_allin1)])
         self.n_tables = 1
@@ -817,7 +1165,23 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
             self.adagrad_args.hessian.append(torch.zeros_like(weight_allin1))
 
     def forward(self, indices: List[torch.Tensor], offset: List[torch.Tensor]):
-        out = DistMergeEmbeddingBagFunc.apply(
+        return self.forward_async(indices, offset).wait()
+
+    def forward_async(self, indices: List[torch.Tensor], offset: List[torch.Tensor]):
+        r"""
+        Look up the local rows and start sending the partial results to the other ranks,
+        `wait()` on the returned handle merges them into the output. Work started in between,
+        e.g. the dense MLP of the current batch, overlaps with the all to all:
+
+            >>> work = distributed_emb.forward_async(indices[i + 1], offsets[i + 1])
+            >>> dense_out = bottom_mlp(dense[i + 1])
+            >>> out = work.wait()
+
+        The lookup reads the weights when it is started, start it after the backward of the
+        previous batch to see its update.
+        """
+        indices = self.sharding_plan.to_global_rows(indices)
+        exchange = dist_merged_embeddingbag_forward_local(
             self.weights[0],
             self._row_offset,
             indices,
@@ -825,9 +1189,45 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
             self._rank,
             self._size,
             self.include_last_offset,
-            self.adagrad_args,
         )
-        return out
+        return DistMergeEmbeddingBagWork(
+            (
+                self.weights[0],
+                self._row_offset,
+                indices,
+                offset,
+                self._rank,
+                self._size,
+                self.include_last_offset,
+                self.adagrad_args,
+            ),
+            exchange,
+        )
+
+    @classmethod
+    def from_embeddingbag_list(
+        cls,
+        tables: List[torch.nn.EmbeddingBag],
+        lr: float = 0.01,
+        eps: float = 1e-10,
+        access_freq: Optional[List[float]] = None,
+        sharding_plan: Optional[EmbeddingShardingPlan] = None,
+    ):
+        embedding_specs = []
+        for emb in tables:
+            emb_shape = emb.weight.shape
+            embedding_specs.append(
+                EmbeddingSpec(
+                    num_embeddings=emb_shape[0],
+                    embedding_dim=emb_shape[1],
+                    pooling_mode=emb.mode,
+                    dtype=emb.weight.dtype,
+                    weight=emb.weight.detach(),
+                    sparse=emb.sparse,
+                    include_last_offset=emb.include_last_offset,
+                )
+            )
+        return cls(embedding_specs, lr, eps, access_freq, sharding_plan)
 
     def extra_repr(self) -> str:
         s = ""
@@ -0,0 +1,349 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+
+import torch
+from torch import nn
+
+from .merged_embeddingbag import (
+    EmbeddingSpec,
+    MergedEmbeddingBag,
+    MergedEmbeddingBagWithAdaGrad,
+    MergedEmbeddingBagWithSGD,
+)
+
+
+class _TieredTable(object):
+    r"""
+    Rows of one embedding table and of its optimizer states. The full rows live in
+    memory-mapped files (cold) and the frequently used rows are cached in DRAM (hot).
+    `hot_states()[i]` caches the rows of `cold_states[i]`, `slot_to_row` maps a cache
+    slot to its row and `row_to_slot` maps a row to its slot or -1.
+    """
+
+    def __init__(self, cold_states, hot_states, num_embeddings, cache_rows):
+        self.cold_states = cold_states
+        # a function, as the parameters of the merged module may be replaced
+        self.hot_states = hot_states
+        self.row_to_slot = torch.full((num_embeddings,), -1, dtype=torch.int32)
+        self.slot_to_row = torch.full((cache_rows,), -1, dtype=torch.int64)
+        # empty slots are evicted first
+        self.slot_score = torch.full((cache_rows,), -float("inf"), dtype=torch.float64)
+        self.slot_dirty = torch.zeros(cache_rows, dtype=torch.bool)
+        # rows written back while a prefetch was reading the cold states
+        self.written_rows = []
+
+    def read_rows(self, rows):
+        return [cold[rows] for cold in self.cold_states]
+
+    def write_back(self, slots):
+        slots = slots[self.slot_dirty[slots]]
+        if slots.numel() == 0:
+            return None
+        rows = self.slot_to_row[slots]
+        for cold, hot in zip(self.cold_states, self.hot_states()):
+            cold[rows] = hot[slots]
+        self.slot_dirty[slots] = False
+        return rows
+
+
+class MergedEmbeddingBagWithCache(nn.Module):
+    r"""
+    A `MergedEmbeddingBag` for tables which do not fit in DRAM. The rows of every table (and the states of the fused
+    optimizer, e.g. the AdaGrad hessian) are stored in memory-mapped files under `storage_dir`, typically on NVMe,
+    while a DRAM cache of `cache_rows` rows per table holds the frequently hit rows. Categorical features usually fit
+    power law distribution, so a small cache absorbs most of the lookups.
+
+    On every forward, the rows missing in the cache are loaded into the slots of the least frequently (`"lfu"`) or
+    least recently (`"lru"`) used rows, after writing the evicted rows back to the files if they were updated. The
+    indices are then remapped to cache slots and looked up by the merged kernel of `MergedEmbeddingBag`,
+    `MergedEmbeddingBagWithSGD` (`optimizer="sgd"`) or `MergedEmbeddingBagWithAdaGrad` (`optimizer="adagrad"`), whose
+    fused backward and update work on the cached rows.
+
+    Usage:
+
+        >>> EmbLists = torch.nn.Modulist(emb1, emb2, emb3, ..., emb_m)
+        >>> merged_emb = MergedEmbeddingBagWithCache.from_embeddingbag_list(
+        >>>     EmbLists, cache_rows=100000, storage_dir="/nvme/emb", optimizer="adagrad", lr=0.01)
+        >>> for step, (indices, offsets) in enumerate(batches):
+        >>>     outputs = merged_emb(indices, offsets)
+        >>>     if step + 1 < len(batches):
+        >>>         # read the cold rows of the next batch during the rest of this step
+        >>>         merged_emb.prefetch(batches[step + 1][0])
+        >>>     ...
+        >>> merged_emb.flush()
+
+    Args:
+        embedding_specs (List[EmbeddingSpec]): specs of the tables. If `weight` is None, the rows are read from the
+            existing file of the table in `storage_dir`, or initialized with N(0, 1) like `nn.EmbeddingBag` if there
+            is no such file.
+        cache_rows (int or List[int]): number of rows cached in DRAM for every table. It must be at least the number
+            of unique indices of a table in one batch.
+        storage_dir (str): directory of the memory-mapped files.
+        cache_policy (str): `"lfu"` or `"lru"`.
+        optimizer (str): None, `"sgd"` or `"adagrad"`, the optimizer fused with the backward.
+        optimizer_args: arguments of the fused optimizer, e.g. `lr`.
+    """
+
+    def __init__(
+        self,
+        embedding_specs: List[EmbeddingSpec],
+        cache_rows: Union[int, List[int]],
+        storage_dir: str,
+        cache_policy: str = "lfu",
+        optimizer: Optional[str] = None,
+        **optimizer_args,
+    ):
+        super(MergedEmbeddingBagWithCache, self).__init__()
+        assert cache_policy in (
+            "lfu",
+            "lru",
+        ), "MergedEmbeddingBagWithCache only support cache_policy lfu or lru"
+        merged_cls = {
+            None: MergedEmbeddingBag,
+            "sgd": MergedEmbeddingBagWithSGD,
+            "adagrad": MergedEmbeddingBagWithAdaGrad,
+        }
+        assert (
+            optimizer in merged_cls
+        ), "MergedEmbeddingBagWithCache only support optimizer None, sgd or adagrad"
+        self.n_tables = len(embedding_specs)
+        if isinstance(cache_rows, int):
+            cache_rows = [cache_rows] * self.n_tables
+        assert len(cache_rows) == self.n_tables, "expect cache_rows for every table"
+        self.cache_rows = [
+            min(rows, specs.num_embeddings)
+            for rows, specs in zip(cache_rows, embedding_specs)
+        ]
+        self.cache_policy = cache_policy
+        self.storage_dir = storage_dir
+        os.makedirs(storage_dir, exist_ok=True)
+
+        # the merged module runs on the cached rows only
+        hot_specs = [
+            specs._replace(
+                num_embeddings=rows,
+                weight=torch.zeros((rows, specs.embedding_dim), dtype=specs.dtype),
+            )
+            for rows, specs in zip(self.cache_rows, embedding_specs)
+        ]
+        self.merged_emb = merged_cls[optimizer](hot_specs, **optimizer_args)
+
+        self.tables = []
+        for i, specs in enumerate(embedding_specs):
+            # the optimizer states are tiered together with the weight rows
+            names = ["weight"]
+            if optimizer == "adagrad":
+                names.append("hessian")
+            if optimizer is not None and specs.dtype == torch.bfloat16:
+                names.append("trail")
+            cold_states = [self._open_weight(i, specs)] + [
+                self._open_state(i, name, specs, self._hot_state(i, name).dtype)
+                for name in names[1:]
+            ]
+            if specs.weight is not None:
+                # training from the given weight, drop the states of the files
+                for state in cold_states[1:]:
+                    state.zero_()
+            self.tables.append(
+                _TieredTable(
+                    cold_states,
+                    lambda i=i, names=names: [
+                        self._hot_state(i, name) for name in names
+                    ],
+                    specs.num_embeddings,
+                    self.cache_rows[i],
+                )
+            )
+
+        self.step = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetch_future = None
+
+    def _hot_state(self, table_idx, name):
+        if name == "weight":
+            return self.merged_emb.weights[table_idx].data
+        if name == "hessian":
+            return self.merged_emb.adagrad_args.hessian[table_idx]
+        if isinstance(self.merged_emb, MergedEmbeddingBagWithSGD):
+            return self.merged_emb.sgd_args.bf16_trail[table_idx]
+        return self.merged_emb.adagrad_args.bf16_trail[table_idx]
+
+    def _state_file(self, table_idx, name):
+        return os.path.join(self.storage_dir, "table{}.{}.bin".format(table_idx, name))
+
+    def _open_state(self, table_idx, name, specs, dtype):
+        filename = self._state_file(table_idx, name)
+        numel = specs.num_embeddings * specs.embedding_dim
+        return torch.from_file(filename, shared=True, size=numel, dtype=dtype).view(
+            specs.num_embeddings, specs.embedding_dim
+        )
+
+    def _open_weight(self, table_idx, specs, chunk_rows=65536):
+        exists = os.path.exists(self._state_file(table_idx, "weight"))
+        weight = self._open_state(table_idx, "weight", specs, specs.dtype)
+        if specs.weight is not None:
+            assert specs.weight.shape == weight.shape, "unexpected weight shape"
+            weight.copy_(specs.weight)
+        elif not exists:
+            # initialize by chunk to avoid materializing the whole table in DRAM
+            for start in range(0, specs.num_embeddings, chunk_rows):
+                weight[start : start + chunk_rows].normal_()
+        return weight
+
+    @classmethod
+    def from_embeddingbag_list(
+        cls,
+        tables: List[torch.nn.EmbeddingBag],
+        cache_rows: Union[int, List[int]],
+        storage_dir: str,
+        cache_policy: str = "lfu",
+        optimizer: Optional[str] = None,
+        **optimizer_args,
+    ):
+        embedding_specs = []
+        for emb in tables:
+            emb_shape = emb.weight.shape
+            embedding_specs.append(
+                EmbeddingSpec(
+                    num_embeddings=emb_shape[0],
+                    embedding_dim=emb_shape[1],
+                    pooling_mode=emb.mode,
+                    dtype=emb.weight.dtype,
+                    weight=emb.weight.detach(),
+                    sparse=emb.sparse,
+                    include_last_offset=emb.include_last_offset,
+                )
+            )
+        return cls(
+            embedding_specs,
+            cache_rows,
+            storage_dir,
+            cache_policy,
+            optimizer,
+            **optimizer_args,
+        )
+
+    def extra_repr(self) -> str:
+        return "cache_rows={}, cache_policy={}, storage_dir={}".format(
+            self.cache_rows, self.cache_policy, self.storage_dir
+        )
+
+    def _read_missing_rows(self, indices):
+        staged = []
+        for table, index in zip(self.tables, indices):
+            rows = torch.unique(index.to(torch.int64))
+            rows = rows[table.row_to_slot[rows] < 0]
+            staged.append((rows, table.read_rows(rows)))
+        return staged
+
+    def prefetch(self, indices: List[torch.Tensor]):
+        r"""
+        Start reading the rows of `indices` which are not cached from the memory-mapped files in a background thread.
+        Call it after the forward of the current batch with the indices of the next batch: the next forward uses the
+        prefetched rows instead of reading them, so the reads overlap with the rest of the current step.
+        """
+        self._wait_prefetch()
+        for table in self.tables:
+            table.written_rows = []
+        self._prefetch_future = self._executor.submit(
+            self._read_missing_rows, [index.detach().clone() for index in indices]
+        )
+
+    def _wait_prefetch(self):
+        if self._prefetch_future is None:
+            return None
+        staged = self._prefetch_future.result()
+        self._prefetch_future = None
+        return staged
+
+    def _evict(self, table, num_slots, hit_slots):
+        score = table.slot_score.clone()
+        score[hit_slots] = float("inf")
+        slots = torch.topk(score, num_slots, largest=False).indices
+        rows = table.write_back(slots)
+        if rows is not None:
+            table.written_rows.append(rows)
+        evicted = table.slot_to_row[slots]
+        table.row_to_slot[evicted[evicted >= 0]] = -1
+        table.slot_score[slots] = 0
+        return slots
+
+    def _load_rows(self, table, rows, slots, staged):
+        from_cold = torch.ones(rows.numel(), dtype=torch.bool)
+        if staged is not None and staged[0].numel() > 0:
+            staged_rows, staged_states = staged
+            pos = torch.searchsorted(staged_rows, rows).clamp_(
+                max=staged_rows.numel() - 1
+            )
+            valid = staged_rows[pos] == rows
+            if table.written_rows:
+                # rows written back since the prefetch began may be stale
+                valid &= ~torch.isin(rows, torch.cat(table.written_rows))
+            for hot, state in zip(table.hot_states(), staged_states):
+                hot[slots[valid]] = state[pos[valid]]
+            from_cold = ~valid
+        if from_cold.any():
+            for hot, state in zip(table.hot_states(), table.read_rows(rows[from_cold])):
+                hot[slots[from_cold]] = state
+        table.row_to_slot[rows] = slots.to(torch.int32)
+        table.slot_to_row[slots] = rows
+
+    @torch.no_grad()
+    def remap_indices(self, indices: List[torch.Tensor]):
+        r"""
+        Load the rows of `indices` into the caches and return the indices of their cache slots.
+        """
+        staged = self._wait_prefetch()
+        self.step += 1
+        slot_indices = []
+        for i, (table, index) in enumerate(zip(self.tables, indices)):
+            rows, inverse, counts = torch.unique(
+                index.to(torch.int64), return_inverse=True, return_counts=True
+            )
+            if rows.numel() > self.cache_rows[i]:
+                raise ValueError(
+                    "table {} has {} unique indices in one batch, which exceeds cache_rows {}".format(
+                        i, rows.numel(), self.cache_rows[i]
+                    )
+                )
+            slots = table.row_to_slot[rows].to(torch.int64)
+            miss = slots < 0
+            if miss.any():
+                new_slots = self._evict(table, int(miss.sum()), slots[~miss])
+                self._load_rows(
+                    table,
+                    rows[miss],
+                    new_slots,
+                    staged[i] if staged is not None else None,
+                )
+                slots[miss] = new_slots
+            if self.cache_policy == "lfu":
+                table.slot_score[slots] += counts.to(torch.float64)
+            else:
+                table.slot_score[slots] = float(self.step)
+            if self.training:
+                table.slot_dirty[slots] = True
+            slot_indices.append(slots[inverse].to(index.dtype))
+        return slot_indices
+
+    def forward(self, indices, offsets):
+        r"""
+        Args:
+            indices (List[Tensor]):
+                See https://pytorch.org/docs/stable/generated/torch.nn.EmbeddingBag.html#torch.nn.EmbeddingBag.forward
+            offsets (List[Tensor]):
+                See https://pytorch.org/docs/stable/generated/torch.nn.EmbeddingBag.html#torch.nn.EmbeddingBag.forward
+        Returns:
+            List[Tensor] output shape of `(batch_size, embedding_dim)` which length = num of tables.
+        """
+        return self.merged_emb(self.remap_indices(indices), offsets)
+
+    @torch.no_grad()
+    def flush(self):
+        r"""
+        Write the updated cached rows back to the memory-mapped files, e.g. before saving or sharing the files.
+        """
+        self._wait_prefetch()
+        for table in self.tables:
+            table.write_back(torch.nonzero(table.slot_to_row >= 0).flatten())
@@ -0,0 +1,203 @@
+import enum
+import math
+from typing import List, NamedTuple, Optional
+
+import torch
+
+
+class ShardingType(enum.Enum):
+    TABLE_WISE = "table_wise"
+    ROW_WISE = "row_wise"
+
+
+class TableShard(NamedTuple):
+    sharding_type: ShardingType
+    # owner rank of a table-wise table, -1 for a row-wise table
+    rank: int
+    # first local row of the table on each rank, -1 if the rank holds no row of it
+    local_offsets: List[int]
+
+
+class EmbeddingShardingPlan(object):
+    r"""
+    Placement of the tables of `DistMergeEmbeddingBagWithAdaGrad` on the ranks.
+
+    The distributed kernels keep global row `g` on rank `g % world_size` at local row `g // world_size`.
+    The plan maps the rows of every table to global rows, so a table is either held entirely by one rank
+    (table-wise) or spread round-robin over all the ranks (row-wise), while the local rows of every rank
+    stay dense.
+
+    Use `EmbeddingShardingPlan.plan` to balance the ranks with table sizes and access frequencies:
+
+        >>> plan = EmbeddingShardingPlan.plan([emb.num_embeddings for emb in EmbLists], world_size, access_freq)
+        >>> distributed_emb = DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(EmbLists, sharding_plan=plan)
+    """
+
+    def __init__(
+        self,
+        num_embeddings: List[int],
+        world_size: int,
+        table_shards: List[TableShard],
+    ):
+        assert len(num_embeddings) == len(table_shards)
+        self.num_embeddings = list(num_embeddings)
+        self.world_size = world_size
+        self.table_shards = list(table_shards)
+        self.local_rows = [0] * world_size
+        for n, shard in zip(self.num_embeddings, self.table_shards):
+            for rank in range(world_size):
+                rows = self._num_local_rows(n, shard, rank)
+                if rows > 0:
+                    self.local_rows[rank] = max(
+                        self.local_rows[rank], shard.local_offsets[rank] + rows
+                    )
+        self._row_wise_offsets = [
+            torch.tensor(shard.local_offsets, dtype=torch.int64)
+            for shard in self.table_shards
+        ]
+
+    def _num_local_rows(self, num_embeddings, shard, rank):
+        if shard.sharding_type == ShardingType.ROW_WISE:
+            return len(range(rank, num_embeddings, self.world_size))
+        return num_embeddings if shard.rank == rank else 0
+
+    @classmethod
+    def plan(
+        cls,
+        num_embeddings: List[int],
+        world_size: int,
+        access_freq: Optional[List[float]] = None,
+        memory_slack: float = 0.1,
+    ):
+        r"""
+        Greedily place the tables on the ranks.
+
+        Args:
+            num_embeddings (List[int]): number of rows of every table.
+            world_size (int): number of ranks.
+            access_freq (List[float], optional): lookups of every table per sample (the pooling factor), or any
+                statistics proportional to it. Tables are taken as equally hot if not given.
+            memory_slack (float): a rank may hold up to `(1 + memory_slack) / world_size` of all the rows.
+
+        A table goes row-wise if it alone is hotter than the fair share of a rank or does not fit in the
+        memory left on any rank. The other tables, hottest first, go table-wise to the least loaded rank
+        with enough memory, which saves sending partial sums of the same bag from several ranks.
+        """
+        n_tables = len(num_embeddings)
+        if access_freq is None:
+            access_freq = [1.0] * n_tables
+        assert len(access_freq) == n_tables, "expect one access_freq for each table"
+        capacity = (1 + memory_slack) * sum(num_embeddings) / world_size
+        fair_load = sum(access_freq) / world_size
+        row_wise = {
+            t
+            for t in range(n_tables)
+            if access_freq[t] > fair_load or num_embeddings[t] > capacity
+        }
+        owners = {}
+        # the row-wise tables take memory on every rank, replan whenever one more
+        # table spills to row-wise
+        spilled = True
+        while spilled:
+            spilled = False
+            memory = [
+                sum(math.ceil(num_embeddings[t] / world_size) for t in row_wise)
+            ] * world_size
+            load = [sum(access_freq[t] for t in row_wise) / world_size] * world_size
+            owners = {}
+            table_wise = sorted(
+                set(range(n_tables)) - row_wise,
+                key=lambda t: (access_freq[t], num_embeddings[t]),
+                reverse=True,
+            )
+            for t in table_wise:
+                fits = [
+                    rank
+                    for rank in range(world_size)
+                    if memory[rank] + num_embeddings[t] <= capacity
+                ]
+                if not fits:
+                    row_wise.add(t)
+                    spilled = True
+                    break
+                rank = min(fits, key=lambda rank: (load[rank], memory[rank]))
+                owners[t] = rank
+                memory[rank] += num_embeddings[t]
+                load[rank] += access_freq[t]
+
+        cursor = [0] * world_size
+        table_shards = []
+        for t in range(n_tables):
+            local_offsets = [-1] * world_size
+            if t in row_wise:
+                for rank in range(world_size):
+                    local_offsets[rank] = cursor[rank]
+                    cursor[rank] += len(range(rank, num_embeddings[t], world_size))
+                table_shards.append(
+                    TableShard(ShardingType.ROW_WISE, -1, local_offsets)
+                )
+            else:
+                rank = owners[t]
+                local_offsets[rank] = cursor[rank]
+                cursor[rank] += num_embeddings[t]
+                table_shards.append(
+                    TableShard(ShardingType.TABLE_WISE, rank, local_offsets)
+                )
+        return cls(num_embeddings, world_size, table_shards)
+
+    def to_global_rows(self, indices: List[torch.Tensor]) -> List[torch.Tensor]:
+        r"""
+        Map the indices of every table to the global rows used by the distributed kernels.
+        """
+        world_size = self.world_size
+        global_rows = []
+        for t, index in enumerate(indices):
+            shard = self.table_shards[t]
+            if shard.sharding_type == ShardingType.TABLE_WISE:
+                rows = (index.long() + shard.local_offsets[shard.rank]) * world_size
+                rows += shard.rank
+            else:
+                rank = index.long() % world_size
+                rows = self._row_wise_offsets[t][rank] + index.long() // world_size
+                rows = rows * world_size + rank
+            global_rows.append(rows.to(index.dtype))
+        return global_rows
+
+    def shard(
+        self,
+        rank: int,
+        weights: List[Optional[torch.Tensor]],
+        embedding_dim: int,
+        dtype: torch.dtype,
+    ) -> torch.Tensor:
+        r"""
+        Build the local rows of `rank` table by table, without concatenating the full tables. A table given
+        as None is initialized on the local rows only, like `torch.nn.EmbeddingBag`.
+        """
+        local_weight = torch.empty((self.local_rows[rank], embedding_dim), dtype=dtype)
+        for t, weight in enumerate(weights):
+            shard = self.table_shards[t]
+            rows = self._num_local_rows(self.num_embeddings[t], shard, rank)
+            if rows == 0:
+                continue
+            begin = shard.local_offsets[rank]
+            dst = local_weight[begin : begin + rows]
+            if weight is None:
+                dst.normal_()
+            elif shard.sharding_type == ShardingType.ROW_WISE:
+                dst.copy_(weight[rank :: self.world_size])
+            else:
+                dst.copy_(weight)
+        return local_weight
+
+    def __repr__(self) -> str:
+        s = "EmbeddingShardingPlan(world_size={}, local_rows={})".format(
+            self.world_size, self.local_rows
+        )
+        for t, shard in enumerate(self.table_shards):
+            s += "\n  table{}: {}, {}".format(
+                t, self.num_embeddings[t], shard.sharding_type.value
+            )
+            if shard.sharding_type == ShardingType.TABLE_WISE:
+                s += " on rank {}".format(shard.rank)
+        return s
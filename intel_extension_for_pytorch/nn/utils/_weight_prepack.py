@@ -1,3 +1,4 @@
+import contextlib
 import os
 import torch
 import torch.nn as nn
@@ -135,8 +136,39 @@ if "deepspeed" in installed_pkg:
     ds_comm_lib_cpu.impl("all_reduce", _all_reduce)
 
 
+# The works of the all-reduce started inside _defer_all_reduce
+_deferred_all_reduce_works = None
+
+
+@contextlib.contextmanager
+def _defer_all_reduce():
+    r"""
+    Inside the context, the row-parallel linears start the all-reduce of their
+    output asynchronously and return it unreduced, the work handles are
+    appended to the yielded list. A linear with bias still reduces in place,
+    and so does every linear while tracing, as the async start and wait are
+    not ops of the graph.
+    """
+    global _deferred_all_reduce_works
+    prev_works = _deferred_all_reduce_works
+    _deferred_all_reduce_works = []
+    try:
+        yield _deferred_all_reduce_works
+    finally:
+        _deferred_all_reduce_works = prev_works
+
+
 def _all_reduce_and_bias_add(mp_group, original_bias, output):
     if mp_group is not None:
+        if (
+            _deferred_all_reduce_works is not None
+            and original_bias is None
+            and not torch.jit.is_tracing()
+        ):
+            from ...transformers.models.cpu.distributed.dist import all_reduce_cpu
+
+            _deferred_all_reduce_works.append(all_reduce_cpu(output, async_op=True))
+            return output
         torch.ops.deepspeed_comm.all_reduce(output)
     if original_bias is not None:
         output += original_bias
@@ -19,6 +19,9 @@ def gptq_quantize(
     device=torch.device("cpu"),
     layer_wise=False,
     model_path=None,
+    calib_batch_size=1,
+    num_workers=1,
+    cache_dir=None,
 ):
     """Run weight-only quantization with weight configs.
 
@@ -44,6 +47,10 @@ def gptq_quantize(
         device: set to torch.device("cpu").
         layer_wise (bool): whether to do LWQ.
         model_path (str): path to register LWQ weight hooks.
+        calib_batch_size (int): number of calibration samples in one forward of a transformer block.
+        num_workers (int): number of threads quantizing the independent layers of a sequential.
+        cache_dir (str): directory to spill the cached activations to and save the per-block checkpoints,
+            the quantization resumes from the checkpoint in it.
     """
     assert isinstance(model, torch.nn.Module), "only support torch module"
     if layer_wise:
@@ -65,6 +72,9 @@ def gptq_quantize(
         pad_max_length,
         device,
         layer_wise=layer_wise,
+        calib_batch_size=calib_batch_size,
+        num_workers=num_workers,
+        cache_dir=cache_dir,
     )
     fp32_modified_model, gptq_config = gptq_quantizer.execute_quantization(
         model_path=model_path
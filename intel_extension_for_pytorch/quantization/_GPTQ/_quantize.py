@@ -21,6 +21,9 @@ def gptq(
     use_max_length=False,
     pad_max_length=2048,
     layer_wise=False,
+    calib_batch_size=1,
+    num_workers=1,
+    cache_dir=None,
     # export arguments
     compression_dtype=torch.int32,
     compression_dim=1,
@@ -43,6 +46,10 @@ def gptq(
         pad_max_length (int): whether to align calibration data to a fixed length.
         device: set to torch.device("cpu").
         layer_wise (bool): whether to do LWQ.
+        calib_batch_size (int): number of calibration samples in one forward of a transformer block.
+        num_workers (int): number of threads quantizing the independent layers of a sequential.
+        cache_dir (str): directory to spill the cached activations to and save the per-block checkpoints,
+            the quantization resumes from the checkpoint in it.
         compression_dtype: data type for compressed dtype, select from [torch.int8|16|32|64].
         compression_dim (int): 0 means output channel while 1 means input channel.
         scale_dtype: data type for scale and bias.
@@ -96,6 +103,9 @@ def gptq(
         pad_max_length,
         layer_wise,
         model_path,
+        calib_batch_size=calib_batch_size,
+        num_workers=num_workers,
+        cache_dir=cache_dir,
     )
     logger.info("Exporting compressed model...")
     compressed_model = gptq_export(
@@ -1,11 +1,13 @@
 import logging
 import math
+import os
 import random
 import re
 import time
 import torch
 import torch.nn as nn
 import transformers
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from tqdm import tqdm
 from .model_utils import (
@@ -17,6 +19,7 @@ from .model_utils import (
 )
 
 DEBUG = False
+_CHECKPOINT_VERSION = 1
 format_str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.INFO, format=format_str)
 logger = logging.getLogger("GPTQ")
@@ -34,6 +37,9 @@ class GPTQuantizer(object):
         pad_max_length=2048,
         device=None,
         layer_wise=False,
+        calib_batch_size=1,
+        num_workers=1,
+        cache_dir=None,
     ):
         """
         Args:
@@ -51,6 +57,14 @@ class GPTQuantizer(object):
                 ...
             }
             dataloader: an iterable containing calibration datasets, contains (inputs, targets)
+            calib_batch_size (int): number of calibration samples concatenated along dim 0 in one forward
+                of a transformer block. The samples are batched if their cached inputs have the same
+                shapes, only the tensors whose dim 0 is the batch of the hidden states are concatenated.
+            num_workers (int): number of threads accumulating the Hessians and running fasterquant for
+                the independent layers of a sequential.
+            cache_dir (str, optional): directory to spill the cached block inputs to, they are
+                memory-mapped from there. A checkpoint is saved after every transformer block, and the
+                quantization resumes from it if the directory already contains one.
         """
         self.model = model
         self.gptq_related_blocks = trace_gptq_target_blocks(
@@ -77,6 +91,9 @@ class GPTQuantizer(object):
         self.device = "cpu"
         self.is_ready = False
         self.layer_wise = layer_wise
+        self.calib_batch_size = max(calib_batch_size, 1)
+        self.num_workers = max(num_workers, 1)
+        self.cache_dir = cache_dir
 
         # dataloader
         self.use_max_length = use_max_length
@@ -432,6 +449,206 @@ class GPTQuantizer(object):
         else:
             self.cache_positional_arguments[0] = outs[:]
 
+    def get_hidden_states_cache(self):
+        if "hidden_states" in self.cache_key_arguments:
+            return self.cache_key_arguments["hidden_states"]
+        return self.cache_positional_arguments[0]
+
+    def get_calib_batches(self):
+        """Group the calibration samples into batches of calib_batch_size, the samples whose cached
+        tensors have different shapes are not batched."""
+        nsamples = len(self.dataloader)
+        if self.calib_batch_size == 1:
+            return [[j] for j in range(nsamples)]
+        caches = [v for k, v in self.cache_key_arguments.items() if k != "i"]
+        caches += self.cache_positional_arguments
+
+        def signature(j):
+            return [
+                tuple(cache[j].shape) if isinstance(cache[j], torch.Tensor) else None
+                for cache in caches
+            ]
+
+        batches = []
+        for j in range(nsamples):
+            if (
+                batches
+                and len(batches[-1]) < self.calib_batch_size
+                and signature(batches[-1][0]) == signature(j)
+            ):
+                batches[-1].append(j)
+            else:
+                batches.append([j])
+        return batches
+
+    def gather_calib_batch(self, indices):
+        # concatenate the cached tensors of the samples whose dim 0 is the batch of the sample, the
+        # others (e.g. rotary embeddings or masks broadcast over the batch) are taken from the first one
+        hidden_states = self.get_hidden_states_cache()
+        batch_sizes = [hidden_states[j].shape[0] for j in indices]
+
+        def concat(items):
+            if len(items) > 1 and all(
+                isinstance(item, torch.Tensor)
+                and item.dim() > 0
+                and item.shape[0] == batch_size
+                for item, batch_size in zip(items, batch_sizes)
+            ):
+                return torch.cat(items)
+            return items[0]
+
+        keyword_batch = {
+            k: concat([v[j] for j in indices])
+            for k, v in self.cache_key_arguments.items()
+        }
+        positional_batch = [
+            concat([data_item[j] for j in indices])
+            for data_item in self.cache_positional_arguments
+        ]
+        return positional_batch, keyword_batch
+
+    def forward_transformer_block(self, transformer_block, after_forward=None):
+        """Run the cached inputs through the block in calibration batches, return the output hidden states
+        of every sample."""
+        hidden_states = self.get_hidden_states_cache()
+        outs = []
+        idx = self.cache_key_arguments.pop("i")
+        for indices in self.get_calib_batches():
+            positional_batch, keyword_batch = self.gather_calib_batch(indices)
+            out = transformer_block(*positional_batch, **keyword_batch)
+            out = self.track_hidden_states(out)
+            if after_forward is not None:
+                after_forward()
+            if len(indices) == 1:
+                outs.append(out)
+            else:
+                outs.extend(
+                    torch.split(out, [hidden_states[j].shape[0] for j in indices])
+                )
+        self.cache_key_arguments["i"] = idx
+        return outs
+
+    def accumulate_hessians(self, gptq_for_this_block, pending_inputs, executor=None):
+        """Add the inputs hooked in a forward to the Hessians. The product of an input feeding several
+        layers (q/k/v, gate/up) is computed once, the inputs run in parallel with executor.
+        """
+        tasks = {}
+        for name, inputs in pending_inputs.items():
+            for inp in inputs:
+                tasks.setdefault(id(inp), (inp, []))[1].append(name)
+            inputs.clear()
+        names = [name for _, task_names in tasks.values() for name in task_names]
+        if len(names) != len(set(names)):
+            # a layer called several times in a forward adds its inputs in order
+            executor = None
+
+        def run(task):
+            inp, task_names = task
+            if len(task_names) == 1:
+                gptq_for_this_block[task_names[0]].add_batch(inp, None)
+                return
+            _, x = gptq_for_this_block[task_names[0]].get_input_matrix(inp)
+            xxt = x.matmul(x.t())
+            for name in task_names:
+                gptq_for_this_block[name].add_batch(inp, None, xxt=xxt)
+
+        if executor is None:
+            for task in tasks.values():
+                run(task)
+        else:
+            list(executor.map(run, tasks.values()))
+
+    def get_cache_path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def save_and_mmap(self, obj, name):
+        """Save obj to cache_dir and load it back memory-mapped, so the cached activations do not
+        stay in RAM."""
+        path = self.get_cache_path(name)
+        torch.save(obj, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        return torch.load(path, mmap=True, weights_only=False)
+
+    def get_checkpoint_meta(self):
+        return {
+            "version": _CHECKPOINT_VERSION,
+            "num_blocks": len(self.gptq_related_blocks["transformers"]),
+            "nsamples": len(self.dataloader),
+            "weight_config": repr(sorted(self.weight_config.items())),
+        }
+
+    def save_calib_inputs(self):
+        idx = self.cache_key_arguments.pop("i")
+        calib_inputs = self.save_and_mmap(
+            {
+                "meta": self.get_checkpoint_meta(),
+                "key": self.cache_key_arguments,
+                "positional": self.cache_positional_arguments,
+            },
+            "calib_inputs.pt",
+        )
+        self.cache_key_arguments = calib_inputs["key"]
+        self.cache_key_arguments["i"] = idx
+        self.cache_positional_arguments = calib_inputs["positional"]
+
+    def save_block_checkpoint(self, block_idx, transformer_block, outs, gptq_config):
+        """Save the quantized block, its outputs and the quantization results so far, the outputs are
+        returned memory-mapped."""
+        outs = self.save_and_mmap(outs, f"block_{block_idx}_outputs.pt")
+        torch.save(
+            transformer_block.state_dict(), self.get_cache_path(f"block_{block_idx}.pt")
+        )
+        path = self.get_cache_path("checkpoint.pt")
+        torch.save(
+            {
+                "meta": self.get_checkpoint_meta(),
+                "next_block": block_idx + 1,
+                "gptq_config": gptq_config,
+            },
+            f"{path}.tmp",
+        )
+        # the checkpoint is switched to this block only after all its files are written
+        os.replace(f"{path}.tmp", path)
+        previous_outputs = self.get_cache_path(f"block_{block_idx - 1}_outputs.pt")
+        if os.path.exists(previous_outputs):
+            os.remove(previous_outputs)
+        return outs
+
+    def load_checkpoint(self):
+        """Restore the quantized blocks and the cached inputs from cache_dir, return the index of the
+        next block to quantize and the quantization results so far."""
+        path = self.get_cache_path("checkpoint.pt")
+        if not os.path.exists(path):
+            return 0, {}
+        checkpoint = torch.load(path, weights_only=False)
+        if checkpoint["meta"] != self.get_checkpoint_meta():
+            logger.warning(
+                f"The checkpoint in {self.cache_dir} is from another model, nsamples or weight_config,"
+                + " quantizing from the first block."
+            )
+            return 0, {}
+        next_block = checkpoint["next_block"]
+        logger.info(f"Resuming from block {next_block + 1} with {path}")
+        calib_inputs = torch.load(
+            self.get_cache_path("calib_inputs.pt"), mmap=True, weights_only=False
+        )
+        self.cache_key_arguments = calib_inputs["key"]
+        self.cache_key_arguments["i"] = len(self.dataloader)
+        self.cache_positional_arguments = calib_inputs["positional"]
+        for block_idx in range(next_block):
+            self.gptq_related_blocks["transformers"][block_idx].load_state_dict(
+                torch.load(
+                    self.get_cache_path(f"block_{block_idx}.pt"), weights_only=False
+                )
+            )
+        outs = torch.load(
+            self.get_cache_path(f"block_{next_block - 1}_outputs.pt"),
+            mmap=True,
+            weights_only=False,
+        )
+        self.update_blockwise_hidden_states(outs)
+        return next_block, checkpoint["gptq_config"]
+
     def find_true_sequential_config(self):
         for layer_name in self.weight_config:
             if self.weight_config[layer_name].get("true_sequential", None) is not None:
@@ -470,10 +687,26 @@ class GPTQuantizer(object):
         # Step1: prepare quantization (calibration datasets)
 
         logger.info("Begin ====>")
-        self.pre_quantization()
+        start_block, gptq_config = 0, {}
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            start_block, gptq_config = self.load_checkpoint()
+        if start_block == 0:
+            self.pre_quantization()
+            if self.cache_dir is not None:
+                self.save_calib_inputs()
 
         # Step2: run gptq quantization in a transformer block-wise manner.
-        gptq_config = {}
+        executor = None
+        # the initializer of the workers changes the thread settings of the process, e.g. of MKL
+        main_num_threads = torch.get_num_threads()
+        if self.num_workers > 1:
+            num_threads = max(main_num_threads // self.num_workers, 1)
+            executor = ThreadPoolExecutor(
+                max_workers=self.num_workers,
+                initializer=torch.set_num_threads,
+                initargs=(num_threads,),
+            )
 
         self.true_sequential = self.find_true_sequential_config()
         # automatically get true_sequential
@@ -482,7 +715,7 @@ class GPTQuantizer(object):
         )
         logger.info(f"Sequential Name: {true_sequential_map}")
         tblock_length = len(self.gptq_related_blocks["transformers"])
-        for block_idx in range(tblock_length):
+        for block_idx in range(start_block, tblock_length):
             logger.info(f"Quantizing layer {block_idx + 1} / {tblock_length}..")
             transformer_block = self.gptq_related_blocks["transformers"][block_idx].to(
                 self.device
@@ -532,11 +765,12 @@ class GPTQuantizer(object):
                     )
 
                 # Step 2.3: modify forward functions to hook inputs data (used in gptq execution)
+                # the inputs are added to the Hessians after every forward of the block
+                pending_inputs = {layer_name: [] for layer_name in sequential_layers}
+
                 def add_batch(_name):
                     def tmp(_, inp, out):
-                        gptq_for_this_block[_name].add_batch(
-                            inp[0].data, out.data
-                        )  # noqa: F821
+                        pending_inputs[_name].append(inp[0])  # noqa: F821
 
                     return tmp
 
@@ -549,29 +783,26 @@ class GPTQuantizer(object):
                             add_batch(layer_name)
                         )
                     )
-                idx = self.cache_key_arguments.pop("i")
-                for j in range(len(self.dataloader)):
-                    cache_keyword_batch = self.gather_single_batch_from_dict(
-                        self.cache_key_arguments, j
-                    )
-                    cache_positional_batch = self.gather_single_batch_from_list(
-                        self.cache_positional_arguments, j
-                    )
-                    out = transformer_block(
-                        *cache_positional_batch, **cache_keyword_batch
-                    )
-                    out = self.track_hidden_states(out)
-                self.cache_key_arguments["i"] = idx
+                self.forward_transformer_block(
+                    transformer_block,
+                    partial(
+                        self.accumulate_hessians,
+                        gptq_for_this_block,
+                        pending_inputs,
+                        executor,
+                    ),
+                )
                 for h in handles:
                     h.remove()
+
                 # Step 2.4: everything is prepared, so start quantization!
-                for layer_name in sequential_layers:
+                def quantize_layer(layer_name):
                     weight_config_this_layer = self.get_layer_config(
                         self.get_full_layer_name(layer_name, block_idx)
                     )
                     logger.info(f"Quantizing layer {layer_name}")
                     W = sequential_layers[layer_name].weight.data.clone()
-                    scale, zp, Q = gptq_for_this_block[layer_name].fasterquant(
+                    return gptq_for_this_block[layer_name].fasterquant(
                         W,
                         blocksize=weight_config_this_layer["block_size"],
                         percdamp=weight_config_this_layer["percdamp"],
@@ -580,6 +811,15 @@ class GPTQuantizer(object):
                         static_groups=weight_config_this_layer["static_groups"],
                     )
 
+                # the layers of a sequential are independent of each other
+                if executor is not None:
+                    results = executor.map(quantize_layer, list(sequential_layers))
+                else:
+                    results = map(quantize_layer, list(sequential_layers))
+                for layer_name, (scale, zp, Q) in zip(list(sequential_layers), results):
+                    weight_config_this_layer = self.get_layer_config(
+                        self.get_full_layer_name(layer_name, block_idx)
+                    )
                     sequential_layers[layer_name].weight.data = Q
                     gptq_config[self.get_full_layer_name(layer_name, block_idx)] = {
                         "scale": scale
@@ -599,27 +839,22 @@ class GPTQuantizer(object):
                     gptq_for_this_block[layer_name].free()
 
             # Step 2.5: replace output data with quantized weights
-            outs = []
-            idx = self.cache_key_arguments.pop("i")
-            for j in range(len(self.dataloader)):
-                cache_keyword_batch = self.gather_single_batch_from_dict(
-                    self.cache_key_arguments, j
-                )
-                cache_positional_batch = self.gather_single_batch_from_list(
-                    self.cache_positional_arguments, j
-                )
-                out = transformer_block(*cache_positional_batch, **cache_keyword_batch)
-                out = self.track_hidden_states(out)
-                outs.append(out)
-            self.cache_key_arguments["i"] = idx
+            outs = self.forward_transformer_block(transformer_block)
             self.gptq_related_blocks["transformers"][
                 block_idx
             ] = transformer_block.cpu()
             del gptq_for_this_block
             torch.cuda.empty_cache()
+            if self.cache_dir is not None:
+                outs = self.save_block_checkpoint(
+                    block_idx, transformer_block, outs, gptq_config
+                )
             # iteratively replace the input with output, thus layerwise quantization can continue.
             self.update_blockwise_hidden_states(outs)
             logger.info("------------------------------")
+        if executor is not None:
+            executor.shutdown()
+            torch.set_num_threads(main_num_threads)
 
         # do the post transformer blocks quantization
         do_post_transformer_quant = self.find_lm_head_config()
@@ -733,7 +968,7 @@ class GPTQ:
         self.quantizer = Quantizer()
         self.perm = None  # act_order choice
 
-    def add_batch(self, inp, out):
+    def get_input_matrix(self, inp):
         if len(inp.shape) == 2:
             inp = inp.unsqueeze(0)
         tmp = inp.shape[0]
@@ -743,9 +978,17 @@ class GPTQ:
             if len(inp.shape) == 3:
                 inp = inp.reshape((-1, inp.shape[-1]))
             inp = inp.t()
+        return tmp, inp.float()
+
+    def add_batch(self, inp, out, xxt=None):
+        # xxt: the product of the input computed once for the layers sharing it
+        tmp, inp = self.get_input_matrix(inp)
         self.H *= self.nsamples / (self.nsamples + tmp)
         self.nsamples += tmp
-        inp = math.sqrt(2 / self.nsamples) * inp.float()
+        if xxt is not None:
+            self.H += (2 / self.nsamples) * xxt
+            return
+        inp = math.sqrt(2 / self.nsamples) * inp
         self.H += inp.matmul(inp.t())  # H = X*X, which should be a sysm matrix
 
     def fasterquant(
@@ -12,6 +12,7 @@ from ._qconfig import (
     WoqWeightDtype,
     WoqWeightQScheme,
 )
+from ._smooth_quant import smooth_quant_blockwise, save_blockwise_qconf_summary
 from ._autotune import autotune
 from ._quantize_utils import (
     quantize_per_channel,
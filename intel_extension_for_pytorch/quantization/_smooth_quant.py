@@ -5,6 +5,8 @@ from torch.ao.quantization import (
     PerChannelMinMaxObserver,
 )
 import copy
+import json
+import warnings
 
 
 class SmoothQuantActivationObserver(UniformQuantizationObserverBase):
@@ -265,3 +267,445 @@ class SmoothQuantWeightObserver(UniformQuantizationObserverBase):
         return "smooth_quant_enabled={}, alpha={}".format(
             self.smooth_quant_enabled, self.alpha
         )
+
+
+# the attributes holding the decoder blocks of the common LLM architectures
+_DECODER_BLOCKS_NAMES = [
+    "model.layers",
+    "model.decoder.layers",
+    "model.language_model.layers",
+    "transformer.h",
+    "transformer.blocks",
+    "transformer.layers",
+    "transformer.encoder.layers",
+    "gpt_neox.layers",
+    "layers",
+]
+
+
+def _find_decoder_blocks(model, blocks_name=None):
+    if blocks_name is not None:
+        blocks = model.get_submodule(blocks_name)
+        if not isinstance(blocks, torch.nn.ModuleList):
+            raise ValueError(
+                f"Expect {blocks_name} of model to be a torch.nn.ModuleList, "
+                + f"but got {type(blocks).__name__}"
+            )
+        return blocks_name, blocks
+    for name in _DECODER_BLOCKS_NAMES:
+        try:
+            blocks = model.get_submodule(name)
+        except AttributeError:
+            continue
+        if isinstance(blocks, torch.nn.ModuleList) and len(blocks) > 0:
+            return name, blocks
+    # fall back to the first ModuleList of the model
+    for name, module in model.named_modules():
+        if isinstance(module, torch.nn.ModuleList) and len(module) > 0:
+            warnings.warn(
+                f"Take {name} as the decoder blocks of model, "
+                + "please pass blocks_name if they are elsewhere."
+            )
+            return name, module
+    raise ValueError("Cannot find the decoder blocks (a torch.nn.ModuleList) of model")
+
+
+def _is_norm(module):
+    weight = getattr(module, "weight", None)
+    return (
+        isinstance(module, torch.nn.LayerNorm) or type(module).__name__.endswith("Norm")
+    ) and (isinstance(weight, torch.Tensor) and weight.dim() == 1)
+
+
+def _fake_quant_per_tensor(x, min_val, max_val):
+    scale = max(max_val - min_val, 1e-8) / 255
+    zero_point = torch.round(-min_val / scale).clamp(0, 255)
+    return torch.fake_quantize_per_tensor_affine(
+        x, scale.item(), int(zero_point.item()), 0, 255
+    )
+
+
+def _fake_quant_weight(w):
+    scale = (w.abs().amax(dim=1) / 127).clamp(min=1e-8)
+    return torch.fake_quantize_per_channel_affine(
+        w, scale, torch.zeros_like(scale, dtype=torch.int32), 0, -128, 127
+    )
+
+
+def _fold_scaling_factors(norm, linears, scaling_factors):
+    # X' = X / s by the norm, W' = W * s
+    norm.weight.div_(scaling_factors.to(norm.weight.dtype))
+    if getattr(norm, "bias", None) is not None:
+        norm.bias.div_(scaling_factors.to(norm.bias.dtype))
+    for linear in linears:
+        linear.weight.mul_(scaling_factors.to(linear.weight.dtype))
+
+
+class _SmoothGroup:
+    """
+    The linears consuming the output of a norm in a decoder block. Keeps the
+    per-input-channel min/max of their input over the calibration stream, and
+    the first ``max_tokens`` rows of it to tune alpha.
+    """
+
+    def __init__(self, norm_name, max_tokens):
+        self.norm_name = norm_name
+        self.linear_names = []
+        self.act_min = None
+        self.act_max = None
+        self.rows = []
+        self.num_rows = 0
+        self.max_tokens = max_tokens
+
+    def observe(self, x):
+        x = x.reshape(-1, x.size(-1)).float()
+        x_min, x_max = x.amin(dim=0), x.amax(dim=0)
+        if self.act_min is None:
+            self.act_min, self.act_max = x_min, x_max
+        else:
+            self.act_min = torch.min(self.act_min, x_min)
+            self.act_max = torch.max(self.act_max, x_max)
+        if self.num_rows < self.max_tokens:
+            rows = x[: self.max_tokens - self.num_rows]
+            self.rows.append(rows)
+            self.num_rows += rows.size(0)
+
+    def get_scaling_factors(self, weights, alpha):
+        x_abs_max_per_ic = (
+            torch.max(torch.abs(self.act_min), torch.abs(self.act_max)) + 1e-6
+        )
+        w_abs_max_per_ic = torch.stack([w.abs().amax(dim=0) for w in weights]).amax(
+            dim=0
+        )
+        w_abs_max_per_ic = w_abs_max_per_ic + 1e-6
+        return torch.pow(x_abs_max_per_ic, alpha) / torch.pow(
+            w_abs_max_per_ic, 1 - alpha
+        )
+
+    def get_loss(self, weights, scaling_factors):
+        # error of the int8 linears on the smoothed inputs, per-tensor affine
+        # activation and per-channel symmetric weight as the default recipe
+        x = torch.cat(self.rows)
+        x_q = _fake_quant_per_tensor(
+            x / scaling_factors,
+            torch.min(self.act_min / scaling_factors).clamp(max=0),
+            torch.max(self.act_max / scaling_factors).clamp(min=0),
+        )
+        loss = 0.0
+        for w in weights:
+            w_q = _fake_quant_weight(w * scaling_factors)
+            loss += torch.nn.functional.mse_loss(x_q @ w_q.t(), x @ w.t()).item()
+        return loss
+
+
+@torch.no_grad()
+def smooth_quant_blockwise(
+    model,
+    dataloader,
+    alpha=0.5,
+    alpha_candidates=None,
+    nsamples=128,
+    max_tune_tokens=2048,
+    load_block=None,
+    offload_block=None,
+    blocks_name=None,
+    qconfig_mapping=None,
+):
+    r"""
+    Streaming SmoothQuant for large language models, see
+    https://arxiv.org/pdf/2211.10438.pdf. Instead of observing the whole model
+    through ``prepare``, the decoder blocks are calibrated one at a time: the
+    inputs of a block are run through it, the per-input-channel min/max of the
+    linears consuming the output of a norm (LayerNorm, RMSNorm, etc.) are
+    collected, the scaling factors are folded into the weights of the norm and
+    of the linears, and the outputs become the inputs of the next block. Only
+    one block and the hidden states of the calibration samples are needed at a
+    time.
+
+    After the smoothing, the model is mathematically unchanged and can be
+    quantized with the default static qconfig, e.g. ``default_static_qconfig_mapping``.
+    If ``qconfig_mapping`` is given, the smoothed inputs of every linear of the
+    blocks are also observed while the block is resident, and
+    ``save_blockwise_qconf_summary`` turns the observers into a qconf summary,
+    so the full model does not need to be calibrated again.
+
+    Args:
+        model (torch.nn.Module): the fp32 model to smooth in place.
+        dataloader: an iterable of calibration inputs of the model, a tensor,
+            a tuple/list whose first element is the input, or a dict of keyword
+            inputs.
+        alpha (float): the SmoothQuant alpha used if ``alpha_candidates`` is None.
+        alpha_candidates (list of float): the alphas to tune for every norm of
+            every block, the one with the lowest error of the int8 linears on
+            the calibration inputs of the block is used.
+        nsamples (int): the number of calibration batches to use.
+        max_tune_tokens (int): the number of tokens kept for every norm to
+            tune alpha.
+        load_block (callable, optional): ``load_block(block_idx, block)`` is
+            called before a block is calibrated, e.g. to load its weights
+            from disk, and may return the block to use.
+        offload_block (callable, optional): ``offload_block(block_idx, block)``
+            is called after a block is smoothed, e.g. to save and free it.
+        blocks_name (str, optional): the name of the ``torch.nn.ModuleList`` of
+            the decoder blocks, e.g. ``model.layers``. The attributes of the
+            common LLM architectures are tried if not given.
+        qconfig_mapping (QConfigMapping, optional): the static qconfig to
+            quantize the smoothed model with, its activation observer is used
+            to observe the inputs of the linears.
+
+    Returns:
+        A dict from the name of every smoothed norm to its ``alpha``, the names
+        of the ``linears`` and the ``scaling_factors``. If ``qconfig_mapping``
+        is given, a tuple of that dict and a dict from the name of every linear
+        of the blocks to the activation observer of its input.
+    """
+    blocks_name, blocks = _find_decoder_blocks(model, blocks_name)
+    act_observer = None
+    if qconfig_mapping is not None:
+        act_observer = qconfig_mapping.global_qconfig.activation
+        if isinstance(act_observer(), SmoothQuantActivationObserver):
+            raise ValueError(
+                "smooth_quant_blockwise: the model is already smoothed, "
+                + "expect a static qconfig without SmoothQuant, "
+                + "e.g. default_static_qconfig_mapping"
+            )
+    cached_args, cached_kwargs = [], []
+
+    class _Captured(Exception):
+        pass
+
+    def capture(module, args, kwargs):
+        # the blocks are run several times, without the KV cache
+        kwargs = dict(kwargs)
+        for key in ["past_key_value", "past_key_values", "layer_past"]:
+            if key in kwargs:
+                kwargs[key] = None
+        if "use_cache" in kwargs:
+            kwargs["use_cache"] = False
+        cached_args.append(args)
+        cached_kwargs.append(kwargs)
+        raise _Captured
+
+    if load_block is not None:
+        blocks[0] = load_block(0, blocks[0]) or blocks[0]
+    handle = blocks[0].register_forward_pre_hook(capture, with_kwargs=True)
+    for i, batch in enumerate(dataloader):
+        if i == nsamples:
+            break
+        try:
+            if isinstance(batch, (list, tuple)):
+                model(batch[0])
+            elif isinstance(batch, dict):
+                model(**batch)
+            else:
+                model(batch)
+        except _Captured:
+            pass
+    handle.remove()
+
+    if alpha_candidates is None:
+        alpha_candidates = [alpha]
+    results = {}
+    act_observers = {}
+    for block_idx in range(len(blocks)):
+        if load_block is not None and block_idx > 0:
+            blocks[block_idx] = (
+                load_block(block_idx, blocks[block_idx]) or blocks[block_idx]
+            )
+        block = blocks[block_idx]
+        prefix = ".".join([blocks_name, str(block_idx)])
+        modules = dict(block.named_modules())
+        # the ids of the norm outputs of the current forward, the linears whose
+        # input is one of them are smoothed with the norm
+        norm_outputs = {}
+        groups = {}
+
+        def norm_hook(name):
+            def hook(module, args, output):
+                norm_outputs[id(output)] = (name, output)
+
+            return hook
+
+        def linear_hook(name):
+            def hook(module, args, output):
+                if id(args[0]) not in norm_outputs:
+                    return
+                norm_name = norm_outputs[id(args[0])][0]
+                group = groups.setdefault(
+                    norm_name, _SmoothGroup(norm_name, max_tune_tokens)
+                )
+                if name not in group.linear_names:
+                    group.linear_names.append(name)
+                    # the linears of a group share the input, observe it once
+                    if len(group.linear_names) > 1:
+                        return
+                elif name != group.linear_names[0]:
+                    return
+                group.observe(args[0])
+
+            return hook
+
+        handles = []
+        for name, module in modules.items():
+            if _is_norm(module):
+                handles.append(module.register_forward_hook(norm_hook(name)))
+            elif isinstance(module, torch.nn.Linear):
+                handles.append(module.register_forward_hook(linear_hook(name)))
+        first_args = cached_args[0]
+        first_output = None
+        for j in range(len(cached_args)):
+            out = block(*cached_args[j], **cached_kwargs[j])
+            norm_outputs.clear()
+            # the smoothing keeps the outputs of the block unchanged, the inputs
+            # are kept to observe the smoothed block if asked
+            hidden_states = out[0] if isinstance(out, (tuple, list)) else out
+            if act_observer is None:
+                cached_args[j] = (hidden_states,) + tuple(cached_args[j][1:])
+            if j == 0:
+                first_output = hidden_states
+        for h in handles:
+            h.remove()
+
+        folded = []
+        for norm_name, group in groups.items():
+            norm = modules[norm_name]
+            linears = [modules[n] for n in group.linear_names]
+            weights = [linear.weight.float() for linear in linears]
+            best = None
+            for candidate in alpha_candidates:
+                scaling_factors = group.get_scaling_factors(weights, candidate)
+                loss = (
+                    group.get_loss(weights, scaling_factors)
+                    if len(alpha_candidates) > 1
+                    else 0.0
+                )
+                if best is None or loss < best[0]:
+                    best = (loss, candidate, scaling_factors)
+            _, best_alpha, scaling_factors = best
+            _fold_scaling_factors(norm, linears, scaling_factors)
+            folded.append((norm_name, group, best_alpha, scaling_factors))
+        # the output of a norm used elsewhere than the linears (e.g. as the
+        # residual) cannot take the scaling factors, revert the block then
+        out = block(*first_args, **cached_kwargs[0])
+        out = out[0] if isinstance(out, (tuple, list)) else out
+        if folded and not torch.allclose(
+            out.float(), first_output.float(), rtol=1e-3, atol=1e-3
+        ):
+            warnings.warn(
+                f"The outputs of block {block_idx} are changed by SmoothQuant, "
+                + "the block is not smoothed."
+            )
+            for norm_name, group, _, scaling_factors in folded:
+                _fold_scaling_factors(
+                    modules[norm_name],
+                    [modules[n] for n in group.linear_names],
+                    1.0 / scaling_factors,
+                )
+            folded = []
+        if act_observer is not None:
+            _observe_linear_inputs(
+                block, prefix, cached_args, cached_kwargs, act_observer, act_observers
+            )
+        for norm_name, group, best_alpha, scaling_factors in folded:
+            results[f"{prefix}.{norm_name}"] = {
+                "alpha": best_alpha,
+                "linears": [f"{prefix}.{n}" for n in group.linear_names],
+                "scaling_factors": scaling_factors,
+            }
+        if offload_block is not None:
+            offload_block(block_idx, block)
+    if act_observer is not None:
+        return results, act_observers
+    return results
+
+
+def _observe_linear_inputs(
+    block, prefix, cached_args, cached_kwargs, act_observer, act_observers
+):
+    # observe the linears of the smoothed block, its outputs become the inputs
+    # of the next block
+    observed = {}
+
+    def hook(name):
+        def observe(module, args):
+            x = args[0]
+            if name not in act_observers:
+                # the linears sharing the input share the observer, like the
+                # observer of the input tensor in a prepared model
+                act_observers[name] = (
+                    observed[id(x)][1] if id(x) in observed else act_observer()
+                )
+            if id(x) not in observed:
+                act_observers[name](x.float())
+                observed[id(x)] = (x, act_observers[name])
+
+        return observe
+
+    handles = [
+        module.register_forward_pre_hook(hook(f"{prefix}.{name}"))
+        for name, module in block.named_modules()
+        if isinstance(module, torch.nn.Linear)
+    ]
+    for j in range(len(cached_args)):
+        out = block(*cached_args[j], **cached_kwargs[j])
+        observed.clear()
+        hidden_states = out[0] if isinstance(out, (tuple, list)) else out
+        cached_args[j] = (hidden_states,) + tuple(cached_args[j][1:])
+    for h in handles:
+        h.remove()
+
+
+def save_blockwise_qconf_summary(prepared_model, act_observers, qconf_summary):
+    r"""
+    Save the qconf summary of a model smoothed by ``smooth_quant_blockwise``
+    from the activation observers it returns, without calibrating the prepared
+    model. The weights are observed from the prepared model. The quantizable
+    ops whose inputs are not observed, e.g. the linears outside the decoder
+    blocks or the matmuls of the attention, are kept in fp32.
+
+    Args:
+        prepared_model (torch.nn.Module): the smoothed model prepared by
+            ``ipex.quantization.prepare`` with the same ``qconfig_mapping``.
+        act_observers (dict): the activation observers returned by
+            ``smooth_quant_blockwise``.
+        qconf_summary (str): the json file to save, it can be loaded by
+            ``prepared_model.load_qconf_summary``.
+    """
+    unobserved = set()
+    for qstate in prepared_model._fqn_to_auto_quant_state_map.values():
+        for idx, op_info in qstate.idx_to_seen_q_op_infos.items():
+            if op_info.type != str(torch.nn.Linear) or op_info.fqn not in act_observers:
+                unobserved.add(op_info.fqn)
+                continue
+            for tensor_info in op_info.input_tensor_infos:
+                if (
+                    tensor_info is not None
+                    and str(tensor_info.id) in qstate.tensor_id_to_observer
+                ):
+                    qstate.tensor_id_to_observer[str(tensor_info.id)] = copy.deepcopy(
+                        act_observers[op_info.fqn]
+                    )
+            weight = prepared_model.get_submodule(op_info.fqn).weight
+            for tensor_info in op_info.weight_tensor_infos:
+                key = str(idx) + "_" + str(tensor_info.id)
+                if key in qstate.weight_tensor_id_to_observer:
+                    qstate.weight_tensor_id_to_observer[key](weight)
+    prepared_model.save_qconf_summary(qconf_summary)
+
+    # the observers of the other ops have not run, do not quantize their inputs
+    with open(qconf_summary, "r") as f:
+        quant_state_dict = json.load(f)
+    for layer_info in quant_state_dict.values():
+        for q_op_info in layer_info["q_op_infos"].values():
+            if q_op_info["fqn"] not in unobserved:
+                continue
+            for tensor_info in q_op_info["input_tensor_infos"]:
+                if len(tensor_info) > 0:
+                    tensor_info["inf_dtype"] = tensor_info["orig_dtype"]
+                    tensor_info["force_dtype"] = tensor_info["orig_dtype"]
+            for tensor_info in q_op_info["weight_tensor_infos"]:
+                if len(tensor_info) > 0:
+                    tensor_info["inf_dtype"] = tensor_info["orig_dtype"]
+    with open(qconf_summary, "w") as f:
+        json.dump(quant_state_dict, f, indent=4)
+    prepared_model.load_qconf_summary(qconf_summary)
@@ -11,9 +11,14 @@ from .tensor_parallel import (
     shard_lm_head_weights,
     shard_mha_weights,
     shard_mlp_weights,
+    shard_moe_experts,
     update_heads_info,
     TensorParallelColumnLinear,
     TensorParallelRowLinear,
     TensorParallelLMhead,
     TensorParallelConv2d,
 )
+from .pipeline_parallel import (
+    partition_pipeline_layers,
+    PipelineParallelStage,
+)
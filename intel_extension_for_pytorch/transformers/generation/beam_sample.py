@@ -10,6 +10,7 @@ from transformers.generation.stopping_criteria import (
 from transformers.generation.logits_process import LogitsProcessorList
 from transformers.generation.beam_search import BeamScorer
 import time
+from .utils import _init_beam_idx, _init_kv_cache
 from transformers.generation.utils import (
     GenerateBeamDecoderOnlyOutput,
     GenerateBeamEncoderDecoderOutput,
@@ -192,19 +193,13 @@ def _beam_sample(
                 first_token = True
                 if self.model_backbone == "T5ForConditionalGeneration":
                     first_token = False
-                    beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
-                    ).contiguous()
+                    beam_idx_tmp = _init_beam_idx(int(batch_size * num_beams))
                     model_inputs["past_key_values"] = tuple(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
                                 beam_idx_tmp,
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
                                 self.decoder.block[i]
@@ -246,9 +241,7 @@ def _beam_sample(
                     )
                 elif self.model_backbone == "GitForCausalLM":
                     first_token = False
-                    beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
-                    ).contiguous()
+                    beam_idx_tmp = _init_beam_idx(int(batch_size * num_beams))
                     num_head = self.git.encoder.layer[
                         0
                     ].attention.self.num_attention_heads
@@ -276,19 +269,13 @@ def _beam_sample(
                     )
                 elif self.model_backbone == "WhisperForConditionalGeneration":
                     first_token = False
-                    beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
-                    ).contiguous()
+                    beam_idx_tmp = _init_beam_idx(int(batch_size * num_beams))
                     model_inputs["past_key_values"] = tuple(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
                                 beam_idx_tmp,
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
                                 self.model.decoder.layers[i]
@@ -331,9 +318,7 @@ def _beam_sample(
                     num_hidden_layers = self.config.num_layers
                 elif hasattr(self.config, "n_layers"):
                     num_hidden_layers = self.config.n_layers
-                beam_idx_tmp = torch.zeros(
-                    (2048, int(batch_size * num_beams)), dtype=torch.long
-                ).contiguous()
+                beam_idx_tmp = _init_beam_idx(int(batch_size * num_beams))
                 if self.model_backbone == "MllamaForConditionalGeneration":
                     head_dim = self.config.text_config.hidden_size // (
                         self.config.text_config.num_hidden_layers
@@ -346,12 +331,8 @@ def _beam_sample(
                                     torch.zeros(
                                         1, 0, 0, 1, dtype=torch.long
                                     ).contiguous(),
-                                    torch.zeros([1, 1, 1, 1])
-                                    .contiguous()
-                                    .to(kv_cache_dtype),
-                                    torch.zeros([1, 1, 1, 1])
-                                    .contiguous()
-                                    .to(kv_cache_dtype),
+                                    _init_kv_cache(kv_cache_dtype),
+                                    _init_kv_cache(kv_cache_dtype),
                                     beam_idx_tmp,
                                 )
                                 if i
@@ -415,9 +396,7 @@ def _beam_sample(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),  # latent_cache
+                                _init_kv_cache(kv_cache_dtype),  # latent_cache
                                 beam_idx_tmp,
                             )
                             for i in range(num_hidden_layers)
@@ -428,12 +407,8 @@ def _beam_sample(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
                                 beam_idx_tmp,
                             )
                             for i in range(num_hidden_layers)
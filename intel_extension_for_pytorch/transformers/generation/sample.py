@@ -10,6 +10,7 @@ from transformers.generation.stopping_criteria import (
 from transformers.generation.logits_process import LogitsProcessorList
 from transformers.generation.streamers import BaseStreamer
 import time
+from .utils import _init_beam_idx, _init_kv_cache
 from transformers.generation.utils import (
     SampleEncoderDecoderOutput,
     SampleDecoderOnlyOutput,
@@ -212,19 +213,13 @@ def _sample(
                 first_token = True
                 if self.model_backbone == "T5ForConditionalGeneration":
                     first_token = False
-                    beam_idx_tmp = torch.zeros(
-                        (2048, int(input_bs)), dtype=torch.long
-                    ).contiguous()
+                    beam_idx_tmp = _init_beam_idx(int(input_bs))
                     model_inputs["past_key_values"] = tuple(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
                                 beam_idx_tmp,
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
                                 self.decoder.block[i]
@@ -266,19 +261,13 @@ def _sample(
                     )
                 if self.model_backbone == "WhisperForConditionalGeneration":
                     first_token = False
-                    beam_idx_tmp = torch.zeros(
-                        (2048, int(input_bs)), dtype=torch.long
-                    ).contiguous()
+                    beam_idx_tmp = _init_beam_idx(int(input_bs))
                     model_inputs["past_key_values"] = tuple(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
                                 beam_idx_tmp,
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
                                 self.model.decoder.layers[i]
@@ -322,9 +311,7 @@ def _sample(
                     num_hidden_layers = self.config.num_layers
                 elif hasattr(self.config, "n_layers"):
                     num_hidden_layers = self.config.n_layers
-                beam_idx_tmp = torch.zeros(
-                    (2048, int(input_bs)), dtype=torch.long
-                ).contiguous()
+                beam_idx_tmp = _init_beam_idx(int(input_bs))
                 if self.model_backbone == "GitForCausalLM":
                     num_head = self.git.encoder.layer[
                         0
@@ -359,12 +346,8 @@ def _sample(
                                     torch.zeros(
                                         1, 0, 0, 1, dtype=torch.long
                                     ).contiguous(),
-                                    torch.zeros([1, 1, 1, 1])
-                                    .contiguous()
-                                    .to(kv_cache_dtype),
-                                    torch.zeros([1, 1, 1, 1])
-                                    .contiguous()
-                                    .to(kv_cache_dtype),
+                                    _init_kv_cache(kv_cache_dtype),
+                                    _init_kv_cache(kv_cache_dtype),
                                     beam_idx_tmp,
                                 )
                                 if i
@@ -428,9 +411,7 @@ def _sample(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),  # latent_cache
+                                _init_kv_cache(kv_cache_dtype),  # latent_cache
                                 beam_idx_tmp,
                             )
                             for i in range(num_hidden_layers)
@@ -441,12 +422,8 @@ def _sample(
                         [
                             (
                                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
-                                torch.zeros([1, 1, 1, 1])
-                                .contiguous()
-                                .to(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
+                                _init_kv_cache(kv_cache_dtype),
                                 beam_idx_tmp,
                             )
                             for i in range(num_hidden_layers)
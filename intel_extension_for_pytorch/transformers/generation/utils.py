@@ -10,6 +10,23 @@ import torch.nn.functional as F
 trans_version = transformers.__version__
 
 
+def _init_beam_idx(beam_batch):
+    # Only a placeholder for the first token, the indirect access kv cache
+    # kernel allocates the beam idx history together with the kv cache and
+    # extends both when the sequence grows, only the beam batch is read here.
+    return torch.zeros((1, beam_batch), dtype=torch.long).contiguous()
+
+
+def _init_kv_cache(kv_cache_dtype):
+    # Only a placeholder for the first token, its dtype selects the format of
+    # the indirect access kv cache, torch.uint8 and torch.uint4 for the int8
+    # and int4 caches. torch.uint4 has no copy kernel, so it can not be
+    # converted from the zeros.
+    if kv_cache_dtype == torch.uint4:
+        return torch.empty([1, 1, 1, 1], dtype=kv_cache_dtype)
+    return torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype)
+
+
 def _extract_past_from_model_output(
     self, outputs: ModelOutput, standardize_cache_format: bool = False
 ):
@@ -1,4 +1,5 @@
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import os
 import intel_extension_for_pytorch as ipex
@@ -16,6 +17,46 @@ def get_int_from_env(env_keys, default):
 
 
 USE_SHM_ALLREDUCE = -1
+# The SHM all-reduce keeps a single buffer and barrier, the asynchronous ones
+# run in this thread in the issue order, and a synchronous one waits for them
+_SHM_EXECUTOR = None
+_SHM_LAST_FUTURE = None
+SHM_ASYNC_NUM_THREADS = get_int_from_env(["TPP_SHM_ASYNC_NUM_THREADS"], 4)
+
+
+class _ShmAllReduceWork:
+    r"""
+    The work handle of an asynchronous SHM all-reduce, ``wait`` blocks until
+    the tensor is reduced in place.
+    """
+
+    def __init__(self, future):
+        self.future = future
+
+    def is_completed(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        self.future.result(timeout)
+        return True
+
+
+def _shm_all_reduce(t, pg, async_op):
+    global _SHM_EXECUTOR, _SHM_LAST_FUTURE
+    if not async_op:
+        if _SHM_LAST_FUTURE is not None:
+            _SHM_LAST_FUTURE.result()
+            _SHM_LAST_FUTURE = None
+        # all the threads of the caller, 0 takes the default
+        ipex._C.tpp_shm_allreduce(t, pg, 0)
+        return t
+    if _SHM_EXECUTOR is None:
+        _SHM_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+    # the communication thread takes only a few cores from the compute
+    _SHM_LAST_FUTURE = _SHM_EXECUTOR.submit(
+        ipex._C.tpp_shm_allreduce, t, pg, SHM_ASYNC_NUM_THREADS
+    )
+    return _ShmAllReduceWork(_SHM_LAST_FUTURE)
 
 
 def all_reduce_cpu(t: torch.Tensor, op=ReduceOp.SUM, group=None, async_op=False):
@@ -43,14 +84,11 @@ def all_reduce_cpu(t: torch.Tensor, op=ReduceOp.SUM, group=None, async_op=False)
 
     if (
         USE_SHM_ALLREDUCE == 1
-        and async_op is False
         and op is ReduceOp.SUM
         and torch.distributed.is_available()
         and torch.distributed.is_initialized()
     ):
-
-        ipex._C.tpp_shm_allreduce(t, pg)
-        return t
+        return _shm_all_reduce(t, pg, async_op)
     else:
         return dist.all_reduce(t, op, group, async_op)
 
@@ -143,6 +143,14 @@ class _IPEXRopeCPU(nn.Module):
 
 
 class _IPEXScaleDotProductCPU(nn.Module):
+    """
+    Scale dot product attention on the indirect access kv cache. The cache is
+    allocated in whole segments of text_max_length tokens for the first token,
+    and a full cache is extended to the larger of the next segment multiple
+    and twice its size, so the copies of the growth stay linear in the
+    sequence length.
+    """
+
     def __init__(self, text_max_length):
         super().__init__()
         self.text_max_length = text_max_length
@@ -226,10 +234,12 @@ class _IPEXScaleDotProductCPU(nn.Module):
             )
             return attn_output, None, None
         if layer_past is None:
+            from ....generation.utils import _init_kv_cache
+
             layer_past = (
                 torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                torch.zeros([1, 1, 1, 1]).contiguous().to(cache_type),
-                torch.zeros([1, 1, 1, 1]).contiguous().to(cache_type),
+                _init_kv_cache(cache_type),
+                _init_kv_cache(cache_type),
                 torch.zeros(1, int(query.size(0)), dtype=torch.long).contiguous(),
             )
         key_cache = layer_past[1].contiguous()
@@ -365,6 +375,11 @@ class _IPEXPagedAttentionCPU:
                 and value_cache.dtype == torch.float8_e5m2
             ):
                 raise TypeError("only float8_e5m2 supported")
+        elif kv_cache_dtype == "int8" or kv_cache_dtype == "int4":
+            if not (
+                key_cache.dtype == torch.uint8 and value_cache.dtype == torch.uint8
+            ):
+                raise TypeError("int8 and int4 kv cache should be allocated as uint8")
         elif kv_cache_dtype != "auto":
             raise TypeError("unsupported kv_cache_dtype")
 
@@ -467,6 +482,9 @@ class _IPEXPagedAttentionCPU:
                 and v_cache.dtype == torch.float8_e5m2
             ):
                 raise TypeError("only float8_e5m2 supported")
+        elif kv_cache_dtype == "int8" or kv_cache_dtype == "int4":
+            if not (k_cache.dtype == torch.uint8 and v_cache.dtype == torch.uint8):
+                raise TypeError("int8 and int4 kv cache should be allocated as uint8")
         elif kv_cache_dtype != "auto":
             raise TypeError("unsupported kv_cache_dtype")
         torch.ops.torch_ipex.flash_attn_varlen_func(
@@ -105,6 +105,8 @@ class _IPEXAttentionCPU(nn.Module):
 
         if self.model_backbone in ["CodeGenForCausalLM"]:
             self._IPEXROPE.embed_positions.sin_cos = self.embed_positions
+        # the segment length of the first allocation of the indirect access
+        # kv cache, a full cache grows to at least twice its size
         self.text_max_length = (
             config.text_max_length if hasattr(config, "text_max_length") else 2048
         )
@@ -1,3 +1,4 @@
+import os
 from torch import nn
 import torch
 from ...cpu.fusions.linear_fusion import (
@@ -9,6 +10,7 @@ from ...cpu.fusions.linear_fusion import (
     _IPEXlinearMulCPU,
     _IPEXlinearSiluMulCPU,
 )
+from .expert_cache import _MoEExpertCache
 from intel_extension_for_pytorch.quantization import (
     WoqWeightQScheme,
     WoqWeightDtype,
@@ -957,9 +959,40 @@ class _IPEXDecoderLayerCPU(nn.Module):
                                     self.down_ctx.append(
                                         expert_layer.down_proj._op_context
                                     )
+            if (
+                getattr(config, "moe_expert_cache_size", None)
+                and (
+                    getattr(self, "use_fused_moe", False)
+                    or getattr(self, "use_fused_moe_woq", False)
+                )
+                and hasattr(self, "w13_weight")
+            ):
+                self.init_expert_cache(config)
         else:
             AssertionError(False, "Do not support the optimization of your model yet")
 
+    def init_expert_cache(self, config):
+        # keep only the hot routed experts of the fused MoE in DRAM
+        if getattr(config, "moe_offload_dir", None) is None:
+            raise ValueError(
+                "moe_offload_dir should be set in the config to use moe_expert_cache_size"
+            )
+        if getattr(self, "expert_parallel", False):
+            raise ValueError(
+                "moe_expert_cache_size is not supported with moe_expert_parallel"
+            )
+        file_name = f"moe_layer_{self.self_attn.layer_idx}"
+        if torch.distributed.is_initialized():
+            file_name += f"_rank_{torch.distributed.get_rank()}"
+        num_pinned_experts = 1 if getattr(self, "unify_experts", False) else 0
+        self.expert_cache = _MoEExpertCache(
+            self,
+            self.w13_weight.size(0) - num_pinned_experts,
+            config.moe_expert_cache_size,
+            os.path.join(config.moe_offload_dir, file_name + ".pt"),
+        )
+        self.moe_expert_prefetch = getattr(config, "moe_expert_prefetch", True)
+
 
 class _IPEXEncoderLayerCPU(nn.Module):
     def __init__(self, module, config, tpp=False, woq=False):
@@ -0,0 +1,179 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import torch
+
+# The stacked tensors of the fused MoE path, dim 0 is the expert. With
+# unify_experts the shared expert is the last one of the stack.
+_EXPERT_TENSOR_NAMES = [
+    "w13_weight",
+    "w13_scale",
+    "w13_zp",
+    "w13_compensation",
+    "w2_weight",
+    "w2_scale",
+    "w2_zp",
+    "w2_compensation",
+]
+
+
+class _MoEExpertCache:
+    r"""
+    Expert cache of one fused MoE layer. The prepacked weights of all the
+    experts are saved to ``offload_dir`` and memory-mapped from there (a local
+    disk, or a DAX / tmpfs mount backed by CXL or far memory), only
+    ``cache_size`` routed experts are kept in DRAM, in stacks of the same layout
+    as the full ones, so the fused kernels run on them with the expert ids
+    mapped to cache slots. The shared expert of ``unify_experts`` is pinned at
+    the end of the stacks.
+
+    The routing frequency of every expert is tracked with an exponential decay,
+    a missing expert replaces the resident expert with the lowest frequency
+    that is not used by the current batch. ``prefetch`` starts loading the
+    experts predicted for a batch in a background thread, so that the copy
+    overlaps with the attention of the layer.
+
+    The residency is decided in Python for every batch, so the cache only
+    works in eager mode, ``ipex.llm.optimize`` does not trace a model with
+    ``moe_expert_cache_size``.
+    """
+
+    def __init__(
+        self,
+        layer,
+        num_routed_experts: int,
+        cache_size: int,
+        offload_path: str,
+        decay: float = 0.9,
+    ):
+        self.num_routed_experts = num_routed_experts
+        self.cache_size = min(cache_size, num_routed_experts)
+        self.decay = decay
+        store = {}
+        for name in _EXPERT_TENSOR_NAMES:
+            tensor = getattr(layer, name, None)
+            if tensor is not None:
+                store[name] = tensor.contiguous()
+        os.makedirs(os.path.dirname(os.path.abspath(offload_path)), exist_ok=True)
+        torch.save(store, offload_path)
+        del store
+        self.store: Dict[str, torch.Tensor] = torch.load(
+            offload_path, mmap=True, weights_only=True
+        )
+        self.resident: Dict[str, torch.Tensor] = {}
+        for name, tensor in self.store.items():
+            resident = torch.empty(
+                (self.cache_size + tensor.size(0) - num_routed_experts,)
+                + tuple(tensor.shape[1:]),
+                dtype=tensor.dtype,
+            )
+            # the pinned shared expert
+            resident[self.cache_size :].copy_(tensor[num_routed_experts:])
+            self.resident[name] = resident
+            setattr(layer, name, resident)
+        self.expert_to_slot = torch.full((num_routed_experts,), -1, dtype=torch.int32)
+        self.slot_to_expert = [-1] * self.cache_size
+        self.scores = torch.zeros(num_routed_experts)
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_prefetched = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self._load(list(range(self.cache_size)), list(range(self.cache_size)))
+
+    def _assign(self, experts: List[int], slots: List[int]):
+        for expert, slot in zip(experts, slots):
+            old = self.slot_to_expert[slot]
+            if old >= 0:
+                self.expert_to_slot[old] = -1
+            self.slot_to_expert[slot] = expert
+            self.expert_to_slot[expert] = slot
+
+    def _copy(self, experts: List[int], slots: List[int]):
+        for expert, slot in zip(experts, slots):
+            for name, resident in self.resident.items():
+                resident[slot].copy_(self.store[name][expert])
+
+    def _load(self, experts: List[int], slots: List[int]):
+        self._assign(experts, slots)
+        self._copy(experts, slots)
+
+    def _victims(self, num: int, keep) -> List[int]:
+        # the empty slots first, then the least frequently routed experts
+        scores = self.scores.tolist()
+        candidates = [s for s, e in enumerate(self.slot_to_expert) if e not in keep]
+        candidates.sort(
+            key=lambda s: (
+                -1.0 if self.slot_to_expert[s] < 0 else scores[self.slot_to_expert[s]]
+            )
+        )
+        return candidates[:num]
+
+    def wait(self):
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def prefetch(self, topk_ids: torch.Tensor):
+        r"""
+        Starts loading the experts of ``topk_ids`` (e.g. the routing of the
+        layer input before the attention) in the background.
+        """
+        self.wait()
+        counts = torch.bincount(
+            topk_ids.flatten().to(torch.int64), minlength=self.num_routed_experts
+        )
+        predicted = counts.nonzero().flatten()
+        if predicted.numel() > self.cache_size:
+            order = counts[predicted].argsort(descending=True)
+            predicted = predicted[order[: self.cache_size]]
+        predicted = predicted.tolist()
+        missing = [e for e in predicted if self.expert_to_slot[e] < 0]
+        if not missing:
+            return
+        slots = self._victims(len(missing), set(predicted))
+        self._assign(missing, slots)
+        self.num_prefetched += len(missing)
+        self.pending = self.executor.submit(self._copy, missing, slots)
+
+    def map_experts(self, topk_ids: torch.Tensor):
+        r"""
+        Makes the experts of ``topk_ids`` resident and yields the ids mapped to
+        the cache slots. When a batch routes to more than ``cache_size`` experts,
+        they are loaded in groups and every group yields the mask of the
+        (token, k) routed to it, the other entries point to slot 0 and should get
+        a zero weight.
+        """
+        self.wait()
+        ids = topk_ids.to(torch.int64)
+        counts = torch.bincount(ids.flatten(), minlength=self.num_routed_experts)
+        self.scores.mul_(self.decay).add_(counts)
+        needed = counts.nonzero().flatten().tolist()
+        if len(needed) <= self.cache_size:
+            self._ensure_resident(needed)
+            yield self.expert_to_slot[ids], None
+            return
+        for i in range(0, len(needed), self.cache_size):
+            group = needed[i : i + self.cache_size]
+            self._ensure_resident(group)
+            in_group = torch.zeros(self.num_routed_experts, dtype=torch.bool)
+            in_group[group] = True
+            mask = in_group[ids]
+            yield self.expert_to_slot[ids].masked_fill(~mask, 0), mask
+
+    def _ensure_resident(self, experts: List[int]):
+        missing = [e for e in experts if self.expert_to_slot[e] < 0]
+        self.num_hits += len(experts) - len(missing)
+        self.num_misses += len(missing)
+        if missing:
+            self._load(missing, self._victims(len(missing), set(experts)))
+
+    def get_stats(self):
+        num_lookups = self.num_hits + self.num_misses
+        return {
+            "num_hits": self.num_hits,
+            "num_misses": self.num_misses,
+            "num_prefetched": self.num_prefetched,
+            "hit_rate": self.num_hits / num_lookups if num_lookups else 0.0,
+        }
@@ -11,10 +11,40 @@ from ...reference.fusions.linear_fusion import (
     _IPEXlinearSiluMulRef,
 )
 from .....llm.functional.fusions import add_layer_norm
+from .....nn.utils._weight_prepack import _defer_all_reduce
+from ....tensor_parallel import shard_moe_experts
 from torch.nn import functional as F
 from .....utils._logger import logger, WarningType
 
 
+def linear_all_reduce_add(self, linear, x, residual, norm=None):
+    # Row-parallel linear, all-reduce and residual add over chunks of tokens,
+    # the all-reduce of a chunk runs in the background with the GEMM of the next
+    # chunks, and the optional norm of the sum with the all-reduce of the later
+    # chunks. Returns the sum and its norm. The traced graph keeps the
+    # synchronous all-reduce, the async start and wait are not graph ops.
+    num_chunks = min(self.allreduce_overlap_chunks, x.numel() // x.size(-1))
+    if num_chunks <= 1 or torch.jit.is_tracing():
+        hidden_states = residual + linear(x)
+        return hidden_states, norm(hidden_states) if norm is not None else None
+    outputs = []
+    for x_chunk in x.reshape(-1, x.size(-1)).chunk(num_chunks):
+        with _defer_all_reduce() as works:
+            outputs.append((linear(x_chunk), works))
+    residual_chunks = residual.reshape(-1, residual.size(-1)).chunk(num_chunks)
+    hidden_chunks, norm_chunks = [], []
+    for (output, works), residual_chunk in zip(outputs, residual_chunks):
+        for work in works:
+            work.wait()
+        hidden_chunks.append(residual_chunk + output)
+        if norm is not None:
+            norm_chunks.append(norm(hidden_chunks[-1]))
+    hidden_states = torch.cat(hidden_chunks).view(residual.shape)
+    if norm is None:
+        return hidden_states, None
+    return hidden_states, torch.cat(norm_chunks).view(residual.shape)
+
+
 def LlamaDecoderLayer_forward(
     self,
     hidden_states: torch.Tensor,
@@ -39,21 +69,27 @@ def LlamaDecoderLayer_forward(
     )
     if not self.distributed:
         hidden_states = self.mha_linear_add(hidden_states, residual)
+        # Fully Connected
+        residual = hidden_states
+        hidden_states = self.post_attention_layernorm(hidden_states)
     else:
-        hidden_states = self.self_attn.o_proj(hidden_states)
-        hidden_states = residual + hidden_states
-
-    # Fully Connected
-    residual = hidden_states
-    hidden_states = self.post_attention_layernorm(hidden_states)
+        # Fully Connected, the input norm overlaps the attention all-reduce
+        residual, hidden_states = linear_all_reduce_add(
+            self,
+            self.self_attn.o_proj,
+            hidden_states,
+            residual,
+            self.post_attention_layernorm,
+        )
 
     mlp_gate = self.linear_silu_mul(hidden_states)
 
     if not self.distributed:
         hidden_states = self.mlp_linear_add(mlp_gate, residual)
     else:
-        hidden_states = self.mlp.down_proj(mlp_gate)
-        hidden_states = residual + hidden_states
+        hidden_states, _ = linear_all_reduce_add(
+            self, self.mlp.down_proj, mlp_gate, residual
+        )
 
     outputs = (hidden_states,)
 
@@ -1985,7 +2021,85 @@ def JambaMambaDecoderLayer_forward(
     return outputs
 
 
+def moe_infer_with_expert_cache(self, x, topk_ids, topk_weight):
+    # the expert ids are mapped to the slots of the resident experts, a batch
+    # routed to more experts than the cache holds runs in several groups
+    final_out = None
+    topk_weight = topk_weight.to(torch.float)
+    for i, (slot_ids, mask) in enumerate(self.expert_cache.map_experts(topk_ids)):
+        # the shared expert is added by the first group only
+        fused_experts = (
+            torch.ops.torch_ipex.fused_experts_with_shared
+            if getattr(self, "unify_experts", False) and i == 0
+            else torch.ops.torch_ipex.fused_experts
+        )
+        out = fused_experts(
+            x,
+            self.w13_weight,
+            self.w2_weight,
+            topk_weight if mask is None else topk_weight.masked_fill(~mask, 0.0),
+            slot_ids,
+            False,  # inplace
+            True,  # is_vnni
+            self.distributed,  # is distributed
+            self.use_fused_moe_woq,  # is_woq
+            self.woq_weight_dtype,
+            self.woq_group_size,
+            self.woq_lowp_mode,
+            self.w13_scale,
+            self.w13_zp,
+            self.w13_compensation,
+            self.w2_scale,
+            self.w2_zp,
+            self.w2_compensation,
+        )
+        final_out = out if final_out is None else final_out + out
+    return final_out
+
+
+def moe_infer_expert_parallel(self, x, topk_ids, topk_weight):
+    # every rank holds all the tokens and the routed experts in [expert_start,
+    # expert_end), the (token, k) pairs of the local experts run as a batch with
+    # topk 1, so that each expert gets all its tokens in one GEMM, and the outputs
+    # of the ranks are summed up
+    topk_ids = topk_ids.to(torch.int64)
+    is_local = (topk_ids >= self.expert_start) & (topk_ids < self.expert_end)
+    token_idx, k_idx = is_local.nonzero(as_tuple=True)
+    final_out = torch.zeros_like(x)
+    # the kernel is not called with an empty batch, a rank whose experts get
+    # no token contributes zeros to the all-reduce
+    if token_idx.numel() > 0:
+        local_out = torch.ops.torch_ipex.fused_experts(
+            x[token_idx],
+            self.w13_weight,
+            self.w2_weight,
+            topk_weight[token_idx, k_idx].to(torch.float).unsqueeze(1),
+            (topk_ids[token_idx, k_idx] - self.expert_start).to(torch.int).unsqueeze(1),
+            False,  # inplace
+            True,  # is_vnni
+            False,  # is distributed, reduced after index_add_
+            self.use_fused_moe_woq,  # is_woq
+            self.woq_weight_dtype,
+            self.woq_group_size,
+            self.woq_lowp_mode,
+            self.w13_scale,
+            self.w13_zp,
+            self.w13_compensation,
+            self.w2_scale,
+            self.w2_zp,
+            self.w2_compensation,
+        )
+        final_out.index_add_(0, token_idx, local_out)
+    if self.distributed:
+        torch.ops.deepspeed_comm.all_reduce(final_out)
+    return final_out
+
+
 def moe_infer(self, x, topk_ids, topk_weight):
+    if getattr(self, "expert_parallel", False):
+        return moe_infer_expert_parallel(self, x, topk_ids, topk_weight)
+    if hasattr(self, "expert_cache"):
+        return moe_infer_with_expert_cache(self, x, topk_ids, topk_weight)
     if self.use_fused_moe or self.use_fused_moe_woq:
         if self.unify_experts:
             final_out = torch.ops.torch_ipex.fused_experts_with_shared(
@@ -2090,6 +2204,19 @@ def DeepseekV2DecoderLayer_forward(
     use_cache: Optional[bool] = False,
     **kwargs,
 ) -> Tuple[torch.FloatTensor, Optional[Tuple[torch.FloatTensor, torch.FloatTensor]]]:
+    if (
+        hasattr(self, "expert_cache")
+        and self.moe_expert_prefetch
+        and hasattr(self.mlp, "experts")
+    ):
+        # route the layer input to predict the experts, they are loaded while
+        # the attention runs
+        predicted_topk_idx = self.mlp.gate(
+            self.post_attention_layernorm(hidden_states).view(
+                -1, hidden_states.shape[-1]
+            )
+        )[0]
+        self.expert_cache.prefetch(predicted_topk_idx)
     residual = hidden_states
     hidden_states = self.input_layernorm(hidden_states)
 
@@ -2167,6 +2294,8 @@ class _IPEXDecoderLayerRef(nn.Module):
                 continue
             setattr(self.__class__, k, getattr(module.__class__, k))
         self.distributed = distributed
+        # the number of token chunks pipelining the tensor-parallel all-reduce
+        self.allreduce_overlap_chunks = getattr(config, "allreduce_overlap_chunks", 1)
         self.model_backbone = config.architectures[0]
         if self.model_backbone in ["GPTJForCausalLM", "CodeGenForCausalLM"]:
             if not self.distributed:
@@ -2449,6 +2578,12 @@ class _IPEXDecoderLayerRef(nn.Module):
                 if hasattr(config, "use_fused_moe_woq") and config.use_fused_moe_woq
                 else False
             )
+            # place whole routed experts on the ranks instead of sharding each
+            self.expert_parallel = (
+                getattr(config, "moe_expert_parallel", False)
+                and self.distributed
+                and (self.use_fused_moe or self.use_fused_moe_woq)
+            )
             if not self.distributed and hasattr(module.self_attn, "o_proj"):
                 self.mha_linear_add = _IPEXlinearAddRef(module.self_attn.o_proj)
                 del self.__dict__["_modules"]["self_attn"].o_proj
@@ -2458,7 +2593,8 @@ class _IPEXDecoderLayerRef(nn.Module):
                 # shared_experts
                 if config.n_shared_experts is not None:
                     self.unify_experts = False
-                    if config.n_shared_experts == 1:
+                    # the shared expert stays sharded with expert parallel
+                    if config.n_shared_experts == 1 and not self.expert_parallel:
                         self.unify_experts = True
                         self.unify_shared_expert_id = config.n_routed_experts + 1
                     if self.unify_experts and (
@@ -2539,6 +2675,14 @@ class _IPEXDecoderLayerRef(nn.Module):
                         in [WoqLowpMode.BF16, WoqLowpMode.INT8]
                     ):
                         self.deepseek_lowbit_load = True
+                        if self.expert_parallel:
+                            logger.warning_once(
+                                "Expert parallel is not supported for the INT8 weight-only "
+                                "quantized experts of DeepSeek with lowp_mode BF16 or INT8, "
+                                "the MoE layers fall back to tensor parallel",
+                                _type=WarningType.NotSupported,
+                            )
+                            self.expert_parallel = False
                     elif hasattr(module.mlp.experts[0], "gate_proj"):  # bf16 path below
                         for idx in range(config.n_routed_experts):
                             weights_list = [
@@ -2553,6 +2697,17 @@ class _IPEXDecoderLayerRef(nn.Module):
                             del self.__dict__["_modules"]["mlp"].experts[idx].gate_proj
                             del self.__dict__["_modules"]["mlp"].experts[idx].up_proj
                             del self.__dict__["_modules"]["mlp"].experts[idx].down_proj
+                        if self.expert_parallel:
+                            (
+                                self.mlp.experts,
+                                self.expert_start,
+                                self.expert_end,
+                            ) = shard_moe_experts(
+                                self.mlp.experts,
+                                config.moe_intermediate_size,
+                                torch.distributed.get_rank(),
+                                torch.distributed.get_world_size(),
+                            )
 
             else:  # DeepseekV2MLP
                 if not self.distributed and hasattr(module.mlp, "down_proj"):
@@ -1,4 +1,5 @@
 import torch
+import torch.distributed as dist
 import copy
 from ..utils._logger import logger, WarningType
 from importlib.metadata import distributions
@@ -21,6 +22,7 @@ from .tensor_parallel import (
     shard_mlp_weights,
     update_heads_info,
 )
+from .pipeline_parallel import partition_pipeline_layers
 
 
 def convert_functions(m, target_m, new_function_name, new_function):
@@ -117,7 +119,7 @@ def check_transformers_for_llm_support():
         )
 
 
-def model_convert_reference(_model):
+def model_convert_reference(_model, pipeline_parallel=False):
     import transformers
     from packaging import version
 
@@ -484,7 +486,8 @@ def model_convert_reference(_model):
 
         world_size = ipex_comm.get_world_size() if ipex_comm.has_ccl() else 1
         rank = ipex_comm.get_rank() if ipex_comm.has_ccl else 0
-        if world_size > 1:
+        # the ranks of pipeline parallel hold whole decoder layers
+        if world_size > 1 and not pipeline_parallel:
             global distributed
             global is_deepspeed
             if is_deepspeed:
@@ -1230,6 +1233,8 @@ def model_convert_reference(_model):
 
 
 def get_dummy_input(_model, return_dict=False):
+    from .generation.utils import _init_kv_cache
+
     sample_inputs = None
     if hasattr(_model.config, "kv_cache_dtype"):
         kv_cache_dtype = _model.config.kv_cache_dtype
@@ -1262,8 +1267,8 @@ def get_dummy_input(_model, return_dict=False):
                 (
                     (
                         torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
                         torch.zeros(1, 4, dtype=torch.long),
                         torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
                         torch.zeros(
@@ -1306,8 +1311,8 @@ def get_dummy_input(_model, return_dict=False):
                 (
                     (
                         torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
                         torch.zeros(1, 4, dtype=torch.long),
                     )
                     if i not in _model.config.text_config.cross_attention_layers
@@ -1363,7 +1368,7 @@ def get_dummy_input(_model, return_dict=False):
                 (
                     (
                         torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
                         torch.zeros(1, 4, dtype=torch.long),
                     )
                 )
@@ -1376,8 +1381,8 @@ def get_dummy_input(_model, return_dict=False):
                 (
                     (
                         torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
-                        torch.zeros([1, 1, 1, 1]).contiguous().to(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
+                        _init_kv_cache(kv_cache_dtype),
                         torch.zeros(1, 4, dtype=torch.long),
                     )
                 )
@@ -2093,6 +2098,142 @@ def model_convert_lowering(
     return _model
 
 
+def _get_optimize_config(
+    dtype, quantization_config, is_woq, cache_weight_for_large_batch
+):
+    # recorded on the optimized model and saved by save_optimized
+    return {
+        "dtype": str(dtype).replace("torch.", ""),
+        "quantization": quantization_config is not None,
+        "weight_only_quantization": is_woq,
+        "quantization_config": (
+            None if quantization_config is None else str(quantization_config)
+        ),
+        "cache_weight_for_large_batch": cache_weight_for_large_batch,
+    }
+
+
+_OPTIMIZED_META_FILE = "ipex_llm_optimized.json"
+_NEXT_TOKEN_GRAPH_FILE = "next_token_graph.pt"
+_FIRST_TOKEN_GRAPH_FILE = "first_token_graph.pt"
+
+
+def save_optimized(model, path):
+    r"""
+    Saves the model optimized by ``ipex.llm.optimize`` (with ``deployment_mode=True``)
+    to the directory ``path``, so that it can be restored by ``ipex.llm.load_optimized``
+    without running the conversions, the weight prepacking and the TorchScript tracing
+    again. The frozen first-token and next-token graphs (which hold the prepacked or
+    quantized weights), the model config and the optimization settings are saved.
+
+    Args:
+        model (torch.nn.Module): the model returned by ``ipex.llm.optimize``.
+        path (str): the directory to save the optimized model to.
+
+    Examples:
+        >>> optimized_model = ipex.llm.optimize(model, dtype=torch.bfloat16)
+        >>> ipex.llm.save_optimized(optimized_model, "./llama-ipex-bf16")
+    """
+    import os
+    import json
+
+    if not hasattr(model, "trace_graph"):
+        raise RuntimeError(
+            "ipex.llm.save_optimized: the model has no optimized graph, please optimize it"
+            + " with ipex.llm.optimize(..., deployment_mode=True) first"
+        )
+    os.makedirs(path, exist_ok=True)
+    model.trace_graph.save(os.path.join(path, _NEXT_TOKEN_GRAPH_FILE))
+    has_first_token_graph = hasattr(model, "trace_graph_first")
+    if has_first_token_graph:
+        model.trace_graph_first.save(os.path.join(path, _FIRST_TOKEN_GRAPH_FILE))
+    model.config.save_pretrained(path)
+    meta = {
+        "ipex_version": ipex.__version__,
+        "torch_version": torch.__version__,
+        "architecture": model.config.architectures[0],
+        "has_first_token_graph": has_first_token_graph,
+        "optimize_config": getattr(model, "ipex_optimize_config", None),
+    }
+    with open(os.path.join(path, _OPTIMIZED_META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_optimized(path, model=None, trust_remote_code=False):
+    r"""
+    Loads a model saved by ``ipex.llm.save_optimized``. The frozen graphs are loaded
+    directly, so the cold start only reads the saved weights instead of converting,
+    prepacking and tracing the model again.
+
+    Args:
+        path (str): the directory written by ``ipex.llm.save_optimized``.
+        model (torch.nn.Module): the model skeleton used for ``model.generate()``, its
+            weights are not used and it can be created on the ``meta`` device. Default
+            is None, which means it is created on the ``meta`` device from the saved
+            config, by the transformers class named by ``config.architectures[0]``.
+            It is required for the models with remote code.
+        trust_remote_code (bool): passed to ``AutoConfig.from_pretrained`` when loading
+            the saved config. Default is False.
+
+    Returns:
+        Optimized model object for model.generate().
+
+    Examples:
+        >>> model = ipex.llm.load_optimized("./llama-ipex-bf16")
+        >>> model.generate(input_ids, max_new_tokens=32)
+    """
+    import os
+    import json
+    import transformers
+    from .models.reference.models import output_hook
+
+    with open(os.path.join(path, _OPTIMIZED_META_FILE)) as f:
+        meta = json.load(f)
+    if meta["ipex_version"] != ipex.__version__:
+        logger.warning(
+            f"ipex.llm.load_optimized: the model is saved by IPEX {meta['ipex_version']},"
+            + f" but IPEX {ipex.__version__} is used, the saved graphs may not be loadable",
+            _type=WarningType.NotSupported,
+        )
+    config = transformers.AutoConfig.from_pretrained(
+        path, trust_remote_code=trust_remote_code
+    )
+    optimize_config = meta["optimize_config"] or {}
+    dtype = getattr(torch, optimize_config.get("dtype", "float"))
+    if model is None:
+        model_class = getattr(transformers, meta["architecture"], None)
+        if model_class is None:
+            raise ValueError(
+                f"ipex.llm.load_optimized: cannot find the class of {meta['architecture']}"
+                + " in transformers, please pass the model skeleton by the model argument"
+            )
+        with torch.device("meta"):
+            model = model_class(config)
+    model.config = config
+    model = model.eval().to(dtype)
+
+    if meta["architecture"] == "ChatGLMModel":
+        torch._C._jit_set_profiling_mode(True)
+        torch._C._jit_set_profiling_executor(True)
+        torch._C._jit_override_can_fuse_on_cpu(False)
+        torch._C._jit_override_can_fuse_on_gpu(False)
+    # only the generation functions and the python forward are converted,
+    # the computation is done by the loaded graphs
+    model = model_convert_reference(model)
+    trace_model = torch.jit.load(os.path.join(path, _NEXT_TOKEN_GRAPH_FILE))
+    trace_model_first = None
+    if meta["has_first_token_graph"]:
+        trace_model_first = torch.jit.load(os.path.join(path, _FIRST_TOKEN_GRAPH_FILE))
+    model = _set_optimized_model_for_generation(
+        model,
+        optimized_model=trace_model,
+        first_token_optimized_model=trace_model_first,
+    )
+    model.register_forward_hook(output_hook, with_kwargs=True)
+    model.ipex_optimize_config = meta["optimize_config"]
+    return model
+
+
 # TODO: refine this check in other specific path
 def validate_device_avaliable(device: str):
     def error_message(device):
@@ -2124,6 +2265,8 @@ def optimize(
     sample_inputs=None,
     deployment_mode=True,
     cache_weight_for_large_batch=False,
+    pipeline_parallel=False,
+    num_micro_batches=None,
 ):
     r"""
     Apply optimizations at Python frontend to the given transformers model (nn.Module).
@@ -2164,6 +2307,12 @@ def optimize(
             its inference (e.g., prefill phase) with extra memory usage. It is only valid for non-quantization cases
             where dtype = bfloat16 and weight-only quantization cases where lowp-mode=BF16/INT8. In other cases, an
             error will be raised. Default value is ``False``.
+        pipeline_parallel (bool): Whether to split the decoder layers into contiguous stages over the ranks
+            of the initialized ``torch.distributed`` default group (e.g. one rank per socket) instead of tensor
+            parallel. The batch is streamed through the stages in micro-batches, there is no collective inside
+            the layers. It needs ``deployment_mode=False``, which is set implicitly. Default value is ``False``.
+        num_micro_batches (int): The number of micro-batches of pipeline parallel. Default value is ``None``,
+            meaning the number of ranks.
 
     Returns:
         Optimized model object for model.generate(), also workable with model.forward
@@ -2245,6 +2394,8 @@ def optimize(
                     sample_inputs=sample_inputs,
                     deployment_mode=False,
                     cache_weight_for_large_batch=cache_weight_for_large_batch,
+                    pipeline_parallel=pipeline_parallel,
+                    num_micro_batches=num_micro_batches,
                 )
         else:
             if quantization_config is not None:
@@ -2300,6 +2451,49 @@ def optimize(
                     quantization_config
                 )
 
+        if pipeline_parallel:
+            assert (
+                dist.is_available() and dist.is_initialized()
+            ), "pipeline_parallel needs the torch.distributed default group to be initialized"
+            assert (
+                not is_quantization or is_woq
+            ), "pipeline_parallel supports weight only quantization only"
+            if deployment_mode:
+                logger.warning(
+                    "ipex.llm.optimize does not trace the model with pipeline_parallel, "
+                    + "deployment_mode is set to False",
+                    _type=WarningType.NotSupported,
+                )
+                deployment_mode = False
+
+        if deployment_mode:
+            from ..llm.serving.lora import LoRALinear
+
+            if any(isinstance(m, LoRALinear) for m in model.modules()):
+                logger.warning(
+                    "ipex.llm.optimize does not trace the model with the LoRA layers of "
+                    + "LoRAManager, the adapters are switched per batch, "
+                    + "deployment_mode is set to False",
+                    _type=WarningType.NotSupported,
+                )
+                deployment_mode = False
+
+        if deployment_mode and getattr(model.config, "moe_expert_cache_size", None):
+            logger.warning(
+                "ipex.llm.optimize does not trace the model with moe_expert_cache_size, "
+                + "the expert residency is decided per batch, "
+                + "deployment_mode is set to False",
+                _type=WarningType.NotSupported,
+            )
+            deployment_mode = False
+
+        if deployment_mode and getattr(model.config, "allreduce_overlap_chunks", 1) > 1:
+            logger.warning(
+                "ipex.llm.optimize traces the tensor-parallel all-reduce unchunked, "
+                + "allreduce_overlap_chunks only takes effect with deployment_mode=False",
+                _type=WarningType.NotSupported,
+            )
+
         # Load low precision checkpoint (generated by GPTQ, etc.) for WOQ before any conversion
         use_low_precision_checkpoint = False
         if device == "cpu" and is_woq and low_precision_checkpoint is not None:
@@ -2335,7 +2529,7 @@ def optimize(
 
         # model reference conversion
         logger.debug("ipex.llm.optimize is converting model to reference model")
-        _model = model_convert_reference(_model)
+        _model = model_convert_reference(_model, pipeline_parallel)
 
         # model quantization if needed
         if is_quantization:
@@ -2416,6 +2610,9 @@ def optimize(
                             _model = _set_optimized_model_for_generation(
                                 _model, optimized_model=trace_model
                             )
+                    _model.ipex_optimize_config = _get_optimize_config(
+                        dtype, quantization_config, is_woq, cache_weight_for_large_batch
+                    )
                     return _model
                 else:
                     print(
@@ -2463,11 +2660,22 @@ def optimize(
             is_woq,
             cache_weight_for_large_batch,
         )
+        if pipeline_parallel:
+            world_size = dist.get_world_size()
+            partition_pipeline_layers(
+                _model,
+                dist.get_rank(),
+                world_size,
+                num_micro_batches if num_micro_batches is not None else world_size,
+            )
         # do not register output hook when doing calibration in static int8
         if not (is_quantization and not is_woq and qconfig_summary_file is None):
             from .models.reference.models import output_hook
 
             _model.register_forward_hook(output_hook, with_kwargs=True)
+        _model.ipex_optimize_config = _get_optimize_config(
+            dtype, quantization_config, is_woq, cache_weight_for_large_batch
+        )
         return _model
 
     except RuntimeError as e:
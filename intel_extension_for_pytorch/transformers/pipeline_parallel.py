@@ -0,0 +1,200 @@
+import torch
+import torch.nn as nn
+import torch.distributed as dist
+
+# The paths to the decoder layers of the models supported by pipeline parallel,
+# their reference forward calls every layer with the past of its own index.
+_PIPELINE_PARALLEL_LAYERS = {
+    "GPTJForCausalLM": ("transformer", "h"),
+    "LlamaForCausalLM": ("model", "layers"),
+    "GPTNeoXForCausalLM": ("gpt_neox", "layers"),
+    "CodeGenForCausalLM": ("transformer", "h"),
+    "MistralForCausalLM": ("model", "layers"),
+    "StableLmForCausalLM": ("model", "layers"),
+    "Qwen2ForCausalLM": ("model", "layers"),
+    "PhiForCausalLM": ("model", "layers"),
+    "Phi3ForCausalLM": ("model", "layers"),
+}
+
+_PAST_KWARG_NAMES = ["past_key_value", "layer_past"]
+
+
+def get_pipeline_stage_range(num_layers, rank, world_size):
+    # the first num_layers % world_size ranks hold one more layer
+    layers_per_rank = num_layers // world_size
+    remainder = num_layers % world_size
+    start = rank * layers_per_rank + min(rank, remainder)
+    end = start + layers_per_rank + (1 if rank < remainder else 0)
+    return start, end
+
+
+def _seq_marker(past, hidden_states):
+    # the same placeholder as the first tensor of the IAKV cache, the models
+    # take the past length from its dim 2
+    past_length = past[0].size(-2) if past is not None else 0
+    seq_length = past_length + hidden_states.size(1)
+    return torch.empty(1, seq_length, seq_length, 1, dtype=torch.long)
+
+
+def _split_args(args, batch_size, num_micro_batches):
+    # the tensors with a batch dim are chunked along it, the others are shared
+    chunks = []
+    for arg in args:
+        if (
+            isinstance(arg, torch.Tensor)
+            and arg.dim() > 0
+            and arg.size(0) == batch_size
+        ):
+            chunks.append(torch.chunk(arg, num_micro_batches))
+        else:
+            chunks.append([arg] * num_micro_batches)
+    if not chunks:
+        return [[] for _ in range(num_micro_batches)]
+    return [list(chunk) for chunk in zip(*chunks)]
+
+
+def _get_layers_parent(model):
+    path = _PIPELINE_PARALLEL_LAYERS.get(model.config.architectures[0])
+    if path is None:
+        raise ValueError(
+            "pipeline parallel is not supported for {}, supported models are {}".format(
+                model.config.architectures[0], list(_PIPELINE_PARALLEL_LAYERS.keys())
+            )
+        )
+    parent = model
+    for name in path[:-1]:
+        parent = getattr(parent, name)
+    return parent, path[-1]
+
+
+class _PipelineSkipLayer(nn.Module):
+    r"""
+    Takes the place of a decoder layer run by another stage, passes the hidden
+    states through and keeps the past length for the model forward.
+    """
+
+    def __init__(self, layer_idx):
+        super().__init__()
+        self.layer_idx = layer_idx
+
+    def forward(self, hidden_states, *args, **kwargs):
+        past = None
+        for name in _PAST_KWARG_NAMES:
+            if kwargs.get(name, None) is not None:
+                past = kwargs[name]
+        if not kwargs.get("use_cache", False):
+            return (hidden_states,)
+        return (hidden_states, (_seq_marker(past, hidden_states),))
+
+
+class PipelineParallelStage(nn.Module):
+    r"""
+    The contiguous decoder layers ``[start, end)`` of one pipeline parallel
+    rank, placed at the index ``start`` of the layers of the model. The batch is
+    split into ``num_micro_batches`` micro-batches, every stage receives the
+    hidden states of a micro-batch from the previous rank, runs its layers and
+    sends them to the next rank without waiting, so the ranks work on different
+    micro-batches at the same time. The output of the last stage is broadcast,
+    all the ranks finish the model forward with the same hidden states and
+    generate the same tokens.
+
+    The past of the stage holds the cache of every micro-batch and local layer,
+    so the batch size and ``num_micro_batches`` should not change during the
+    generation. A micro-batch should not split the beams of a prompt.
+    """
+
+    def __init__(self, layers, start, end, rank, world_size, num_micro_batches=1):
+        super().__init__()
+        self.layers = nn.ModuleList(layers)
+        self.start = start
+        self.end = end
+        self.rank = rank
+        self.world_size = world_size
+        self.num_micro_batches = num_micro_batches
+
+    def forward(self, hidden_states, *args, **kwargs):
+        assert not kwargs.get(
+            "output_attentions", False
+        ), "output_attentions is not supported with pipeline parallel"
+        use_cache = kwargs.get("use_cache", False)
+        past_name = next(
+            (name for name in _PAST_KWARG_NAMES if name in kwargs), _PAST_KWARG_NAMES[0]
+        )
+        past = kwargs.pop(past_name, None)
+        batch_size = hidden_states.size(0)
+        num_micro_batches = min(self.num_micro_batches, batch_size)
+        micro_hidden_states = torch.chunk(hidden_states, num_micro_batches)
+        num_micro_batches = len(micro_hidden_states)
+        micro_args = _split_args(args, batch_size, num_micro_batches)
+        keys = list(kwargs.keys())
+        micro_kwargs = [
+            dict(zip(keys, values))
+            for values in _split_args(
+                [kwargs[key] for key in keys], batch_size, num_micro_batches
+            )
+        ]
+        micro_pasts = (
+            past[1]
+            if past is not None
+            else [[None] * len(self.layers)] * num_micro_batches
+        )
+        assert (
+            len(micro_pasts) == num_micro_batches
+        ), "the batch size should not change during the generation with pipeline parallel"
+
+        outputs, presents, works = [], [], []
+        for m in range(num_micro_batches):
+            h = micro_hidden_states[m]
+            if self.rank > 0:
+                h = torch.empty_like(h)
+                dist.recv(h, self.rank - 1)
+            layer_presents = []
+            for layer, layer_past in zip(self.layers, micro_pasts[m]):
+                micro_kwargs[m][past_name] = layer_past
+                layer_outputs = layer(h, *micro_args[m], **micro_kwargs[m])
+                h = layer_outputs[0]
+                if use_cache:
+                    layer_presents.append(layer_outputs[1])
+            presents.append(tuple(layer_presents))
+            if self.rank < self.world_size - 1:
+                h = h.contiguous()
+                works.append(dist.isend(h, self.rank + 1))
+            outputs.append(h)
+        for work in works:
+            work.wait()
+
+        output = torch.cat(outputs) if num_micro_batches > 1 else outputs[0]
+        if self.world_size > 1:
+            output = output.contiguous()
+            dist.broadcast(output, self.world_size - 1)
+        if not use_cache:
+            return (output,)
+        return (output, (_seq_marker(past, hidden_states), tuple(presents)))
+
+
+def partition_pipeline_layers(model, rank, world_size, num_micro_batches=1):
+    r"""
+    Keeps the decoder layers of the pipeline stage of ``rank`` in a
+    PipelineParallelStage and replaces the others with skip layers, so the
+    model forward runs the embedding, this stage and the head. The weights of
+    the layers of the other stages are released.
+    """
+    parent, name = _get_layers_parent(model)
+    layers = getattr(parent, name)
+    assert world_size <= len(
+        layers
+    ), "pipeline parallel needs at least one decoder layer on each rank"
+    start, end = get_pipeline_stage_range(len(layers), rank, world_size)
+    stage = PipelineParallelStage(
+        [layers[i] for i in range(start, end)],
+        start,
+        end,
+        rank,
+        world_size,
+        num_micro_batches,
+    )
+    new_layers = [
+        stage if i == start else _PipelineSkipLayer(i) for i in range(len(layers))
+    ]
+    setattr(parent, name, nn.ModuleList(new_layers))
+    return stage
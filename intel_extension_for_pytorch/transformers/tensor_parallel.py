@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import torch.distributed as dist
 from ..cpu import comm as ipex_comm
 import os
 
@@ -688,3 +689,61 @@ def update_heads_info(_model, rank, world_size):
             update(sub_m, group_size, kv_head_range)
 
     update(_model, group_size, kv_heads_range)
+
+
+def get_expert_parallel_range(num_experts, rank, world_size):
+    # the first num_experts % world_size ranks hold one more expert
+    experts_per_rank = num_experts // world_size
+    remainder = num_experts % world_size
+    start = rank * experts_per_rank + min(rank, remainder)
+    end = start + experts_per_rank + (1 if rank < remainder else 0)
+    return start, end
+
+
+def _all_gather_shards(shard, dim, world_size):
+    # the shards of tensor parallel may have different sizes along dim, they are
+    # padded to the largest one for the all_gather
+    sizes = [torch.zeros(1, dtype=torch.int64) for _ in range(world_size)]
+    dist.all_gather(sizes, torch.tensor([shard.size(dim)], dtype=torch.int64))
+    sizes = [size.item() for size in sizes]
+    padded_shape = list(shard.shape)
+    padded_shape[dim] = max(sizes)
+    padded = shard.new_zeros(padded_shape)
+    padded.narrow(dim, 0, shard.size(dim)).copy_(shard)
+    buffers = [torch.empty_like(padded) for _ in range(world_size)]
+    dist.all_gather(buffers, padded)
+    return [buffer.narrow(dim, 0, size) for buffer, size in zip(buffers, sizes)]
+
+
+def shard_moe_experts(experts, intermediate_size, rank, world_size):
+    r"""
+    Places whole routed experts on the ranks for expert parallel. Every expert
+    holds the concatenated gate/up weight ``w13_weight`` of shape
+    ``[2 * intermediate_size, hidden_size]`` and the down weight ``w2_weight`` of
+    shape ``[hidden_size, intermediate_size]``. If they are the shards of tensor
+    parallel, the full weights of the local experts are gathered from all the
+    ranks. Returns the local experts and the ``[start, end)`` of their ids.
+    """
+    start, end = get_expert_parallel_range(len(experts), rank, world_size)
+    local_experts = []
+    for idx, expert in enumerate(experts):
+        is_local = start <= idx < end
+        if expert.w2_weight.size(1) != intermediate_size:
+            w13_shards = _all_gather_shards(
+                expert.w13_weight.detach().contiguous(), 0, world_size
+            )
+            w2_shards = _all_gather_shards(
+                expert.w2_weight.detach().contiguous(), 1, world_size
+            )
+            if is_local:
+                # every shard of w13 holds the gate rows followed by the up rows
+                halves = [shard.chunk(2, 0) for shard in w13_shards]
+                del expert.w13_weight, expert.w2_weight
+                expert.w13_weight = torch.cat(
+                    [half[0] for half in halves] + [half[1] for half in halves], 0
+                )
+                expert.w2_weight = torch.cat(w2_shards, 1)
+            del w13_shards, w2_shards
+        if is_local:
+            local_experts.append(expert)
+    return nn.ModuleList(local_experts), start, end
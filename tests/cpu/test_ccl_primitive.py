@@ -67,6 +67,40 @@ class CCLTester(unittest.TestCase):
                 ipex.distributed.all_reduce(input_tensor)
                 torch.allclose(input_tensor, target_tensor)
 
+    @unittest.skipIf(not ipex_llm_world_size > 1, "only test with distributed")
+    def test_ipex_llm_all_reduce_add_async(self):
+        _, _rank, _world_size = self.init_env()
+        for dtype in [torch.float32, torch.bfloat16]:
+            input_tensors = [
+                torch.tensor([_rank + 1.0 + i]).to(dtype).repeat(4096 * 8)
+                for i in range(4)
+            ]
+            works = [
+                ipex.distributed.all_reduce(input_tensor, async_op=True)
+                for input_tensor in input_tensors
+            ]
+            # a synchronous all-reduce is ordered after the pending ones
+            sync_tensor = torch.tensor([_rank + 1.0]).to(dtype).repeat(4096)
+            ipex.distributed.all_reduce(sync_tensor)
+            for i, (input_tensor, work) in enumerate(zip(input_tensors, works)):
+                work.wait()
+                target_tensor = (
+                    torch.tensor(
+                        [float(_world_size * (_world_size + 1) / 2 + _world_size * i)]
+                    )
+                    .to(dtype)
+                    .repeat(4096 * 8)
+                )
+                self.assertTrue(torch.allclose(input_tensor, target_tensor))
+            self.assertTrue(
+                torch.allclose(
+                    sync_tensor,
+                    torch.tensor([float(_world_size * (_world_size + 1) / 2)])
+                    .to(dtype)
+                    .repeat(4096),
+                )
+            )
+
     @unittest.skipIf(not ipex_llm_world_size > 1, "only test with distributed")
     def test_ipex_llm_allgather(self):
         _, _rank, _world_size = self.init_env()
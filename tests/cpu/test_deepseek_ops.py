@@ -897,6 +897,120 @@ class DeepSeekTester(TestCase):
         run_single_test(2, 128, 32, 4, 2, torch.bfloat16, renormalize=True)
         run_single_test(2, 4096, 1024 + 32, 8, 2, torch.bfloat16, renormalize=True)
 
+    @skipIfNoIns
+    def test_fused_moe_expert_cache(self):
+        import tempfile
+        import types
+        from intel_extension_for_pytorch.transformers.models.cpu.modules.expert_cache import (
+            _MoEExpertCache,
+        )
+        from intel_extension_for_pytorch.transformers.models.reference.modules.decoder import (
+            moe_infer_with_expert_cache,
+        )
+
+        def run_single_test(m, n, k, e, topk, cache_size, unify_experts):
+            dtype = torch.bfloat16
+            num_stacked = e + 1 if unify_experts else e
+            w1 = torch.randn((num_stacked, 2 * n, k), dtype=dtype) / 10
+            w2 = torch.randn((num_stacked, k, n), dtype=dtype) / 10
+            layer = types.SimpleNamespace(
+                w13_weight=torch.ops.torch_ipex.convert_weight_packed_bf16(w1),
+                w2_weight=torch.ops.torch_ipex.convert_weight_packed_bf16(w2),
+                w13_scale=None,
+                w13_zp=None,
+                w13_compensation=None,
+                w2_scale=None,
+                w2_zp=None,
+                w2_compensation=None,
+                distributed=False,
+                use_fused_moe_woq=False,
+                woq_weight_dtype=WoqWeightDtype.INT8,
+                woq_group_size=-1,
+                woq_lowp_mode=WoqLowpMode.BF16,
+                unify_experts=unify_experts,
+            )
+            with tempfile.TemporaryDirectory() as offload_dir:
+                layer.expert_cache = _MoEExpertCache(
+                    layer, e, cache_size, f"{offload_dir}/moe_layer_0.pt"
+                )
+                self.assertEqual(layer.w13_weight.size(0), num_stacked - e + cache_size)
+                for step in range(3):
+                    a = torch.randn((m, k), dtype=dtype) / 10
+                    score = torch.randn((m, e), dtype=dtype)
+                    if step == 1:
+                        layer.expert_cache.prefetch(torch.topk(score, topk)[1])
+                    topk_weights, topk_ids = grouped_topk_native(
+                        a, score, topk, True, 1, 1
+                    )
+                    out = moe_infer_with_expert_cache(layer, a, topk_ids, topk_weights)
+                    ref = torch_naive_moe(a, w1[:e], w2[:e], score, topk, True)
+                    if unify_experts:
+                        ref = ref + SiluAndMul(a @ w1[e].t()) @ w2[e].t()
+                    compare(out, ref)
+                stats = layer.expert_cache.get_stats()
+                self.assertGreater(stats["num_misses"], 0)
+                del layer
+
+        # the batch routes to more experts than the cache holds
+        run_single_test(16, 128, 64, 8, 2, 3, False)
+        run_single_test(16, 128, 64, 8, 2, 3, True)
+        run_single_test(2, 128, 64, 8, 2, 4, True)
+
+    @skipIfNoIns
+    def test_fused_moe_expert_parallel(self):
+        import types
+        from intel_extension_for_pytorch.transformers.tensor_parallel import (
+            get_expert_parallel_range,
+        )
+        from intel_extension_for_pytorch.transformers.models.reference.modules.decoder import (
+            moe_infer_expert_parallel,
+        )
+
+        def run_single_test(m, n, k, e, topk, world_size):
+            dtype = torch.bfloat16
+            w1 = torch.randn((e, 2 * n, k), dtype=dtype) / 10
+            w2 = torch.randn((e, k, n), dtype=dtype) / 10
+            a = torch.randn((m, k), dtype=dtype) / 10
+            score = torch.randn((m, e), dtype=dtype)
+            topk_weights, topk_ids = grouped_topk_native(a, score, topk, True, 1, 1)
+            # run the ranks one by one, the all_reduce is the sum of their outputs
+            out = torch.zeros_like(a)
+            ranges = [
+                get_expert_parallel_range(e, rank, world_size)
+                for rank in range(world_size)
+            ]
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], e)
+            for start, end in ranges:
+                layer = types.SimpleNamespace(
+                    w13_weight=torch.ops.torch_ipex.convert_weight_packed_bf16(
+                        w1[start:end].contiguous()
+                    ),
+                    w2_weight=torch.ops.torch_ipex.convert_weight_packed_bf16(
+                        w2[start:end].contiguous()
+                    ),
+                    w13_scale=None,
+                    w13_zp=None,
+                    w13_compensation=None,
+                    w2_scale=None,
+                    w2_zp=None,
+                    w2_compensation=None,
+                    distributed=False,
+                    use_fused_moe_woq=False,
+                    woq_weight_dtype=WoqWeightDtype.INT8,
+                    woq_group_size=-1,
+                    woq_lowp_mode=WoqLowpMode.BF16,
+                    expert_start=start,
+                    expert_end=end,
+                )
+                out += moe_infer_expert_parallel(layer, a, topk_ids, topk_weights)
+            ref = torch_naive_moe(a, w1, w2, score, topk, True)
+            compare(out, ref)
+
+        run_single_test(16, 128, 64, 8, 2, 2)
+        run_single_test(2, 128, 64, 8, 2, 3)
+        run_single_test(32, 128, 64, 6, 3, 4)
+
     # testing R1/V3 GroupedTopK and also moegate_linear modules
     @skipIfNoIns
     def test_moegate_r1(self):
@@ -1002,6 +1116,36 @@ class DeepSeekTester(TestCase):
                 )
                 self.assertEqual(output_ref, output_ipex, prec=0.05)
 
+    def test_mla_rejects_quantized_kv_cache(self):
+        dtype = torch.bfloat16
+        query = torch.rand(1, 1, 2, 192, dtype=dtype)
+        kv = torch.rand(1, 1, 1, 512, dtype=dtype)
+        k_pe = torch.rand(1, 1, 1, 64, dtype=dtype)
+        weight = torch.rand(1, 1, dtype=dtype)
+        for kv_cache in [
+            torch.zeros([1, 1, 1, 1], dtype=torch.uint8),
+            torch.empty([1, 1, 1, 1], dtype=torch.uint4),
+        ]:
+            with self.assertRaisesRegex(RuntimeError, "kv cache are not supported"):
+                torch.ops.torch_ipex.deepseekv2_mla(
+                    query,
+                    kv,
+                    k_pe,
+                    kv_cache,
+                    weight,
+                    weight,
+                    weight,
+                    torch.zeros(1, 1, dtype=torch.long),
+                    torch.tensor(0, dtype=torch.long),
+                    1.0,
+                    2048,
+                    128,
+                    None,
+                    torch.zeros(1, 1, 1, 1, dtype=dtype),
+                    None,
+                    False,
+                )
+
 
 if __name__ == "__main__":
     test = unittest.main()
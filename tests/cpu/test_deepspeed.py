@@ -1,7 +1,9 @@
 import sys
 import os
+import copy
 import tempfile
 import unittest
+from unittest import mock
 
 from intel_extension_for_pytorch.llm.utils import (
     load_low_precision_checkpoint,
@@ -19,6 +21,7 @@ from intel_extension_for_pytorch.nn.utils._weight_prepack import (
     _IPEXLmHeadLinearAllreduce,
 )
 from intel_extension_for_pytorch.quantization import prepare, convert
+from intel_extension_for_pytorch.transformers.models.reference.modules import decoder
 from intel_extension_for_pytorch.quantization._quantize import (
     DynamicQuantizedLinearLayer,
     DynamicQuantizedLinearAllreduce,
@@ -413,6 +416,58 @@ class DeepspeedTester(JitTestCase):
         with torch.no_grad():
             model(*example_inputs)
 
+    def test_llama_allreduce_overlap_with_llm_optimize(self):
+        curpath = os.path.abspath(os.path.dirname(__file__))
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        model = transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+        input_ids = torch.ones(8).to(torch.long)
+        attention_mask = torch.ones(len(input_ids))
+        position_ids = torch.arange(len(input_ids))
+        past_key_values = tuple(
+            [
+                (
+                    torch.zeros(1, 1, 0, 1, dtype=torch.long).contiguous(),
+                    torch.zeros([1, 1, 1, 1]).contiguous(),
+                    torch.zeros([1, 1, 1, 1]).contiguous(),
+                    torch.zeros(1, 4, dtype=torch.long),
+                )
+                for i in range(config.num_hidden_layers)
+            ]
+        )
+        example_inputs = (
+            input_ids.unsqueeze(0),
+            attention_mask.unsqueeze(0),
+            past_key_values,
+            position_ids.unsqueeze(0),
+        )
+        outputs = []
+        # the unchunked eager model is the reference, the chunked eager model
+        # overlaps the all-reduce of the chunks, and the chunked traced model
+        # must trace the synchronous all-reduce instead of returning partial sums
+        for chunks, deployment_mode in [(1, False), (4, False), (4, True)]:
+            m = copy.deepcopy(model)
+            m.config.allreduce_overlap_chunks = chunks
+            m = self._get_ds_model(m)
+            m = ipex.llm.optimize(
+                m.eval(),
+                dtype=torch.float,
+                inplace=True,
+                deployment_mode=deployment_mode,
+            )
+            self.assertEqual(hasattr(m, "trace_graph"), deployment_mode)
+            with torch.no_grad(), mock.patch.object(
+                decoder, "_defer_all_reduce", wraps=decoder._defer_all_reduce
+            ) as defer_all_reduce:
+                outputs.append(m(*example_inputs)[0])
+            # the chunked branch only runs in eager mode
+            self.assertEqual(
+                defer_all_reduce.called, chunks > 1 and not deployment_mode
+            )
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
     def test_shard_awq_low_precision_checkpoint(self):
         curpath = os.path.abspath(os.path.dirname(__file__))
         config = AutoConfig.from_pretrained(
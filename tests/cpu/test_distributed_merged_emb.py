@@ -6,6 +6,11 @@ from bench.custom_op_bench.merged_embeddingbag import (
     MergedEmbAdaGrad,
 )
 import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.nn.modules.merged_embeddingbag import (
+    pack_sparse_buffers,
+    unpack_sparse_buffers,
+    _sparse_split_sizes,
+)
 import copy
 import os
 
@@ -48,6 +53,79 @@ class DistMergedEmbeddingTester(TestCase):
         1,
     ]
 
+    def test_sharding_plan(self):
+        world_size = 4
+        num_embeddings = [1000, 10, 300, 50000, 2000, 7, 1000, 64]
+        # table 1 is tiny but hot, table 3 is too large for a single rank
+        access_freq = [1.0, 40.0, 2.0, 1.0, 3.0, 1.0, 1.0, 5.0]
+        plan = ipex.nn.modules.EmbeddingShardingPlan.plan(
+            num_embeddings, world_size, access_freq
+        )
+        sharding_types = [shard.sharding_type.value for shard in plan.table_shards]
+        self.assertEqual(sharding_types[1], "row_wise")
+        self.assertEqual(sharding_types[3], "row_wise")
+        self.assertTrue("table_wise" in sharding_types)
+        # every rank holds about 1 / world_size of the rows
+        capacity = 1.1 * sum(num_embeddings) / world_size
+        self.assertTrue(all(rows <= capacity for rows in plan.local_rows))
+
+        weights = [torch.randn(n, 8) for n in num_embeddings]
+        shards = [
+            plan.shard(rank, weights, 8, torch.float) for rank in range(world_size)
+        ]
+        for index_type in [torch.int64, torch.int32]:
+            indices = [torch.arange(n).to(index_type) for n in num_embeddings]
+            global_rows = plan.to_global_rows(indices)
+            # every row is mapped to a distinct global row
+            all_rows = torch.cat([rows.long() for rows in global_rows])
+            self.assertEqual(all_rows.unique().numel(), sum(num_embeddings))
+            for weight, rows in zip(weights, global_rows):
+                self.assertEqual(rows.dtype, index_type)
+                rows = rows.long()
+                # global row g is local row g // world_size of rank g % world_size
+                for rank in range(world_size):
+                    mask = rows % world_size == rank
+                    self.assertEqual(
+                        shards[rank][rows[mask] // world_size], weight[mask]
+                    )
+
+    def test_sparse_all2all_packing(self):
+        world_size = 3
+        emb_dim = 5
+        for index_type in [torch.int64, torch.int32]:
+            for val_type in [torch.float32, torch.float64, torch.bfloat16]:
+                sends = []
+                packed = []
+                for rank in range(world_size):
+                    # odd and empty sizes check the padding of each section
+                    n = [0, 3, 7][rank:] + [0, 3, 7][:rank]
+                    send_idx = [torch.randint(100, (k,)).to(index_type) for k in n]
+                    send_buf = [torch.randn(k, emb_dim).to(val_type) for k in n]
+                    send_ofs = [torch.randint(100, (rank + 2,)) for _ in n]
+                    sends.append((send_idx, send_buf, send_ofs))
+                    packed.append(pack_sparse_buffers(send_idx, send_buf, send_ofs))
+                for rank in range(world_size):
+                    # all_to_all_single delivers chunk `rank` of every rank
+                    chunks = []
+                    headers = []
+                    for buffer, header, split_sizes in packed:
+                        begin = sum(split_sizes[:rank])
+                        chunks.append(buffer[begin : begin + split_sizes[rank]])
+                        headers.append(header[rank])
+                    recv_header = torch.stack(headers)
+                    self.assertEqual(
+                        _sparse_split_sizes(recv_header, index_type, val_type, emb_dim),
+                        [chunk.numel() for chunk in chunks],
+                    )
+                    recv_idx, recv_buf, recv_ofs = unpack_sparse_buffers(
+                        torch.cat(chunks), recv_header, index_type, val_type, emb_dim
+                    )
+                    for src in range(world_size):
+                        send_idx, send_buf, send_ofs = sends[src]
+                        self.assertEqual(recv_idx[src], send_idx[rank])
+                        self.assertEqual(recv_buf[src], send_buf[rank])
+                        self.assertEqual(recv_ofs[src], send_ofs[rank])
+
     @skipIfNoTORCHCCL
     def test_training(self):
         import torch.distributed as dist
@@ -109,6 +187,9 @@ class DistMergedEmbeddingTester(TestCase):
                             copy.deepcopy(emb_list.list), lr=1
                         )
                         out = distributed_emb(indices, offsets)
+                        self.assertEqual(
+                            distributed_emb.forward_async(indices, offsets).wait(), out
+                        )
                         output_list = [torch.empty_like(out) for _ in range(my_size)]
                         # gather local BS for each rank and compare it with ref_out
                         dist.all_gather(output_list, out)
@@ -135,12 +216,19 @@ class DistMergedEmbeddingTester(TestCase):
                         ref_out.backward(torch.ones_like(ref_out))
                         # slice out ref_weight/ref_hessian for on different ranks and compare them with
                         # the weight/hessian in DistMergeEmbeddingBagWithAdaGrad after updating
-                        ref_weight = torch.cat(
-                            [w.data for w in ref_m.merged_emb.weights]
-                        )[my_rank::my_size, :]
-                        ref_hessian = torch.cat(ref_m.merged_emb.adagrad_args.hessian)[
-                            my_rank::my_size, :
-                        ]
+                        plan = distributed_emb.sharding_plan
+                        ref_weight = plan.shard(
+                            my_rank,
+                            [w.data for w in ref_m.merged_emb.weights],
+                            NUM_DIM,
+                            dtype,
+                        )
+                        ref_hessian = plan.shard(
+                            my_rank,
+                            ref_m.merged_emb.adagrad_args.hessian,
+                            NUM_DIM,
+                            ref_m.merged_emb.adagrad_args.hessian[0].dtype,
+                        )
                         self.assertEqual(distributed_emb.weights[0], ref_weight)
                         self.assertEqual(
                             distributed_emb.adagrad_args.hessian[0], ref_hessian
@@ -0,0 +1,160 @@
+import copy
+import tempfile
+import unittest
+
+import torch
+import torch.nn as nn
+from common_utils import TestCase
+
+from intel_extension_for_pytorch.quantization._GPTQ.gptq import GPTQuantizer
+from intel_extension_for_pytorch.quantization._GPTQ.gptq.gptq import GPTQ
+
+hidden_size = 64
+seq_len = 16
+num_layers = 4
+
+
+class Block(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.q_proj = nn.Linear(hidden_size, hidden_size)
+        self.k_proj = nn.Linear(hidden_size, hidden_size)
+        self.v_proj = nn.Linear(hidden_size, hidden_size)
+        self.o_proj = nn.Linear(hidden_size, hidden_size)
+        self.gate_proj = nn.Linear(hidden_size, 2 * hidden_size)
+        self.up_proj = nn.Linear(hidden_size, 2 * hidden_size)
+        self.down_proj = nn.Linear(2 * hidden_size, hidden_size)
+
+    def forward(
+        self,
+        hidden_states,
+        attention_mask=None,
+        position_ids=None,
+        position_embeddings=None,
+    ):
+        # position_embeddings is shared by the batch, [seq_len, hidden_size]
+        x = hidden_states + position_embeddings
+        attn = torch.softmax(
+            self.q_proj(x) @ self.k_proj(x).transpose(1, 2) + attention_mask, -1
+        )
+        h = hidden_states + self.o_proj(attn @ self.v_proj(x))
+        mlp = torch.relu(self.gate_proj(h)) * self.up_proj(h)
+        return (h + self.down_proj(mlp),)
+
+
+class ToyModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed_tokens = nn.Embedding(100, hidden_size)
+        self.layers = nn.ModuleList([Block() for _ in range(num_layers)])
+        self.position_embeddings = nn.Parameter(torch.randn(seq_len, hidden_size))
+
+    def forward(self, input_ids):
+        h = self.embed_tokens(input_ids)
+        mask = torch.full((seq_len, seq_len), -1e9).triu(1).unsqueeze(0)
+        position_ids = torch.arange(seq_len).unsqueeze(0)
+        for layer in self.layers:
+            h = layer(
+                h,
+                attention_mask=mask,
+                position_ids=position_ids,
+                position_embeddings=self.position_embeddings,
+            )[0]
+        return h
+
+
+def weight_config():
+    return {
+        f"layers.{i}.{name}": {"wbits": 4, "group_size": 32, "act_order": True}
+        for i in range(num_layers)
+        for name in [
+            "q_proj",
+            "k_proj",
+            "v_proj",
+            "o_proj",
+            "gate_proj",
+            "up_proj",
+            "down_proj",
+        ]
+    }
+
+
+class GPTQTester(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = ToyModel().eval()
+        self.dataloader = [torch.randint(0, 100, (1, seq_len)) for _ in range(8)]
+
+    def quantize(self, quantizer_class=GPTQuantizer, **kwargs):
+        quantizer = quantizer_class(
+            copy.deepcopy(self.model),
+            weight_config(),
+            self.dataloader,
+            nsamples=len(self.dataloader),
+            use_max_length=False,
+            pad_max_length=seq_len,
+            **kwargs,
+        )
+        return quantizer.execute_quantization()
+
+    def assert_same_quantization(self, ref, res):
+        ref_model, ref_config = ref
+        model, config = res
+        for ref_param, param in zip(ref_model.parameters(), model.parameters()):
+            self.assertEqual(ref_param, param, prec=1e-4)
+        self.assertEqual(sorted(ref_config.keys()), sorted(config.keys()))
+        for name in ref_config:
+            self.assertEqual(
+                torch.tensor(ref_config[name]["scale"]),
+                torch.tensor(config[name]["scale"]),
+                prec=1e-4,
+            )
+
+    def test_hessian_batched(self):
+        layer = nn.Linear(hidden_size, hidden_size)
+        inputs = [torch.randn(1, seq_len, hidden_size) for _ in range(4)]
+        unbatched = GPTQ(layer, layer.weight.data)
+        for inp in inputs:
+            unbatched.add_batch(inp, None)
+        batched = GPTQ(layer, layer.weight.data)
+        batched.add_batch(torch.cat(inputs[:3]), None)
+        batched.add_batch(inputs[3], None)
+        self.assertEqual(batched.nsamples, unbatched.nsamples)
+        self.assertEqual(batched.H, unbatched.H, prec=1e-4)
+        # the product shared by the layers with the same input
+        shared = GPTQ(layer, layer.weight.data)
+        for inp in inputs:
+            _, x = shared.get_input_matrix(inp)
+            shared.add_batch(inp, None, xxt=x.matmul(x.t()))
+        self.assertEqual(shared.H, unbatched.H, prec=1e-4)
+
+    def test_calib_batch_and_workers(self):
+        num_threads = torch.get_num_threads()
+        ref = self.quantize()
+        # position_embeddings is not batch first and must not be concatenated
+        self.assert_same_quantization(ref, self.quantize(calib_batch_size=4))
+        self.assert_same_quantization(
+            ref, self.quantize(calib_batch_size=3, num_workers=3)
+        )
+        self.assertEqual(torch.get_num_threads(), num_threads)
+
+    def test_checkpoint_resume(self):
+        ref = self.quantize()
+
+        class CrashedQuantizer(GPTQuantizer):
+            def save_block_checkpoint(self, block_idx, *args):
+                outs = super().save_block_checkpoint(block_idx, *args)
+                if block_idx == 1:
+                    raise RuntimeError("crash after block 1")
+                return outs
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with self.assertRaises(RuntimeError):
+                self.quantize(CrashedQuantizer, cache_dir=cache_dir)
+            # resumes from block 2 with the cached inputs and quantized blocks
+            resumed = self.quantize(cache_dir=cache_dir)
+        self.assert_same_quantization(ref, resumed)
+
+
+if __name__ == "__main__":
+    test = unittest.main()
@@ -0,0 +1,104 @@
+import csv
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from common_utils import TestCase
+
+from intel_extension_for_pytorch.cpu.hypertune.strategy.hyperband import (
+    HyperbandTuneStrategy,
+)
+
+
+class TestHyperband(TestCase):
+    def make_strategy(self, output_dir, ninstances):
+        execution_conf = SimpleNamespace(
+            tuning=SimpleNamespace(
+                strategy="hyperband",
+                max_trials=100,
+                n_startup_trials=2,
+                eta=3,
+                min_budget=1.0 / 9,
+            ),
+            hyperparams={
+                "launcher": {"hp": ["ninstances"], "ninstances": ninstances},
+            },
+            output_dir=output_dir,
+        )
+        conf = SimpleNamespace(
+            execution_conf=execution_conf,
+            program="program.py",
+            program_args=[],
+            usr_objectives=[
+                {
+                    "name": "latency",
+                    "higher_is_better": False,
+                    "target_val": -float("inf"),
+                }
+            ],
+        )
+        strategy = HyperbandTuneStrategy(conf)
+        # the latency does not depend on the budget, the best is ninstances 7
+        strategy.multiobjective.evaluate = lambda cfg, budget: [
+            float(abs(cfg["ninstances"] - 7))
+        ]
+        return strategy
+
+    def test_successive_halving(self):
+        np.random.seed(0)
+        # the 9 + 5 + 3 new configurations of the brackets of one hyperband
+        # iteration exhaust the search space
+        ninstances = list(range(1, 18))
+        with tempfile.TemporaryDirectory() as tmp:
+            strategy = self.make_strategy(tmp, ninstances)
+            self.assertEqual(strategy.s_max, 2)
+            strategy.traverse()
+            with open(os.path.join(tmp, "record.csv")) as f:
+                rows = list(csv.reader(f))
+        history = strategy.tune_history
+
+        # budget schedule: bracket s runs n configurations with eta^-s of the
+        # full budget, and keeps 1/eta of them for eta times the budget
+        budgets = [budget for _, budget, _ in history]
+        expected = [1.0 / 9] * 9 + [1.0 / 3] * 3 + [1.0]
+        expected += [1.0 / 3] * 5 + [1.0]
+        expected += [1.0] * 3
+        self.assertEqual(len(budgets), len(expected))
+        for budget, expected_budget in zip(budgets, expected):
+            self.assertAlmostEqual(budget, expected_budget)
+
+        # candidate pruning: the configurations of a rung are the best 1/eta
+        # of the previous rung, best first
+        rungs = [(0, 9), (9, 12), (12, 13), (13, 18), (18, 19), (19, 22)]
+        for prev, cur in [(0, 1), (1, 2), (3, 4)]:
+            prev_trials = history[rungs[prev][0] : rungs[prev][1]]
+            cur_cfgs = [cfg for cfg, _, _ in history[rungs[cur][0] : rungs[cur][1]]]
+            ranked = sorted(prev_trials, key=lambda trial: trial[2][0])
+            self.assertEqual(cur_cfgs, [cfg for cfg, _, _ in ranked[: len(cur_cfgs)]])
+
+        # every bracket starts from new configurations
+        first_rungs = [
+            history[begin:end] for begin, end in [rungs[0], rungs[3], rungs[5]]
+        ]
+        new_cfgs = [cfg["ninstances"] for rung in first_rungs for cfg, _, _ in rung]
+        self.assertEqual(sorted(new_cfgs), ninstances)
+
+        # only the full budget trials are compared for the best configuration
+        full_budget_results = [
+            result[0] for _, budget, result in history if budget >= 1.0
+        ]
+        self.assertEqual(strategy.best_tune_result[0], min(full_budget_results))
+
+        # the budget of every trial is recorded
+        self.assertEqual(rows[0], ["ninstances", "budget", "latency"])
+        self.assertEqual(len(rows), len(history) + 1)
+        for row, (cfg, budget, result) in zip(rows[1:], history):
+            self.assertEqual(int(row[0]), cfg["ninstances"])
+            self.assertAlmostEqual(float(row[1]), budget)
+            self.assertAlmostEqual(float(row[2]), result[0])
+
+
+if __name__ == "__main__":
+    test = unittest.main()
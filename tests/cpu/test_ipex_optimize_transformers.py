@@ -53,6 +53,33 @@ def _get_gptj_example_inputs(batch_size=8, kv_cache_dtype=torch.float):
     )
 
 
+def _run_pipeline_parallel(rank, world_size, port, model, input_ids, ref_res):
+    import torch.distributed as dist
+
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    ipex_m = ipex.llm.optimize(
+        model,
+        dtype=torch.float,
+        deployment_mode=False,
+        inplace=True,
+        pipeline_parallel=True,
+        num_micro_batches=2,
+    )
+    stages = [
+        layer
+        for layer in ipex_m.model.layers
+        if isinstance(layer, ipex.transformers.PipelineParallelStage)
+    ]
+    assert len(stages) == 1 and len(stages[0].layers) == 1
+    generate_kwargs = dict(do_sample=False, max_new_tokens=4, min_new_tokens=4)
+    with torch.inference_mode(), torch.no_grad():
+        res = ipex_m.generate(input_ids, **generate_kwargs)
+    assert torch.equal(res, ref_res)
+    dist.destroy_process_group()
+
+
 model_info = namedtuple(
     "model_info",
     "name, model_class, has_position_ids, attention_class, decoder_class",
@@ -537,6 +564,46 @@ class OptimizeTransformersTester(TestCase):
                     )
                     self.assertEqual(ipex_res_dict.sequences, ref_res_dict.sequences)
 
+    def test_save_load_optimized(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        m = transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+        ipex_m = ipex.llm.optimize(
+            m, dtype=torch.float, deployment_mode=True, inplace=True
+        )
+        input_ids = torch.ones(8).unsqueeze(0).to(torch.long)
+        generate_kwargs = dict(do_sample=False, max_new_tokens=4, min_new_tokens=4)
+        with tempfile.TemporaryDirectory() as work_dir:
+            ipex.llm.save_optimized(ipex_m, work_dir)
+            loaded_m = ipex.llm.load_optimized(work_dir)
+            self.assertTrue(hasattr(loaded_m, "trace_graph"))
+            self.assertEqual(loaded_m.ipex_optimize_config["dtype"], "float32")
+            with torch.inference_mode(), torch.no_grad():
+                ref_res = ipex_m.generate(input_ids, **generate_kwargs)
+                loaded_res = loaded_m.generate(input_ids, **generate_kwargs)
+            self.assertEqual(loaded_res, ref_res)
+
+    def test_pipeline_parallel(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        config.num_hidden_layers = 2
+        m = transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+        ref_m = ipex.llm.optimize(
+            copy.deepcopy(m), dtype=torch.float, deployment_mode=False
+        )
+        input_ids = torch.randint(0, config.vocab_size, (4, 8))
+        generate_kwargs = dict(do_sample=False, max_new_tokens=4, min_new_tokens=4)
+        with torch.inference_mode(), torch.no_grad():
+            ref_res = ref_m.generate(input_ids, **generate_kwargs)
+        world_size = 2
+        torch.multiprocessing.spawn(
+            _run_pipeline_parallel,
+            args=(world_size, 29581, m, input_ids, ref_res),
+            nprocs=world_size,
+        )
+
     @unittest.skipIf(
         not torch.ops.mkldnn._is_mkldnn_bf16_supported(),
         "mkldnn bf16 is not supported on this device",
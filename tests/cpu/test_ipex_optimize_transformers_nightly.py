@@ -24,14 +24,16 @@ from hf_configs.deepseekv2.modeling_deepseek import DeepseekV2ForCausalLM
 from hf_configs.deepseekv3.modeling_deepseek import DeepseekV3ForCausalLM
 from hf_configs.phi4.modeling_phi4mm import Phi4MMForCausalLM
 from intel_extension_for_pytorch.cpu._auto_kernel_selection import _disable_tpp
-from intel_extension_for_pytorch.llm.utils import load_low_precision_checkpoint
+from intel_extension_for_pytorch.llm.utils import (
+    load_low_precision_checkpoint,
+    shard_low_precision_checkpoint,
+)
 from intel_extension_for_pytorch.utils.weight_only_quantization import (
     _gptq_lowp_checkpoint_config,
     _awq_lowp_checkpoint_config,
     _get_keys_from_config,
 )
 
-
 try:
     import transformers
     from transformers import AutoConfig
@@ -436,6 +438,44 @@ class OptimizeTransformersNightlyTester(TestCase):
             self.model_replacement_check(m, dtype, jit, torchcompile, ret_dict)
         _disable_tpp()
 
+    def test_deepseek_expert_cache(self):
+        if not core.isa_has_avx512_bf16_support():
+            return
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/deepseekv2",
+            return_dict=False,
+            trust_remote_code=True,
+            _attn_implementation="eager",
+        )
+        model = DeepseekV2ForCausalLM(config).to(torch.bfloat16).eval()
+        input_dict = {
+            "input_ids": torch.randint(0, 1000, (1, 10)),
+            "attention_mask": torch.ones(1, 10),
+            "position_ids": torch.arange(10).unsqueeze(0),
+            "use_cache": True,
+        }
+        ref_m = ipex.llm.optimize(
+            copy.deepcopy(model), dtype=torch.bfloat16, deployment_mode=False
+        )
+        with tempfile.TemporaryDirectory() as work_dir:
+            model.config.moe_expert_cache_size = 4
+            model.config.moe_offload_dir = work_dir
+            # the residency is decided per batch in Python, the model must not
+            # be traced with the trace-time mapping of the experts
+            ipex_m = ipex.llm.optimize(
+                model, dtype=torch.bfloat16, deployment_mode=True
+            )
+            self.assertFalse(hasattr(ipex_m, "trace_graph"))
+            moe_layer = ipex_m.model.layers[config.first_k_dense_replace]
+            self.assertTrue(hasattr(moe_layer, "expert_cache"))
+            with torch.no_grad(), torch.cpu.amp.autocast(dtype=torch.bfloat16):
+                ref_out = ref_m(**input_dict)
+                ipex_out = ipex_m(**input_dict)
+            self.assertEqual(ref_out[0], ipex_out[0], prec=0.1)
+            stats = moe_layer.expert_cache.get_stats()
+            self.assertGreater(stats["num_misses"], 0)
+        _disable_tpp()
+
     def test_load_low_precision_checkpoint(self):
         config = AutoConfig.from_pretrained(
             f"{curpath}/hf_configs/gptj", return_dict=False
@@ -573,6 +613,75 @@ class OptimizeTransformersNightlyTester(TestCase):
                         keys_found
                     ), "Error: Format of checkpoint and config do not match"
 
+    def test_load_low_precision_checkpoint_sharded(self):
+        model_config = {
+            "num_attention_heads": 4,
+            "quantization_config": {
+                "quant_method": "gptq",
+                "group_size": 32,
+                "desc_act": False,
+            },
+        }
+        N, K, group_size, comp_ratio = 256, 128, 32, 8
+        state_dict = {}
+        for i in range(2):
+            for name, (n, k) in {
+                "self_attn.q_proj": (N, K),
+                "self_attn.o_proj": (K, N),
+                "mlp.up_proj": (N, K),
+                "mlp.down_proj": (K, N),
+            }.items():
+                prefix = f"model.layers.{i}.{name}"
+                state_dict[prefix + ".qweight"] = torch.randint(
+                    -(2**31), 2**31 - 1, (k // comp_ratio, n), dtype=torch.int32
+                )
+                state_dict[prefix + ".scales"] = torch.randn(
+                    (k // group_size, n), dtype=torch.half
+                )
+                state_dict[prefix + ".qzeros"] = torch.randint(
+                    -(2**31),
+                    2**31 - 1,
+                    (k // group_size, n // comp_ratio),
+                    dtype=torch.int32,
+                )
+            state_dict[f"model.layers.{i}.input_layernorm.weight"] = torch.randn(K)
+        state_dict["lm_head.weight"] = torch.randn(64, K)
+        keys = list(state_dict.keys())
+        file_formats = ["pt"]
+        try:
+            from safetensors.torch import save_file
+
+            file_formats.append("safetensors")
+        except ImportError:
+            pass
+        for file_format in file_formats:
+            with tempfile.TemporaryDirectory() as work_dir:
+                with open(work_dir + "/config.json", "w", encoding="utf-8") as file:
+                    json.dump(model_config, file)
+                # the checkpoint is split into 2 files loaded in parallel
+                for i, part in enumerate(
+                    [keys[: len(keys) // 2], keys[len(keys) // 2 :]]
+                ):
+                    part = {k: state_dict[k] for k in part}
+                    if file_format == "pt":
+                        torch.save(part, f"{work_dir}/checkpoint-{i}.pt")
+                    else:
+                        save_file(part, f"{work_dir}/checkpoint-{i}.safetensors")
+                checkpoint, _ = load_low_precision_checkpoint(work_dir)
+                self.assertEqual(set(checkpoint.keys()), set(keys))
+                for k in keys:
+                    self.assertEqual(checkpoint[k], state_dict[k])
+                for rank in range(2):
+                    ref_checkpoint = shard_low_precision_checkpoint(
+                        state_dict, model_config, rank, 2, "gptq", group_size, False, 4
+                    )
+                    checkpoint, _ = load_low_precision_checkpoint(
+                        work_dir, rank, 2, num_workers=2
+                    )
+                    self.assertEqual(set(checkpoint.keys()), set(ref_checkpoint.keys()))
+                    for k, v in ref_checkpoint.items():
+                        self.assertEqual(checkpoint[k], v)
+
 
 if __name__ == "__main__":
     test = unittest.main()
@@ -5,7 +5,12 @@ from intel_extension_for_pytorch.cpu.launch import (
     CPUPoolList,
     Launcher,
     DistributedTrainingLauncher,
+    MultiInstancesLauncher,
 )
+from intel_extension_for_pytorch.cpu.launch.autotune import LayoutAutotuner
+from intel_extension_for_pytorch.cpu.launch.supervisor import InstanceSupervisor
+import argparse
+import tempfile
 import os
 from os.path import expanduser
 import glob
@@ -714,6 +719,158 @@ class TestLauncher(TestCase):
         }
         self.verify_affinity(cpuinfo.pools_ondemand, ground_truth)
 
+    def test_autotune_profile(self):
+        num_nodes = 2
+        n_phycores_per_node = 28
+        lscpu_txt = construct_numa_config(
+            num_nodes, n_phycores_per_node, enable_ht=True, numa_mode=0
+        )
+        cpuinfo = CPUPoolList(lscpu_txt=lscpu_txt)
+
+        class FakeAutotuner(LayoutAutotuner):
+            # the best throughput with 8 cores per instance
+            def benchmark(self, pools, hook, warmup=2, iters=10):
+                ncores = len(pools[0])
+                return len(pools) * ncores / (1 + abs(ncores - 8)), float(ncores)
+
+        autotuner = FakeAutotuner(cpuinfo)
+        candidates = autotuner.gen_candidates()
+        self.assertEqual(
+            [(c["ninstances"], c["ncores_per_instance"]) for c in candidates],
+            [(1, 0), (56, 1), (28, 2), (14, 4), (6, 8), (2, 16), (2, 28)],
+        )
+        for metric, ninstances, ncores_per_instance in [
+            ("throughput", 6, 8),
+            ("latency", 56, 1),
+        ]:
+            profile = autotuner.tune(lambda: None, metric=metric)
+            with tempfile.TemporaryDirectory() as work_dir:
+                path = os.path.join(work_dir, "profile.json")
+                autotuner.save_profile(profile, path)
+                args = argparse.Namespace()
+                autotuner.apply_profile(args, path)
+            self.assertEqual(args.ninstances, ninstances)
+            self.assertEqual(args.ncores_per_instance, ncores_per_instance)
+            self.assertTrue(args.bind_numa_node)
+            cpuinfo.gen_pools_ondemand(
+                ninstances=args.ninstances,
+                ncores_per_instance=args.ncores_per_instance,
+                bind_numa_node=args.bind_numa_node,
+            )
+            self.assertEqual(len(cpuinfo.pools_ondemand), ninstances)
+
+    def test_supervisor_restart(self):
+        num_nodes = 2
+        n_phycores_per_node = 28
+        lscpu_txt = construct_numa_config(
+            num_nodes, n_phycores_per_node, enable_ht=True, numa_mode=0
+        )
+        launcher = Launcher(lscpu_txt=lscpu_txt)
+        launcher.cpuinfo.gen_pools_ondemand(ninstances=2)
+        with tempfile.TemporaryDirectory() as work_dir:
+            args = argparse.Namespace(
+                max_restarts=2,
+                metrics_dir=os.path.join(work_dir, "metrics"),
+                health_check_interval=0.1,
+                heartbeat_timeout=0.0,
+                slow_instance_ratio=0.0,
+                drain_timeout=5.0,
+            )
+
+            def spawn(index, restarted):
+                # instance 0 crashes at the first run, instance 1 reports metrics
+                marker = os.path.join(work_dir, f"started_{index}")
+                metrics = os.path.join(args.metrics_dir, f"instance_{index}.json")
+                if index == 0:
+                    cmd = f"if [ -e {marker} ]; then exit 0; fi; touch {marker}; exit 3"
+                else:
+                    report = '{"time": 0, "throughput": 10.0, "latency_ms": 5.0, "num_samples": 20}'
+                    cmd = f"echo '{report}' > {metrics}"
+                process = subprocess.Popen(cmd, shell=True, start_new_session=True)
+                return {"process": process, "cmd": cmd}
+
+            supervisor = InstanceSupervisor(
+                launcher, args, spawn, launcher.cpuinfo.pools_ondemand
+            )
+            supervisor.run([0, 1])
+            summary = supervisor.summary()
+            self.assertEqual(
+                [(i["status"], i["restarts"]) for i in summary["instances"]],
+                [("finished", 1), ("finished", 0)],
+            )
+            self.assertEqual(summary["num_samples"], 20)
+            self.assertTrue(
+                os.path.exists(os.path.join(args.metrics_dir, "summary.json"))
+            )
+
+            # an instance crashing every time fails after max_restarts
+            def spawn_crash(index, restarted):
+                process = subprocess.Popen("exit 3", shell=True, start_new_session=True)
+                return {"process": process, "cmd": "exit 3"}
+
+            supervisor = InstanceSupervisor(
+                launcher, args, spawn_crash, launcher.cpuinfo.pools_ondemand
+            )
+            with self.assertRaises(subprocess.CalledProcessError):
+                supervisor.run([0])
+            self.assertEqual(supervisor.instances[0].restarts, args.max_restarts)
+
+    def test_supervisor_restart_with_log_dir(self):
+        num_nodes = 2
+        n_phycores_per_node = 28
+        lscpu_txt = construct_numa_config(
+            num_nodes, n_phycores_per_node, enable_ht=True, numa_mode=0
+        )
+        launcher = MultiInstancesLauncher(lscpu_txt=lscpu_txt)
+        launcher.cpuinfo.gen_pools_ondemand(ninstances=2)
+        with tempfile.TemporaryDirectory() as work_dir:
+            # crashes at the first run and prints to the log, the exit status
+            # must not be hidden by tee
+            marker = os.path.join(work_dir, "started")
+            program = os.path.join(work_dir, "crash.sh")
+            with open(program, "w") as f:
+                f.write(
+                    f"if [ -e {marker} ]; then echo done; exit 0; fi\n"
+                    + f"touch {marker}\necho crashed\nexit 3\n"
+                )
+            args = argparse.Namespace(
+                no_python=True,
+                module=False,
+                program="sh",
+                program_args=[program],
+                log_dir=work_dir,
+                log_file_prefix="run",
+                max_restarts=2,
+                metrics_dir=os.path.join(work_dir, "metrics"),
+                health_check_interval=0.1,
+                heartbeat_timeout=0.0,
+                slow_instance_ratio=0.0,
+                drain_timeout=5.0,
+            )
+            os.makedirs(args.metrics_dir)
+
+            def spawn(index, restarted):
+                return launcher.execution_command_builder(
+                    args=args,
+                    omp_runtime="default",
+                    task_mgr="none",
+                    environ=dict(os.environ),
+                    cpu_pools=launcher.cpuinfo.pools_ondemand,
+                    index=index,
+                    supervised=True,
+                    append_log=restarted,
+                )
+
+            supervisor = InstanceSupervisor(
+                launcher, args, spawn, launcher.cpuinfo.pools_ondemand
+            )
+            supervisor.run([0])
+            self.assertEqual(supervisor.instances[0].restarts, 1)
+            log_files = glob.glob(os.path.join(work_dir, "run_instance_0_*.log"))
+            self.assertEqual(len(log_files), 1)
+            with open(log_files[0]) as f:
+                self.assertEqual(f.read().split(), ["crashed", "done"])
+
 
 if __name__ == "__main__":
     test = unittest.main()
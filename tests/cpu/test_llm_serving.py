@@ -0,0 +1,455 @@
+import copy
+import types
+import unittest
+import torch
+import intel_extension_for_pytorch as ipex
+from common_utils import TestCase
+from intel_extension_for_pytorch.llm.serving import (
+    BlockSpaceManager,
+    Engine,
+    LoRAConfig,
+    LoRAManager,
+    NgramProposer,
+    PrefixCachingBlockAllocator,
+    SamplingParams,
+    Scheduler,
+    SchedulerConfig,
+    Sequence,
+    SpeculativeConfig,
+)
+from intel_extension_for_pytorch.transformers.models.cpu.fusions.linear_fusion import (
+    _IPEXConcatLinearCPU,
+    _IPEXlinearAddCPU,
+)
+from intel_extension_for_pytorch.transformers.models.reference.fusions.linear_fusion import (
+    _IPEXConcatLinearRef,
+)
+
+
+class ToyPagedLM(torch.nn.Module):
+    def __init__(self, vocab_size=128, hidden_size=64, num_head=4, num_layers=2):
+        super().__init__()
+        self.num_head = num_head
+        self.head_size = hidden_size // num_head
+        self.embed = torch.nn.Embedding(vocab_size, hidden_size)
+        self.pos_embed = torch.nn.Embedding(512, hidden_size)
+        self.qkv = torch.nn.ModuleList(
+            [torch.nn.Linear(hidden_size, 3 * hidden_size) for _ in range(num_layers)]
+        )
+        self.lm_head = torch.nn.Linear(hidden_size, vocab_size)
+
+    def forward(self, input_ids, positions, kv_caches, attn_metadata):
+        hidden = self.embed(input_ids) + self.pos_embed(positions)
+        for qkv, (key_cache, value_cache) in zip(self.qkv, kv_caches):
+            q, k, v = qkv(hidden).view(-1, 3, self.num_head, self.head_size).unbind(1)
+            out = ipex.llm.serving.paged_attention(
+                q.contiguous(),
+                k.contiguous(),
+                v.contiguous(),
+                key_cache,
+                value_cache,
+                attn_metadata,
+                self.head_size**-0.5,
+            )
+            hidden = hidden + out.view(hidden.shape)
+        return self.lm_head(hidden)
+
+    def reference_forward(self, input_ids):
+        # dense causal attention over the whole sequence, no KV cache
+        positions = torch.arange(input_ids.size(0))
+        hidden = self.embed(input_ids) + self.pos_embed(positions)
+        for qkv in self.qkv:
+            q, k, v = qkv(hidden).view(-1, 3, self.num_head, self.head_size).unbind(1)
+            out = torch.nn.functional.scaled_dot_product_attention(
+                q.transpose(0, 1),
+                k.transpose(0, 1),
+                v.transpose(0, 1),
+                is_causal=True,
+            )
+            hidden = hidden + out.transpose(0, 1).reshape(hidden.shape)
+        return self.lm_head(hidden)
+
+    def reference_generate(self, prompt, max_new_tokens):
+        tokens = list(prompt)
+        for _ in range(max_new_tokens):
+            logits = self.reference_forward(torch.tensor(tokens))
+            tokens.append(int(logits[-1].argmax()))
+        return tokens[len(prompt) :]
+
+
+class ToyFusedDecoderLayer(torch.nn.Module):
+    # the layout of a decoder layer lowered by ipex.llm.optimize, q/k/v_proj
+    # are concatenated and o_proj is fused with the residual add
+    def __init__(self, hidden_size=64, kv_size=32):
+        super().__init__()
+        self.sizes = [hidden_size, kv_size, kv_size]
+        q_proj, k_proj, v_proj = [
+            torch.nn.Linear(hidden_size, size) for size in self.sizes
+        ]
+        self.self_attn = torch.nn.Module()
+        self.self_attn.concat_qkv = _IPEXConcatLinearCPU(
+            _IPEXConcatLinearRef([q_proj, k_proj, v_proj])
+        )
+        self.mha_linear_add = _IPEXlinearAddCPU(
+            torch.nn.Linear(hidden_size, hidden_size)
+        )
+
+    def forward(self, x):
+        query, key, value = self.self_attn.concat_qkv(x).split(self.sizes, -1)
+        return self.mha_linear_add(query, x), key, value
+
+
+def lora_state_dict(names, in_features, out_features, rank):
+    state_dict = {}
+    for name, n_in, n_out in zip(names, in_features, out_features):
+        state_dict[f"base_model.model.{name}.lora_A.weight"] = torch.randn(rank, n_in)
+        state_dict[f"base_model.model.{name}.lora_B.weight"] = torch.randn(n_out, rank)
+    return state_dict
+
+
+class LLMServingTester(TestCase):
+    def test_block_space_manager(self):
+        manager = BlockSpaceManager(block_size=4, num_blocks=8, watermark=0.0)
+        manager.append_slots(0, 5)
+        self.assertEqual(len(manager.get_block_table(0)), 2)
+        self.assertEqual(manager.num_free_blocks, 6)
+        block = manager.get_block_table(0)[1]
+        self.assertEqual(manager.get_slot(0, 5), block * 4 + 1)
+        self.assertTrue(manager.can_append_slots(0, 32))
+        self.assertFalse(manager.can_append_slots(0, 33))
+        manager.free(0)
+        self.assertEqual(manager.num_free_blocks, 8)
+
+    def test_scheduler_chunked_prefill_and_preemption(self):
+        config = SchedulerConfig(max_num_seqs=4, max_num_batched_tokens=8)
+        scheduler = Scheduler(config, BlockSpaceManager(4, 4, watermark=0.0))
+        params = SamplingParams(max_new_tokens=8)
+        long_seq = Sequence(0, "0", list(range(10)), params)
+        short_seq = Sequence(1, "1", [1, 2], params)
+        scheduler.add_sequence(long_seq)
+        scheduler.add_sequence(short_seq)
+        # the long prompt is chunked to the token budget
+        output = scheduler.schedule()
+        self.assertEqual([(s.seq_id, n) for s, n in output.scheduled], [(0, 8)])
+        long_seq.num_computed_tokens += 8
+        # the rest of the prefill is mixed with the new request
+        output = scheduler.schedule()
+        self.assertEqual([(s.seq_id, n) for s, n in output.scheduled], [(0, 2), (1, 2)])
+        long_seq.num_computed_tokens += 2
+        short_seq.num_computed_tokens += 2
+        for _ in range(4):
+            long_seq.append_token(0)
+            long_seq.num_computed_tokens += 1
+        # 4 blocks are exhausted, the latest admitted sequence is preempted
+        long_seq.append_token(0)
+        output = scheduler.schedule()
+        self.assertEqual([s.seq_id for s in output.preempted], [1])
+        self.assertEqual(short_seq.num_computed_tokens, 0)
+        self.assertEqual(scheduler.waiting[0].seq_id, 1)
+
+    def test_engine_continuous_batching(self):
+        torch.manual_seed(0)
+        model = ToyPagedLM().eval()
+        prompts = [torch.randint(0, 128, (n,)).tolist() for n in [3, 17, 40, 1, 25, 9]]
+        max_new_tokens = [4, 12, 6, 20, 8, 3]
+        for block_size, max_num_batched_tokens in [(16, 2048), (8, 32)]:
+            engine = Engine(
+                model,
+                num_layers=2,
+                num_kv_heads=4,
+                head_size=16,
+                num_blocks=64,
+                block_size=block_size,
+                dtype=torch.float,
+                scheduler_config=SchedulerConfig(
+                    max_num_seqs=4, max_num_batched_tokens=max_num_batched_tokens
+                ),
+            )
+            for i, (prompt, n) in enumerate(zip(prompts, max_new_tokens)):
+                engine.add_request(
+                    str(i), prompt, SamplingParams(max_new_tokens=n, ignore_eos=True)
+                )
+            outputs = {}
+            while engine.has_unfinished_requests():
+                for output in engine.step():
+                    if output.finished:
+                        outputs[output.request_id] = output.output_token_ids
+            with torch.no_grad():
+                for i, (prompt, n) in enumerate(zip(prompts, max_new_tokens)):
+                    self.assertEqual(
+                        outputs[str(i)], model.reference_generate(prompt, n)
+                    )
+            self.assertEqual(engine.block_manager.num_free_blocks, 64)
+            # the prompt and the new tokens do not fit in the 64 blocks
+            with self.assertRaises(ValueError):
+                engine.add_request(
+                    "too-long",
+                    [1] * (64 * block_size - 3),
+                    SamplingParams(max_new_tokens=4),
+                )
+            self.assertFalse(engine.has_unfinished_requests())
+
+    def test_prefix_caching_block_allocator(self):
+        allocator = PrefixCachingBlockAllocator(4, max_cached_blocks=2)
+        blocks = [allocator.allocate() for _ in range(3)]
+        for i, block in enumerate(blocks):
+            allocator.register(block, i)
+            allocator.free(block)
+        # only the 2 most recently freed blocks are kept
+        self.assertEqual(allocator.num_cached_blocks, 2)
+        self.assertEqual(allocator.num_free_blocks, 4)
+        self.assertIsNone(allocator.lookup(0))
+        self.assertEqual(allocator.lookup(2), blocks[2])
+        self.assertEqual(allocator.lookup(2), blocks[2])
+        self.assertEqual(allocator.ref_counts[blocks[2]], 2)
+        # a new block evicts the least recently used cached block
+        for _ in range(3):
+            allocator.allocate()
+        self.assertFalse(allocator.peek(1))
+        self.assertTrue(allocator.peek(2))
+
+    def test_engine_prefix_caching(self):
+        torch.manual_seed(0)
+        model = ToyPagedLM().eval()
+        system_prompt = torch.randint(0, 128, (37,)).tolist()
+        prompts = [
+            system_prompt + torch.randint(0, 128, (n,)).tolist() for n in [5, 12, 1]
+        ]
+        prompts.append(list(prompts[0]))
+        engine = Engine(
+            model,
+            num_layers=2,
+            num_kv_heads=4,
+            head_size=16,
+            num_blocks=64,
+            block_size=8,
+            dtype=torch.float,
+            scheduler_config=SchedulerConfig(max_num_seqs=4, max_num_batched_tokens=32),
+            enable_prefix_caching=True,
+        )
+        params = SamplingParams(max_new_tokens=6, ignore_eos=True)
+        outputs = engine.generate(prompts[:1], params)
+        outputs += engine.generate(prompts[1:], params)
+        with torch.no_grad():
+            for prompt, output in zip(prompts, outputs):
+                self.assertEqual(
+                    output.output_token_ids, model.reference_generate(prompt, 6)
+                )
+        # 4 blocks of the system prompt, 5 blocks of the repeated prompt
+        manager = engine.block_manager
+        self.assertEqual(manager.num_hit_prefix_tokens, (4 + 4 + 5) * 8)
+        self.assertGreater(manager.prefix_cache_hit_rate, 0.0)
+        self.assertEqual(manager.num_free_blocks, 64)
+
+    def test_ngram_proposer(self):
+        proposer = NgramProposer(prompt_lookup_max=3, prompt_lookup_min=1)
+        params = SamplingParams()
+        seq = Sequence(0, "0", [1, 2, 3, 4, 5, 9, 2, 3, 4, 6, 7, 2, 3, 4], params)
+        # the latest earlier occurrence of the longest n-gram is used
+        self.assertEqual(proposer.propose([seq], [3]), [[6, 7, 2]])
+        seq = Sequence(1, "1", [1, 2, 3], params)
+        self.assertEqual(proposer.propose([seq], [3]), [[]])
+
+    def test_engine_speculative_decoding(self):
+        torch.manual_seed(0)
+        model = ToyPagedLM().eval()
+        draft_model = ToyPagedLM(num_layers=1).eval()
+        draft_model.embed = model.embed
+        draft_model.pos_embed = model.pos_embed
+        draft_model.qkv[0] = model.qkv[0]
+        draft_model.lm_head = model.lm_head
+        pattern = torch.randint(0, 128, (6,)).tolist()
+        prompts = [pattern * 4, torch.randint(0, 128, (19,)).tolist(), [5]]
+        configs = [
+            SpeculativeConfig(num_speculative_tokens=3),
+            SpeculativeConfig(
+                num_speculative_tokens=4,
+                draft_model=model,
+                draft_num_layers=2,
+                draft_num_kv_heads=4,
+                draft_head_size=16,
+            ),
+            SpeculativeConfig(
+                num_speculative_tokens=2,
+                draft_model=draft_model,
+                draft_num_layers=1,
+                draft_num_kv_heads=4,
+                draft_head_size=16,
+            ),
+        ]
+        acceptance_rates = []
+        for config in configs:
+            engine = Engine(
+                model,
+                num_layers=2,
+                num_kv_heads=4,
+                head_size=16,
+                num_blocks=64,
+                block_size=8,
+                dtype=torch.float,
+                scheduler_config=SchedulerConfig(
+                    max_num_seqs=4, max_num_batched_tokens=16
+                ),
+                speculative_config=config,
+            )
+            outputs = engine.generate(
+                prompts, SamplingParams(max_new_tokens=10, ignore_eos=True)
+            )
+            with torch.no_grad():
+                for prompt, output in zip(prompts, outputs):
+                    self.assertEqual(
+                        output.output_token_ids, model.reference_generate(prompt, 10)
+                    )
+            self.assertGreater(engine.num_draft_tokens, 0)
+            self.assertEqual(engine.block_manager.num_free_blocks, 64)
+            acceptance_rates.append(engine.draft_acceptance_rate)
+        # the repeated pattern is found by prompt lookup, and the target model
+        # accepts the drafts of itself
+        self.assertGreater(acceptance_rates[0], 0.0)
+        self.assertGreater(acceptance_rates[1], 0.9)
+
+    def test_lora_manager(self):
+        torch.manual_seed(0)
+        model = torch.nn.Module()
+        model.config = types.SimpleNamespace(
+            num_attention_heads=4, num_key_value_heads=2, hidden_size=64
+        )
+        model.layers = torch.nn.ModuleList([ToyFusedDecoderLayer()])
+        model = model.to(torch.bfloat16).eval()
+        layer = model.layers[0]
+        concat_linear = layer.self_attn.concat_qkv.concat_linear
+        o_proj = layer.mha_linear_add.linear
+        # as prepacked for TPP
+        o_proj.tpp_fallback = False
+        manager = LoRAManager(
+            model, LoRAConfig(max_loras=2, max_lora_rank=8, dtype=torch.bfloat16)
+        )
+        self.assertIs(layer.mha_linear_add.linear.weight, o_proj.weight)
+        self.assertEqual(
+            sorted(manager.lora_layers.keys()),
+            [
+                "layers.0.self_attn.k_proj",
+                "layers.0.self_attn.o_proj",
+                "layers.0.self_attn.q_proj",
+                "layers.0.self_attn.v_proj",
+            ],
+        )
+        names = ["layers.0.self_attn.q_proj", "layers.0.self_attn.v_proj"]
+        names += ["layers.0.self_attn.o_proj"]
+        adapters = {
+            "a": lora_state_dict(names, [64, 64, 64], [64, 32, 64], 4),
+            "b": lora_state_dict(names[:2], [64, 64], [64, 32], 8),
+            "c": lora_state_dict(names[2:], [64], [64], 2),
+        }
+        for adapter_id, state_dict in adapters.items():
+            manager.add_adapter(adapter_id, state_dict, lora_alpha=16)
+
+        def reference(x, adapter_id):
+            def delta(name, inputs):
+                if adapter_id is None:
+                    return 0
+                state_dict = adapters[adapter_id]
+                key = f"base_model.model.{name}.lora_"
+                if key + "A.weight" not in state_dict:
+                    return 0
+                lora_a = state_dict[key + "A.weight"]
+                lora_b = state_dict[key + "B.weight"]
+                return inputs.float() @ lora_a.t() @ lora_b.t() * 16 / lora_a.size(0)
+
+            qkv = concat_linear(x).float()
+            query, key, value = qkv.split([64, 32, 32], -1)
+            query = (query + delta(names[0], x)).to(x.dtype)
+            value = value + delta(names[1], x)
+            out = o_proj(query).float() + x.float() + delta(names[2], query)
+            return out, key, value
+
+        for batch in [["a", None, "b"], ["c", "c", None], [None, None, None]]:
+            x = torch.randn(len(batch), 5, 64, dtype=torch.bfloat16)
+            manager.set_batch_adapters(batch)
+            # the fused kernels read the base weight when no adapter is used
+            self.assertEqual(
+                layer.mha_linear_add.linear.tpp_fallback,
+                any(adapter_id is not None for adapter_id in batch),
+            )
+            with torch.no_grad():
+                outputs = model.layers[0](x)
+            for i, adapter_id in enumerate(batch):
+                for out, ref in zip(outputs, reference(x[i], adapter_id)):
+                    self.assertEqual(
+                        out[i].float(), ref, prec=0.1 * ref.abs().max().item()
+                    )
+        # "c" evicted the least recently used adapter "a"
+        self.assertEqual(manager.num_loads, 3)
+        self.assertEqual(manager.num_evictions, 1)
+        self.assertEqual(list(manager.slots.keys()), ["b", "c"])
+        with self.assertRaises(ValueError):
+            manager.set_batch_adapters(["a", "b", "c"])
+        # the adapters of a traced model would be fixed at trace time
+        model.trace_graph = None
+        with self.assertRaises(ValueError):
+            LoRAManager(model)
+
+    def test_engine_lora(self):
+        torch.manual_seed(0)
+        model = ToyPagedLM().eval()
+        reference_models = {None: copy.deepcopy(model)}
+        manager = LoRAManager(
+            model,
+            LoRAConfig(max_loras=2, target_modules=["lm_head"], dtype=torch.float),
+        )
+        for adapter_id in ["0", "1", "2", "3"]:
+            state_dict = lora_state_dict(["lm_head"], [64], [128], 4)
+            manager.add_adapter(adapter_id, state_dict, lora_alpha=8)
+            merged = copy.deepcopy(reference_models[None])
+            merged.lm_head.weight.data += (
+                state_dict["base_model.model.lm_head.lora_B.weight"]
+                @ state_dict["base_model.model.lm_head.lora_A.weight"]
+                * 2
+            )
+            reference_models[adapter_id] = merged
+        engine = Engine(
+            model,
+            num_layers=2,
+            num_kv_heads=4,
+            head_size=16,
+            num_blocks=64,
+            block_size=8,
+            dtype=torch.float,
+            scheduler_config=SchedulerConfig(max_num_seqs=4, max_num_batched_tokens=32),
+            lora_manager=manager,
+        )
+        with self.assertRaises(ValueError):
+            engine.add_request("0", [1, 2, 3], lora_id="4")
+        prompts = [torch.randint(0, 128, (n,)).tolist() for n in [7, 20, 3, 11]]
+        lora_ids = [None, "0", "1", "0"]
+        outputs = engine.generate(
+            prompts, SamplingParams(max_new_tokens=6, ignore_eos=True), lora_ids
+        )
+        with torch.no_grad():
+            for prompt, lora_id, output in zip(prompts, lora_ids, outputs):
+                self.assertEqual(
+                    output.output_token_ids,
+                    reference_models[lora_id].reference_generate(prompt, 6),
+                )
+        self.assertIsNone(manager.seq_indices)
+
+        # more distinct adapters than max_loras, the scheduler serves them in
+        # turns and every request completes
+        prompts = [torch.randint(0, 128, (n,)).tolist() for n in [5, 9, 14, 2, 8, 4]]
+        lora_ids = ["0", "1", "2", "3", None, "2"]
+        outputs = engine.generate(
+            prompts, SamplingParams(max_new_tokens=6, ignore_eos=True), lora_ids
+        )
+        with torch.no_grad():
+            for prompt, lora_id, output in zip(prompts, lora_ids, outputs):
+                self.assertTrue(output.finished)
+                self.assertEqual(
+                    output.output_token_ids,
+                    reference_models[lora_id].reference_generate(prompt, 6),
+                )
+        self.assertTrue(manager.num_evictions > 0)
+        self.assertEqual(engine.block_manager.num_free_blocks, 64)
+
+
+if __name__ == "__main__":
+    test = unittest.main()
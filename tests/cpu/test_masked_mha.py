@@ -795,6 +795,70 @@ class MaskedMHATest(TestCase):
                 )
                 self.assertEqual(outputs[0], ref_outputs[0], prec=1e-2)
 
+    def test_kv_cache_segment_growth(self):
+        head_num = 4
+        head_size = 64
+        segment = 8
+        prompt_len = 5
+        mha = MaskedMHA(
+            hidden_size=head_num * head_size,
+            n_head=head_num,
+            n_head_kv=head_num,
+            head_dim=head_size,
+        )
+        input_t = torch.randn(1, prompt_len, head_num * head_size)
+        attention_mask = torch.full((prompt_len, prompt_len), -1e6).triu(1)[None, None]
+        key_cache_iakv = torch.zeros(1, 1, head_num, head_size)
+        value_cache_iakv = torch.zeros(1, 1, head_num, head_size)
+        beam_idx = torch.zeros(1, 1, dtype=torch.int64)
+        with torch.inference_mode(), torch.no_grad():
+            _, _, key_cache, value_cache, _ = mha(
+                input_t, None, None, segment, attention_mask, None, None
+            )
+            _, _, key_cache_iakv, value_cache_iakv, beam_idx = mha(
+                input_t,
+                key_cache_iakv,
+                value_cache_iakv,
+                segment,
+                attention_mask,
+                beam_idx,
+                True,
+                torch.tensor(0),
+            )
+            self.assertEqual(key_cache_iakv.size(0), segment)
+            # decode across several segments, the cache is at least doubled by
+            # whole segments and the results stay the same as the concat kv cache
+            cache_size = segment
+            for offset in range(prompt_len, prompt_len + 3 * segment):
+                input_t = torch.randn(1, 1, head_num * head_size)
+                attention_mask = torch.zeros(1, 1, 1, offset + 1)
+                naive_output, _, key_cache, value_cache, _ = mha(
+                    input_t, key_cache, value_cache, segment, attention_mask, None
+                )
+                (
+                    iakv_output,
+                    _,
+                    key_cache_iakv,
+                    value_cache_iakv,
+                    beam_idx,
+                ) = mha(
+                    input_t,
+                    key_cache_iakv,
+                    value_cache_iakv,
+                    segment,
+                    attention_mask,
+                    beam_idx,
+                    True,
+                    torch.tensor(offset),
+                )
+                if offset + 1 > cache_size:
+                    cache_size = max(
+                        ((offset + 1) // segment + 1) * segment, cache_size * 2
+                    )
+                self.assertEqual(key_cache_iakv.size(0), cache_size)
+                self.assertEqual(beam_idx.size(0), key_cache_iakv.size(0) + 2)
+                self.assertEqual(naive_output, iakv_output)
+
     def test_mha(self):
         self._test_mha(torchcompile=False)
         self._test_mha_fp16(torchcompile=False)
@@ -10,7 +10,11 @@ from bench.custom_op_bench.merged_embeddingbag import (
     MergedEmbAdaGrad,
 )
 import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.nn.modules.merged_embeddingbag import (
+    dequantize_rowwise,
+)
 import copy
+import tempfile
 
 dtypes = [torch.float64, torch.float32]
 if torch.ops.mkldnn._is_mkldnn_bf16_supported():
@@ -237,6 +241,201 @@ class TestMergedEmbedding(TestCase):
                                 )
                             self._test_training(m, ref_m, (indices, offsets), opt=opt)
 
+    def test_mixed_tables(self):
+        B = 1029
+        dims = [16, 128, 129, 256, 64, 32]
+        include_last_offsets = [True, False, False, True, False, True]
+        for mode in ["mean", "sum"]:
+            for index_type in [torch.int32, torch.int64]:
+                emb_list = EmbeddingBagList(0, 0, torch.float)
+                indices = []
+                offsets = []
+                for i, (dim, include_last_offset) in enumerate(
+                    zip(dims, include_last_offsets)
+                ):
+                    emb_list.list.append(
+                        torch.nn.EmbeddingBag(
+                            1000,
+                            dim,
+                            dtype=dtypes[i % len(dtypes)],
+                            mode=mode,
+                            include_last_offset=include_last_offset,
+                        )
+                    )
+                    indices.append(
+                        torch.randint(1000, (B * self.multi_hot[i],)).to(index_type)
+                    )
+                    n_offset = B + 1 if include_last_offset else B
+                    offsets.append(
+                        torch.arange(
+                            0, n_offset * self.multi_hot[i], self.multi_hot[i]
+                        ).to(index_type)
+                    )
+                m = MergedEmb(copy.deepcopy(emb_list))
+                self.assertEqual(m.merged_emb.embedding_dims, dims)
+                self.assertTrue(m.merged_emb.embedding_dim is None)
+                self._test_inference(m, copy.deepcopy(emb_list), (indices, offsets))
+                out = m(indices, offsets)
+                self.assertEqual([o.shape for o in out], [(B, dim) for dim in dims])
+
+                # one kernel returns the grad of every table in its own dtype
+                m = MergedEmb(copy.deepcopy(emb_list))
+                ref_m = copy.deepcopy(emb_list)
+                out = m(indices, offsets)
+                ref_out = ref_m(indices, offsets)
+                sum(o.float().sum() for o in out).backward()
+                sum(o.float().sum() for o in ref_out).backward()
+                for weight, ref in zip(m.merged_emb.weights, ref_m.list):
+                    self.assertEqual(weight.grad.dtype, ref.weight.dtype)
+                    self.assertEqual(
+                        weight.grad.float(),
+                        ref.weight.grad.float(),
+                        rtol=0.1,
+                        atol=0.1,
+                    )
+
+                # fused update with sgd on float and double tables
+                for emb, dtype in zip(
+                    emb_list.list, [torch.float, torch.double] * len(dims)
+                ):
+                    emb.to(dtype)
+                m = MergedEmbSGD(copy.deepcopy(emb_list), lr=0.1)
+                ref_m = copy.deepcopy(emb_list)
+                opt = torch.optim.SGD(ref_m.parameters(), lr=0.1)
+                opt.zero_grad()
+                sum(o.sum() for o in m(indices, offsets)).backward()
+                sum(o.sum() for o in ref_m(indices, offsets)).backward()
+                opt.step()
+                for weight, ref in zip(m.merged_emb.weights, ref_m.list):
+                    self.assertEqual(weight, ref.weight, rtol=1e-5, atol=0.016)
+
+        # the cat with dense feature needs tables of the same shape
+        emb_list = EmbeddingBagList(2, 16, torch.float)
+        emb_list.list.append(torch.nn.EmbeddingBag(1000, 32))
+        with self.assertRaises(AssertionError):
+            MergedEmbCatDense(emb_list)
+
+    def test_rowwise_quantized(self):
+        B = 129
+        dims = [16, 64, 40, 128]
+        include_last_offsets = [True, False, True, False]
+        for mode in ["sum", "mean"]:
+            for bits in [8, 4, [8, 4, 4, 8]]:
+                emb_list = EmbeddingBagList(0, 0, torch.float)
+                indices = []
+                offsets = []
+                for i, (dim, include_last_offset) in enumerate(
+                    zip(dims, include_last_offsets)
+                ):
+                    emb_list.list.append(
+                        torch.nn.EmbeddingBag(
+                            1000,
+                            dim,
+                            mode=mode,
+                            include_last_offset=include_last_offset,
+                        )
+                    )
+                    indices.append(torch.randint(1000, (B * self.multi_hot[i],)))
+                    n_offset = B + 1 if include_last_offset else B
+                    offsets.append(
+                        torch.arange(0, n_offset * self.multi_hot[i], self.multi_hot[i])
+                    )
+                m = ipex.nn.modules.QuantizedMergedEmbeddingBag.from_embeddingbag_list(
+                    emb_list.list, bits
+                )
+                table_bits = bits if isinstance(bits, list) else [bits] * len(dims)
+                with torch.no_grad():
+                    out = m(indices, offsets)
+                    ref_out = emb_list(indices, offsets)
+                for i, emb in enumerate(emb_list.list):
+                    # fused dequantize-pooling equals pooling the dequantized table
+                    weight = dequantize_rowwise(m.qweights[i], table_bits[i])
+                    ref = torch.nn.functional.embedding_bag(
+                        indices[i],
+                        weight,
+                        offsets[i],
+                        mode=mode,
+                        include_last_offset=include_last_offsets[i],
+                    )
+                    self.assertEqual(out[i], ref)
+                    self.assertEqual(
+                        m.qweights[i].size(1), dims[i] * table_bits[i] // 8 + 8
+                    )
+                    atol = 0.1 if table_bits[i] == 8 else 1.5
+                    self.assertEqual(out[i], ref_out[i], rtol=0, atol=atol)
+
+    def test_cache(self):
+        B = 128
+        NUM_TABLE = 4
+        NUM_ROWS = 1000
+        for optimizer, cache_policy in [
+            (None, "lfu"),
+            ("sgd", "lfu"),
+            ("adagrad", "lru"),
+        ]:
+            emb_list = EmbeddingBagList(NUM_TABLE, 16, torch.float)
+            # power law indices, most of the lookups hit a few rows
+            batches = []
+            for _ in range(8):
+                indices = [
+                    (
+                        torch.distributions.Pareto(1.0, 1.0).sample(
+                            (B * self.multi_hot[i],)
+                        )
+                        - 1
+                    )
+                    .long()
+                    .clamp(max=NUM_ROWS - 1)
+                    for i in range(NUM_TABLE)
+                ]
+                offsets = [
+                    torch.arange(0, B * self.multi_hot[i], self.multi_hot[i])
+                    for i in range(NUM_TABLE)
+                ]
+                batches.append((indices, offsets))
+            ref_m = copy.deepcopy(emb_list)
+            opt = None
+            optimizer_args = {}
+            if optimizer == "sgd":
+                opt = torch.optim.SGD(ref_m.parameters(), lr=0.1)
+                optimizer_args = {"lr": 0.1}
+            elif optimizer == "adagrad":
+                opt = torch.optim.Adagrad(ref_m.parameters(), lr=0.01, eps=1e-10)
+                optimizer_args = {"lr": 0.01, "eps": 1e-10}
+            with tempfile.TemporaryDirectory() as storage_dir:
+                m = ipex.nn.modules.MergedEmbeddingBagWithCache.from_embeddingbag_list(
+                    copy.deepcopy(emb_list).list,
+                    cache_rows=200,
+                    storage_dir=storage_dir,
+                    cache_policy=cache_policy,
+                    optimizer=optimizer,
+                    **optimizer_args,
+                )
+                for step, (indices, offsets) in enumerate(batches):
+                    out = m(indices, offsets)
+                    if step + 1 < len(batches):
+                        m.prefetch(batches[step + 1][0])
+                    ref_out = ref_m(indices, offsets)
+                    self.assertEqual(out, ref_out)
+                    if opt is None:
+                        continue
+                    opt.zero_grad()
+                    sum(out).sum().backward()
+                    sum(ref_out).sum().backward()
+                    opt.step()
+                m.flush()
+                # the files hold the full updated tables
+                for i in range(NUM_TABLE):
+                    weight = torch.from_file(
+                        m._state_file(i, "weight"), size=NUM_ROWS * 16
+                    ).view(NUM_ROWS, 16)
+                    self.assertEqual(weight, ref_m.list[i].weight)
+                with self.assertRaises(ValueError):
+                    m(
+                        [torch.arange(NUM_ROWS)] * NUM_TABLE,
+                        [torch.arange(NUM_ROWS)] * NUM_TABLE,
+                    )
+
 
 if __name__ == "__main__":
     test = unittest.main()
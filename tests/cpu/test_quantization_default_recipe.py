@@ -1,4 +1,5 @@
 import itertools
+import json
 import tempfile
 import torch
 import torch.nn as nn
@@ -257,6 +258,108 @@ class TestDefaultRecipe(JitLlgaTestCase):
         with self.assertRaises(AssertionError):
             prepared_model = ipex.quantization.prepare(m, qconfig_mapping)
 
+    def test_smooth_quant_blockwise(self):
+        class Block(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.norm = nn.LayerNorm(16)
+                self.q = nn.Linear(16, 16)
+                self.k = nn.Linear(16, 16)
+                self.v = nn.Linear(16, 16)
+                self.o = nn.Linear(16, 16)
+
+            def forward(self, hidden_states, use_cache=False):
+                h = self.norm(hidden_states)
+                a = torch.softmax(self.q(h) @ self.k(h).transpose(1, 2), -1)
+                a = a @ self.v(h)
+                return (hidden_states + self.o(a),)
+
+        class M(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.embed = nn.Embedding(32, 16)
+                self.layers = nn.ModuleList([Block() for _ in range(2)])
+
+            def forward(self, input_ids):
+                h = self.embed(input_ids)
+                for layer in self.layers:
+                    h = layer(h, use_cache=True)[0]
+                return h
+
+        m = M().eval()
+        with torch.no_grad():
+            # an outlier channel
+            m.embed.weight[:, 3] *= 20
+        init_state = copy.deepcopy(m.state_dict())
+        data = [torch.randint(0, 32, (2, 8)) for _ in range(4)]
+        with torch.no_grad():
+            ref = [m(x) for x in data]
+        alpha_candidates = [0.3, 0.5, 0.7]
+        results = ipex.quantization.smooth_quant_blockwise(
+            m, data, alpha_candidates=alpha_candidates
+        )
+        self.assertEqual(sorted(results.keys()), ["layers.0.norm", "layers.1.norm"])
+        for result in results.values():
+            self.assertTrue(result["alpha"] in alpha_candidates)
+            self.assertEqual(len(result["linears"]), 3)
+        # the smoothing is folded into the weights, the outputs are unchanged
+        with torch.no_grad():
+            for x, y in zip(data, ref):
+                self.assertEqual(m(x), y, atol=1e-4, rtol=1e-4)
+        qconfig_mapping = ipex.quantization.default_static_qconfig_mapping
+        prepared_model = ipex.quantization.prepare(m, qconfig_mapping, data[0])
+        for x in data:
+            prepared_model(x)
+        converted_model = ipex.quantization.convert(prepared_model)
+        with torch.no_grad():
+            traced_model = torch.jit.trace(converted_model, data[0])
+            traced_model = torch.jit.freeze(traced_model)
+            self.assertEqual(traced_model(data[0]), ref[0], atol=0.5, rtol=0.1)
+
+        # observe the smoothed blocks and save the qconf summary, without
+        # calibrating the prepared model
+        m2 = M().eval()
+        m2.load_state_dict(init_state)
+        results, act_observers = ipex.quantization.smooth_quant_blockwise(
+            m2,
+            data,
+            alpha_candidates=alpha_candidates,
+            blocks_name="layers",
+            qconfig_mapping=qconfig_mapping,
+        )
+        self.assertEqual(sorted(results.keys()), ["layers.0.norm", "layers.1.norm"])
+        self.assertEqual(
+            sorted(act_observers.keys()),
+            sorted(f"layers.{i}.{n}" for i in range(2) for n in "qkvo"),
+        )
+        # q, k and v share the input
+        self.assertTrue(act_observers["layers.0.q"] is act_observers["layers.0.v"])
+        prepared_model = ipex.quantization.prepare(m2, qconfig_mapping, data[0])
+        with tempfile.TemporaryDirectory() as tmp:
+            qconf_summary = os.path.join(tmp, "qconf.json")
+            ipex.quantization.save_blockwise_qconf_summary(
+                prepared_model, act_observers, qconf_summary
+            )
+            with open(qconf_summary) as f:
+                quant_state_dict = json.load(f)
+            for layer_info in quant_state_dict.values():
+                for q_op_info in layer_info["q_op_infos"].values():
+                    # only the linears with observed inputs are quantized
+                    quantized = q_op_info["fqn"] in act_observers
+                    for tensor_info in q_op_info["input_tensor_infos"]:
+                        if len(tensor_info) > 0:
+                            self.assertEqual(
+                                tensor_info["inf_dtype"] != tensor_info["orig_dtype"],
+                                quantized,
+                            )
+            prepared_model = ipex.quantization.prepare(m2, qconfig_mapping, data[0])
+            prepared_model.load_qconf_summary(qconf_summary=qconf_summary)
+        converted_model = ipex.quantization.convert(prepared_model)
+        with torch.no_grad():
+            traced_model = torch.jit.trace(converted_model, data[0])
+            traced_model = torch.jit.freeze(traced_model)
+            self.assertEqual(traced_model(data[0]), ref[0], atol=0.5, rtol=0.1)
+
 
 class WeightOnlyQuantizationTester(TestCase):
     def test_weight_only_quantization(self):
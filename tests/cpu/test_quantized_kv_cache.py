@@ -0,0 +1,316 @@
+import torch
+import intel_extension_for_pytorch as ipex
+from common_utils import TestCase
+import unittest
+import random
+from itertools import product
+
+
+def dequantize_kv_cache(cache, head_size):
+    # The reference of the int8/int4 cache rows, see
+    # csrc/cpu/aten/utils/kv_cache_quant.h
+    if cache.size(-1) == head_size + 8:
+        codes = cache[..., :head_size].float()
+        scale_min = cache[..., head_size:].contiguous().view(torch.float)
+        return codes * scale_min[..., :1] + scale_min[..., 1:]
+    codes = cache[..., : head_size // 2]
+    codes = torch.stack([codes & 0xF, codes >> 4], dim=-1).flatten(-2).float()
+    group_size = 32 if head_size % 32 == 0 else head_size
+    codes = codes.unflatten(-1, (-1, group_size))
+    scale_min = cache[..., head_size // 2 :].contiguous().view(torch.float)
+    scale_min = scale_min.unflatten(-1, (-1, 2))
+    return (codes * scale_min[..., :1] + scale_min[..., 1:]).flatten(-2)
+
+
+def ref_attention(query, key, value, scale, attn_mask=None):
+    # query: [q_len, num_heads, head_size], key/value: [kv_len, num_kv_heads, head_size]
+    num_queries_per_kv = query.size(1) // key.size(1)
+    key = key.repeat_interleave(num_queries_per_kv, dim=1)
+    value = value.repeat_interleave(num_queries_per_kv, dim=1)
+    attn_weights = scale * torch.einsum("qhd,khd->hqk", query.float(), key.float())
+    if attn_mask is not None:
+        attn_weights = attn_weights + attn_mask
+    attn_weights = torch.softmax(attn_weights, dim=-1)
+    return torch.einsum("hqk,khd->qhd", attn_weights, value.float())
+
+
+class QuantizedKVCacheTest(TestCase):
+    def _create_kv_caches(
+        self, num_blocks, block_size, num_kv_head, head_size, kv_cache_dtype, dtype
+    ):
+        # fill every slot of the caches
+        row_size = ipex.llm.modules.PagedAttention.get_kv_cache_head_size(
+            head_size, kv_cache_dtype
+        )
+        shape = (num_blocks, num_kv_head, block_size, row_size)
+        key_cache = torch.zeros(shape, dtype=torch.uint8)
+        value_cache = torch.zeros(shape, dtype=torch.uint8)
+        num_slots = num_blocks * block_size
+        key = torch.randn(num_slots, num_kv_head, head_size, dtype=dtype)
+        value = torch.randn(num_slots, num_kv_head, head_size, dtype=dtype)
+        slot_mapping = torch.randperm(num_slots, dtype=torch.int32)
+        ipex.llm.modules.PagedAttention.reshape_and_cache(
+            key, value, key_cache, value_cache, slot_mapping, kv_cache_dtype
+        )
+        return key, value, key_cache, value_cache, slot_mapping
+
+    def test_reshape_and_cache(self):
+        num_blocks = 16
+        block_size = 16
+        num_kv_head = 4
+        for head_size, kv_cache_dtype, dtype in product(
+            [64, 80, 128], ["int8", "int4"], [torch.float, torch.bfloat16]
+        ):
+            torch.manual_seed(0)
+            key, value, key_cache, value_cache, slot_mapping = self._create_kv_caches(
+                num_blocks,
+                block_size,
+                num_kv_head,
+                head_size,
+                kv_cache_dtype,
+                dtype,
+            )
+            block_idx = slot_mapping.long() // block_size
+            block_offset = slot_mapping.long() % block_size
+            for cache, ref in [(key_cache, key), (value_cache, value)]:
+                cached = dequantize_kv_cache(cache, head_size)
+                cached = cached[block_idx, :, block_offset, :]
+                # the error is bounded by half of the quantization step
+                max_code = 255 if kv_cache_dtype == "int8" else 15
+                atol = 0.6 * (ref.float().max() - ref.float().min()).item() / max_code
+                self.assertTrue(torch.allclose(cached, ref.float(), atol=atol))
+            with self.assertRaises(TypeError):
+                ipex.llm.modules.PagedAttention.reshape_and_cache(
+                    key,
+                    value,
+                    key.new_zeros(key_cache.shape),
+                    value.new_zeros(value_cache.shape),
+                    slot_mapping,
+                    kv_cache_dtype,
+                )
+
+    def test_single_query_cached_kv_attention(self):
+        num_blocks = 64
+        block_size = 16
+        num_seqs = 5
+        max_seq_len = 256
+        for head_size, num_head, kv_cache_dtype, dtype in product(
+            [64, 80, 128],
+            [(8, 8), (8, 2)],
+            ["int8", "int4"],
+            [torch.float, torch.bfloat16],
+        ):
+            random.seed(0)
+            torch.manual_seed(0)
+            num_query_heads, num_kv_head = num_head
+            scale = float(1.0 / (head_size**0.5))
+            _, _, key_cache, value_cache, _ = self._create_kv_caches(
+                num_blocks, block_size, num_kv_head, head_size, kv_cache_dtype, dtype
+            )
+            query = torch.randn(num_seqs, num_query_heads, head_size, dtype=dtype)
+            head_mapping = torch.repeat_interleave(
+                torch.arange(num_kv_head, dtype=torch.int32),
+                num_query_heads // num_kv_head,
+            )
+            context_lens = [random.randint(1, max_seq_len) for _ in range(num_seqs)]
+            context_lens[-1] = max_seq_len
+            max_num_blocks_per_seq = (max_seq_len + block_size - 1) // block_size
+            block_tables = torch.randint(
+                0, num_blocks, (num_seqs, max_num_blocks_per_seq), dtype=torch.int32
+            )
+            output = torch.empty_like(query)
+            ipex.llm.modules.PagedAttention.single_query_cached_kv_attention(
+                output,
+                query,
+                key_cache,
+                value_cache,
+                head_mapping,
+                scale,
+                block_tables,
+                torch.tensor(context_lens, dtype=torch.int32),
+                block_size,
+                max_seq_len,
+                None,
+            )
+
+            key_cache_ref = dequantize_kv_cache(key_cache, head_size)
+            value_cache_ref = dequantize_kv_cache(value_cache, head_size)
+            for i, context_len in enumerate(context_lens):
+                positions = torch.arange(context_len)
+                blocks = block_tables[i].long()[positions // block_size]
+                key = key_cache_ref[blocks, :, positions % block_size, :]
+                value = value_cache_ref[blocks, :, positions % block_size, :]
+                ref_output = ref_attention(query[i : i + 1], key, value, scale)
+                self.assertEqual(
+                    output[i].float(),
+                    ref_output[0],
+                    atol=1e-5 if dtype == torch.float else 2e-2,
+                    rtol=1e-3 if dtype == torch.float else 2e-2,
+                )
+
+    def test_flash_attn_varlen(self):
+        num_blocks = 64
+        block_size = 16
+        num_seqs = 3
+        num_query_heads = 8
+        for head_size, num_kv_head, kv_cache_dtype in product(
+            [64, 128], [8, 2], ["int8", "int4"]
+        ):
+            random.seed(0)
+            torch.manual_seed(0)
+            scale = float(1.0 / (head_size**0.5))
+            _, _, key_cache, value_cache, _ = self._create_kv_caches(
+                num_blocks,
+                block_size,
+                num_kv_head,
+                head_size,
+                kv_cache_dtype,
+                torch.float,
+            )
+            query_lens = [random.randint(1, 64) for _ in range(num_seqs)]
+            seq_lens = [q + random.randint(0, 128) for q in query_lens]
+            cu_seq_lens_q = torch.tensor([0] + query_lens).cumsum(0).int()
+            cu_seq_lens_kv = torch.tensor([0] + seq_lens).cumsum(0).int()
+            max_num_blocks_per_seq = (max(seq_lens) + block_size - 1) // block_size
+            block_table = torch.randperm(num_blocks, dtype=torch.int32)
+            block_table = block_table[: num_seqs * max_num_blocks_per_seq].view(
+                num_seqs, max_num_blocks_per_seq
+            )
+            query = torch.randn(sum(query_lens), num_query_heads, head_size)
+            output = torch.empty_like(query)
+            ipex.llm.modules.PagedAttention.flash_attn_varlen_func(
+                output,
+                query,
+                key_cache,
+                value_cache,
+                cu_seq_lens_q,
+                cu_seq_lens_kv,
+                max(query_lens),
+                max(seq_lens),
+                scale,
+                True,
+                block_table,
+                None,
+                kv_cache_dtype=kv_cache_dtype,
+            )
+
+            key_cache_ref = dequantize_kv_cache(key_cache, head_size)
+            value_cache_ref = dequantize_kv_cache(value_cache, head_size)
+            for i, (query_len, seq_len) in enumerate(zip(query_lens, seq_lens)):
+                positions = torch.arange(seq_len)
+                blocks = block_table[i].long()[positions // block_size]
+                key = key_cache_ref[blocks, :, positions % block_size, :]
+                value = value_cache_ref[blocks, :, positions % block_size, :]
+                causal_mask = torch.full((query_len, seq_len), float("-inf"))
+                causal_mask = causal_mask.triu(seq_len - query_len + 1)
+                ref_output = ref_attention(
+                    query[cu_seq_lens_q[i] : cu_seq_lens_q[i + 1]],
+                    key,
+                    value,
+                    scale,
+                    causal_mask,
+                )
+                self.assertEqual(
+                    output[cu_seq_lens_q[i] : cu_seq_lens_q[i + 1]],
+                    ref_output,
+                    atol=1e-4,
+                    rtol=1e-3,
+                )
+
+    def test_indirect_access_kv_cache(self):
+        head_num = 8
+        prompt_len = 12
+        max_seq_len = 16
+        decode_steps = 6
+        for batch_size, beam_size, head_num_kv, head_size, kv_cache_dtype in product(
+            [1, 2], [1, 4], [8, 2], [64, 80], [torch.uint8, torch.uint4]
+        ):
+            torch.manual_seed(0)
+            beam_batch = batch_size * beam_size
+            query = torch.randn(batch_size, prompt_len, head_num, head_size)
+            key = torch.randn(batch_size, prompt_len, head_num_kv, head_size)
+            value = torch.randn(batch_size, prompt_len, head_num_kv, head_size)
+            causal_mask = torch.full((prompt_len, prompt_len), -1e6).triu(1)
+            attention_mask = causal_mask.expand(batch_size, 1, -1, -1).contiguous()
+            key_cache = torch.empty([1, 1, 1, 1], dtype=kv_cache_dtype)
+            value_cache = torch.empty([1, 1, 1, 1], dtype=kv_cache_dtype)
+            beam_idx = torch.zeros(max_seq_len, beam_batch, dtype=torch.long)
+            output, _, key_cache, value_cache, beam_idx = (
+                torch.ops.torch_ipex.masked_multihead_self_attention(
+                    query,
+                    key,
+                    value,
+                    key_cache,
+                    value_cache,
+                    beam_idx,
+                    torch.tensor(0),
+                    head_size**0.5,
+                    max_seq_len,
+                    None,
+                    attention_mask,
+                )
+            )
+            self.assertEqual(key_cache.dtype, torch.uint8)
+            # the prompt is cached in the first beam of every batch
+            key_cache_ref = dequantize_kv_cache(key_cache, head_size)
+            value_cache_ref = dequantize_kv_cache(value_cache, head_size)
+            prompt_beams = torch.arange(batch_size) * beam_size
+            keys = key_cache_ref[:prompt_len, prompt_beams].transpose(0, 1)
+            values = value_cache_ref[:prompt_len, prompt_beams].transpose(0, 1)
+            max_code = 255 if kv_cache_dtype == torch.uint8 else 15
+            atol = 0.6 * (key.max() - key.min()).item() / max_code
+            self.assertTrue(torch.allclose(keys, key, atol=atol))
+            keys = keys.repeat_interleave(beam_size, 0)
+            values = values.repeat_interleave(beam_size, 0)
+
+            for offset in range(prompt_len, prompt_len + decode_steps):
+                # reorder the beams of every batch, the indirect access kv cache
+                # only records the beam idx
+                beam_idx_t = torch.cat(
+                    [
+                        torch.randint(0, beam_size, (beam_size,)) + i * beam_size
+                        for i in range(batch_size)
+                    ]
+                )
+                beam_idx[offset - 1] = beam_idx_t
+                keys = keys[beam_idx_t]
+                values = values[beam_idx_t]
+                query = torch.randn(beam_batch, 1, head_num, head_size)
+                key = torch.randn(beam_batch, 1, head_num_kv, head_size)
+                value = torch.randn(beam_batch, 1, head_num_kv, head_size)
+                attention_mask = torch.zeros(beam_batch, 1, 1, offset + 1)
+                output, _, key_cache, value_cache, beam_idx = (
+                    torch.ops.torch_ipex.masked_multihead_self_attention(
+                        query,
+                        key,
+                        value,
+                        key_cache,
+                        value_cache,
+                        beam_idx,
+                        torch.tensor(offset),
+                        head_size**0.5,
+                        max_seq_len,
+                        None,
+                        attention_mask,
+                    )
+                )
+                # the current key/value are read back from the cache
+                key_cache_ref = dequantize_kv_cache(key_cache[offset], head_size)
+                value_cache_ref = dequantize_kv_cache(value_cache[offset], head_size)
+                atol = 0.6 * (key.max() - key.min()).item() / max_code
+                self.assertTrue(torch.allclose(key_cache_ref, key[:, 0], atol=atol))
+                keys = torch.cat([keys, key_cache_ref.unsqueeze(1)], 1)
+                values = torch.cat([values, value_cache_ref.unsqueeze(1)], 1)
+                for i in range(beam_batch):
+                    ref_output = ref_attention(
+                        query[i], keys[i], values[i], head_size**-0.5
+                    )
+                    self.assertEqual(
+                        output[i].transpose(0, 1), ref_output, atol=1e-4, rtol=1e-3
+                    )
+            # the cache is extended by segments once it is full
+            self.assertEqual(key_cache.size(0), 2 * max_seq_len)
+
+
+if __name__ == "__main__":
+    test = unittest.main()
@@ -1,3 +1,5 @@
+import asyncio
+import threading
 import unittest
 import torch
 import intel_extension_for_pytorch as ipex
@@ -220,6 +222,39 @@ class TestRuntimeAPI(TestCase):
         y_runtime = y_runtime_future.get()
         self.assertEqual(y, y_runtime)
 
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_task_awaitable_api(self):
+        model = SimpleNet()
+        model.eval()
+        traced_model = torch.jit.trace(model, torch.rand(1, 64, 3, 3))
+        xs = [torch.rand(batch_size, 64, 3, 3) for batch_size in [1, 8, 64]]
+        # Calculate the reference result
+        ys = [model(x) for x in xs]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(node_id=0)
+        for m in [model, traced_model]:
+            task = ipex.cpu.runtime.Task(m, cpu_pool)
+
+            # Several requests in flight on one task
+            async def infer():
+                return await asyncio.gather(*[task.run_async_awaitable(x) for x in xs])
+
+            for y, y_runtime in zip(ys, asyncio.run(infer())):
+                self.assertEqual(y, y_runtime)
+
+        # The done callback is invoked once the task finished
+        task = ipex.cpu.runtime.Task(model, cpu_pool)
+        done = threading.Event()
+        y_runtime_future = task(xs[0])
+        y_runtime_future.add_done_callback(done.set)
+        self.assertTrue(done.wait(timeout=60))
+        self.assertTrue(y_runtime_future.done())
+        self.assertEqual(ys[0], y_runtime_future.get())
+
     @unittest.skipIf(
         not ipex.cpu.runtime.is_runtime_ext_enabled(),
         "Skip when IPEX Runtime extension is not enabled",
@@ -471,6 +506,134 @@ class TestMultiStreamModule(TestCase):
         self.assertEqual(y_runtime2[1].size(0), 1)
         self.assertEqual(y_runtime2[2].size(0), 1)
 
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_adaptive_multi_stream_module(self):
+        model = SimpleNet()
+        model.eval()
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1, 2, 3])
+        for work_stealing in [True, False]:
+            multi_stream_model = ipex.cpu.runtime.MultiStreamModule(
+                model,
+                num_streams=4,
+                cpu_pool=cpu_pool,
+                adaptive=True,
+                work_stealing=work_stealing,
+            )
+            self.assertEqual(multi_stream_model.candidate_num_streams, [1, 2, 4])
+            # The batchsize changes between the forward calls
+            for batch_size in [1, 3, 8, 8, 8, 8, 5, 2]:
+                x = torch.rand(batch_size, 64, 3, 3)
+                y = model(x)
+                y_runtime = multi_stream_model(x)
+                self.assertEqual(y, y_runtime)
+                self.assertLessEqual(
+                    multi_stream_model.used_num_streams, min(batch_size, 4)
+                )
+            # Every candidate with enough samples is measured for batchsize 8
+            for num_streams in [1, 2, 4]:
+                self.assertIn((4, num_streams), multi_stream_model.latency_per_sample)
+
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(
+            model, num_streams=4, cpu_pool=cpu_pool, concat_output=False, adaptive=True
+        )
+        x = torch.rand(6, 64, 3, 3)
+        y_runtime = multi_stream_model(x)
+        self.assertEqual(model(x), torch.cat(y_runtime))
+
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_forward_async(self):
+        model = SimpleNet()
+        model.eval()
+        xs = [torch.rand(batch_size, 64, 3, 3) for batch_size in [1, 3, 8, 5]]
+        # Calculate the reference result
+        ys = [model(x) for x in xs]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1, 2, 3])
+        for num_streams, adaptive in [(1, False), (2, False), (4, True)]:
+            multi_stream_model = ipex.cpu.runtime.MultiStreamModule(
+                model, num_streams=num_streams, cpu_pool=cpu_pool, adaptive=adaptive
+            )
+
+            async def infer():
+                return await asyncio.gather(
+                    *[multi_stream_model.forward_async(x) for x in xs]
+                )
+
+            for y, y_runtime in zip(ys, asyncio.run(infer())):
+                self.assertEqual(y, y_runtime)
+
+
+class TestDynamicBatcher(TestCase):
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher(self):
+        model = SimpleNet()
+        model.eval()
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1, 2, 3])
+        xs = [torch.rand(batch_size, 64, 3, 3) for batch_size in [1, 2, 1, 3, 9, 1]]
+        # Calculate the reference result
+        ys = [model(x) for x in xs]
+
+        with ipex.cpu.runtime.DynamicBatcher(
+            model, max_batch_size=8, max_wait_ms=50, cpu_pool=cpu_pool, num_streams=2
+        ) as batcher:
+            futures = [batcher.submit(x) for x in xs]
+            for y, future in zip(ys, futures):
+                self.assertEqual(y, future.result())
+            metrics = batcher.get_metrics()
+            self.assertEqual(metrics["num_requests"], 6)
+            # The requests are coalesced, and the one larger than max_batch_size
+            # runs alone
+            self.assertLess(metrics["num_batches"], 6)
+            self.assertGreater(metrics["batch_fill_rate"], 0.0)
+
+            async def infer():
+                return await asyncio.gather(*[batcher.infer_async(x) for x in xs])
+
+            for y, y_runtime in zip(ys, asyncio.run(infer())):
+                self.assertEqual(y, y_runtime)
+
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher_bucket_by_shape(self):
+        # This module:
+        #   * Accept 2 tensors as input
+        #   * Return 1 tuple(2 tensors) as output
+        model = TestInputOutputModule().eval()
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        batcher = ipex.cpu.runtime.DynamicBatcher(
+            model,
+            max_batch_size=8,
+            max_wait_ms=50,
+            cpu_pool=cpu_pool,
+            num_streams=2,
+            input_split_hint=ipex.cpu.runtime.MultiStreamModuleHint(0, 0),
+            output_concat_hint=ipex.cpu.runtime.MultiStreamModuleHint((0, 0)),
+        )
+        inputs = [
+            (torch.rand(2, feature), torch.rand(2, feature)) for feature in [3, 5, 3]
+        ]
+        futures = [batcher.submit(*input) for input in inputs]
+        for input, future in zip(inputs, futures):
+            self.assertEqual(model(*input), future.result())
+        batcher.close()
+        # The inputs of different shapes are not batched together
+        self.assertEqual(batcher.get_metrics()["num_batches"], 2)
+
 
 class TestModuleMultiStreamModuleHint(TestCase):
     # For the inputs format which can't be jit.trace